@@ -0,0 +1,262 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+import aiohttp # Dépendance de python-binance (AsyncClient)
+from binance.client import AsyncClient
+from binance.exceptions import BinanceAPIException, BinanceRequestException
+import binance_client_wrapper
+import metrics
+
+# Version asyncio du wrapper Binance : un seul AsyncClient dont la session aiohttp
+# garde ses connexions HTTPS ouvertes (keep-alive, pool borné), des requêtes
+# indépendantes lancées en parallèle avec asyncio.gather, et des tentatives
+# multiples espacées par asyncio.sleep au lieu de bloquer le thread.
+#
+# La boucle asyncio tourne dans un thread dédié ; le code synchrone (run_bot)
+# y soumet ses coroutines avec run(). Les soldes alimentent le même cache que
+# binance_client_wrapper (AccountSnapshot).
+
+try:
+    import config
+    API_KEY = config.BINANCE_API_KEY
+    API_SECRET = config.BINANCE_API_SECRET
+    USE_TESTNET = getattr(config, 'USE_TESTNET', False)
+    POOL_SIZE = getattr(config, 'ASYNC_POOL_SIZE', 20) # Connexions HTTP simultanées max
+    API_URL = getattr(config, 'API_URL', None) # Exchange REST local (mock_exchange.py)
+except (ImportError, AttributeError):
+    logging.error("Fichier config.py non trouvé ou clés API non définies dans async_client_wrapper.")
+    API_KEY = "YOUR_API_KEY"
+    API_SECRET = "YOUR_SECRET_KEY"
+    USE_TESTNET = False
+    POOL_SIZE = 20
+    API_URL = None
+
+_loop = None
+_loop_thread = None
+_loop_lock = threading.Lock()
+_async_client = None
+_client_init_lock = None # asyncio.Lock, créé dans la boucle
+
+
+def _get_loop():
+    """Démarre (une seule fois) la boucle asyncio de fond et la retourne."""
+    global _loop, _loop_thread
+    with _loop_lock:
+        if _loop is None or not _loop_thread.is_alive():
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=_loop.run_forever, name="BinanceAsyncLoop", daemon=True)
+            _loop_thread.start()
+        return _loop
+
+def run(coro, timeout=None):
+    """Exécute une coroutine sur la boucle de fond depuis du code synchrone et retourne son résultat."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result(timeout)
+
+
+async def get_async_client():
+    """Initialise (une seule fois) et retourne l'AsyncClient partagé, ou None en cas d'échec."""
+    global _async_client, _client_init_lock
+    if _client_init_lock is None:
+        _client_init_lock = asyncio.Lock()
+    async with _client_init_lock:
+        if _async_client is None:
+            if not API_KEY or not API_SECRET or API_KEY == "YOUR_API_KEY" or API_SECRET == "YOUR_SECRET_KEY":
+                logging.error("Clés API Binance non configurées ou invalides dans config.py.")
+                return None
+            try:
+                # Connexions conservées entre les cycles : pas de nouvelle poignée de main TLS par requête
+                connector = aiohttp.TCPConnector(limit=POOL_SIZE, keepalive_timeout=60)
+                if API_URL:
+                    # Exchange local : changer l'URL avant le premier appel (create() pinge l'API réelle)
+                    _async_client = AsyncClient(API_KEY, API_SECRET, testnet=USE_TESTNET, session_params={'connector': connector})
+                    _async_client.API_URL = _async_client.API_TESTNET_URL = API_URL.rstrip('/')
+                    await _async_client.ping()
+                else:
+                    _async_client = await AsyncClient.create(API_KEY, API_SECRET, testnet=USE_TESTNET,
+                                                             session_params={'connector': connector})
+                logging.info(f"Client Binance asynchrone initialisé ({'TESTNET' if USE_TESTNET else 'API réelle'}).")
+            except (BinanceAPIException, BinanceRequestException) as e:
+                logging.error(f"Erreur API Binance lors de l'initialisation du client asynchrone : {e}")
+                _async_client = None
+            except Exception as e:
+                logging.error(f"Erreur inattendue lors de l'initialisation du client asynchrone : {e}")
+                _async_client = None
+        return _async_client
+
+async def close_async_client():
+    """Ferme la session HTTP du client asynchrone."""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close_connection()
+        _async_client = None
+
+
+async def _request(client, endpoint, call, **params):
+    """Appel REST asynchrone soumis au limiteur de débit partagé avec binance_client_wrapper, chronométré."""
+    limiter = binance_client_wrapper.rate_limiter
+    await limiter.acquire_async(endpoint)
+    client.timestamp_offset = int(round(binance_client_wrapper.server_clock.offset_ms)) # Requêtes signées à l'heure serveur
+    start = time.perf_counter()
+    try:
+        result = await call(**params)
+    except Exception as e:
+        metrics.API_ERRORS.inc(endpoint=endpoint, code=binance_client_wrapper.error_code(e))
+        if isinstance(e, BinanceAPIException): limiter.record_error(e)
+        raise
+    finally:
+        metrics.API_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint, client='async')
+    limiter.record_headers(getattr(getattr(client, 'response', None), 'headers', None))
+    return result
+
+
+async def get_klines(symbol, interval, limit=100, retries=3, delay=5, start_time=None, end_time=None):
+    """
+    Récupère les klines d'un symbole (même interface que binance_client_wrapper.get_klines).
+    Les tentatives suivantes attendent delay, 2*delay... sans bloquer les autres requêtes.
+    """
+    client = await get_async_client()
+    if not client:
+        logging.error("Client Binance asynchrone non initialisé pour get_klines.")
+        return None
+
+    params = {'symbol': symbol, 'interval': interval, 'limit': limit}
+    if start_time is not None: params['startTime'] = int(start_time)
+    if end_time is not None: params['endTime'] = int(end_time)
+    for attempt in range(retries):
+        try:
+            klines = await _request(client, 'klines', client.get_klines, **params)
+            if klines:
+                logging.debug(f"Klines récupérées pour {symbol} ({interval}), limit={limit}.")
+                return klines
+            logging.warning(f"Aucune kline retournée pour {symbol} ({interval}). Tentative {attempt + 1}/{retries}")
+        except (BinanceAPIException, BinanceRequestException) as e:
+            logging.error(f"Erreur API Binance lors de la récupération des klines pour {symbol} ({interval}). Tentative {attempt + 1}/{retries}. Erreur : {e}")
+        except Exception as e:
+            logging.exception(f"Erreur inattendue lors de la récupération des klines pour {symbol} ({interval}). Tentative {attempt + 1}/{retries}.")
+        if attempt < retries - 1:
+            await asyncio.sleep(delay * 2 ** attempt) # Backoff non bloquant
+    logging.error(f"Échec final de récupération des klines pour {symbol} après {retries} tentatives.")
+    return None
+
+async def get_account_snapshot(max_age=None):
+    """
+    Retourne l'instantané des soldes (cache partagé avec binance_client_wrapper),
+    rafraîchi via get_account() s'il est périmé.
+
+    Returns:
+        AccountSnapshot: L'instantané, ou None en cas d'erreur.
+    """
+    snapshot = binance_client_wrapper.get_cached_account_snapshot(max_age)
+    if snapshot is not None:
+        return snapshot
+    client = await get_async_client()
+    if not client:
+        logging.error("Client Binance asynchrone non initialisé pour get_account_snapshot.")
+        return None
+    try:
+        account_info = await _request(client, 'account', client.get_account)
+        snapshot = binance_client_wrapper.store_account_snapshot(account_info.get('balances', []))
+        logging.debug(f"Instantané du compte rafraîchi ({len(snapshot.balances)} assets).")
+        return snapshot
+    except (BinanceAPIException, BinanceRequestException) as e:
+        logging.error(f"Erreur API Binance lors de la récupération du compte : {e}")
+        return None
+    except Exception as e:
+        logging.exception("Erreur inattendue lors de la récupération du compte.")
+        return None
+
+async def get_account_balance(asset='USDT'):
+    """Solde disponible d'un asset (via l'instantané du compte), None en cas d'erreur."""
+    snapshot = await get_account_snapshot()
+    return None if snapshot is None else snapshot.free(asset)
+
+async def get_symbol_ticker(symbol):
+    """Ticker (prix actuel) d'un symbole : {'symbol': '...', 'price': '...'}, None en cas d'erreur."""
+    client = await get_async_client()
+    if not client:
+        logging.error("Client Binance asynchrone non initialisé pour get_symbol_ticker.")
+        return None
+    try:
+        return await _request(client, 'ticker', client.get_symbol_ticker, symbol=symbol)
+    except (BinanceAPIException, BinanceRequestException) as e:
+        logging.error(f"Erreur API/Request Binance lors de la récupération du ticker pour {symbol}: {e}")
+        return None
+    except Exception as e:
+        logging.exception(f"Erreur inattendue lors de la récupération du ticker pour {symbol}")
+        return None
+
+async def get_ticker_prices(symbols=None):
+    """Prix de plusieurs symboles en un seul appel : {symbole: prix}, None en cas d'erreur."""
+    client = await get_async_client()
+    if not client:
+        logging.error("Client Binance asynchrone non initialisé pour get_ticker_prices.")
+        return None
+    try:
+        if symbols:
+            tickers = await _request(client, 'tickers', client.get_symbol_ticker, symbols=json.dumps(list(symbols), separators=(',', ':')))
+        else:
+            tickers = await _request(client, 'tickers', client.get_all_tickers)
+        if isinstance(tickers, dict): tickers = [tickers]
+        return {t['symbol']: float(t['price']) for t in tickers}
+    except (BinanceAPIException, BinanceRequestException) as e:
+        logging.error(f"Erreur API/Request Binance lors de la récupération des tickers : {e}")
+        return None
+    except Exception as e:
+        logging.exception("Erreur inattendue lors de la récupération des tickers.")
+        return None
+
+async def place_order(symbol, side, quantity, order_type='MARKET', price=None, time_in_force='GTC'):
+    """Place un ordre MARKET ou LIMIT GTC (même interface que binance_client_wrapper.place_order)."""
+    client = await get_async_client()
+    if not client:
+        logging.error("Client Binance asynchrone non initialisé pour place_order.")
+        return None
+    params = {'symbol': symbol, 'side': side, 'type': order_type, 'quantity': quantity}
+    if order_type == 'LIMIT':
+        if price is None:
+            logging.error("Le prix est requis pour un ordre LIMIT.")
+            return None
+        params['price'] = price
+        params['timeInForce'] = time_in_force
+    elif order_type != 'MARKET':
+        logging.error(f"Type d'ordre '{order_type}' non supporté par cette fonction simplifiée.")
+        return None
+    try:
+        logging.info(f"Tentative de placement d'un ordre {order_type} {side} de {quantity} {symbol}...")
+        order = await _request(client, 'order', client.create_order, **params)
+        binance_client_wrapper.invalidate_account_snapshot()
+        logging.info(f"Ordre {order_type} {side} placé avec succès pour {quantity} {symbol}. OrderId: {order.get('orderId')}")
+        return order
+    except (BinanceAPIException, BinanceRequestException) as e:
+        logging.error(f"Erreur API Binance lors du placement de l'ordre {order_type} {side} pour {symbol}: Code={getattr(e, 'code', 'N/A')}, Message={e}")
+        return None
+    except Exception as e:
+        logging.exception(f"Erreur inattendue lors du placement de l'ordre {order_type} {side} pour {symbol}.")
+        return None
+
+
+async def _no_result():
+    return None
+
+async def fetch_cycle_data(price_symbols, buffers, account_max_age=None, fetch_account=True):
+    """
+    Phase de récupération d'un cycle du bot en un seul aller-retour : prix, soldes et
+    rattrapage des buffers de klines sont demandés en parallèle.
+
+    Args:
+        price_symbols (list): Symboles dont le prix est à récupérer (aucun appel si vide).
+        buffers (list): KlineRingBuffer à synchroniser.
+        account_max_age (float, optional): Âge maximal de l'instantané des soldes.
+        fetch_account (bool): False pour ne pas lire les soldes (paper trading : soldes virtuels).
+
+    Returns:
+        tuple: (prix {symbole: float} ou None, AccountSnapshot ou None,
+                liste des nouvelles klines de chaque buffer, None en cas d'échec).
+    """
+    results = await asyncio.gather(
+        get_ticker_prices(price_symbols) if price_symbols else _no_result(),
+        get_account_snapshot(account_max_age) if fetch_account else _no_result(),
+        *(buffer.sync_async(get_klines) for buffer in buffers))
+    return results[0], results[1], list(results[2:])
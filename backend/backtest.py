@@ -0,0 +1,329 @@
+import argparse
+import glob
+import logging
+import time
+import numpy as np
+import pandas as pd
+from binance.helpers import interval_to_milliseconds
+import kline_resampler
+import kline_store
+import strategy
+
+# Backtest de la stratégie EMA crossover / RSI sur des klines historiques locales
+# (fichiers CSV au format de data.binance.vision ou de client.get_klines(),
+# ou stockage local kline_store).
+# Les indicateurs et signaux viennent de strategy.calculate_indicators et
+# strategy.generate_signals ; l'exécution (entrée à la clôture du signal,
+# stop-loss de check_entry_conditions, sortie sur signal inverse) est simulée
+# avec des opérations NumPy sur les bougies : la seule boucle Python porte sur
+# les trades, jamais sur les bougies.
+
+KLINE_COLUMNS = ['Open time', 'Open', 'High', 'Low', 'Close', 'Volume', 'Close time']
+# Colonne -> champ des tableaux de kline_resampler
+RESAMPLE_FIELDS = dict(zip(KLINE_COLUMNS, ('open_time', 'open', 'high', 'low', 'close', 'volume', 'close_time')))
+
+# Raisons de sortie d'un trade
+EXIT_STOP_LOSS = 0
+EXIT_SIGNAL = 1
+EXIT_END = 2
+EXIT_REASONS = {EXIT_STOP_LOSS: 'stop_loss', EXIT_SIGNAL: 'signal', EXIT_END: 'end'}
+
+
+def load_klines(paths):
+    """
+    Charge des klines historiques depuis un ou plusieurs fichiers CSV (ou .zip contenant un CSV).
+
+    Args:
+        paths (str | list): Chemin(s) ou motif(s) glob, ex: 'data/BTCUSDT-5m-2023-*.zip'.
+
+    Returns:
+        pd.DataFrame: Colonnes KLINE_COLUMNS (temps en ms), triées par 'Open time' sans doublons.
+                      None si aucun fichier n'a pu être lu.
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    files = sorted(f for pattern in paths for f in (glob.glob(pattern) or [pattern]))
+    frames = []
+    for path in files:
+        try:
+            frame = pd.read_csv(path, header=None, usecols=range(7), names=KLINE_COLUMNS)
+        except (OSError, ValueError) as e:
+            logging.error(f"Impossible de lire le fichier de klines {path} : {e}")
+            continue
+        # Certains exports ont une ligne d'en-tête : elle devient NaN après conversion
+        frame = frame.apply(pd.to_numeric, errors='coerce').dropna()
+        frames.append(frame)
+    if not frames:
+        logging.error(f"Aucune kline chargée depuis {paths}.")
+        return None
+
+    df = pd.concat(frames, ignore_index=True)
+    for column in ('Open time', 'Close time'):
+        times = df[column].astype(np.int64)
+        # Les fichiers récents de data.binance.vision sont horodatés en microsecondes
+        df[column] = np.where(times > 10**14, times // 1000, times)
+    df = df.sort_values('Open time').drop_duplicates('Open time').reset_index(drop=True)
+    logging.info(f"{len(df)} klines chargées depuis {len(files)} fichier(s).")
+    return df
+
+
+def add_data_arguments(parser):
+    """Options de ligne de commande communes (backtest, optimiseur) pour choisir les klines."""
+    parser.add_argument('files', nargs='*', help="Fichiers CSV/ZIP de klines (motifs glob acceptés)")
+    parser.add_argument('--store', metavar='SYMBOLE:INTERVALLE', help="Lire les klines depuis le stockage local, ex: BTCUSDT:1m")
+    parser.add_argument('--start', help="Début de la plage lue dans le stockage (YYYY-MM-DD, UTC)")
+    parser.add_argument('--end', help="Fin de la plage lue dans le stockage (YYYY-MM-DD, UTC)")
+    parser.add_argument('--backfill', action='store_true', help="Télécharger d'abord les klines absentes du stockage sur la plage")
+    parser.add_argument('--resample', metavar='INTERVALLE', help="Agréger les klines chargées (ex: 1m) en bougies de cet intervalle (3m à 1d)")
+
+def resample_klines(df, interval):
+    """
+    Agrège des klines (DataFrame de load_klines) en bougies `interval` alignées sur l'epoch, comme
+    le bot à partir du flux 1m. Les bougies incomplètes aux bords de la plage sont écartées.
+
+    Returns:
+        pd.DataFrame: Colonnes KLINE_COLUMNS, ou None si l'intervalle n'est pas agrégeable.
+    """
+    if not kline_resampler.can_resample(interval):
+        logging.error(f"Intervalle non agrégeable : {interval} (3m à 1d, alignés sur l'epoch).")
+        return None
+    interval_ms = interval_to_milliseconds(interval)
+    arrays = {field: df[column].to_numpy() for column, field in RESAMPLE_FIELDS.items()}
+    first = int(arrays['open_time'][0]) if len(df) else 0
+    start = int(np.searchsorted(arrays['open_time'], -(-first // interval_ms) * interval_ms)) # Première bougie complète
+    columns, _ = kline_resampler.resample_arrays({field: values[start:] for field, values in arrays.items()}, interval_ms)
+    resampled = pd.DataFrame({column: columns[field] for column, field in RESAMPLE_FIELDS.items()})
+    logging.info(f"{len(df)} klines agrégées en {len(resampled)} bougies {interval}.")
+    return resampled
+
+def load_data(args):
+    """Klines désignées par les options de add_data_arguments (DataFrame de load_klines, ou None)."""
+    if args.store:
+        symbol, _, interval = args.store.partition(':')
+        df = kline_store.load_dataframe(symbol, interval or '1m', args.start, args.end, backfill=args.backfill)
+    elif not args.files:
+        logging.error("Aucune source de klines : indiquer des fichiers ou --store SYMBOLE:INTERVALLE.")
+        return None
+    else:
+        df = load_klines(args.files)
+    if df is not None and getattr(args, 'resample', None):
+        df = resample_klines(df, args.resample)
+    return df
+
+
+def _next_true_after(mask):
+    """Pour chaque index i, index du premier True strictement après i (len(mask) si aucun)."""
+    n = len(mask)
+    positions = np.where(mask, np.arange(n), n)
+    first_from = np.minimum.accumulate(positions[::-1])[::-1] # Premier True à partir de i
+    return np.append(first_from[1:], n)
+
+
+def simulate_trades(open_, high, low, close, signal, stop_loss_percent=None,
+                    fee_rate=0.001, slippage=0.0005, allow_short=True):
+    """
+    Simule les trades d'une série de signaux, comme run_bot + check_entry_conditions :
+    entrée au prix de clôture de la bougie du signal (une seule position à la fois),
+    stop-loss à stop_loss_percent du prix d'entrée, sortie à la clôture d'un signal inverse
+    (qui peut ouvrir immédiatement la position opposée) ou à la fin des données.
+
+    Args:
+        open_, high, low, close (np.ndarray): Prix des bougies.
+        signal (np.ndarray): 1 (achat), -1 (vente), 0 (neutre).
+        stop_loss_percent (float, optional): Distance du stop (défaut strategy.STOP_LOSS_PERCENT).
+        fee_rate (float): Frais par côté (0.001 = 0.1%).
+        slippage (float): Glissement défavorable par exécution (fraction du prix).
+        allow_short (bool): Si False, les signaux -1 ne servent qu'à sortir.
+
+    Returns:
+        dict: Tableaux NumPy par trade : entry_index, exit_index, side, entry_price,
+              exit_price, exit_reason, return (rendement net de frais, en fraction).
+    """
+    if stop_loss_percent is None:
+        stop_loss_percent = strategy.STOP_LOSS_PERCENT
+    open_, high, low, close = (np.asarray(a, dtype=np.float64) for a in (open_, high, low, close))
+    signal = np.asarray(signal)
+    n = len(close)
+
+    next_long = _next_true_after(signal == 1)
+    next_short = _next_true_after(signal == -1)
+    candidates = np.flatnonzero(signal == 1 if not allow_short else signal != 0)
+
+    entries, exits, sides, reasons, exit_prices = [], [], [], [], []
+    next_free = 0
+    while True:
+        k = np.searchsorted(candidates, next_free, side='left') # Prochain signal pris (position à plat)
+        if k >= len(candidates):
+            break
+        i = int(candidates[k])
+        side = int(signal[i])
+        signal_exit = int(next_short[i] if side == 1 else next_long[i])
+        last = min(signal_exit, n - 1)
+
+        # Premier franchissement du stop entre i+1 et la sortie sur signal (incluse)
+        stop_level = close[i] * (1 - stop_loss_percent * side)
+        if side == 1:
+            hits = low[i + 1:last + 1] <= stop_level
+        else:
+            hits = high[i + 1:last + 1] >= stop_level
+        hit = int(np.argmax(hits)) if hits.size else 0
+        if hits.size and hits[hit]:
+            e = i + 1 + hit
+            # Si la bougie ouvre déjà au-delà du stop, exécution à l'ouverture (gap)
+            fill = min(open_[e], stop_level) if side == 1 else max(open_[e], stop_level)
+            reason = EXIT_STOP_LOSS
+        elif signal_exit < n:
+            e, fill, reason = signal_exit, close[signal_exit], EXIT_SIGNAL
+        else:
+            e, fill, reason = n - 1, close[n - 1], EXIT_END
+
+        entries.append(i); exits.append(e); sides.append(side); reasons.append(reason); exit_prices.append(fill)
+        # Un nouveau signal peut être pris dès la bougie de sortie (stop-and-reverse sur signal inverse)
+        if reason == EXIT_END:
+            break
+        next_free = e
+
+    entry_index = np.asarray(entries, dtype=np.int64)
+    exit_index = np.asarray(exits, dtype=np.int64)
+    side = np.asarray(sides, dtype=np.int8)
+    entry_price = close[entry_index] * (1 + slippage * side)
+    exit_price = np.asarray(exit_prices, dtype=np.float64) * (1 - slippage * side)
+    gross = side * (exit_price - entry_price) / entry_price if len(entries) else np.zeros(0)
+    net = gross - fee_rate * (1 + exit_price / entry_price) if len(entries) else np.zeros(0)
+    return {
+        'entry_index': entry_index,
+        'exit_index': exit_index,
+        'side': side,
+        'entry_price': entry_price,
+        'exit_price': exit_price,
+        'exit_reason': np.asarray(reasons, dtype=np.int8),
+        'return': net,
+    }
+
+
+def position_fraction(risk_per_trade, stop_loss_percent):
+    """
+    Fraction du capital engagée par trade, comme calculate_position_size
+    (risque / distance du stop), plafonnée à 100% (spot, sans levier).
+    """
+    return min(risk_per_trade / stop_loss_percent, 1.0)
+
+
+def compute_report(trades, n_bars, initial_capital=1000.0, risk_per_trade=0.01, stop_loss_percent=None):
+    """
+    Calcule les statistiques d'un backtest à partir des trades simulés.
+
+    Returns:
+        dict: PnL, rendement, drawdown maximal, statistiques des trades et courbe d'equity.
+    """
+    if stop_loss_percent is None:
+        stop_loss_percent = strategy.STOP_LOSS_PERCENT
+    returns = trades['return']
+    fraction = position_fraction(risk_per_trade, stop_loss_percent)
+    equity = initial_capital * np.cumprod(1 + fraction * returns)
+    equity_with_start = np.concatenate(([initial_capital], equity))
+    peaks = np.maximum.accumulate(equity_with_start)
+    drawdowns = (peaks - equity_with_start) / peaks
+
+    wins = returns[returns > 0]
+    losses = returns[returns <= 0]
+    held = trades['exit_index'] - trades['entry_index']
+    final_equity = float(equity[-1]) if len(equity) else initial_capital
+    return {
+        'bars': int(n_bars),
+        'trades': int(len(returns)),
+        'position_fraction': fraction,
+        'final_equity': final_equity,
+        'pnl': final_equity - initial_capital,
+        'total_return': final_equity / initial_capital - 1,
+        'max_drawdown': float(drawdowns.max()) if len(drawdowns) else 0.0,
+        'win_rate': float(len(wins) / len(returns)) if len(returns) else 0.0,
+        'avg_trade_return': float(returns.mean()) if len(returns) else 0.0,
+        'profit_factor': float(wins.sum() / -losses.sum()) if losses.sum() < 0 else float('inf'),
+        'stop_loss_exits': int((trades['exit_reason'] == EXIT_STOP_LOSS).sum()),
+        'signal_exits': int((trades['exit_reason'] == EXIT_SIGNAL).sum()),
+        'avg_bars_held': float(held.mean()) if len(held) else 0.0,
+        'exposure': float(held.sum() / n_bars) if n_bars else 0.0,
+        'equity_curve': equity,
+    }
+
+
+def run_backtest(klines_df, fee_rate=0.001, slippage=0.0005, risk_per_trade=0.01,
+                 initial_capital=1000.0, allow_short=True, params=None):
+    """
+    Backtest complet : indicateurs et signaux de la stratégie, puis simulation vectorisée des exécutions.
+
+    Args:
+        klines_df (pd.DataFrame): Klines (colonnes KLINE_COLUMNS), ex: retour de load_klines().
+        params (StrategyParams, optional): Paramètres de la stratégie (défaut strategy.DEFAULT_PARAMS).
+
+    Returns:
+        tuple: (rapport dict, DataFrame des trades), ou (None, None) en cas d'erreur.
+    """
+    started = time.perf_counter()
+    params = params if params is not None else strategy.DEFAULT_PARAMS
+    df = strategy.calculate_indicators(klines_df.copy(), params)
+    df = strategy.generate_signals(df, params) if df is not None else None
+    if df is None or df.empty:
+        logging.error("Backtest impossible : échec du calcul des indicateurs ou des signaux.")
+        return None, None
+
+    trades = simulate_trades(df['Open'].to_numpy(), df['High'].to_numpy(), df['Low'].to_numpy(),
+                             df['Close'].to_numpy(), df['signal'].to_numpy(), params.stop_loss_percent,
+                             fee_rate=fee_rate, slippage=slippage, allow_short=allow_short)
+    report = compute_report(trades, len(df), initial_capital, risk_per_trade, params.stop_loss_percent)
+    report['buy_and_hold_return'] = float(df['Close'].iloc[-1] / df['Close'].iloc[0] - 1)
+    report['elapsed_s'] = time.perf_counter() - started
+
+    open_times = df['Open time'].to_numpy()
+    trades_df = pd.DataFrame({
+        'entry_time': pd.to_datetime(open_times[trades['entry_index']], unit='ms'),
+        'exit_time': pd.to_datetime(open_times[trades['exit_index']], unit='ms'),
+        'side': np.where(trades['side'] == 1, 'BUY', 'SELL'),
+        'entry_price': trades['entry_price'],
+        'exit_price': trades['exit_price'],
+        'exit_reason': [EXIT_REASONS[r] for r in trades['exit_reason']],
+        'return': trades['return'],
+    })
+    return report, trades_df
+
+
+def format_report(report):
+    """Met en forme le rapport pour l'affichage console."""
+    return "\n".join([
+        f"Bougies                 : {report['bars']}",
+        f"Trades                  : {report['trades']} (stop-loss: {report['stop_loss_exits']}, signal inverse: {report['signal_exits']})",
+        f"Fraction par trade      : {report['position_fraction']:.2%}",
+        f"Equity finale           : {report['final_equity']:.2f} (PnL {report['pnl']:+.2f})",
+        f"Rendement total         : {report['total_return']:+.2%} (buy & hold {report.get('buy_and_hold_return', 0):+.2%})",
+        f"Drawdown maximal        : {report['max_drawdown']:.2%}",
+        f"Taux de réussite        : {report['win_rate']:.2%}",
+        f"Rendement moyen / trade : {report['avg_trade_return']:+.4%}",
+        f"Profit factor           : {report['profit_factor']:.2f}",
+        f"Durée moyenne (bougies) : {report['avg_bars_held']:.1f} (exposition {report['exposure']:.2%})",
+    ])
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Backtest de la stratégie EMA crossover / RSI sur klines locales.")
+    add_data_arguments(parser)
+    parser.add_argument('--fee', type=float, default=0.001, help="Frais par côté (défaut 0.001)")
+    parser.add_argument('--slippage', type=float, default=0.0005, help="Glissement par exécution (défaut 0.0005)")
+    parser.add_argument('--risk', type=float, default=0.01, help="RISK_PER_TRADE (défaut 0.01)")
+    parser.add_argument('--capital', type=float, default=1000.0, help="Capital initial (défaut 1000)")
+    parser.add_argument('--long-only', action='store_true', help="Ignorer les entrées short (signaux -1)")
+    parser.add_argument('--trades-csv', help="Exporter la liste des trades dans ce fichier CSV")
+    args = parser.parse_args()
+
+    klines_df = load_data(args)
+    if klines_df is not None:
+        report, trades_df = run_backtest(klines_df, fee_rate=args.fee, slippage=args.slippage,
+                                         risk_per_trade=args.risk, initial_capital=args.capital,
+                                         allow_short=not args.long_only)
+        if report is not None:
+            print(format_report(report))
+            print(f"Durée du backtest       : {report['elapsed_s']:.2f}s")
+            if args.trades_csv:
+                trades_df.to_csv(args.trades_csv, index=False)
+                print(f"Trades exportés dans {args.trades_csv}")
@@ -0,0 +1,335 @@
+import argparse
+import gc
+import json
+import logging
+import platform
+import socket
+import statistics
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import strategy
+import symbol_rules
+
+# Benchmarks des chemins critiques : calcul batch des indicateurs/signaux,
+# moteur incrémental, calcul de taille de position, agrégation 1m -> timeframe
+# supérieur, Monte Carlo des séquences de trades et cycle complet du bot
+# (contre mock_exchange), pour plusieurs tailles de fenêtre, nombres de
+# symboles et configurations d'indicateurs.
+# Chaque cas mesure le temps (médiane et min sur plusieurs répétitions), les
+# allocations et le pic mémoire (tracemalloc, sur une exécution séparée).
+# Les résultats peuvent être enregistrés comme référence (JSON) ; une exécution
+# suivante signale les régressions au-delà d'un seuil (code de sortie 1).
+#
+#   python benchmarks.py --save-baseline            # enregistre benchmarks_baseline.json
+#   python benchmarks.py --threshold 1.3            # compare à la référence
+#   python benchmarks.py --filter indicators --quick
+
+DEFAULT_BASELINE = 'benchmarks_baseline.json'
+
+# Configurations d'indicateurs testées : (nom, surcharges des paramètres de strategy)
+INDICATOR_CONFIGS = [
+    ('default', {}),
+    ('no_filter', {'USE_EMA_FILTER': False}),
+    ('volume', {'USE_VOLUME_CONFIRMATION': True}),
+    ('long_periods', {'EMA_SHORT_PERIOD': 50, 'EMA_LONG_PERIOD': 200, 'EMA_FILTER_PERIOD': 400, 'RSI_PERIOD': 28}),
+]
+
+SYMBOL_INFO = {
+    'symbol': 'BTCUSDT', 'baseAsset': 'BTC', 'quoteAsset': 'USDT',
+    'filters': [
+        {'filterType': 'PRICE_FILTER', 'minPrice': '0.01', 'maxPrice': '1000000', 'tickSize': '0.01'},
+        {'filterType': 'LOT_SIZE', 'minQty': '0.00001', 'maxQty': '9000', 'stepSize': '0.00001'},
+        {'filterType': 'NOTIONAL', 'minNotional': '5', 'applyMinToMarket': True},
+    ],
+}
+
+
+def rest_klines(n, seed=1, start_time=1577836800000):
+    """Génère n klines 1m synthétiques au format de client.get_klines() (prix en str)."""
+    rng = np.random.default_rng(seed)
+    close = 30000 * np.exp(np.cumsum(rng.normal(0, 0.0008, n)))
+    open_ = np.concatenate(([30000.0], close[:-1]))
+    volume = rng.uniform(1, 10, n)
+    return [[start_time + i * 60000, f"{open_[i]:.2f}", f"{max(open_[i], close[i]):.2f}", f"{min(open_[i], close[i]):.2f}",
+             f"{close[i]:.2f}", f"{volume[i]:.4f}", start_time + i * 60000 + 59999, '0', 0, '0', '0', '0']
+            for i in range(n)]
+
+def strategy_params(overrides):
+    """Paramètres par défaut de la stratégie avec des surcharges (clés au format config.py)."""
+    return strategy.StrategyParams.from_config(overrides)
+
+
+def measure(func, repeat=10, warmup=1):
+    """
+    Mesure une fonction sans argument.
+
+    Returns:
+        dict: median_s, min_s, allocs (blocs alloués nets), alloc_kb, peak_kb.
+    """
+    for _ in range(warmup):
+        func()
+    times = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable() # Éviter qu'une collecte tombe au milieu d'une mesure
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+    finally:
+        if gc_was_enabled: gc.enable()
+
+    # Mémoire sur une exécution séparée (tracemalloc ralentit fortement le code mesuré)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    base_current, _ = tracemalloc.get_traced_memory()
+    func()
+    current, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocs = sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0)
+    return {'median_s': statistics.median(times), 'min_s': min(times), 'allocs': allocs,
+            'alloc_kb': (current - base_current) / 1024, 'peak_kb': (peak - base_current) / 1024}
+
+
+# --- Cas de benchmark : chaque fabrique retourne {nom: (fonction, répétitions)} ---
+
+def bench_indicators(quick=False):
+    """Chemin batch (calculate_indicators_and_signals) et moteur incrémental, par taille de fenêtre et configuration."""
+    cases = {}
+    windows = (100, 1000) if quick else (100, 500, 1000, 5000)
+    for window in windows:
+        klines = rest_klines(window + 1)
+        for config_name, overrides in INDICATOR_CONFIGS:
+            params = strategy_params(overrides)
+            lookback = max(params.indicator_params[:4])
+            if window <= lookback:
+                continue # Historique insuffisant : rien d'utile à mesurer
+            def batch(klines=klines, params=params):
+                strategy.calculate_indicators_and_signals(klines, params)
+            def incremental(klines=klines, params=params):
+                strategy.create_indicator_engine(warmup_klines=klines, params=params)
+            repeat = 5 if window >= 5000 else 20
+            cases[f"indicators_batch[window={window},config={config_name}]"] = (batch, repeat)
+            cases[f"indicators_warmup[window={window},config={config_name}]"] = (incremental, repeat)
+    # Mise à jour incrémentale d'une bougie (cas du cycle normal)
+    klines = rest_klines(1001)
+    for config_name, overrides in INDICATOR_CONFIGS:
+        engine = strategy.create_indicator_engine(warmup_klines=klines[:1000], params=strategy_params(overrides))
+        last = klines[-1]
+        def update(engine=engine, last=last):
+            for _ in range(1000):
+                engine.update_kline(last)
+        cases[f"indicators_update_x1000[config={config_name}]"] = (update, 20)
+    return cases
+
+def bench_position_size(quick=False):
+    """calculate_position_size avec des règles déjà compilées (cas du bot) et à compiler (dict brut)."""
+    symbol_rules.compile_symbol_rules(SYMBOL_INFO)
+    def sizing():
+        for _ in range(1000):
+            strategy.calculate_position_size(1000.0, 0.01, 30123.45, 30033.08, SYMBOL_INFO)
+    def sizing_uncached():
+        for _ in range(100):
+            strategy.calculate_position_size(1000.0, 0.01, 30123.45, 30033.08, symbol_rules.SymbolRules(SYMBOL_INFO))
+    return {'position_size_x1000': (sizing, 20), 'position_size_compile_x100': (sizing_uncached, 20)}
+
+def bench_resample(quick=False):
+    """
+    Agrégation 1m -> timeframe supérieur : initialisation depuis un buffer 1m plein
+    (changement de timeframe) et mise à jour à chaque bougie 1m clôturée.
+    """
+    import kline_buffer
+    import kline_resampler
+    import mock_exchange
+
+    base_size = kline_resampler.BASE_BUFFER_SIZE
+    data = mock_exchange.synthetic_klines(base_size + 1440)
+    data['close_time'] = data['open_time'] + 59_999
+    fields = list(kline_buffer.KLINE_INDEX)
+    klines = [list(row) for row in zip(*(data[field].tolist() for field in fields))]
+    now_ms = int(data['close_time'][-1]) + 1
+    cases = {}
+    for interval in (('1h',) if quick else ('5m', '1h', '1d')):
+        def seed(interval=interval):
+            base = kline_buffer.KlineRingBuffer('SYM', '1m', base_size)
+            with base.lock:
+                base._fill({field: data[field][:base_size] for field in fields})
+            kline_resampler.ResampledKlineBuffer(base, interval, 50 if interval != '1d' else 3).load_from_store(now_ms=now_ms)
+        def update_1440(interval=interval):
+            base = kline_buffer.KlineRingBuffer('SYM', '1m', base_size)
+            with base.lock:
+                base._fill({field: data[field][:base_size] for field in fields})
+            buffer = kline_resampler.ResampledKlineBuffer(base, interval, 3)
+            buffer.load_from_store(now_ms=now_ms)
+            for kline in klines[base_size:]:
+                buffer.ingest([kline], now_ms=now_ms)
+        cases[f"resample_seed[{interval}, base={base_size}]"] = (seed, 20)
+        cases[f"resample_update_x1440[{interval}]"] = (update_1440, 5)
+    return cases
+
+def bench_monte_carlo(quick=False):
+    """Monte Carlo des séquences de trades : 3 risques candidats, bootstrap et permutation."""
+    import monte_carlo
+
+    returns = np.random.default_rng(3).normal(0.0005, 0.01, 500)
+    n_paths = 5000 if quick else 20000
+    cases = {}
+    for method in monte_carlo.METHODS:
+        def run(method=method):
+            monte_carlo.simulate(returns, [0.0005, 0.001, 0.002], stop_loss_percent=0.003, n_paths=n_paths, method=method, seed=1)
+        cases[f"monte_carlo[{method}, paths={n_paths}, trades=500]"] = (run, 5)
+    return cases
+
+def _free_port():
+    """Port TCP libre en local (l'exchange simulé ne doit pas entrer en collision avec un autre run)."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def bench_bot_cycle(quick=False):
+    """
+    Cycle complet du bot (récupération prix/soldes/klines, indicateurs, signaux, ordres) pour N symboles,
+    contre mock_exchange en local avec une horloge avancée d'une bougie par cycle.
+    """
+    import async_client_wrapper
+    import binance_client_wrapper
+    import bot
+    import kline_buffer
+    import kline_resampler
+    import mock_exchange
+
+    logging.getLogger().setLevel(logging.ERROR) # Les logs du cycle fausseraient la mesure
+    # Limiteur sans plafond : on mesure le code du cycle, pas l'attente imposée par le quota Binance
+    saved_limiter = binance_client_wrapper.rate_limiter
+    binance_client_wrapper.rate_limiter = binance_client_wrapper.RateLimiter(weight_limit=10 ** 9, order_limit_10s=10 ** 9)
+    symbol_counts = (1, 10) if quick else (1, 10, 50)
+    # Données alignées sur l'heure réelle : la dernière bougie simulée se termine à peu près maintenant
+    cycles = 40
+    now_minute = int(time.time() // 60) * 60000
+    bars = 1000 + cycles + 5
+    start_time = now_minute - bars * 60000
+    data = {f"SYM{i}USDT": mock_exchange.synthetic_klines(bars, start_price=100.0 + i, seed=i, start_time=start_time)
+            for i in range(max(symbol_counts))}
+    balances = {'USDT': 1e9, **{symbol[:-4]: 1e6 for symbol in data}} # Ordres toujours acceptés (sans log d'erreur)
+    exchange = mock_exchange.MockExchange(data, speed=0, warmup_bars=1000, balances=balances, port=_free_port()).start()
+    # Configuration remplacée le temps du benchmark, restaurée par cleanup()
+    saved = (binance_client_wrapper.API_URL, async_client_wrapper.API_URL, binance_client_wrapper._client,
+             kline_buffer.USE_KLINE_STORE)
+    binance_client_wrapper.API_URL = async_client_wrapper.API_URL = exchange.api_url
+    binance_client_wrapper._client = None
+    async_client_wrapper.run(async_client_wrapper.close_async_client())
+    sync_pool = bot.ThreadPoolExecutor(max_workers=bot.SYMBOL_SYNC_WORKERS)
+
+    kline_buffer.USE_KLINE_STORE = False # Mesurer le cycle, pas les écritures disque (et ne pas polluer le stockage)
+    kline_resampler.clear_buffers()
+    cases = {}
+    for count in symbol_counts:
+        states = {}
+        for symbol in list(data)[:count]:
+            state = states[symbol] = bot.SymbolState(symbol)
+            state.rules = symbol_rules.compile_symbol_rules(exchange.symbol_info(symbol))
+            state.base_asset, state.quote_asset = state.rules.base_asset, state.rules.quote_asset
+        def cycle(states=states, cycle_strategy=strategy.Strategy()):
+            bot.bot_state['symbols'] = states
+            exchange.advance(60000) # Une nouvelle bougie clôturée par symbole
+            prepared = [bot.prepare_symbol_buffer(state, '1m', 60, False) for state in states.values()]
+            prices, account, synced = bot.fetch_cycle_data(list(states), [p[0] for p in prepared], sync_pool)
+            for state, (candle_buffer, _, _), new_klines in zip(states.values(), prepared, synced):
+                state.current_price = prices.get(state.symbol, state.current_price)
+                if account is not None: state.update_balances(account)
+                bot.process_symbol(state, candle_buffer, new_klines or [], '1m', 0.01, 0.1, cycle_strategy)
+        cases[f"bot_cycle[symbols={count}]"] = (cycle, 10)
+    def cleanup():
+        sync_pool.shutdown(wait=False)
+        async_client_wrapper.run(async_client_wrapper.close_async_client())
+        exchange.stop()
+        binance_client_wrapper.rate_limiter = saved_limiter
+        (binance_client_wrapper.API_URL, async_client_wrapper.API_URL, binance_client_wrapper._client,
+         kline_buffer.USE_KLINE_STORE) = saved
+    return cases, cleanup
+
+BENCHMARK_GROUPS = {
+    'indicators': bench_indicators,
+    'position_size': bench_position_size,
+    'resample': bench_resample,
+    'monte_carlo': bench_monte_carlo,
+    'bot_cycle': bench_bot_cycle,
+}
+
+
+def run_benchmarks(name_filter=None, quick=False):
+    """Exécute les benchmarks (dont le nom contient name_filter) et retourne {nom: mesures}."""
+    results = {}
+    for group, factory in BENCHMARK_GROUPS.items():
+        if name_filter and name_filter not in group:
+            continue
+        produced = factory(quick)
+        cases, cleanup = produced if isinstance(produced, tuple) else (produced, None)
+        try:
+            for name, (func, repeat) in cases.items():
+                results[name] = measure(func, repeat=max(3, repeat // 4) if quick else repeat)
+                r = results[name]
+                print(f"{name:<62} {r['median_s'] * 1000:10.3f} ms  (min {r['min_s'] * 1000:.3f})  "
+                      f"allocs {r['allocs']:>7}  peak {r['peak_kb']:10.1f} Ko", flush=True)
+        finally:
+            if cleanup is not None:
+                cleanup()
+    return results
+
+def environment():
+    return {'python': platform.python_version(), 'machine': platform.machine(), 'processor': platform.processor(),
+            'numpy': np.__version__, 'pandas': pd.__version__, 'date': time.strftime('%Y-%m-%d %H:%M:%S')}
+
+def compare(results, baseline, threshold=1.25):
+    """
+    Compare les résultats à la référence.
+
+    Returns:
+        list: Régressions [(nom, métrique, référence, actuel, ratio)].
+    """
+    regressions = []
+    for name, current in results.items():
+        reference = baseline.get('results', {}).get(name)
+        if not reference:
+            continue
+        for metric in ('median_s', 'peak_kb'):
+            ref_value, value = reference.get(metric, 0), current[metric]
+            # Ignorer les valeurs trop petites pour être significatives
+            if ref_value > (1e-5 if metric == 'median_s' else 16) and value / ref_value > threshold:
+                regressions.append((name, metric, ref_value, value, value / ref_value))
+    return regressions
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Benchmarks des chemins critiques (stratégie, sizing, cycle du bot).")
+    parser.add_argument('--filter', help="N'exécuter que les groupes dont le nom contient ce texte")
+    parser.add_argument('--quick', action='store_true', help="Moins de tailles et de répétitions")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Fichier JSON de référence")
+    parser.add_argument('--save-baseline', action='store_true', help="Enregistrer les résultats comme référence")
+    parser.add_argument('--threshold', type=float, default=1.25, help="Ratio au-delà duquel une mesure est une régression")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.filter, args.quick)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'environment': environment(), 'results': results}, f, indent=2)
+        print(f"Référence enregistrée dans {args.baseline}")
+    else:
+        try:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        except (OSError, ValueError):
+            print(f"Pas de référence lisible ({args.baseline}) : utiliser --save-baseline pour en créer une.")
+            raise SystemExit(0)
+        regressions = compare(results, baseline, args.threshold)
+        for name, metric, ref_value, value, ratio in regressions:
+            print(f"RÉGRESSION {name} {metric}: {ref_value:.6g} -> {value:.6g} (x{ratio:.2f})")
+        if regressions:
+            raise SystemExit(1)
+        print(f"Aucune régression (seuil x{args.threshold}, référence du {baseline.get('environment', {}).get('date', '?')}).")
@@ -1,8 +1,15 @@
 import logging
 import threading # Import threading for the lock
+import asyncio
+import json
+import queue
+import sys
 from binance.client import Client
 from binance.exceptions import BinanceAPIException, BinanceRequestException
+from binance.helpers import interval_to_milliseconds
+import websockets # Dépendance de python-binance
 import time
+import metrics
 
 # Importer la configuration pour les clés API et le mode testnet
 try:
@@ -10,12 +17,27 @@ try:
     API_KEY = config.BINANCE_API_KEY
     API_SECRET = config.BINANCE_API_SECRET
     USE_TESTNET = getattr(config, 'USE_TESTNET', False) # Par défaut, utiliser l'API réelle
+    STREAM_URL = getattr(config, 'STREAM_URL', None) # Permet de pointer vers un serveur WebSocket local
+    API_URL = getattr(config, 'API_URL', None) # Permet de pointer vers un exchange REST local (mock_exchange.py)
+    ACCOUNT_CACHE_TTL = getattr(config, 'ACCOUNT_CACHE_TTL', 5) # Durée de validité (s) de l'instantané des soldes
+    REQUEST_WEIGHT_LIMIT = getattr(config, 'REQUEST_WEIGHT_LIMIT', 6000) # Poids REST autorisé par minute
+    ORDER_LIMIT_10S = getattr(config, 'ORDER_LIMIT_10S', 100) # Ordres autorisés par 10 secondes
+    SYNC_SERVER_TIME = getattr(config, 'SYNC_SERVER_TIME', True) # Horloge du bot recalée sur celle du serveur Binance
 except ImportError:
     logging.error("Fichier config.py non trouvé ou clés API non définies dans binance_client_wrapper.")
     # Utiliser des placeholders ou lever une erreur plus explicite
     API_KEY = "YOUR_API_KEY" # Changed placeholder
     API_SECRET = "YOUR_SECRET_KEY" # Changed placeholder
     USE_TESTNET = False
+    STREAM_URL = None
+    API_URL = None
+    ACCOUNT_CACHE_TTL = 5
+    REQUEST_WEIGHT_LIMIT = 6000
+    ORDER_LIMIT_10S = 100
+    SYNC_SERVER_TIME = True
+
+if not STREAM_URL:
+    STREAM_URL = "wss://stream.testnet.binance.vision" if USE_TESTNET else "wss://stream.binance.com:9443"
 
 # Variable globale pour le client et lock pour la gestion thread-safe
 _client = None
@@ -33,12 +55,16 @@ def get_client():
                      # Ne pas initialiser le client si les clés sont invalides
                      return None # Retourner None directement
 
+                # ping=False : le test de connexion est fait ci-dessous, après un éventuel changement d'URL
                 if USE_TESTNET:
-                    _client = Client(API_KEY, API_SECRET, testnet=True)
+                    _client = Client(API_KEY, API_SECRET, testnet=True, ping=False)
                     logging.info("Client Binance initialisé en mode TESTNET.")
                 else:
-                    _client = Client(API_KEY, API_SECRET)
+                    _client = Client(API_KEY, API_SECRET, ping=False)
                     logging.info("Client Binance initialisé en mode API réelle.")
+                if API_URL:
+                    _client.API_URL = _client.API_TESTNET_URL = API_URL.rstrip('/')
+                    logging.info(f"API REST redirigée vers {API_URL}.")
 
                 _client.ping() # Teste la connexion
                 logging.info("Connexion à l'API Binance réussie.")
@@ -52,19 +78,243 @@ def get_client():
         # Retourner l'instance (qui peut être None si l'initialisation a échoué)
         return _client
 
-def get_klines(symbol, interval, limit=100, retries=3, delay=5):
+# --- Limiteur de débit (poids des requêtes REST Binance) ---
+
+# Poids de chaque endpoint utilisé (documentation Binance Spot) ; les ordres comptent aussi
+# dans la limite d'ordres (ORDER_LIMIT_10S).
+ENDPOINT_WEIGHTS = {
+    'ping': 1, 'klines': 2, 'ticker': 2, 'tickers': 4, 'account': 20,
+    'exchange_info': 20, 'order': 1, 'order_oco': 1, 'listen_key': 2,
+    'cancel_order': 1, 'order_status': 4, 'order_list': 4, 'server_time': 1, 'my_trades': 20,
+}
+ORDER_ENDPOINTS = {'order': 1, 'order_oco': 2} # Nombre d'ordres comptés par requête
+
+# Priorités : les ordres passent avant les soldes, eux-mêmes avant les données de marché
+PRIORITY_ORDER = 0
+PRIORITY_ACCOUNT = 1
+PRIORITY_MARKET_DATA = 2
+ENDPOINT_PRIORITIES = {'order': PRIORITY_ORDER, 'order_oco': PRIORITY_ORDER, 'cancel_order': PRIORITY_ORDER,
+                       'account': PRIORITY_ACCOUNT, 'listen_key': PRIORITY_ACCOUNT,
+                       'order_status': PRIORITY_ACCOUNT, 'order_list': PRIORITY_ACCOUNT, 'my_trades': PRIORITY_ACCOUNT}
+
+
+class RateLimiter:
+    """
+    Seau à jetons sur le poids des requêtes REST : le budget se recharge en continu
+    (REQUEST_WEIGHT_LIMIT par minute, avec une marge de sécurité) et un seau de
+    taille limitée lisse les rafales. Une fraction du budget est réservée aux ordres
+    (les données de marché ne peuvent pas y puiser), et le compteur réel du serveur
+    (en-têtes X-MBX-USED-WEIGHT-1M / X-MBX-ORDER-COUNT-10S) recale l'estimation locale.
+    Après un 429/418, toutes les requêtes attendent la fin du Retry-After.
+    """
+
+    def __init__(self, weight_limit=6000, order_limit_10s=100, safety=0.9, burst_seconds=10, order_reserve=0.1,
+                 clock=time.monotonic):
+        self.clock = clock # Horloge monotone (s), injectable pour les tests
+        self.weight_limit = weight_limit
+        self.order_limit_10s = order_limit_10s
+        self.budget = weight_limit * safety # Poids utilisable par minute
+        self.rate = self.budget / 60.0      # Jetons rechargés par seconde
+        self.capacity = self.rate * burst_seconds
+        self.order_capacity = order_limit_10s * safety
+        self.order_rate = self.order_capacity / 10.0
+        # Seuil minimal de jetons par priorité (une priorité basse ne descend pas sous sa réserve)
+        self.reserves = {PRIORITY_ORDER: 0.0, PRIORITY_ACCOUNT: self.capacity * order_reserve / 2,
+                         PRIORITY_MARKET_DATA: self.capacity * order_reserve}
+        self.tokens = self.capacity
+        self.order_tokens = self.order_capacity
+        self.used_weight = 0        # Dernière valeur de X-MBX-USED-WEIGHT-1M
+        self.blocked_until = 0.0    # time.monotonic() de fin de ban (429/418)
+        self.throttled = 0          # Requêtes retardées par le limiteur
+        self._updated_at = self.clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.order_tokens = min(self.order_capacity, self.order_tokens + elapsed * self.order_rate)
+
+    def try_acquire(self, endpoint, priority=None):
+        """
+        Tente de réserver le poids d'une requête sans bloquer.
+
+        Returns:
+            float: 0 si la requête peut partir, sinon le délai (s) à attendre avant de réessayer.
+        """
+        weight = ENDPOINT_WEIGHTS.get(endpoint, 1)
+        orders = ORDER_ENDPOINTS.get(endpoint, 0)
+        priority = ENDPOINT_PRIORITIES.get(endpoint, PRIORITY_MARKET_DATA) if priority is None else priority
+        with self._lock:
+            now = self.clock()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            self._refill(now)
+            # Besoin plafonné à la taille du seau : une requête plus lourde part seau plein
+            # (solde négatif ensuite) au lieu d'attendre indéfiniment (petit REQUEST_WEIGHT_LIMIT)
+            needed = min(weight + self.reserves.get(priority, 0.0), self.capacity)
+            missing = max(0.0, needed - self.tokens) / self.rate
+            if orders:
+                missing = max(missing, (min(orders, self.order_capacity) - self.order_tokens) / self.order_rate)
+            if missing > 0:
+                return missing
+            self.tokens -= weight
+            self.order_tokens -= orders
+            return 0.0
+
+    def acquire(self, endpoint, priority=None):
+        """Attend (en bloquant le thread) que le budget permette la requête."""
+        delay = self.try_acquire(endpoint, priority)
+        if delay > 0:
+            self.throttled += 1; metrics.RATE_LIMIT_THROTTLED.inc()
+            logging.debug(f"Limiteur de débit : requête {endpoint} retardée de {delay:.2f}s.")
+        while delay > 0:
+            time.sleep(delay)
+            delay = self.try_acquire(endpoint, priority)
+
+    async def acquire_async(self, endpoint, priority=None):
+        """Comme acquire, sans bloquer la boucle asyncio."""
+        delay = self.try_acquire(endpoint, priority)
+        if delay > 0:
+            self.throttled += 1; metrics.RATE_LIMIT_THROTTLED.inc()
+            logging.debug(f"Limiteur de débit : requête {endpoint} retardée de {delay:.2f}s.")
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self.try_acquire(endpoint, priority)
+
+    def record_headers(self, headers):
+        """Recale le budget local sur les compteurs renvoyés par le serveur."""
+        if not headers:
+            return
+        used = headers.get('x-mbx-used-weight-1m')
+        order_count = headers.get('x-mbx-order-count-10s')
+        with self._lock:
+            self._refill(self.clock())
+            if used is not None:
+                self.used_weight = int(used); metrics.RATE_LIMIT_USED_WEIGHT.set(self.used_weight)
+                # Ne jamais dépasser ce qu'il reste réellement dans la minute côté serveur
+                self.tokens = min(self.tokens, self.budget - self.used_weight)
+            if order_count is not None:
+                self.order_tokens = min(self.order_tokens, self.order_capacity - int(order_count))
+
+    def record_error(self, error):
+        """Applique un 429 (limite atteinte) ou 418 (IP bannie) : pause de Retry-After secondes."""
+        if getattr(error, 'status_code', None) not in (418, 429):
+            return
+        headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+        try:
+            retry_after = float(headers.get('Retry-After', 60))
+        except (TypeError, ValueError):
+            retry_after = 60.0
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, self.clock() + retry_after)
+            self.tokens = 0.0
+        metrics.RATE_LIMIT_BANS.inc(status=error.status_code)
+        logging.error(f"Limite de requêtes Binance atteinte (HTTP {error.status_code}), pause de {retry_after:.0f}s.")
+
+
+rate_limiter = RateLimiter(REQUEST_WEIGHT_LIMIT, ORDER_LIMIT_10S)
+metrics.RATE_LIMIT_WEIGHT_LIMIT.set(REQUEST_WEIGHT_LIMIT)
+
+def _response_headers(client):
+    response = getattr(client, 'response', None)
+    return getattr(response, 'headers', None)
+
+def error_code(error):
+    """Code d'erreur d'un appel REST pour les métriques (code Binance, sinon type de l'exception)."""
+    code = getattr(error, 'code', None)
+    return str(code) if code is not None else type(error).__name__
+
+def _request(client, endpoint, call, **params):
+    """Appel REST synchrone soumis au limiteur de débit (budget réservé avant, en-têtes lus après), chronométré."""
+    rate_limiter.acquire(endpoint)
+    start = time.perf_counter()
+    try:
+        result = call(**params)
+    except Exception as e:
+        metrics.API_ERRORS.inc(endpoint=endpoint, code=error_code(e))
+        if isinstance(e, BinanceAPIException): rate_limiter.record_error(e)
+        raise
+    finally:
+        metrics.API_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint, client='sync')
+    rate_limiter.record_headers(_response_headers(client))
+    return result
+
+# --- Horloge du serveur Binance ---
+
+class ServerClock:
+    """
+    Décalage estimé entre l'horloge locale et celle du serveur Binance (GET /api/v3/time).
+    Parmi plusieurs mesures, celle au plus court aller-retour est retenue : l'erreur est
+    bornée par la moitié de cet aller-retour. Le décalage est aussi appliqué aux timestamps
+    des requêtes signées (évite les erreurs -1021 quand l'horloge locale dérive).
+    """
+
+    def __init__(self, samples=5):
+        self.samples = samples
+        self.offset_ms = 0.0   # Heure serveur - heure locale
+        self.rtt_ms = None     # Aller-retour de la mesure retenue
+        self.synced_at = None  # time.monotonic() de la dernière synchronisation réussie
+
+    def now_ms(self):
+        """Heure serveur estimée (ms)."""
+        return int(time.time() * 1000 + self.offset_ms)
+
+    def sync(self, max_age=None):
+        """
+        Mesure le décalage avec le serveur (sans requête si la dernière mesure a moins de max_age s).
+
+        Returns:
+            float: Le décalage (ms), ou None si désactivé (SYNC_SERVER_TIME) ou en cas d'erreur.
+        """
+        if not SYNC_SERVER_TIME:
+            return None
+        if max_age is not None and self.synced_at is not None and time.monotonic() - self.synced_at < max_age:
+            return self.offset_ms
+        client = get_client()
+        if not client:
+            logging.error("Client Binance non initialisé pour la synchronisation de l'horloge.")
+            return None
+        best = None
+        try:
+            for _ in range(self.samples):
+                sent = time.time() * 1000
+                server_time = _request(client, 'server_time', client.get_server_time)['serverTime']
+                received = time.time() * 1000
+                if best is None or received - sent < best[1]:
+                    best = (server_time - (sent + received) / 2, received - sent)
+        except (BinanceAPIException, BinanceRequestException, KeyError, TypeError) as e:
+            logging.error(f"Erreur lors de la lecture de l'heure du serveur Binance : {e}")
+            if best is None:
+                return None
+        first_sync = self.synced_at is None
+        self.offset_ms, self.rtt_ms = best
+        self.synced_at = time.monotonic()
+        client.timestamp_offset = int(round(self.offset_ms)) # Timestamps des requêtes signées
+        metrics.CLOCK_OFFSET_SECONDS.set(self.offset_ms / 1000)
+        log = logging.info if first_sync else logging.debug
+        log(f"Horloge serveur Binance : décalage {self.offset_ms:+.0f} ms (aller-retour {self.rtt_ms:.0f} ms).")
+        return self.offset_ms
+
+server_clock = ServerClock()
+
+def get_klines(symbol, interval, limit=100, retries=3, delay=5, start_time=None, end_time=None):
     """
     Récupère les données klines pour un symbole et un intervalle donnés.
     Gère les erreurs API et les tentatives multiples.
+    start_time / end_time (ms, optionnels) permettent de ne récupérer qu'une plage (backfill).
     """
     client = get_client()
     if not client:
         logging.error("Client Binance non initialisé pour get_klines.")
         return None
 
+    params = {'symbol': symbol, 'interval': interval, 'limit': limit}
+    if start_time is not None: params['startTime'] = int(start_time)
+    if end_time is not None: params['endTime'] = int(end_time)
     for attempt in range(retries):
         try:
-            klines = client.get_klines(symbol=symbol, interval=interval, limit=limit)
+            klines = _request(client, 'klines', client.get_klines, **params)
             logging.debug(f"Klines récupérées pour {symbol} ({interval}), limit={limit}.")
             if not klines:
                 logging.warning(f"Aucune kline retournée pour {symbol} ({interval}). Tentative {attempt + 1}/{retries}")
@@ -94,32 +344,139 @@ def get_klines(symbol, interval, limit=100, retries=3, delay=5):
                 return None
     return None
 
+class AccountSnapshot:
+    """
+    Instantané des soldes du compte, indexé par asset (un seul appel get_account()
+    sert toutes les consultations de soldes d'un cycle).
+    Peut être mis à jour en place par les événements du user data stream.
+    """
+
+    def __init__(self, balances):
+        self.balances = {}
+        for item in balances:
+            try:
+                self.balances[item['asset']] = (float(item.get('free', 0)), float(item.get('locked', 0)))
+            except (KeyError, ValueError, TypeError):
+                logging.warning(f"Entrée de solde invalide ignorée : {item}")
+        self.updated_at = time.monotonic()
+
+    def free(self, asset):
+        """Solde disponible d'un asset (0.0 si non possédé)."""
+        return self.balances.get(asset, (0.0, 0.0))[0]
+
+    def locked(self, asset):
+        """Solde bloqué (ordres ouverts) d'un asset."""
+        return self.balances.get(asset, (0.0, 0.0))[1]
+
+    def age(self):
+        """Âge de l'instantané en secondes."""
+        return time.monotonic() - self.updated_at
+
+    def apply_update(self, balances):
+        """
+        Applique une mise à jour partielle (événement 'outboundAccountPosition' du user data stream).
+
+        Args:
+            balances (list): Entrées {'a': asset, 'f': free, 'l': locked}.
+        """
+        for item in balances:
+            try:
+                self.balances[item['a']] = (float(item['f']), float(item['l']))
+            except (KeyError, ValueError, TypeError):
+                logging.warning(f"Mise à jour de solde invalide ignorée : {item}")
+        self.updated_at = time.monotonic()
+
+
+_account_snapshot = None
+_account_lock = threading.Lock()
+_account_stream_active = False # True quand le user data stream maintient l'instantané à jour
+
+def _fresh_account_snapshot(max_age):
+    """Instantané en cache s'il est encore valide, sinon None (appelant détenteur de _account_lock)."""
+    max_age = ACCOUNT_CACHE_TTL if max_age is None else max_age
+    snapshot = _account_snapshot
+    if snapshot is not None and (_account_stream_active or snapshot.age() <= max_age):
+        return snapshot
+    return None
+
+def get_cached_account_snapshot(max_age=None):
+    """Retourne l'instantané en cache s'il est encore valide (sans appel API), sinon None."""
+    with _account_lock:
+        return _fresh_account_snapshot(max_age)
+
+def store_account_snapshot(balances):
+    """Remplace l'instantané en cache par les soldes d'une réponse get_account() (ex: client asynchrone)."""
+    global _account_snapshot
+    snapshot = AccountSnapshot(balances)
+    with _account_lock:
+        _account_snapshot = snapshot
+    return snapshot
+
+def get_account_snapshot(max_age=None):
+    """
+    Retourne l'instantané des soldes, rafraîchi via get_account() s'il est plus vieux
+    que max_age (par défaut ACCOUNT_CACHE_TTL) ou s'il a été invalidé.
+    Quand le user data stream est actif, l'instantané n'expire pas (hors invalidation).
+
+    Returns:
+        AccountSnapshot: L'instantané, ou None en cas d'erreur.
+    """
+    global _account_snapshot
+    with _account_lock:
+        snapshot = _fresh_account_snapshot(max_age)
+        if snapshot is not None:
+            return snapshot
+
+        client = get_client()
+        if not client:
+            logging.error("Client Binance non initialisé pour get_account_snapshot.")
+            return None
+        try:
+            account_info = _request(client, 'account', client.get_account)
+            # Utiliser .get('balances', []) pour éviter KeyError si 'balances' manque
+            _account_snapshot = AccountSnapshot(account_info.get('balances', []))
+            logging.debug(f"Instantané du compte rafraîchi ({len(_account_snapshot.balances)} assets).")
+            return _account_snapshot
+        except (BinanceAPIException, BinanceRequestException) as e:
+            logging.error(f"Erreur API Binance lors de la récupération du compte : {e}")
+            return None
+        except Exception as e:
+            logging.exception("Erreur inattendue lors de la récupération du compte.")
+            return None
+
+def invalidate_account_snapshot():
+    """
+    Force le rafraîchissement des soldes au prochain accès (ex: après une exécution d'ordre).
+    Sans effet quand le user data stream est actif : ses événements mettent déjà l'instantané à jour.
+    """
+    global _account_snapshot
+    with _account_lock:
+        if not _account_stream_active:
+            _account_snapshot = None
+
+def apply_account_update(balances):
+    """Applique une mise à jour de soldes du user data stream à l'instantané en cache (s'il existe)."""
+    with _account_lock:
+        if _account_snapshot is not None:
+            _account_snapshot.apply_update(balances)
+
+def set_account_stream_active(active):
+    """Indique si le user data stream maintient les soldes à jour (l'instantané n'expire plus)."""
+    global _account_stream_active
+    with _account_lock:
+        _account_stream_active = bool(active)
+
 def get_account_balance(asset='USDT'):
-    """Récupère le solde disponible pour un actif spécifique."""
-    client = get_client()
-    if not client:
-        logging.error("Client Binance non initialisé pour get_account_balance.")
+    """Récupère le solde disponible pour un actif spécifique (via l'instantané du compte en cache)."""
+    snapshot = get_account_snapshot()
+    if snapshot is None:
         return None # Retourner None pour indiquer une erreur plutôt que 0.0
-
-    try:
-        account_info = client.get_account()
-        # Utiliser .get('balances', []) pour éviter KeyError si 'balances' manque
-        balances = account_info.get('balances', [])
-        balance_info = next((item for item in balances if item.get("asset") == asset), None)
-
-        if balance_info and 'free' in balance_info:
-            available_balance = float(balance_info['free'])
-            logging.info(f"Solde {asset} disponible récupéré : {available_balance}")
-            return available_balance
-        else:
-            logging.warning(f"Aucune information de solde trouvée pour l'asset {asset}.")
-            return 0.0 # Retourner 0.0 si l'asset n'est pas trouvé
-    except (BinanceAPIException, BinanceRequestException) as e:
-        logging.error(f"Erreur API Binance lors de la récupération du solde {asset} : {e}")
-        return None # Indiquer une erreur
-    except Exception as e:
-        logging.exception(f"Erreur inattendue lors de la récupération du solde {asset}.") # Utiliser logging.exception
-        return None # Indiquer une erreur
+    if asset not in snapshot.balances:
+        logging.warning(f"Aucune information de solde trouvée pour l'asset {asset}.")
+        return 0.0 # Retourner 0.0 si l'asset n'est pas trouvé
+    available_balance = snapshot.free(asset)
+    logging.debug(f"Solde {asset} disponible : {available_balance}")
+    return available_balance
 
 def get_symbol_info(symbol):
     """Récupère les informations et règles de trading pour un symbole."""
@@ -128,7 +485,7 @@ def get_symbol_info(symbol):
         logging.error("Client Binance non initialisé pour get_symbol_info.")
         return None
     try:
-        info = client.get_symbol_info(symbol)
+        info = _request(client, 'exchange_info', client.get_symbol_info, symbol=symbol)
         if info:
             logging.debug(f"Informations récupérées pour le symbole {symbol}.")
             return info
@@ -143,6 +500,21 @@ def get_symbol_info(symbol):
         logging.exception(f"Erreur inattendue lors de la récupération des infos pour {symbol}.") # Utiliser logging.exception
         return None
 
+def get_exchange_info():
+    """Récupère l'exchangeInfo complet (règles de tous les symboles) en un seul appel."""
+    client = get_client()
+    if not client:
+        logging.error("Client Binance non initialisé pour get_exchange_info.")
+        return None
+    try:
+        return _request(client, 'exchange_info', client.get_exchange_info)
+    except (BinanceAPIException, BinanceRequestException) as e:
+        logging.error(f"Erreur API Binance lors de la récupération de l'exchangeInfo : {e}")
+        return None
+    except Exception as e:
+        logging.exception("Erreur inattendue lors de la récupération de l'exchangeInfo.")
+        return None
+
 # --- AJOUT DE LA FONCTION MANQUANTE ---
 def get_symbol_ticker(symbol):
     """
@@ -156,7 +528,7 @@ def get_symbol_ticker(symbol):
 
     try:
         logging.debug(f"Récupération du ticker pour {symbol}...")
-        ticker = client.get_symbol_ticker(symbol=symbol)
+        ticker = _request(client, 'ticker', client.get_symbol_ticker, symbol=symbol)
         logging.debug(f"Ticker pour {symbol} reçu: {ticker}")
         return ticker # Retourne le dictionnaire {'symbol': '...', 'price': '...'}
     except (BinanceAPIException, BinanceRequestException) as e:
@@ -167,8 +539,37 @@ def get_symbol_ticker(symbol):
         return None
 # --- FIN AJOUT ---
 
+def get_ticker_prices(symbols=None):
+    """
+    Récupère les derniers prix de plusieurs symboles en un seul appel REST
+    (au lieu d'un get_symbol_ticker par symbole).
+
+    Args:
+        symbols (list, optional): Symboles voulus ; tous les symboles de l'exchange si None.
+
+    Returns:
+        dict: {symbole: prix (float)}, ou None en cas d'erreur.
+    """
+    client = get_client()
+    if not client:
+        logging.error("Client Binance non initialisé pour get_ticker_prices.")
+        return None
+    try:
+        if symbols:
+            tickers = _request(client, 'tickers', client.get_symbol_ticker, symbols=json.dumps(list(symbols), separators=(',', ':')))
+        else:
+            tickers = _request(client, 'tickers', client.get_all_tickers)
+        if isinstance(tickers, dict): tickers = [tickers]
+        return {t['symbol']: float(t['price']) for t in tickers}
+    except (BinanceAPIException, BinanceRequestException) as e:
+        logging.error(f"Erreur API/Request Binance lors de la récupération des tickers : {e}")
+        return None
+    except Exception as e:
+        logging.exception("Erreur inattendue lors de la récupération des tickers.")
+        return None
+
 
-def place_order(symbol, side, quantity, order_type='MARKET', price=None, time_in_force='GTC'):
+def place_order(symbol, side, quantity, order_type='MARKET', price=None, time_in_force='GTC', client_order_id=None):
     """
     Place un ordre sur Binance avec gestion d'erreur.
     Simplifié pour MARKET et LIMIT GTC.
@@ -180,6 +581,7 @@ def place_order(symbol, side, quantity, order_type='MARKET', price=None, time_in
         order_type (str): 'MARKET' ou 'LIMIT'.
         price (str, optional): Le prix formaté en string pour les ordres LIMIT.
         time_in_force (str): Time in force pour LIMIT (par défaut 'GTC').
+        client_order_id (str, optional): Identifiant client de l'ordre (newClientOrderId), repris par le user data stream.
 
     Returns:
         dict: Les informations de l'ordre si succès, None sinon.
@@ -197,6 +599,8 @@ def place_order(symbol, side, quantity, order_type='MARKET', price=None, time_in
             'type': order_type,
             'quantity': quantity,
         }
+        if client_order_id:
+            params['newClientOrderId'] = client_order_id
 
         if order_type == 'LIMIT':
             if price is None:
@@ -209,7 +613,8 @@ def place_order(symbol, side, quantity, order_type='MARKET', price=None, time_in
             return None
 
         logging.info(f"Tentative de placement d'un ordre {order_type} {side} de {quantity} {symbol}...")
-        order = client.create_order(**params)
+        order = _request(client, 'order', client.create_order, **params)
+        invalidate_account_snapshot() # Les soldes ont changé : prochain accès via get_account()
         logging.info(f"Ordre {order_type} {side} placé avec succès pour {quantity} {symbol}. OrderId: {order.get('orderId')}")
         return order
 
@@ -221,12 +626,494 @@ def place_order(symbol, side, quantity, order_type='MARKET', price=None, time_in
         logging.exception(f"Erreur inattendue lors du placement de l'ordre {order_type} {side} pour {symbol}.") # Utiliser logging.exception
         return None
 
+def place_oco_order(symbol, side, quantity, price, stop_price, stop_limit_price, time_in_force='GTC',
+                    limit_client_order_id=None, stop_client_order_id=None):
+    """
+    Place un ordre OCO (One-Cancels-the-Other) : un LIMIT_MAKER (take-profit) et un
+    STOP_LOSS_LIMIT (stop-loss) ; l'exécution de l'un annule l'autre, côté exchange.
+
+    Args:
+        symbol (str): Le symbole.
+        side (str): 'SELL' pour sortir d'un long, 'BUY' pour sortir d'un short.
+        quantity (str): Quantité formatée (stepSize).
+        price (str): Prix limite du take-profit (tickSize).
+        stop_price (str): Prix de déclenchement du stop.
+        stop_limit_price (str): Prix limite de l'ordre stop une fois déclenché.
+        time_in_force (str): Time in force de l'ordre stop-limit.
+        limit_client_order_id (str, optional): Identifiant client du take-profit (LIMIT_MAKER).
+        stop_client_order_id (str, optional): Identifiant client du stop (STOP_LOSS_LIMIT).
+
+    Returns:
+        dict: La liste d'ordres (orderListId, orders, orderReports) si succès, None sinon.
+    """
+    client = get_client()
+    if not client:
+        logging.error("Client Binance non initialisé pour place_oco_order.")
+        return None
+    try:
+        logging.info(f"Placement d'un ordre OCO {side} de {quantity} {symbol} (TP {price}, stop {stop_price} / {stop_limit_price})...")
+        client_ids = {key: value for key, value in (('limitClientOrderId', limit_client_order_id),
+                                                    ('stopClientOrderId', stop_client_order_id)) if value}
+        order_list = _request(client, 'order_oco', client.create_oco_order, symbol=symbol, side=side, quantity=quantity,
+                              price=price, stopPrice=stop_price, stopLimitPrice=stop_limit_price,
+                              stopLimitTimeInForce=time_in_force, **client_ids)
+        invalidate_account_snapshot() # Quantité bloquée par l'OCO
+        logging.info(f"Ordre OCO {side} placé pour {quantity} {symbol}. OrderListId: {order_list.get('orderListId')}")
+        return order_list
+    except (BinanceAPIException, BinanceRequestException) as e:
+        logging.error(f"Erreur API Binance lors du placement de l'ordre OCO {side} pour {symbol}: Code={getattr(e, 'code', 'N/A')}, Message={e}")
+        return None
+    except Exception as e:
+        logging.exception(f"Erreur inattendue lors du placement de l'ordre OCO {side} pour {symbol}.")
+        return None
+
+def get_order_list(order_list_id):
+    """Retourne l'état d'une liste d'ordres (OCO) : listOrderStatus, orders, ou None en cas d'erreur."""
+    client = get_client()
+    if not client:
+        logging.error("Client Binance non initialisé pour get_order_list.")
+        return None
+    try:
+        return _request(client, 'order_list', client._get, path='orderList', signed=True, data={'orderListId': order_list_id})
+    except (BinanceAPIException, BinanceRequestException) as e:
+        logging.error(f"Erreur API Binance lors de la lecture de la liste d'ordres {order_list_id}: {e}")
+        return None
+    except Exception as e:
+        logging.exception(f"Erreur inattendue lors de la lecture de la liste d'ordres {order_list_id}.")
+        return None
+
+def cancel_order_list(symbol, order_list_id):
+    """Annule une liste d'ordres (OCO) encore ouverte. Retourne la réponse, ou None en cas d'erreur."""
+    client = get_client()
+    if not client:
+        logging.error("Client Binance non initialisé pour cancel_order_list.")
+        return None
+    try:
+        result = _request(client, 'cancel_order', client._delete, path='orderList', signed=True,
+                          data={'symbol': symbol, 'orderListId': order_list_id})
+        invalidate_account_snapshot() # Quantité débloquée
+        logging.info(f"Liste d'ordres {order_list_id} ({symbol}) annulée.")
+        return result
+    except (BinanceAPIException, BinanceRequestException) as e:
+        logging.error(f"Erreur API Binance lors de l'annulation de la liste d'ordres {order_list_id} ({symbol}): {e}")
+        return None
+    except Exception as e:
+        logging.exception(f"Erreur inattendue lors de l'annulation de la liste d'ordres {order_list_id} ({symbol}).")
+        return None
+
+def get_order(symbol, order_id=None, client_order_id=None):
+    """
+    Retourne l'état d'un ordre (status, executedQty, cummulativeQuoteQty...), identifié par son orderId
+    ou son identifiant client, ou None en cas d'erreur.
+    """
+    client = get_client()
+    if not client:
+        logging.error("Client Binance non initialisé pour get_order.")
+        return None
+    key = {'orderId': order_id} if client_order_id is None else {'origClientOrderId': client_order_id}
+    try:
+        return _request(client, 'order_status', client.get_order, symbol=symbol, **key)
+    except (BinanceAPIException, BinanceRequestException) as e:
+        logging.error(f"Erreur API Binance lors de la lecture de l'ordre {order_id or client_order_id} ({symbol}): {e}")
+        return None
+    except Exception as e:
+        logging.exception(f"Erreur inattendue lors de la lecture de l'ordre {order_id or client_order_id} ({symbol}).")
+        return None
+
+def get_order_trades(symbol, order_id):
+    """Retourne les exécutions (id, price, qty, commission, commissionAsset) d'un ordre, ou None en cas d'erreur."""
+    client = get_client()
+    if not client:
+        logging.error("Client Binance non initialisé pour get_order_trades.")
+        return None
+    try:
+        return _request(client, 'my_trades', client.get_my_trades, symbol=symbol, orderId=order_id)
+    except (BinanceAPIException, BinanceRequestException) as e:
+        logging.error(f"Erreur API Binance lors de la lecture des exécutions de l'ordre {order_id} ({symbol}): {e}")
+        return None
+    except Exception as e:
+        logging.exception(f"Erreur inattendue lors de la lecture des exécutions de l'ordre {order_id} ({symbol}).")
+        return None
+
+# --- User data stream : clé d'écoute (listenKey) ---
+
+def create_listen_key():
+    """Crée (ou retourne) la clé d'écoute du user data stream, ou None en cas d'erreur."""
+    client = get_client()
+    if not client:
+        logging.error("Client Binance non initialisé pour create_listen_key.")
+        return None
+    try:
+        return _request(client, 'listen_key', client.stream_get_listen_key)
+    except (BinanceAPIException, BinanceRequestException) as e:
+        logging.error(f"Erreur API Binance lors de la création de la clé du user data stream : {e}")
+        return None
+    except Exception as e:
+        logging.exception("Erreur inattendue lors de la création de la clé du user data stream.")
+        return None
+
+def keepalive_listen_key(listen_key):
+    """Prolonge la validité de la clé d'écoute (expire après 60 min sans keepalive). Retourne True si succès."""
+    client = get_client()
+    if not client:
+        return False
+    try:
+        _request(client, 'listen_key', client.stream_keepalive, listenKey=listen_key)
+        return True
+    except (BinanceAPIException, BinanceRequestException) as e:
+        logging.error(f"Erreur API Binance lors du keepalive du user data stream : {e}")
+        return False
+    except Exception as e:
+        logging.exception("Erreur inattendue lors du keepalive du user data stream.")
+        return False
+
+def close_listen_key(listen_key):
+    """Ferme la clé d'écoute du user data stream (erreurs seulement loguées)."""
+    client = get_client()
+    if not client:
+        return
+    try:
+        _request(client, 'listen_key', client.stream_close, listenKey=listen_key)
+    except Exception as e:
+        logging.warning(f"Fermeture de la clé du user data stream impossible : {e}")
+
 # Fonction simplifiée, place_order est plus générale
 # def place_market_order(symbol, side, quantity):
 #     """Place un ordre au marché simple."""
 #     return place_order(symbol, side, quantity, order_type='MARKET')
 
 
+# --- Flux WebSocket (klines + ticker) avec repli REST ---
+
+def _ws_kline_to_rest(k):
+    """Convertit une kline du flux WebSocket au format liste retourné par client.get_klines()."""
+    return [k['t'], k['o'], k['h'], k['l'], k['c'], k['v'], k['T'], k['q'], k['n'], k['V'], k['Q'], k.get('B', '0')]
+
+
+BACKFILL_PAGE_SIZE = 1000 # Bougies par requête de backfill (maximum de /api/v3/klines)
+
+class MarketStream:
+    """
+    Souscrit aux flux kline et miniTicker (ou aggTrade, prix de chaque transaction) d'un
+    ou plusieurs symboles (combined stream) dans un thread dédié, et publie des événements
+    dans une file :
+
+        {'type': 'kline_closed', 'symbol', 'interval', 'kline': [...], 'source': 'ws' | 'rest'}
+        {'type': 'ticker', 'symbol', 'price': float}
+        {'type': 'connected' | 'disconnected'}
+        {'type': 'backfill_failed', 'symbol', 'interval', 'start_time', 'end_time'}
+
+    Les klines sont au format de client.get_klines(). En cas de trou dans la séquence
+    des bougies clôturées (message perdu) ou après une déconnexion, les bougies
+    manquantes sont récupérées via REST (get_klines, par pages de BACKFILL_PAGE_SIZE)
+    avant de reprendre le flux ; si le REST échoue, le flux ne saute pas le trou.
+    L'URL est configurable (config.STREAM_URL) pour tester contre un serveur local.
+    """
+
+    def __init__(self, symbols, interval, url=None, reconnect_delay=1, max_reconnect_delay=60, recv_timeout=90, trades=False):
+        self.symbols = [symbols] if isinstance(symbols, str) else list(symbols)
+        self.interval = interval
+        self.trades = trades # Prix à chaque transaction (aggTrade, sous la seconde) plutôt qu'une fois par seconde
+        self.interval_ms = interval_to_milliseconds(interval)
+        self.url = (url or STREAM_URL).rstrip('/')
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.recv_timeout = recv_timeout # Sans message pendant ce délai, la connexion est considérée morte
+        self.events = queue.Queue()
+        self.connected = False
+        self.last_prices = {}
+        self._last_closed = {} # symbole -> open time (ms) de la dernière bougie clôturée publiée
+        self._stop = threading.Event()
+        self._loop = None
+        self._thread = None
+
+    def stream_names(self):
+        """Noms des flux Binance souscrits."""
+        names = []
+        for symbol in self.symbols:
+            names.append(f"{symbol.lower()}@kline_{self.interval}")
+            names.append(f"{symbol.lower()}@{'aggTrade' if self.trades else 'miniTicker'}")
+        return names
+
+    def start(self):
+        """Démarre le thread de réception."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="MarketStream", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        """Arrête le flux et attend la fin du thread."""
+        self._stop.set() # La boucle de réception vérifie ce drapeau chaque seconde
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def get_event(self, timeout=None):
+        """Retourne le prochain événement, ou None si aucun n'arrive avant le timeout."""
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def wake(self):
+        """Interrompt un get_event() en attente (événement 'wake', ex: arrêt demandé)."""
+        self.events.put({'type': 'wake'})
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._main())
+        except Exception:
+            logging.exception("Erreur inattendue dans le flux WebSocket.")
+        finally:
+            self._loop.close()
+            self._loop = None
+            self.connected = False
+
+    async def _main(self):
+        url = f"{self.url}/stream?streams={'/'.join(self.stream_names())}"
+        delay = self.reconnect_delay
+        while not self._stop.is_set():
+            try:
+                async with websockets.connect(url, ping_interval=20, ping_timeout=20, close_timeout=5) as ws:
+                    self.connected = True
+                    delay = self.reconnect_delay
+                    logging.info(f"Flux WebSocket connecté ({', '.join(self.symbols)} {self.interval}).")
+                    self.events.put({'type': 'connected'})
+                    # Rattraper les bougies clôturées pendant la déconnexion
+                    for symbol in self.symbols:
+                        await self._backfill(symbol, None)
+                    last_message_at = time.monotonic()
+                    while not self._stop.is_set():
+                        try:
+                            message = await asyncio.wait_for(ws.recv(), timeout=1) # Timeout court pour vérifier l'arrêt
+                            last_message_at = time.monotonic()
+                        except asyncio.TimeoutError:
+                            if time.monotonic() - last_message_at > self.recv_timeout:
+                                raise ConnectionError(f"Aucun message reçu depuis {self.recv_timeout}s")
+                            continue
+                        await self._handle_message(message)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                logging.warning(f"Flux WebSocket interrompu ({e}). Reconnexion dans {delay}s, repli REST pour les bougies manquantes.")
+            if self.connected:
+                self.connected = False
+                self.events.put({'type': 'disconnected'})
+            if self._stop.is_set():
+                break
+            reconnect_at = time.monotonic() + delay
+            while time.monotonic() < reconnect_at and not self._stop.is_set():
+                await asyncio.sleep(0.5)
+            delay = min(delay * 2, self.max_reconnect_delay)
+        logging.info("Flux WebSocket arrêté.")
+
+    async def _handle_message(self, message):
+        try:
+            payload = json.loads(message)
+        except ValueError:
+            logging.warning(f"Message WebSocket illisible ignoré : {message[:200]}")
+            return
+        data = payload.get('data', payload) # Combined stream : {'stream': ..., 'data': {...}}
+        event_type = data.get('e')
+        if event_type == 'kline':
+            k = data['k']
+            if not k.get('x'):
+                return # Bougie encore ouverte
+            symbol = data.get('s', k.get('s'))
+            open_time = int(k['t'])
+            last = self._last_closed.get(symbol)
+            if last is not None and open_time <= last:
+                return # Doublon (déjà publié via REST ou WS)
+            if last is not None and open_time > last + self.interval_ms and not await self._backfill(symbol, open_time):
+                return # Trou non comblé : la bougie n'est pas publiée, le prochain message relancera le backfill
+            self._publish_kline(symbol, _ws_kline_to_rest(k), 'ws')
+        elif event_type in ('24hrMiniTicker', '24hrTicker', 'aggTrade'):
+            try:
+                price = float(data['p'] if event_type == 'aggTrade' else data['c'])
+            except (KeyError, ValueError, TypeError):
+                return
+            self.last_prices[data['s']] = price
+            self.events.put({'type': 'ticker', 'symbol': data['s'], 'price': price})
+
+    def _publish_kline(self, symbol, kline, source):
+        self._last_closed[symbol] = int(kline[0])
+        self.events.put({'type': 'kline_closed', 'symbol': symbol, 'interval': self.interval, 'kline': kline, 'source': source})
+
+    async def _backfill(self, symbol, before_open_time):
+        """
+        Récupère via REST, page par page, les bougies clôturées manquantes après la dernière publiée
+        (et avant before_open_time). En cas d'échec, la dernière bougie publiée reste inchangée
+        (nouvelle tentative au prochain trou) et un événement 'backfill_failed' est publié.
+
+        Returns:
+            bool: False si une page n'a pas pu être récupérée.
+        """
+        if self._last_closed.get(symbol) is None:
+            return True # Rien publié encore : l'historique initial est chargé par l'appelant
+        logging.info(f"Backfill REST des bougies {symbol} {self.interval} depuis {self._last_closed[symbol] + self.interval_ms}.")
+        while True:
+            start_time = self._last_closed[symbol] + self.interval_ms
+            if before_open_time is not None and start_time >= before_open_time:
+                return True
+            if start_time + self.interval_ms > server_clock.now_ms():
+                return True # Bougie encore ouverte : rien à rattraper
+            end_time = before_open_time - 1 if before_open_time is not None else None
+            klines = await self._loop.run_in_executor(
+                None, lambda: get_klines(symbol, self.interval, limit=BACKFILL_PAGE_SIZE, start_time=start_time, end_time=end_time))
+            if klines is None:
+                logging.warning(f"Backfill REST des bougies {symbol} {self.interval} impossible depuis {start_time} : nouvelle tentative au prochain trou.")
+                self.events.put({'type': 'backfill_failed', 'symbol': symbol, 'interval': self.interval,
+                                 'start_time': start_time, 'end_time': end_time})
+                return False
+            now_ms = server_clock.now_ms()
+            for kline in klines:
+                open_time = int(kline[0])
+                if (before_open_time is not None and open_time >= before_open_time) or int(kline[6]) >= now_ms:
+                    return True # Trou comblé, ou bougie encore ouverte
+                if open_time > self._last_closed[symbol]:
+                    self._publish_kline(symbol, kline, 'rest')
+            if len(klines) < BACKFILL_PAGE_SIZE or self._last_closed[symbol] + self.interval_ms == start_time:
+                return True # Dernière page (ou aucune progression)
+
+
+class UserDataStream:
+    """
+    User data stream du compte (clé d'écoute) dans un thread dédié. Les soldes poussés par
+    'outboundAccountPosition' sont appliqués à l'instantané en cache, qui n'expire plus tant que
+    le flux est connecté (plus de get_account() après chaque ordre). Chaque événement est aussi
+    transmis à on_event (appelé depuis le thread du flux) :
+
+        {'type': 'execution_report', 'report': {...}}   (executionReport Binance)
+        {'type': 'account', 'balances': [...]}
+        {'type': 'connected' | 'disconnected'}
+
+    La clé est prolongée toutes les keepalive_interval secondes et recréée si elle expire.
+    À chaque (re)connexion, les soldes sont relus par REST : les événements manqués pendant
+    la coupure sont rattrapés par l'appelant (OrderManager.reconcile).
+    """
+
+    def __init__(self, on_event=None, url=None, keepalive_interval=1800, reconnect_delay=1, max_reconnect_delay=60):
+        self.on_event = on_event
+        self.url = (url or STREAM_URL).rstrip('/')
+        self.keepalive_interval = keepalive_interval
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.connected = False
+        self._stop = threading.Event()
+        self._loop = None
+        self._thread = None
+
+    def start(self):
+        """Démarre le thread de réception."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="UserDataStream", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        """Arrête le flux et attend la fin du thread (les soldes repassent en lecture REST)."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _emit(self, event):
+        if self.on_event is None:
+            return
+        try:
+            self.on_event(event)
+        except Exception:
+            logging.exception(f"Erreur lors du traitement d'un événement du user data stream ({event.get('type')}).")
+
+    def _set_connected(self, connected):
+        if connected == self.connected:
+            return
+        self.connected = connected
+        set_account_stream_active(connected)
+        if not connected:
+            invalidate_account_snapshot() # Soldes relus par REST tant que le flux est coupé
+        self._emit({'type': 'connected' if connected else 'disconnected'})
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._main())
+        except Exception:
+            logging.exception("Erreur inattendue dans le user data stream.")
+        finally:
+            self._loop.close()
+            self._loop = None
+            self._set_connected(False)
+
+    async def _main(self):
+        delay = self.reconnect_delay
+        listen_key = None
+        while not self._stop.is_set():
+            try:
+                listen_key = await self._loop.run_in_executor(None, create_listen_key)
+                if not listen_key:
+                    raise ConnectionError("clé d'écoute indisponible")
+                async with websockets.connect(f"{self.url}/ws/{listen_key}", ping_interval=20, ping_timeout=20, close_timeout=5) as ws:
+                    # Instantané de référence, ensuite tenu à jour par les événements du flux
+                    if await self._loop.run_in_executor(None, lambda: get_account_snapshot(max_age=0)) is None:
+                        raise ConnectionError("soldes initiaux indisponibles")
+                    self._set_connected(True)
+                    delay = self.reconnect_delay
+                    logging.info("User data stream connecté (ordres et soldes poussés par Binance).")
+                    keepalive_at = time.monotonic() + self.keepalive_interval
+                    while not self._stop.is_set():
+                        if time.monotonic() >= keepalive_at:
+                            keepalive_at = time.monotonic() + self.keepalive_interval
+                            if not await self._loop.run_in_executor(None, keepalive_listen_key, listen_key):
+                                raise ConnectionError("keepalive de la clé d'écoute refusé")
+                        try:
+                            message = await asyncio.wait_for(ws.recv(), timeout=1) # Timeout court pour vérifier l'arrêt
+                        except asyncio.TimeoutError:
+                            continue
+                        if not self._handle_message(message):
+                            raise ConnectionError("clé d'écoute expirée")
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                logging.warning(f"User data stream interrompu ({e}). Reconnexion dans {delay}s, soldes relus par REST.")
+            self._set_connected(False)
+            if self._stop.is_set():
+                break
+            reconnect_at = time.monotonic() + delay
+            while time.monotonic() < reconnect_at and not self._stop.is_set():
+                await asyncio.sleep(0.5)
+            delay = min(delay * 2, self.max_reconnect_delay)
+        if listen_key:
+            await self._loop.run_in_executor(None, close_listen_key, listen_key)
+        logging.info("User data stream arrêté.")
+
+    def _handle_message(self, message):
+        """Traite un message du flux ; retourne False si la clé d'écoute a expiré."""
+        try:
+            data = json.loads(message)
+        except ValueError:
+            logging.warning(f"Message du user data stream illisible ignoré : {message[:200]}")
+            return True
+        data = data.get('data', data)
+        event_type = data.get('e')
+        if event_type == 'outboundAccountPosition':
+            apply_account_update(data.get('B', []))
+            self._emit({'type': 'account', 'balances': data.get('B', [])})
+        elif event_type == 'executionReport':
+            self._emit({'type': 'execution_report', 'report': data})
+        elif event_type == 'listenKeyExpired':
+            return False
+        return True
+
+
 # --- Autres fonctions utiles (get_open_orders, cancel_order, etc.) ---
 # ... à implémenter selon les besoins ...
 
@@ -285,55 +1172,44 @@ if __name__ == '__main__':
         # Décommentez avec prudence et une petite quantité valide pour tester
         test_symbol = 'BTCUSDT'
         test_side = 'BUY'
-        # !! Ajuster cette quantité selon les filtres LOT_SIZE et MIN_NOTIONAL !!
-        # 1. Obtenir minQty et stepSize de LOT_SIZE
-        # 2. Obtenir minNotional de MIN_NOTIONAL
-        # 3. Calculer une quantité q >= minQty et q * prix_actuel >= minNotional
-        # 4. Formater q selon stepSize
+        # !! Ajuster cette quantité selon les filtres LOT_SIZE et NOTIONAL (vérifiés via symbol_rules) !!
         test_quantity_str = "0.0001" # Exemple, à adapter absolument !
         print(f"Vérification des conditions pour placer un ordre {test_side} de {test_quantity_str} {test_symbol}...")
 
-        symbol_info_test = get_symbol_info(test_symbol)
+        import symbol_rules # Import local : symbol_rules importe déjà ce module
+        rules_test = symbol_rules.get_symbol_rules(test_symbol)
         current_ticker = get_symbol_ticker(test_symbol)
         can_place_order = False
-        if symbol_info_test and current_ticker and 'price' in current_ticker:
+        if rules_test and current_ticker and 'price' in current_ticker:
             try:
                 current_price = float(current_ticker['price'])
-                lot_size = next((f for f in symbol_info_test.get('filters', []) if f.get('filterType') == 'LOT_SIZE'), None)
-                min_notional_filter = next((f for f in symbol_info_test.get('filters', []) if f.get('filterType') == 'MIN_NOTIONAL'), None)
-
-                if lot_size and min_notional_filter:
-                    min_qty = float(lot_size.get('minQty', 0))
-                    step_size = float(lot_size.get('stepSize', 0))
-                    min_notional = float(min_notional_filter.get('minNotional', 0))
-                    test_quantity_float = float(test_quantity_str)
-
-                    # Vérifier minQty
-                    if test_quantity_float < min_qty:
-                        print(f"ERREUR: Quantité {test_quantity_float} < minQty ({min_qty})")
-                    # Vérifier minNotional
-                    elif test_quantity_float * current_price < min_notional:
-                         print(f"ERREUR: Notionnel {test_quantity_float * current_price:.2f} < minNotional ({min_notional})")
-                    # Vérifier stepSize (si nécessaire, mais create_order le gère souvent)
-                    # On pourrait ajouter une fonction pour formater la quantité ici
-                    else:
-                        print("Conditions de quantité et notionnel minimum respectées.")
-                        can_place_order = True
+                # Vérifier minQty, stepSize et minNotional (NOTIONAL / MIN_NOTIONAL) en une fois
+                valid, reason = rules_test.validate(test_quantity_str, current_price, market=True)
+                if valid:
+                    print("Conditions de quantité et notionnel minimum respectées.")
+                    can_place_order = True
                 else:
-                    print("ERREUR: Filtres LOT_SIZE ou MIN_NOTIONAL non trouvés.")
+                    print(f"ERREUR: {reason}")
             except (ValueError, TypeError) as e:
                 print(f"ERREUR lors de la vérification des filtres: {e}")
         else:
              print(f"Impossible de récupérer les infos symbole ou le ticker pour {test_symbol}, ordre non vérifié.")
 
-        if can_place_order:
+        # Ordre placé automatiquement uniquement sur l'exchange simulé (mock_exchange.py, en local) ;
+        # API_URL peut aussi viser le testnet ou un proxy : ailleurs, --place-order est obligatoire
+        from urllib.parse import urlparse
+        local_exchange = bool(API_URL) and urlparse(API_URL).hostname in ('localhost', '127.0.0.1')
+        if can_place_order and (local_exchange or '--place-order' in sys.argv):
+            order_result = place_order(test_symbol, test_side, test_quantity_str, order_type='MARKET')
+            print(f"Ordre de test MARKET BUY placé ({'exchange simulé' if local_exchange else API_URL or 'Binance'}) :", order_result)
+        elif can_place_order:
             # Décommenter la ligne suivante pour réellement placer l'ordre
             # order_result = place_order(test_symbol, test_side, test_quantity_str, order_type='MARKET')
             # if order_result:
             #     print("Ordre de test MARKET BUY placé (simulé ou réel) :", order_result)
             # else:
             #     print("Échec du placement de l'ordre de test MARKET BUY.")
-            print(f"Placement d'ordre MARKET BUY pour {test_quantity_str} {test_symbol} NON EXÉCUTÉ dans cet exemple.")
+            print(f"Placement d'ordre MARKET BUY pour {test_quantity_str} {test_symbol} NON EXÉCUTÉ (relancer avec --place-order pour le placer).")
         else:
             print("Placement d'ordre non tenté car les conditions ne sont pas remplies ou n'ont pas pu être vérifiées.")
 
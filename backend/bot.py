@@ -1,7 +1,8 @@
 import time
+import json
 import logging
 import threading
-import queue  # Ajout pour la file d'attente
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, jsonify, request, Response  # Ajout de Response
 from flask_cors import CORS
 from binance.client import Client as BinanceClient
@@ -11,23 +12,36 @@ from binance.exceptions import BinanceAPIException, BinanceRequestException
 import config
 import strategy
 import binance_client_wrapper
+import kline_resampler
+import symbol_rules
+import async_client_wrapper
+import metrics
+import exit_engine
+import paper_trading
+import order_manager
+import candle_scheduler
+from broadcast import BroadcastHub, format_sse
 
 # --- Configuration du Logging ---
-# Créer une file d'attente pour les logs destinés au frontend
-log_queue = queue.Queue()
-
-# Gestionnaire de logging personnalisé pour mettre les messages dans la file d'attente
-class QueueHandler(logging.Handler):
-    def __init__(self, log_queue):
+# Logs destinés au frontend : buffer circulaire borné diffusé à tous les clients /stream_logs
+LOG_BUFFER_SIZE = getattr(config, 'LOG_BUFFER_SIZE', 1000) # Entrées conservées (mémoire constante)
+LOG_REPLAY_ON_CONNECT = getattr(config, 'LOG_REPLAY_ON_CONNECT', 100) # Entrées récentes renvoyées à un nouveau client
+log_hub = BroadcastHub(LOG_BUFFER_SIZE)
+
+# Gestionnaire de logging personnalisé pour publier les messages vers les clients SSE
+class BroadcastHandler(logging.Handler):
+    def __init__(self, hub):
         super().__init__()
-        self.log_queue = log_queue
+        self.hub = hub
 
     def emit(self, record):
-        # Formater le message et le mettre dans la file d'attente
+        # Formater le message et le publier (chaque client connecté le recevra)
         # Ignorer les messages DEBUG pour ne pas surcharger le frontend
         if record.levelno >= logging.INFO: # Utiliser >= pour la comparaison
-            log_entry = self.format(record)
-            self.log_queue.put(log_entry)
+            try:
+                self.hub.publish(self.format(record))
+            except Exception:
+                self.handleError(record)
 
 # Configurer le logging principal
 log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
@@ -37,9 +51,9 @@ log_level = logging.INFO # Définir le niveau de log principal (INFO et supérie
 stream_handler = logging.StreamHandler()
 stream_handler.setFormatter(log_formatter)
 
-# Configurer le handler pour la file d'attente SSE
-queue_handler = QueueHandler(log_queue)
-queue_handler.setFormatter(log_formatter)
+# Configurer le handler pour la diffusion SSE
+broadcast_handler = BroadcastHandler(log_hub)
+broadcast_handler.setFormatter(log_formatter)
 
 # Obtenir le logger racine et ajouter les handlers
 # Important: Ne pas utiliser basicConfig si on configure les handlers manuellement
@@ -49,7 +63,7 @@ logger.setLevel(log_level)
 if logger.hasHandlers():
     logger.handlers.clear()
 logger.addHandler(stream_handler) # Ajouter le handler console
-logger.addHandler(queue_handler)  # Ajouter le handler pour SSE
+logger.addHandler(broadcast_handler)  # Ajouter le handler pour SSE
 
 # --- Clés API, Paramètres, Mapping, États ---
 try:
@@ -60,6 +74,15 @@ except AttributeError:
     API_KEY = "INVALID_KEY"
     API_SECRET = "INVALID_SECRET"
 SYMBOL = getattr(config, 'SYMBOL', 'BTCUSDT')
+SYMBOLS = list(getattr(config, 'SYMBOLS', None) or [SYMBOL]) # Symboles tradés par le moteur (le premier est le symbole principal)
+SYMBOL_SYNC_WORKERS = getattr(config, 'SYMBOL_SYNC_WORKERS', 8) # Requêtes klines REST simultanées (rattrapage des buffers)
+USE_ASYNC_CLIENT = getattr(config, 'USE_ASYNC_CLIENT', True) # Requêtes d'un cycle en parallèle via le client asyncio
+USE_WEBSOCKET_STREAM = getattr(config, 'USE_WEBSOCKET_STREAM', True) # Klines/prix via WebSocket (sinon polling REST)
+USE_TRADE_STREAM = getattr(config, 'USE_TRADE_STREAM', True) # Prix de chaque transaction (aggTrade) pour les sorties
+EXIT_POLL_INTERVAL = 1 # Sans flux WebSocket : intervalle (s) de lecture des prix des symboles en position
+CLOCK_SYNC_INTERVAL = getattr(config, 'CLOCK_SYNC_INTERVAL', 600) # Intervalle (s) de resynchronisation sur l'heure serveur
+STREAM_STALL_TIMEOUT = getattr(config, 'STREAM_STALL_TIMEOUT', 5) # Délai (s) après la clôture sans bougie du flux avant rattrapage REST
+USE_USER_DATA_STREAM = getattr(config, 'USE_USER_DATA_STREAM', True) # Exécutions et soldes poussés par Binance (sans relecture REST)
 VALID_TIMEFRAMES = ['1m', '3m', '5m', '15m', '30m', '1h', '2h', '4h', '6h', '8h', '12h', '1d', '3d', '1w', '1M']
 TIMEFRAME_CONSTANT_MAP = {
     '1m': 'KLINE_INTERVAL_1MINUTE', '3m': 'KLINE_INTERVAL_3MINUTE', '5m': 'KLINE_INTERVAL_5MINUTE',
@@ -76,7 +99,30 @@ bot_config = {
     "RSI_PERIOD": getattr(config, 'RSI_PERIOD', 14), "RSI_OVERBOUGHT": getattr(config, 'RSI_OVERBOUGHT', 75),
     "RSI_OVERSOLD": getattr(config, 'RSI_OVERSOLD', 25), "VOLUME_AVG_PERIOD": getattr(config, 'VOLUME_AVG_PERIOD', 20),
     "USE_EMA_FILTER": getattr(config, 'USE_EMA_FILTER', True), "USE_VOLUME_CONFIRMATION": getattr(config, 'USE_VOLUME_CONFIRMATION', False),
+    "STOP_LOSS_PERCENT": getattr(config, 'STOP_LOSS_PERCENT', 0.003), "TAKE_PROFIT_PERCENT": getattr(config, 'TAKE_PROFIT_PERCENT', 0.0),
+    "TRAILING_STOP_PERCENT": getattr(config, 'TRAILING_STOP_PERCENT', 0.0), "EXIT_ON_REVERSE_SIGNAL": getattr(config, 'EXIT_ON_REVERSE_SIGNAL', True),
 }
+# Stratégie active (paramètres immuables) : /parameters la remplace par une nouvelle instance,
+# prise en compte par run_bot au début du cycle suivant (à la clôture de bougie)
+active_strategy = strategy.Strategy(strategy.StrategyParams.from_config(bot_config))
+# Stratégies évaluées en parallèle sur les mêmes bougies, sans passer d'ordre (comparaison A/B)
+SHADOW_STRATEGIES = getattr(config, 'SHADOW_STRATEGIES', {}) # {nom: {paramètre: valeur}}
+shadow_strategies = [strategy.Strategy(strategy.StrategyParams.from_config(overrides, base=active_strategy.params), name=name)
+                     for name, overrides in SHADOW_STRATEGIES.items()]
+# Paper trading : ordres du bot exécutés sur des soldes virtuels, au dernier prix du flux (aucun ordre Binance)
+def last_stream_price(symbol):
+    market_stream = bot_state["market_stream"]
+    return market_stream.last_prices.get(symbol) if market_stream is not None else None
+paper_account = paper_trading.PaperAccount(price_source=last_stream_price) if paper_trading.PAPER_TRADING else None
+# Ordres réels suivis par identifiant client (exécutions du user data stream, exposition par symbole)
+orders = order_manager.OrderManager()
+# Positions ouvertes et sorties (TP / SL / stop suiveur évalués à chaque tick de prix ; sans OCO en paper trading)
+exits = exit_engine.ExitEngine(use_oco=False if paper_account else None, broker=paper_account or orders)
+# Stratégies shadow tradées en paper trading, chacune sur son portefeuille virtuel
+shadow_books = {shadow.name: paper_trading.PaperBook(shadow, paper_trading.PaperAccount(name=shadow.name, price_source=last_stream_price))
+                for shadow in shadow_strategies} if paper_trading.PAPER_TRADE_SHADOWS else {}
+# Réveils de la boucle (clôtures de bougie, lecture des prix) en heure serveur Binance
+timers = candle_scheduler.CandleScheduler()
 client = None # Le client global est géré par le wrapper
 def initialize_binance_client():
     global client
@@ -93,18 +139,64 @@ def interval_to_seconds(interval_str):
         elif unit == 'M': return value * 60 * 60 * 24 * 30 # Approximation pour mois
         else: logging.warning(f"Intervalle non reconnu pour conversion secondes: {interval_str}"); return 0
     except (IndexError, ValueError, TypeError): logging.warning(f"Format d'intervalle invalide pour conversion secondes: {interval_str}"); return 0
-# --- État Global du Bot (Statut, Position, etc.) ---
+# --- État par symbole ---
+class SymbolState:
+    """État de trading d'un symbole : règles, position, soldes, buffer de bougies et moteur d'indicateurs."""
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.status = "En attente"
+        self.rules = None               # SymbolRules compilées
+        self.base_asset = ""            # Nom de l'asset de base (ex: BTC)
+        self.quote_asset = "USDT"       # Nom de l'asset de cotation (ex: USDT)
+        self.in_position = False
+        self.current_price = 0.0
+        self.available_balance = 0.0    # Solde Quote Asset (ex: USDT)
+        self.symbol_quantity = 0.0      # Quantité Base Asset (ex: BTC)
+        self.position_quantity = 0.0    # Exposition nette du bot (exécutions de ses ordres, OrderManager)
+        self.average_entry_price = None
+        self.pending_klines = []        # Bougies clôturées reçues du flux, en attente de traitement
+        self.last_signal = 0
+        self.last_candle_time = None    # Close time (ms) de la dernière bougie traitée
+
+    def update_balances(self, account):
+        """Met à jour les soldes depuis un instantané de compte (AccountSnapshot)."""
+        quote_balance = account.free(self.quote_asset)
+        if quote_balance != self.available_balance:
+            logging.info(f"[{self.symbol}] Mise à jour solde {self.quote_asset} : {quote_balance}"); self.available_balance = quote_balance # Frontend
+        base_quantity = account.free(self.base_asset)
+        if base_quantity != self.symbol_quantity:
+            logging.info(f"[{self.symbol}] Mise à jour quantité {self.base_asset} : {base_quantity}"); self.symbol_quantity = base_quantity # Frontend
+
+    def update_position(self, position):
+        """Met à jour l'exposition depuis l'état de position de l'OrderManager (PositionState.to_status())."""
+        self.position_quantity = position['quantity']; self.average_entry_price = position['average_entry_price']
+
+    def to_status(self):
+        return {
+            'status': self.status,
+            'symbol': self.symbol,
+            'in_position': self.in_position,
+            'available_balance': self.available_balance,
+            'current_price': self.current_price,
+            'symbol_quantity': self.symbol_quantity,
+            'position_quantity': self.position_quantity,
+            'average_entry_price': self.average_entry_price,
+            'base_asset': self.base_asset,
+            'quote_asset': self.quote_asset,
+            'last_signal': self.last_signal,
+            'last_candle_time': self.last_candle_time,
+        }
+
+# --- État Global du Bot (Statut, symboles, etc.) ---
 bot_state = {
     "status": "Arrêté",
-    "in_position": False,
-    "available_balance": 0.0, # Solde Quote Asset (ex: USDT)
-    "current_price": 0.0,
-    "symbol_quantity": 0.0,   # Quantité Base Asset (ex: BTC)
-    "base_asset": "",         # Nom de l'asset de base (ex: BTC)
-    "quote_asset": "USDT",    # Nom de l'asset de cotation (ex: USDT)
-    "symbol": SYMBOL,
+    "symbol": SYMBOLS[0],   # Symbole principal (affiché par le frontend)
+    "symbols": {},          # symbole -> SymbolState (rempli au démarrage)
     "timeframe": bot_config["TIMEFRAME_STR"],
     "thread": None,
+    "market_stream": None,  # Flux WebSocket actif (réveillé sur /stop)
+    "user_stream": None,    # User data stream actif (exécutions des ordres, soldes)
     "stop_requested": False
 }
 
@@ -113,21 +205,28 @@ app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
 
 # --- Routes API ---
-@app.route('/status')
-def get_status():
-    """Retourne le statut actuel du bot."""
-    status_data = {
+def build_status():
+    """Statut actuel du bot (symbole principal à la racine, détail par symbole dans 'symbols')."""
+    states = dict(bot_state['symbols'])
+    primary = states.get(bot_state['symbol']) or SymbolState(bot_state['symbol'])
+    status_data = primary.to_status()
+    status_data.update({
         'status': bot_state['status'],
-        'symbol': bot_state['symbol'],
         'timeframe': bot_state['timeframe'],
-        'in_position': bot_state['in_position'],
-        'available_balance': bot_state['available_balance'], # Solde Quote Asset
-        'current_price': bot_state['current_price'],
-        'symbol_quantity': bot_state['symbol_quantity'],     # Quantité Base Asset
-        'base_asset': bot_state['base_asset'],               # Nom Base Asset
-        'quote_asset': bot_state['quote_asset'],             # Nom Quote Asset
-    }
-    return jsonify(status_data)
+        'symbols': {symbol: state.to_status() for symbol, state in states.items()},
+        'positions': exits.to_status(),
+        'strategy': active_strategy.to_status(),
+        'shadow_strategies': {shadow.name: dict(shadow.to_status(), paper=shadow_books[shadow.name].to_status() if shadow.name in shadow_books else None)
+                              for shadow in shadow_strategies},
+        'paper_account': paper_account.to_status() if paper_account else None,
+        'orders': orders.to_status(),
+    })
+    return status_data
+
+@app.route('/status')
+def get_status():
+    """Retourne le statut actuel du bot (voir build_status)."""
+    return jsonify(build_status())
 @app.route('/parameters', methods=['GET'])
 def get_parameters():
     with config_lock: current_config = bot_config.copy()
@@ -135,17 +234,17 @@ def get_parameters():
 
 @app.route('/parameters', methods=['POST'])
 def set_parameters():
-    global bot_config
+    global bot_config, active_strategy
     new_params = request.json
     if not new_params: return jsonify({"success": False, "message": "Aucun paramètre fourni."}), 400
     logging.info(f"Tentative de mise à jour des paramètres: {new_params}") # Ce log ira au frontend
-    restart_recommended = False
+    timeframe_changed = False
     validated_params = {}
     try:
         new_timeframe = str(new_params.get("TIMEFRAME_STR", bot_config["TIMEFRAME_STR"]))
         if new_timeframe not in VALID_TIMEFRAMES: raise ValueError(f"TIMEFRAME_STR invalide.")
         validated_params["TIMEFRAME_STR"] = new_timeframe
-        if new_timeframe != bot_config["TIMEFRAME_STR"]: restart_recommended = True
+        if new_timeframe != bot_config["TIMEFRAME_STR"]: timeframe_changed = True
 
         # --- Utilisation des opérateurs de comparaison corrects ---
         validated_params["RISK_PER_TRADE"] = float(new_params.get("RISK_PER_TRADE", bot_config["RISK_PER_TRADE"]))
@@ -180,22 +279,33 @@ def set_parameters():
 
         validated_params["USE_EMA_FILTER"] = bool(new_params.get("USE_EMA_FILTER", bot_config["USE_EMA_FILTER"]))
         validated_params["USE_VOLUME_CONFIRMATION"] = bool(new_params.get("USE_VOLUME_CONFIRMATION", bot_config["USE_VOLUME_CONFIRMATION"]))
+
+        validated_params["STOP_LOSS_PERCENT"] = float(new_params.get("STOP_LOSS_PERCENT", bot_config["STOP_LOSS_PERCENT"]))
+        if not (0 < validated_params["STOP_LOSS_PERCENT"] < 1): raise ValueError("STOP_LOSS_PERCENT doit être entre 0 et 1 (exclus)")
+
+        validated_params["TAKE_PROFIT_PERCENT"] = float(new_params.get("TAKE_PROFIT_PERCENT", bot_config["TAKE_PROFIT_PERCENT"]))
+        if not (0 <= validated_params["TAKE_PROFIT_PERCENT"] < 1): raise ValueError("TAKE_PROFIT_PERCENT doit être entre 0 (inclus, désactivé) et 1 (exclus)")
+
+        validated_params["TRAILING_STOP_PERCENT"] = float(new_params.get("TRAILING_STOP_PERCENT", bot_config["TRAILING_STOP_PERCENT"]))
+        if not (0 <= validated_params["TRAILING_STOP_PERCENT"] < 1): raise ValueError("TRAILING_STOP_PERCENT doit être entre 0 (inclus, désactivé) et 1 (exclus)")
+
+        validated_params["EXIT_ON_REVERSE_SIGNAL"] = bool(new_params.get("EXIT_ON_REVERSE_SIGNAL", bot_config["EXIT_ON_REVERSE_SIGNAL"]))
     except (ValueError, TypeError) as e:
         logging.error(f"Erreur de validation des paramètres: {e}") # Ce log ira au frontend
         return jsonify({"success": False, "message": f"Paramètres invalides: {e}"}), 400
-    with config_lock: bot_config.update(validated_params); logging.info(f"Paramètres mis à jour avec succès.") # Ce log ira au frontend
-    # Mettre à jour les variables globales de la stratégie (si elles sont utilisées directement)
-    strategy.EMA_SHORT_PERIOD = bot_config["EMA_SHORT_PERIOD"]
-    strategy.EMA_LONG_PERIOD = bot_config["EMA_LONG_PERIOD"]
-    strategy.EMA_FILTER_PERIOD = bot_config["EMA_FILTER_PERIOD"]
-    strategy.RSI_PERIOD = bot_config["RSI_PERIOD"]
-    strategy.RSI_OVERBOUGHT = bot_config["RSI_OVERBOUGHT"]
-    strategy.RSI_OVERSOLD = bot_config["RSI_OVERSOLD"]
-    strategy.VOLUME_AVG_PERIOD = bot_config["VOLUME_AVG_PERIOD"]
-    strategy.USE_EMA_FILTER = bot_config["USE_EMA_FILTER"]
-    strategy.USE_VOLUME_CONFIRMATION = bot_config["USE_VOLUME_CONFIRMATION"]
+    with config_lock:
+        bot_config.update(validated_params)
+        new_params = strategy.StrategyParams.from_config(validated_params, base=active_strategy.params)
+        if new_params != active_strategy.params:
+            # Nouvelle instance (moteurs neufs) : remplace l'active au début du prochain cycle
+            active_strategy = strategy.Strategy(new_params)
+    logging.info(f"Paramètres mis à jour avec succès.") # Ce log ira au frontend
+    notify_status()
     message = "Paramètres mis à jour."
-    if restart_recommended: message += " Un redémarrage du bot est conseillé pour appliquer le nouveau timeframe."
+    if timeframe_changed:
+        # Timeframe agrégé depuis le 1m : bougies déjà en mémoire ; sinon historique téléchargé au prochain cycle
+        resampled = kline_resampler.source_interval(validated_params["TIMEFRAME_STR"]) != validated_params["TIMEFRAME_STR"]
+        message += " Nouveau timeframe appliqué " + ("à la prochaine bougie 1m." if resampled else "au prochain cycle.")
     return jsonify({"success": True, "message": message})
 
 @app.route('/start', methods=['POST'])
@@ -204,7 +314,7 @@ def start_bot_route():
     if bot_state["thread"] is not None and bot_state["thread"].is_alive(): return jsonify({"success": False, "message": "Le bot est déjà en cours."}), 400
     if not initialize_binance_client(): return jsonify({"success": False, "message": "Échec de l'initialisation du client Binance."}), 500
     logging.info("Démarrage du bot demandé...") # Ce log ira au frontend
-    bot_state["status"] = "Démarrage..."; bot_state["stop_requested"] = False
+    bot_state["status"] = "Démarrage..."; bot_state["stop_requested"] = False; notify_status()
     bot_state["thread"] = threading.Thread(target=run_bot, daemon=True); bot_state["thread"].start()
     time.sleep(1); return jsonify({"success": True, "message": "Ordre de démarrage envoyé."})
 
@@ -213,29 +323,105 @@ def stop_bot_route():
     global bot_state
     if bot_state["thread"] is None or not bot_state["thread"].is_alive(): bot_state["status"] = "Arrêté"; return jsonify({"success": False, "message": "Le bot n'est pas en cours."}), 400
     logging.info("Arrêt du bot demandé...") # Ce log ira au frontend
-    bot_state["status"] = "Arrêt..."; bot_state["stop_requested"] = True
+    bot_state["status"] = "Arrêt..."; bot_state["stop_requested"] = True; notify_status()
+    wake_bot()
     return jsonify({"success": True, "message": "Ordre d'arrêt envoyé."})
 
+@app.route('/metrics')
+def get_metrics():
+    """Métriques de latence, d'erreurs API et de consommation du quota Binance (format texte Prometheus)."""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+# --- Flux de statut (SSE) : seuls les champs modifiés sont poussés aux clients ---
+STATUS_PUSH_INTERVAL = getattr(config, 'STATUS_PUSH_INTERVAL', 0.5) # Fenêtre de regroupement des changements rapides (prix)
+STATUS_REFRESH_INTERVAL = 2 # Détection des changements non signalés par notify_status()
+status_hub = BroadcastHub(256)
+_status_changed = threading.Event()
+_status_publisher = None
+_status_publisher_lock = threading.Lock()
+
+def notify_status():
+    """Signale un changement d'état à pousser aux clients de /stream_status (non bloquant)."""
+    _status_changed.set()
+
+def diff_status(old, new):
+    """Champs de new différents de old (récursif pour 'symbols' ; None pour un champ disparu)."""
+    diff = {}
+    for key, value in new.items():
+        if isinstance(value, dict) and isinstance(old.get(key), dict):
+            nested = diff_status(old[key], value)
+            if nested: diff[key] = nested
+        elif key not in old or old[key] != value:
+            diff[key] = value
+    for key in old:
+        if key not in new: diff[key] = None
+    return diff
+
+def publish_status_changes():
+    """Boucle du thread de diffusion : publie les champs modifiés, en regroupant les changements rapprochés."""
+    last_status = build_status()
+    while True:
+        if _status_changed.wait(STATUS_REFRESH_INTERVAL):
+            time.sleep(STATUS_PUSH_INTERVAL) # Plusieurs ticks de prix dans la fenêtre -> un seul envoi
+            _status_changed.clear()
+        try:
+            current = build_status()
+            changes = diff_status(last_status, current)
+            if changes:
+                status_hub.publish(json.dumps(changes)); last_status = current
+        except Exception:
+            logging.exception("Erreur lors de la diffusion du statut.")
+
+def ensure_status_publisher():
+    """Démarre le thread de diffusion du statut au premier client connecté."""
+    global _status_publisher
+    with _status_publisher_lock:
+        if _status_publisher is None or not _status_publisher.is_alive():
+            _status_publisher = threading.Thread(target=publish_status_changes, name="StatusPublisher", daemon=True)
+            _status_publisher.start()
+
+@app.route('/stream_status')
+def stream_status():
+    """Flux SSE du statut : un événement 'snapshot' complet à la connexion, puis les champs modifiés."""
+    ensure_status_publisher()
+    cursor = status_hub.last_id # Avant l'instantané : aucun changement ultérieur ne peut être manqué
+    def generate(cursor):
+        yield format_sse(json.dumps(build_status()), event='snapshot')
+        while True:
+            entries, dropped, cursor = status_hub.read(cursor, timeout=15)
+            if dropped:
+                # Client trop lent : un nouvel instantané remplace les changements perdus
+                cursor = status_hub.last_id
+                yield format_sse(json.dumps(build_status()), event='snapshot')
+            elif entries:
+                yield ''.join(format_sse(changes, event_id=entry_id) for entry_id, changes in entries)
+            else:
+                yield ": keep-alive\n\n"
+    return Response(generate(cursor), mimetype='text/event-stream')
+
 # --- ROUTE POUR LE STREAMING DES LOGS ---
 @app.route('/stream_logs')
 def stream_logs():
-    def generate():
+    # Reprise après reconnexion : le navigateur renvoie l'id du dernier log reçu
+    cursor = log_hub.cursor(request.headers.get('Last-Event-ID'), replay=LOG_REPLAY_ON_CONNECT)
+    def generate(cursor):
         # Envoyer un message initial pour confirmer la connexion au frontend
         yield f"data: Connexion au flux de logs établie.\n\n"
         logging.info("Client connecté au flux de logs.") # Log pour le backend uniquement
         try:
             while True:
-                # Attendre un message de la file d'attente (bloquant avec timeout)
-                try:
-                    log_entry = log_queue.get(timeout=1) # Timeout pour vérifier périodiquement
-                    # Envoyer au format SSE: "data: message\n\n"
-                    yield f"data: {log_entry}\n\n"
-                    log_queue.task_done() # Marquer la tâche comme terminée
-                except queue.Empty:
+                # Attendre les logs postérieurs au curseur de ce client (bloquant avec timeout)
+                entries, dropped, cursor = log_hub.read(cursor, timeout=15)
+                if dropped:
+                    # Client trop lent : les logs sortis du buffer sont perdus pour lui seul
+                    yield format_sse(f"[{dropped} message(s) de log non transmis]")
+                if entries:
+                    # Tous les logs disponibles en un seul envoi, avec leur id pour Last-Event-ID
+                    yield ''.join(format_sse(log_entry, event_id=entry_id) for entry_id, log_entry in entries)
+                else:
                     # Envoyer un commentaire keep-alive pour maintenir la connexion ouverte
                     # si aucun log n'est généré pendant un certain temps
                     yield ": keep-alive\n\n"
-                    continue
         except GeneratorExit:
             # Se produit lorsque le client se déconnecte
             logging.info("Client déconnecté du flux de logs.")
@@ -243,49 +429,267 @@ def stream_logs():
             # Nettoyage si nécessaire
             pass
     # Retourner une réponse en streaming avec le bon mimetype
-    return Response(generate(), mimetype='text/event-stream')
+    return Response(generate(cursor), mimetype='text/event-stream')
 # --- FIN ROUTE LOGS ---
 
 
 # --- Boucle Principale du Bot ---
+def wake_bot():
+    """Interrompt l'attente de la boucle du bot (minuteurs et flux WebSocket), ex: arrêt demandé."""
+    timers.wake()
+    market_stream = bot_state["market_stream"]
+    if market_stream is not None: market_stream.wake()
+
+def wait_for_closed_klines(market_stream, states):
+    """
+    Attend la clôture de la prochaine bougie sur le flux WebSocket (interruptible par /stop).
+    Les bougies clôturées sont rangées dans le SymbolState de leur symbole ; à chaque événement
+    de prix reçu pendant l'attente, le prix courant est mis à jour et les sorties de la position
+    éventuelle (TP / SL / stop suiveur) sont évaluées.
+    Si aucune bougie n'arrive STREAM_STALL_TIMEOUT s après la clôture attendue (heure serveur),
+    l'attente prend fin : le cycle suivant rattrape les buffers par REST.
+
+    Returns:
+        int: Nombre de bougies clôturées reçues (0 si arrêt demandé ou flux muet).
+    """
+    received = 0
+    batch_deadline = None
+    clock = binance_client_wrapper.server_clock
+    stall_at = candle_scheduler.next_candle_close_ms(market_stream.interval, clock.now_ms(), STREAM_STALL_TIMEOUT * 1000) if STREAM_STALL_TIMEOUT else None
+    while not bot_state["stop_requested"]:
+        # Après la première bougie, laisser un court délai aux autres symboles (leurs bougies
+        # clôturent au même instant) puis traiter le lot, même si les prix continuent d'arriver
+        if batch_deadline is not None:
+            timeout = batch_deadline - time.monotonic()
+            if timeout <= 0: break
+        elif stall_at is not None:
+            timeout = (stall_at - clock.now_ms()) / 1000
+            if timeout <= 0:
+                logging.warning(f"Aucune bougie {market_stream.interval} reçue du flux après la clôture, rattrapage REST.") # Frontend
+                break
+        else:
+            timeout = None # Intervalle sans durée fixe (1M) ou détection désactivée : attente de l'événement de clôture
+        event = market_stream.get_event(timeout=timeout)
+        if event is None:
+            continue
+        state = states.get(event.get('symbol'))
+        if state is None:
+            continue
+        if event['type'] == 'ticker':
+            state.current_price = event['price']; notify_status()
+            if has_open_position(state): check_exits(state, event['price'])
+        elif event['type'] == 'kline_closed':
+            state.pending_klines.append(event['kline']); received += 1
+            if batch_deadline is None: batch_deadline = time.monotonic() + 0.05
+    return received
+
+def get_account(max_age=None):
+    """Instantané des soldes : compte Binance, ou soldes virtuels en paper trading."""
+    if paper_account is not None:
+        return paper_account.snapshot()
+    return binance_client_wrapper.get_account_snapshot(max_age=max_age)
+
+def has_open_position(state):
+    """True si le bot ou une stratégie shadow (paper trading) a une position ouverte sur le symbole."""
+    return state.in_position or any(book.has_position(state.symbol) for book in shadow_books.values())
+
+def check_exits(state, price):
+    """Évalue TP / SL / stop suiveur des positions du symbole (bot et stratégies shadow) au prix du dernier tick."""
+    try:
+        if paper_account is not None: paper_account.update_price(state.symbol, price)
+        for book in shadow_books.values(): book.on_price(state.symbol, price)
+        handle_exit(state, exits.on_price(state.symbol, price))
+        state.in_position = exits.has_position(state.symbol) # Entrée en attente abandonnée (ordre expiré)
+    except Exception:
+        logging.exception(f"[{state.symbol}] Erreur lors de l'évaluation des sorties")
+
+def handle_exit(state, exit_result):
+    """Met à jour l'état du symbole après une sortie exécutée (exit_result None : rien à faire)."""
+    if exit_result is None:
+        return
+    state.in_position = exits.has_position(state.symbol)
+    refresh_balances()
+    notify_status()
+
+def refresh_balances():
+    """Relit les soldes après un ordre, sauf quand le user data stream les pousse déjà (on_order_event)."""
+    if paper_account is None and orders.stream_connected:
+        return
+    account = get_account() # Instantané invalidé par place_order : un appel get_account
+    if account is not None:
+        for state in bot_state["symbols"].values(): state.update_balances(account)
+
+def on_order_event(event):
+    """
+    Listener de l'OrderManager (appelé depuis le thread du user data stream ou la boucle du bot) :
+    exposition du symbole à chaque exécution, soldes à chaque événement de compte.
+    """
+    states = bot_state["symbols"]
+    if event['type'] == 'fill':
+        state = states.get(event['symbol'])
+        if state is not None: state.update_position(event['position'])
+    elif event['type'] == 'account':
+        account = binance_client_wrapper.get_cached_account_snapshot()
+        if account is not None:
+            for state in states.values(): state.update_balances(account)
+    notify_status()
+
+orders.add_listener(on_order_event)
+
+def wait_for_next_candle(states, interval_str, interval_seconds):
+    """
+    Sans flux WebSocket : attend la clôture de la prochaine bougie en heure serveur (interruptible
+    par /stop), en lisant chaque EXIT_POLL_INTERVAL le prix des symboles en position pour évaluer
+    leurs sorties. Le thread dort jusqu'au prochain minuteur échu (clôture ou lecture des prix).
+    """
+    try:
+        timers.schedule_candle_close('candle', interval_str)
+    except ValueError:
+        if not timers.is_scheduled('candle'): timers.schedule_every('candle', interval_seconds) # 1M : durée approximative
+    while not bot_state["stop_requested"]:
+        in_position = [state for state in states.values() if has_open_position(state)]
+        if not in_position: timers.cancel('exits')
+        elif not timers.is_scheduled('exits'): timers.schedule_every('exits', EXIT_POLL_INTERVAL)
+        due = timers.wait()
+        if 'candle' in due:
+            return
+        if 'exits' in due and in_position:
+            prices = binance_client_wrapper.get_ticker_prices([state.symbol for state in in_position]) or {}
+            for state in in_position:
+                if state.symbol in prices:
+                    state.current_price = prices[state.symbol]; check_exits(state, prices[state.symbol])
+
+def prepare_symbol_buffer(state, interval, required_limit, use_stream):
+    """
+    Prépare la mise à jour du buffer de bougies d'un symbole : les bougies livrées par le flux
+    suffisent si disponibles ; sinon (ou en cas de trou) un rattrapage REST est nécessaire,
+    limité aux bougies manquantes. Un timeframe agrégé depuis le 1m s'initialise depuis le
+    buffer 1m du symbole, sans appel REST s'il couvre la fenêtre.
+
+    Returns:
+        tuple: (buffer, klines du flux en attente, rattrapage REST nécessaire)
+    """
+    candle_buffer = kline_resampler.get_buffer(state.symbol, interval, required_limit)
+    candle_buffer.load_from_store() # Démarrage à chaud (stockage local, ou buffer 1m pour un timeframe agrégé)
+    pending, state.pending_klines = state.pending_klines, []
+    needs_rest = not use_stream or len(candle_buffer) == 0 or candle_buffer.is_behind(pending) # Trou entre l'historique et le flux
+    return candle_buffer, pending, needs_rest
+
+def fetch_cycle_data(price_symbols, buffers, sync_pool):
+    """
+    Phase de récupération d'un cycle : prix manquants (un seul appel pour tous les symboles),
+    instantané des soldes et rattrapage des buffers de klines.
+    Avec le client asyncio, toutes ces requêtes partent en parallèle (un seul aller-retour).
+
+    Returns:
+        tuple: (prix {symbole: float}, AccountSnapshot ou None, nouvelles klines par buffer)
+    """
+    fetch_account = paper_account is None # Soldes virtuels en paper trading : pas d'appel get_account
+    if USE_ASYNC_CLIENT:
+        prices, account, synced = async_client_wrapper.run(async_client_wrapper.fetch_cycle_data(price_symbols, buffers, fetch_account=fetch_account))
+    else:
+        prices = binance_client_wrapper.get_ticker_prices(price_symbols) if price_symbols else None
+        account = binance_client_wrapper.get_account_snapshot() if fetch_account else None # Un seul appel (ou cache) pour tous les soldes du cycle
+        synced = list(sync_pool.map(lambda candle_buffer: candle_buffer.sync(), buffers))
+    if not fetch_account: account = get_account()
+    return prices or {}, account, synced
+
+def process_symbol(state, candle_buffer, new_klines, timeframe_str, risk_per_trade, capital_allocation,
+                   cycle_strategy, shadows=()):
+    """
+    Met à jour les indicateurs d'un symbole et applique la logique d'entrée/sortie sur une nouvelle bougie clôturée.
+    Seule cycle_strategy passe des ordres réels ; les stratégies shadow évaluent les mêmes bougies et
+    tradent sur leur portefeuille virtuel (shadow_books) si PAPER_TRADE_SHADOWS.
+    """
+    # Indicateurs/Signaux (incrémental : O(1) par nouvelle bougie clôturée ; warm-up depuis le buffer
+    # au premier cycle d'une instance ou après un changement de timeframe)
+    with metrics.CYCLE_PHASE_SECONDS.time(phase='indicators'):
+        current_data = cycle_strategy.update(state.symbol, candle_buffer, new_klines, timeframe_str)
+        for shadow in shadows:
+            shadow_data = shadow.update(state.symbol, candle_buffer, new_klines, timeframe_str)
+            book = shadow_books.get(shadow.name)
+            if shadow_data is not None and shadow_data['signal'] != 0:
+                logging.info(f"[{state.symbol}] Signal {'BUY' if shadow_data['signal'] == 1 else 'SELL'} de la stratégie shadow '{shadow.name}' ({'paper trading' if book else 'sans ordre'}).") # Frontend
+            if shadow_data is not None and book is not None and state.rules is not None:
+                book.on_candle(state.symbol, shadow_data, risk_per_trade, capital_allocation, state.rules)
+    if cycle_strategy.last_row(state.symbol) is None:
+        logging.warning(f"[{state.symbol}] Impossible de calculer indicateurs/signaux, attente."); state.status = "Warm-up" # Frontend
+        return
+    state.status = "En cours"
+
+    # Logique d'Entrée/Sortie (uniquement sur une nouvelle bougie clôturée)
+    if current_data is None:
+        logging.debug(f"[{state.symbol}] Aucune nouvelle bougie clôturée depuis le dernier cycle.") # DEBUG
+        return
+    state.last_signal = current_data['signal']; state.last_candle_time = current_data['Close time']
+    if state.last_candle_time:
+        metrics.CANDLE_TO_SIGNAL_SECONDS.observe(max(0.0, binance_client_wrapper.server_clock.now_ms() / 1000 - (int(state.last_candle_time) + 1) / 1000), symbol=state.symbol)
+    if state.in_position:
+        # OCO exécuté depuis le dernier tick vérifié, puis sortie sur signal inverse
+        with metrics.CYCLE_PHASE_SECONDS.time(phase='signal'):
+            handle_exit(state, exits.sync_oco(state.symbol) or cycle_strategy.check_exit_conditions(current_data, state.symbol, exits))
+    if not state.in_position:
+        # check_entry_conditions logue le signal et le placement d'ordre (via le wrapper)
+        with metrics.CYCLE_PHASE_SECONDS.time(phase='signal'):
+            order = cycle_strategy.check_entry_conditions(current_data, state.symbol, risk_per_trade, capital_allocation, state.available_balance, state.rules,
+                                                          broker=paper_account or orders)
+        if order:
+            # Suivi de la position (TP / SL / stop suiveur à chaque tick, OCO éventuel ; ordre en attente avec latence simulée)
+            exits.open_position(state.symbol, order, cycle_strategy.params, state.rules)
+            state.in_position = exits.has_position(state.symbol)
+            refresh_balances()
+
 def run_bot():
     global bot_state, bot_config
     with config_lock: initial_config = bot_config.copy()
     initial_timeframe_str = initial_config["TIMEFRAME_STR"]
     # Ce log ira au frontend via le QueueHandler
-    logging.info(f"Démarrage effectif du bot pour {SYMBOL} sur {initial_timeframe_str}")
+    logging.info(f"Démarrage effectif du bot pour {', '.join(SYMBOLS)} sur {initial_timeframe_str}")
+    if paper_account is not None: logging.info(f"Paper trading : ordres simulés sur les soldes virtuels {paper_account.initial_balances}") # Frontend
     bot_state["status"] = "En cours"; bot_state["timeframe"] = initial_timeframe_str
+    market_stream = None # Un seul flux WebSocket pour tous les symboles
+    stream_stalled = False # Flux muet à la dernière clôture : rattrapage REST de tous les symboles
+    cycle_strategy = None # Instance de stratégie utilisée pendant le cycle en cours
+    sync_pool = ThreadPoolExecutor(max_workers=max(1, min(SYMBOL_SYNC_WORKERS, len(SYMBOLS))), thread_name_prefix="KlineSync")
     try:
-        # --- Récupérer infos symbole et assets ---
-        symbol_info = binance_client_wrapper.get_symbol_info(SYMBOL)
-        if not symbol_info: raise Exception(f"Impossible de récupérer les infos pour {SYMBOL}.")
-        bot_state['base_asset'] = symbol_info.get('baseAsset', '')
-        bot_state['quote_asset'] = symbol_info.get('quoteAsset', 'USDT')
-        if not bot_state['base_asset']: raise Exception(f"Impossible de déterminer l'asset de base pour {SYMBOL}.")
-        logging.info(f"Asset de base: {bot_state['base_asset']}, Asset de cotation: {bot_state['quote_asset']}") # Frontend
-        # --- Fin récupération infos symbole ---
-
-        # --- Récupérer soldes initiaux ---
-        initial_quote_balance = binance_client_wrapper.get_account_balance(asset=bot_state['quote_asset'])
-        if initial_quote_balance is None: raise Exception(f"Impossible de récupérer le solde initial {bot_state['quote_asset']}.")
-        bot_state["available_balance"] = initial_quote_balance
-        logging.info(f"Solde {bot_state['quote_asset']} initial : {bot_state['available_balance']}") # Frontend
-
-        initial_base_quantity = binance_client_wrapper.get_account_balance(asset=bot_state['base_asset'])
-        if initial_base_quantity is None: initial_base_quantity = 0.0 # Considérer 0 si erreur ou non possédé
-        bot_state["symbol_quantity"] = initial_base_quantity
-        logging.info(f"Quantité {bot_state['base_asset']} initiale : {bot_state['symbol_quantity']}") # Frontend
+        # --- Récupérer infos symboles et assets (un seul exchangeInfo si plusieurs symboles) ---
+        if len(SYMBOLS) > 1: symbol_rules.load_all_symbol_rules()
+        states = {}
+        for symbol in SYMBOLS:
+            rules = symbol_rules.get_symbol_rules(symbol, max_age=None if len(SYMBOLS) > 1 else 0) # Filtres compilés une fois, rafraîchis périodiquement
+            if not rules or not rules.base_asset:
+                logging.error(f"Impossible de récupérer les infos pour {symbol}, symbole ignoré."); continue # Frontend
+            state = SymbolState(symbol)
+            state.rules = rules; state.base_asset = rules.base_asset; state.quote_asset = rules.quote_asset or 'USDT'
+            state.in_position = exits.has_position(symbol) # Position ouverte avant un arrêt/redémarrage du bot
+            state.update_position(orders.get_position(symbol))
+            logging.info(f"[{symbol}] Asset de base: {state.base_asset}, Asset de cotation: {state.quote_asset}") # Frontend
+            states[symbol] = state
+        if not states: raise Exception(f"Impossible de récupérer les infos pour {', '.join(SYMBOLS)}.")
+        bot_state["symbols"] = states
+        # --- Fin récupération infos symboles ---
+
+        # --- Récupérer soldes initiaux (un seul appel get_account pour tous les symboles) ---
+        account = get_account(max_age=0)
+        if account is None: raise Exception("Impossible de récupérer les soldes initiaux.")
+        for state in states.values(): state.update_balances(account)
         # --- Fin récupération soldes initiaux ---
+        if paper_account is None and USE_USER_DATA_STREAM:
+            # Exécutions et soldes poussés par Binance : plus de get_account après chaque ordre
+            bot_state["user_stream"] = binance_client_wrapper.UserDataStream(orders.on_stream_event); bot_state["user_stream"].start()
+        binance_client_wrapper.server_clock.sync() # Horloge serveur pour les échéances de bougie
 
         while not bot_state["stop_requested"]:
-            with config_lock: current_config = bot_config.copy()
+            with config_lock: current_config = bot_config.copy(); latest_strategy = active_strategy
             local_timeframe_str = current_config["TIMEFRAME_STR"]
             local_risk_per_trade = current_config["RISK_PER_TRADE"]
             local_capital_allocation = current_config["CAPITAL_ALLOCATION"]
-            # Récupérer les paramètres de stratégie actuels
-            local_ema_short = current_config["EMA_SHORT_PERIOD"]; local_ema_long = current_config["EMA_LONG_PERIOD"]
-            local_rsi_period = current_config["RSI_PERIOD"]; use_ema_filter = current_config["USE_EMA_FILTER"]
-            ema_filter_period = current_config["EMA_FILTER_PERIOD"]
+            # Stratégie du cycle : une instance remplacée par /parameters n'est prise en compte qu'ici,
+            # entre deux bougies (la nouvelle instance s'initialise depuis les buffers)
+            if latest_strategy is not cycle_strategy:
+                if cycle_strategy is not None:
+                    logging.info(f"Nouveaux paramètres de stratégie appliqués : {latest_strategy.params.to_config()}") # Frontend
+                cycle_strategy = latest_strategy
 
             # Obtenir la constante Binance pour le timeframe
             binance_constant_name = TIMEFRAME_CONSTANT_MAP.get(local_timeframe_str)
@@ -295,88 +699,92 @@ def run_bot():
                 local_timeframe_str = '5m'; local_timeframe_interval = BinanceClient.KLINE_INTERVAL_5MINUTE
             # Mettre à jour l'état si le timeframe a changé (pour affichage)
             if bot_state["timeframe"] != local_timeframe_str:
-                 logging.info(f"Changement de timeframe détecté pour {local_timeframe_str}. Redémarrage conseillé.") # Frontend
+                 logging.info(f"Changement de timeframe détecté pour {local_timeframe_str}.") # Frontend
                  bot_state["timeframe"] = local_timeframe_str
+            # (Re)démarrer le flux WebSocket au premier cycle ou si le timeframe change d'intervalle source
+            # (klines 1m pour tous les timeframes agrégés : pas de redémarrage entre eux)
+            stream_interval = kline_resampler.source_interval(local_timeframe_interval)
+            if USE_WEBSOCKET_STREAM and (market_stream is None or market_stream.interval != stream_interval):
+                if market_stream is not None: market_stream.stop()
+                market_stream = binance_client_wrapper.MarketStream(list(states), stream_interval, trades=USE_TRADE_STREAM); market_stream.start()
+                bot_state["market_stream"] = market_stream
+                for state in states.values(): state.pending_klines = []
             try:
-                 # --- Mise à jour Prix et Soldes ---
-                # CORRECTION: Call get_symbol_ticker and extract price
-                ticker_info = binance_client_wrapper.get_symbol_ticker(symbol=SYMBOL)
-                current_price = None # Default to None
-                if ticker_info and 'price' in ticker_info:
-                    try:
-                        current_price = float(ticker_info['price'])
-                        bot_state["current_price"] = current_price
-                        logging.info(f"Prix actuel {SYMBOL}: {current_price}") # Frontend
-                    except (ValueError, TypeError) as price_err:
-                        logging.warning(f"Impossible de convertir le prix '{ticker_info['price']}' en float: {price_err}") # Frontend
-                else:
-                    logging.warning(f"Impossible de récupérer les informations de ticker ou le prix pour {SYMBOL}") # Frontend
-                    if ticker_info:
-                         logging.warning(f"Ticker info reçu: {ticker_info}") # Log pour débogage
-
-
-                current_quote_balance = binance_client_wrapper.get_account_balance(asset=bot_state['quote_asset'])
-                if current_quote_balance is not None and current_quote_balance != bot_state["available_balance"]:
-                    logging.info(f"Mise à jour solde {bot_state['quote_asset']} : {current_quote_balance}"); bot_state["available_balance"] = current_quote_balance # Frontend
-
-                current_base_quantity = binance_client_wrapper.get_account_balance(asset=bot_state['base_asset'])
-                if current_base_quantity is not None and current_base_quantity != bot_state["symbol_quantity"]:
-                    logging.info(f"Mise à jour quantité {bot_state['base_asset']} : {current_base_quantity}"); bot_state["symbol_quantity"] = current_base_quantity # Frontend
+                cycle_start = time.perf_counter()
+                binance_client_wrapper.server_clock.sync(max_age=CLOCK_SYNC_INTERVAL) # Dérive de l'horloge locale
+                if paper_account is None: orders.reconcile() # Ordres sans nouvelles (flux coupé, rapport ou réponse perdus)
+                with metrics.CYCLE_PHASE_SECONDS.time(phase='rules'):
+                    # Périmées : toutes rechargées en un seul exchangeInfo
+                    for symbol, rules in symbol_rules.refresh_symbol_rules(list(states)).items():
+                        states[symbol].rules = rules or states[symbol].rules
+
+                # --- Mise à jour Prix, Soldes et Klines ---
+                # Prix déjà reçus via le flux ticker ; seuls les autres sont demandés
+                stream_prices = dict(market_stream.last_prices) if market_stream is not None else {}
+                missing = [symbol for symbol in states if symbol not in stream_prices]
+                # Buffers à mettre à jour : tous sans flux, sinon ceux qui ont reçu une bougie (ou à initialiser)
+                required_limit = max(instance.required_history() for instance in [cycle_strategy, *shadow_strategies])
+                due = [state for state in states.values()
+                       if market_stream is None or stream_stalled or state.pending_klines
+                       or cycle_strategy.needs_warmup(state.symbol, local_timeframe_str)]
+                prepared = [prepare_symbol_buffer(state, local_timeframe_interval, required_limit, market_stream is not None) for state in due]
+                rest_buffers = [candle_buffer for candle_buffer, _, needs_rest in prepared if needs_rest]
+                with metrics.CYCLE_PHASE_SECONDS.time(phase='fetch'):
+                    prices, account, synced = fetch_cycle_data(missing, rest_buffers, sync_pool)
+                rest_klines = dict(zip((id(candle_buffer) for candle_buffer in rest_buffers), synced))
+
+                stream_prices.update(prices)
+                for symbol, state in states.items():
+                    if symbol in stream_prices:
+                        state.current_price = stream_prices[symbol]
+                        if paper_account is not None: paper_account.update_price(symbol, state.current_price)
+                        for book in shadow_books.values(): book.account.update_price(symbol, state.current_price)
+                    else: logging.warning(f"Impossible de récupérer le prix pour {symbol}") # Frontend
+                logging.info("Prix actuels: " + ", ".join(f"{symbol}={state.current_price}" for symbol, state in states.items())) # Frontend
+                if account is not None:
+                    for state in states.values(): state.update_balances(account)
+                notify_status()
                 # --- Fin Mise à jour ---
 
-                # 1. Récupérer Klines
-                required_limit = max(local_ema_long, ema_filter_period if use_ema_filter else 0, local_rsi_period) + 5
-                klines = binance_client_wrapper.get_klines(SYMBOL, local_timeframe_interval, limit=required_limit)
-                if not klines: logging.warning("Aucune donnée kline reçue, attente..."); time.sleep(30); continue # Frontend
-
-                # 2. Calculer Indicateurs/Signaux
-                signals_df = strategy.calculate_indicators_and_signals(klines)
-                if signals_df is None or signals_df.empty: logging.warning("Impossible de calculer indicateurs/signaux, attente."); time.sleep(30); continue # Frontend
-                current_data = signals_df.iloc[-1]
-                # logging.debug(f"Dernière bougie ({current_data['Close time']}): Close={current_data['Close']}, Signal={current_data['signal']}") # DEBUG
-
-                # 3. Logique d'Entrée/Sortie
-                if not bot_state["in_position"]:
-                    # check_entry_conditions logue le signal et le placement d'ordre (via le wrapper)
-                    entered = strategy.check_entry_conditions(current_data, SYMBOL, local_risk_per_trade, local_capital_allocation, bot_state["available_balance"], symbol_info)
-                    if entered:
-                        bot_state["in_position"] = True
-                        # Rafraîchir les deux soldes après une entrée réussie
-                        refreshed_quote_balance = binance_client_wrapper.get_account_balance(asset=bot_state['quote_asset'])
-                        if refreshed_quote_balance is not None: bot_state["available_balance"] = refreshed_quote_balance
-                        refreshed_base_quantity = binance_client_wrapper.get_account_balance(asset=bot_state['base_asset'])
-                        if refreshed_base_quantity is not None: bot_state["symbol_quantity"] = refreshed_base_quantity
-                else:
-                    # logging.debug(f"En position pour {SYMBOL}. Vérification sortie...") # DEBUG
-                    # Implémenter la logique de sortie ici, par exemple:
-                    # closed = strategy.check_exit_conditions(current_data, SYMBOL, bot_state["symbol_quantity"], symbol_info)
-                    # if closed:
-                    #     bot_state["in_position"] = False
-                    #     # Rafraîchir les deux soldes après une sortie réussie
-                    #     refreshed_quote_balance = binance_client_wrapper.get_account_balance(asset=bot_state['quote_asset'])
-                    #     if refreshed_quote_balance is not None: bot_state["available_balance"] = refreshed_quote_balance
-                    #     refreshed_base_quantity = binance_client_wrapper.get_account_balance(asset=bot_state['base_asset'])
-                    #     if refreshed_base_quantity is not None: bot_state["symbol_quantity"] = refreshed_base_quantity
-                    pass # Placeholder pour la logique de sortie
+                # 2-3. Indicateurs, signaux et entrées/sorties, symbole par symbole
+                for state, (candle_buffer, pending, needs_rest) in zip(due, prepared):
+                    if bot_state["stop_requested"]: break
+                    new_klines = rest_klines[id(candle_buffer)] if needs_rest else []
+                    if pending:
+                        # Bougies clôturées livrées par le flux (ou par son backfill REST) : pas d'appel get_klines
+                        with metrics.CYCLE_PHASE_SECONDS.time(phase='ingest'):
+                            new_klines = (new_klines or []) + candle_buffer.ingest(pending)
+                    if new_klines is None or len(candle_buffer) == 0:
+                        logging.warning(f"[{state.symbol}] Aucune donnée kline reçue, attente..."); state.status = "Données indisponibles"; continue # Frontend
+                    try:
+                        process_symbol(state, candle_buffer, new_klines, local_timeframe_str, local_risk_per_trade, local_capital_allocation,
+                                       cycle_strategy, shadow_strategies)
+                    except (BinanceAPIException, BinanceRequestException):
+                        raise
+                    except Exception as e:
+                        # Une erreur sur un symbole ne bloque pas les autres
+                        logging.exception(f"[{state.symbol}] Erreur inattendue lors du traitement"); state.status = "Erreur Interne" # Frontend
+                bot_state["status"] = "En cours"; notify_status()
+                metrics.CYCLE_PHASE_SECONDS.observe(time.perf_counter() - cycle_start, phase='cycle') # Cycle complet, hors attente
 
                 # 4. Attendre la prochaine bougie
                 if bot_state["stop_requested"]: break
 
-                # logging.debug("Cycle terminé, calcul attente prochaine bougie...") # DEBUG
                 interval_seconds = interval_to_seconds(local_timeframe_str)
-                if interval_seconds > 0:
-                    current_time_s = time.time(); time_to_next_candle_s = interval_seconds - (current_time_s % interval_seconds) + 1
-                    # logging.debug(f"Attente de {time_to_next_candle_s:.2f}s...") # DEBUG
-                    sleep_interval = 1; end_sleep = time.time() + time_to_next_candle_s
-                    # Boucle de sommeil interruptible
-                    while time.time() < end_sleep and not bot_state["stop_requested"]:
-                        time.sleep(min(sleep_interval, max(0, end_sleep - time.time()))) # Attendre au max le temps restant
+                if market_stream is not None:
+                    # Réveil sur l'événement de clôture de bougie du flux (quelques ms après la clôture)
+                    stream_stalled = wait_for_closed_klines(market_stream, states) == 0
+                elif interval_seconds > 0:
+                    wait_for_next_candle(states, local_timeframe_interval, interval_seconds) # Réveil à la clôture (heure serveur)
                 else:
                     logging.warning(f"Intervalle de sommeil invalide pour {local_timeframe_str}. Attente 60s."); time.sleep(60) # Frontend
             except (BinanceAPIException, BinanceRequestException) as e:
                 logging.error(f"Erreur API/Request Binance: {e}") # Frontend
                 if isinstance(e, BinanceAPIException) and e.status_code == 401:
                     logging.error("Erreur Auth Binance (clés API invalides?). Arrêt."); bot_state["status"] = "Erreur Auth"; bot_state["stop_requested"] = True # Frontend
+                elif isinstance(e, BinanceAPIException) and e.status_code in (418, 429):
+                    # Le limiteur de débit suspend déjà toutes les requêtes jusqu'à la fin du Retry-After
+                    bot_state["status"] = "Limite API"; time.sleep(1); continue
                 else:
                     bot_state["status"] = "Erreur API/Req"
                 time.sleep(60) # Attendre avant de réessayer en cas d'erreur API
@@ -385,7 +793,16 @@ def run_bot():
     except Exception as e:
         logging.exception(f"Erreur majeure lors de l'initialisation de run_bot"); bot_state["status"] = "Erreur Init" # Frontend (avec traceback)
     finally:
-        logging.info("Boucle du bot terminée."); bot_state["status"] = "Arrêté"; bot_state["in_position"] = False; bot_state["thread"] = None # Frontend
+        if market_stream is not None: market_stream.stop()
+        bot_state["market_stream"] = None
+        if bot_state["user_stream"] is not None: bot_state["user_stream"].stop()
+        bot_state["user_stream"] = None
+        timers.cancel('candle'); timers.cancel('exits')
+        sync_pool.shutdown(wait=False)
+        for state in bot_state["symbols"].values(): state.in_position = exits.has_position(state.symbol); state.status = "Arrêté"
+        unmanaged = [symbol for symbol, position in exits.to_status().items() if position['oco_order_list_id'] is None]
+        if unmanaged: logging.warning(f"Positions ouvertes sans OCO, non surveillées pendant l'arrêt : {', '.join(unmanaged)}") # Frontend
+        logging.info("Boucle du bot terminée."); bot_state["status"] = "Arrêté"; bot_state["thread"] = None; notify_status() # Frontend
 
 # --- Démarrage Application ---
 if __name__ == "__main__":
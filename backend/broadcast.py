@@ -0,0 +1,89 @@
+import itertools
+import threading
+from collections import deque
+
+# Diffusion d'événements vers plusieurs clients SSE (Server-Sent Events).
+# Les entrées publiées sont numérotées et conservées dans un buffer circulaire
+# borné ; chaque abonné ne garde qu'un curseur (l'id de la dernière entrée lue).
+# La mémoire reste donc constante quel que soit le nombre de clients connectés
+# (ou en l'absence de client), chaque client reçoit toutes les entrées, et un
+# client qui se reconnecte reprend à son en-tête Last-Event-ID.
+# Un client trop lent pour suivre perd les entrées sorties du buffer : il est
+# averti du nombre d'entrées manquées au lieu de ralentir les autres.
+
+
+class BroadcastHub:
+    """
+    Buffer circulaire d'entrées numérotées (id croissant à partir de 1) lu par
+    plusieurs abonnés indépendants.
+    """
+
+    def __init__(self, capacity=1000):
+        if capacity <= 0:
+            raise ValueError(f"Capacité de diffusion invalide : {capacity}")
+        self.capacity = capacity
+        self._entries = deque(maxlen=capacity) # (id, données)
+        self._last_id = 0
+        self._condition = threading.Condition()
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    def publish(self, data):
+        """Ajoute une entrée (la plus ancienne est écartée si le buffer est plein) et réveille les abonnés."""
+        with self._condition:
+            self._last_id += 1
+            self._entries.append((self._last_id, data))
+            self._condition.notify_all()
+            return self._last_id
+
+    def cursor(self, last_event_id=None, replay=0):
+        """
+        Curseur de départ d'un nouvel abonné.
+
+        Args:
+            last_event_id (str | int, optional): En-tête Last-Event-ID envoyé par le navigateur à la reconnexion.
+            replay (int): Sans Last-Event-ID, nombre d'entrées récentes à renvoyer à la connexion.
+
+        Returns:
+            int: Id de la dernière entrée considérée comme déjà reçue.
+        """
+        with self._condition:
+            try:
+                cursor = int(last_event_id)
+            except (TypeError, ValueError):
+                return max(0, self._last_id - max(0, replay))
+            # Id inconnu (serveur redémarré depuis) : tout le buffer est nouveau pour ce client
+            return cursor if 0 <= cursor <= self._last_id else 0
+
+    def read(self, cursor, timeout=None, max_entries=200):
+        """
+        Attend (au plus timeout secondes) des entrées postérieures au curseur.
+        Les entrées disponibles sont retournées ensemble (un seul envoi au client),
+        dans la limite de max_entries.
+
+        Returns:
+            tuple: (liste de (id, données), nombre d'entrées perdues car sorties du buffer, nouveau curseur)
+        """
+        with self._condition:
+            if cursor >= self._last_id:
+                self._condition.wait(timeout)
+            if not self._entries or cursor >= self._last_id:
+                return [], 0, cursor
+            first_id = self._entries[0][0]
+            dropped = max(0, first_id - cursor - 1)
+            start = max(cursor + 1, first_id) - first_id
+            entries = list(itertools.islice(self._entries, start, start + max_entries))
+        return entries, dropped, entries[-1][0]
+
+
+def format_sse(data, event_id=None, event=None):
+    """Formate un message SSE (les données sur plusieurs lignes, ex: traceback, sont découpées en lignes data:)."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event is not None:
+        lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in str(data).split('\n'))
+    return '\n'.join(lines) + '\n\n'
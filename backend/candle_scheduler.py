@@ -0,0 +1,139 @@
+import heapq
+import itertools
+import threading
+import time
+from binance.helpers import interval_to_milliseconds
+import binance_client_wrapper
+import metrics
+
+try:
+    import config
+    CANDLE_CLOSE_DELAY_MS = getattr(config, 'CANDLE_CLOSE_DELAY_MS', 250) # Marge après la clôture avant de lire la bougie
+except ImportError:
+    CANDLE_CLOSE_DELAY_MS = 250
+
+# Ordonnanceur des réveils de la boucle du bot : clôtures de bougie et tâches
+# périodiques, pour un nombre quelconque de symboles / intervalles, dans un seul
+# tas trié par échéance. Les échéances sont en heure serveur Binance (ServerClock) :
+# une dérive de l'horloge locale ne retarde pas la lecture des bougies.
+#
+# Le thread qui appelle wait() dort jusqu'à la prochaine échéance (pas de
+# tranches d'une seconde) ; wake() l'interrompt, par exemple sur /stop.
+
+# Les bougies Binance sont alignées sur l'epoch Unix (un jeudi), sauf 1w (lundi)
+ALIGN_OFFSET_MS = {'1w': 4 * 86_400_000}
+
+
+def next_candle_close_ms(interval, now_ms, delay_ms=0):
+    """
+    Première clôture de bougie `interval` (+ delay_ms) strictement postérieure à now_ms.
+
+    Returns:
+        int: Échéance en ms (heure serveur), ou None si l'intervalle n'a pas de durée fixe (1M).
+    """
+    interval_ms = interval_to_milliseconds(interval)
+    if interval_ms is None:
+        return None
+    shift = ALIGN_OFFSET_MS.get(interval, 0) + delay_ms
+    return ((now_ms - shift) // interval_ms + 1) * interval_ms + shift
+
+
+class CandleScheduler:
+    """
+    Minuteurs nommés (clés) : alignés sur les clôtures de bougie d'un intervalle, ou périodiques.
+    Les minuteurs sont répétés : une fois échus, ils sont réarmés pour l'échéance suivante.
+    """
+
+    def __init__(self, clock=None):
+        self.clock = clock or binance_client_wrapper.server_clock
+        self._heap = []   # (échéance ms, n°, clé) ; les entrées remplacées ou annulées sont ignorées
+        self._timers = {} # clé -> (échéance ms, période ms, alignement sur les bougies)
+        self._seq = itertools.count()
+        self._condition = threading.Condition()
+        self._woken = False
+
+    def _arm(self, key, due_ms, period_ms, aligned):
+        self._timers[key] = (due_ms, period_ms, aligned)
+        heapq.heappush(self._heap, (due_ms, next(self._seq), key))
+        self._condition.notify_all()
+
+    def schedule_candle_close(self, key, interval, delay_ms=None):
+        """
+        Minuteur échu à chaque clôture de bougie `interval` (heure serveur), delay_ms après la clôture.
+        Sans effet si le minuteur existe déjà pour cet intervalle (une clôture en retard n'est pas perdue).
+
+        Raises:
+            ValueError: Intervalle sans durée fixe (1M).
+        """
+        interval_ms = interval_to_milliseconds(interval)
+        if interval_ms is None:
+            raise ValueError(f"Intervalle sans durée fixe : {interval}")
+        delay_ms = CANDLE_CLOSE_DELAY_MS if delay_ms is None else delay_ms
+        with self._condition:
+            timer = self._timers.get(key)
+            if timer is not None and timer[1] == interval_ms and timer[2]:
+                return
+            self._arm(key, next_candle_close_ms(interval, self.clock.now_ms(), delay_ms), interval_ms, True)
+
+    def schedule_every(self, key, period_s):
+        """Minuteur échu toutes les period_s secondes (première échéance dans period_s)."""
+        period_ms = int(period_s * 1000)
+        with self._condition:
+            self._arm(key, self.clock.now_ms() + period_ms, period_ms, False)
+
+    def is_scheduled(self, key):
+        return key in self._timers
+
+    def cancel(self, key):
+        with self._condition:
+            self._timers.pop(key, None)
+
+    def wake(self):
+        """Interrompt l'attente en cours (ou la prochaine) : wait() retourne une liste vide."""
+        with self._condition:
+            self._woken = True
+            self._condition.notify_all()
+
+    def _pop_due(self, now_ms):
+        """Retire les minuteurs échus (réarmés pour leur prochaine échéance) et retourne leurs clés."""
+        due = []
+        while self._heap and self._heap[0][0] <= now_ms:
+            due_ms, _, key = heapq.heappop(self._heap)
+            timer = self._timers.get(key)
+            if timer is None or timer[0] != due_ms:
+                continue # Minuteur annulé ou reprogrammé
+            metrics.SCHEDULER_WAKEUP_DELAY_SECONDS.observe((now_ms - due_ms) / 1000, timer=key)
+            _, period_ms, aligned = timer
+            if aligned:
+                # Prochaine clôture ; les clôtures déjà passées (cycle trop long) ne sont pas rejouées
+                next_ms = due_ms + period_ms * max(1, (now_ms - due_ms) // period_ms + 1)
+            else:
+                next_ms = now_ms + period_ms
+            self._arm(key, next_ms, period_ms, aligned)
+            due.append(key)
+        return due
+
+    def wait(self, timeout=None):
+        """
+        Dort jusqu'à la prochaine échéance, un appel à wake() ou la fin de timeout (s).
+
+        Returns:
+            list: Clés des minuteurs échus ([] si réveillé par wake() ou timeout).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while True:
+                if self._woken:
+                    self._woken = False
+                    return []
+                now_ms = self.clock.now_ms()
+                due = self._pop_due(now_ms)
+                if due:
+                    return due
+                wait_s = (self._heap[0][0] - now_ms) / 1000 if self._heap else None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return []
+                    wait_s = remaining if wait_s is None else min(wait_s, remaining)
+                self._condition.wait(wait_s)
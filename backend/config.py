@@ -14,6 +14,7 @@ BINANCE_API_SECRET = os.getenv('API_SECRET','zOTf6xuhYl0ZCSPXYoxydPAbpQCOLK8Cz6u
 
 # --- Autres paramètres de configuration (peuvent être déplacés ici depuis bot.py) ---
 # SYMBOL = 'BTCUSDT'
+# SYMBOLS = ['BTCUSDT', 'ETHUSDT', 'BNBUSDT'] # Plusieurs symboles tradés par un seul moteur (par défaut [SYMBOL])
 # TIMEFRAME = '5m' # Utiliser la chaîne de caractères ici peut être plus simple pour certaines fonctions
 # RISK_PER_TRADE = 0.01
 # CAPITAL_ALLOCATION = 0.1
@@ -23,8 +24,75 @@ BINANCE_API_SECRET = os.getenv('API_SECRET','zOTf6xuhYl0ZCSPXYoxydPAbpQCOLK8Cz6u
 # RSI_PERIOD = 14
 # RSI_OVERBOUGHT = 75
 # RSI_OVERSOLD = 25
-# TAKE_PROFIT_PERCENT = 0.005 # 0.5%
-# STOP_LOSS_PERCENT = 0.003 # 0.3%
+# SHADOW_STRATEGIES = {'ema_12_26': {'EMA_SHORT_PERIOD': 12, 'EMA_LONG_PERIOD': 26}} # Évaluées sur les mêmes bougies (paper trading si PAPER_TRADE_SHADOWS)
+
+# --- Sorties (évaluées à chaque tick de prix entre les bougies, 0 pour désactiver TP / stop suiveur) ---
+TAKE_PROFIT_PERCENT = 0 # Ex: 0.005 : 0.5% (non modélisé par backtest.py)
+STOP_LOSS_PERCENT = 0.003 # 0.3%
+TRAILING_STOP_PERCENT = 0 # Ex: 0.004 : stop relevé à 0.4% sous le plus haut atteint depuis l'entrée
+EXIT_ON_REVERSE_SIGNAL = True # Clôturer la position sur un signal inverse (clôture de bougie)
+USE_TRADE_STREAM = True # Prix de chaque transaction (aggTrade) au lieu du miniTicker (1 par seconde)
+USE_OCO_ORDERS = False # TP / SL placés côté exchange (ordre OCO) : la sortie ne dépend plus de la boucle du bot
+OCO_STOP_LIMIT_OFFSET = 0.001 # Prix limite du stop OCO au-delà du prix de déclenchement (garantit l'exécution)
+
+# --- Paper trading : ordres simulés sur des soldes virtuels, au dernier prix du flux (aucun ordre envoyé) ---
+PAPER_TRADING = False
+PAPER_TRADE_SHADOWS = True # Chaque stratégie shadow trade sur son propre portefeuille virtuel
+PAPER_BALANCES = {'USDT': 10000.0}
+PAPER_FEE_RATE = 0.001
+PAPER_SLIPPAGE = 0.0005 # Glissement défavorable appliqué au prix d'exécution
+PAPER_LATENCY_MS = 0 # Latence simulée : l'ordre est exécuté au premier prix reçu après ce délai (sans bloquer la boucle)
 
 # --- Utiliser le Testnet Binance (True/False) ---
 USE_TESTNET = True # Mettre à False pour utiliser l'API réelle
+
+# --- Cache des soldes : durée (s) pendant laquelle un instantané get_account() est réutilisé ---
+ACCOUNT_CACHE_TTL = 5
+
+# --- User data stream : exécutions des ordres et soldes poussés par Binance (plus de get_account après chaque ordre) ---
+USE_USER_DATA_STREAM = True
+CLIENT_ORDER_PREFIX = "tb" # Préfixe des identifiants client (newClientOrderId) des ordres du bot
+ORDER_RECONCILE_AFTER = 5 # Délai (s) avant de relire par REST un ordre non terminé sans nouvelles (flux coupé)
+
+# --- Règles de trading (LOT_SIZE, PRICE_FILTER, NOTIONAL...) : intervalle de rafraîchissement (s) ---
+SYMBOL_RULES_REFRESH_INTERVAL = 3600
+
+# --- Flux WebSocket (klines + ticker) ---
+USE_WEBSOCKET_STREAM = True # False pour revenir au polling REST à chaque bougie
+# STREAM_URL = "ws://localhost:8765" # Serveur WebSocket local (tests) ; par défaut celui de Binance selon USE_TESTNET
+# API_URL = "http://localhost:8766/api" # API REST locale (mock_exchange.py) ; avec STREAM_URL = "ws://localhost:8766"
+STREAM_STALL_TIMEOUT = 5 # Délai (s) après une clôture sans bougie du flux avant rattrapage REST (0 : désactivé)
+
+# --- Horloge serveur Binance : échéances de bougie et timestamps des requêtes signées ---
+SYNC_SERVER_TIME = True
+CLOCK_SYNC_INTERVAL = 600 # Intervalle (s) de resynchronisation
+CANDLE_CLOSE_DELAY_MS = 250 # Sans flux WebSocket : marge après la clôture avant de lire la bougie
+
+# --- Multi-symboles : requêtes klines REST simultanées lors du rattrapage des buffers ---
+SYMBOL_SYNC_WORKERS = 8
+
+# --- Client asyncio : requêtes d'un cycle (prix, soldes, klines) en parallèle sur des connexions keep-alive ---
+USE_ASYNC_CLIENT = True
+ASYNC_POOL_SIZE = 20 # Connexions HTTP simultanées max
+
+# --- Limiteur de débit REST (limites Binance Spot ; marge de sécurité appliquée par le wrapper) ---
+REQUEST_WEIGHT_LIMIT = 6000 # Poids par minute
+ORDER_LIMIT_10S = 100 # Ordres par 10 secondes
+
+# --- Flux de logs du frontend (/stream_logs) ---
+LOG_BUFFER_SIZE = 1000 # Logs récents conservés en mémoire (partagés par tous les clients)
+LOG_REPLAY_ON_CONNECT = 100 # Logs récents renvoyés à un nouveau client
+
+# --- Flux de statut du frontend (/stream_status) : fenêtre (s) de regroupement des changements (prix) ---
+STATUS_PUSH_INTERVAL = 0.5
+
+# --- Stockage local des klines (colonnes binaires lues par memmap) : démarrage à chaud, backtests ---
+USE_KLINE_STORE = True
+# KLINE_STORE_DIR = "data/klines" # Par défaut backend/data/klines
+
+# --- Validation walk-forward (walk_forward.py) : cache des résultats par fenêtre ---
+# WALK_FORWARD_CACHE_DIR = "data/walk_forward" # Par défaut backend/data/walk_forward
+
+# --- Timeframes agrégés en mémoire depuis un seul flux de klines 1m (3m à 1d) ---
+USE_RESAMPLING = True # Changement de timeframe sans redémarrage du flux ni téléchargement si le 1m couvre la fenêtre
+BASE_BUFFER_SIZE = 5000 # Bougies 1m gardées en mémoire par symbole (≈ 3,5 jours)
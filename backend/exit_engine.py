@@ -0,0 +1,344 @@
+import logging
+import threading
+import time
+import binance_client_wrapper
+import metrics
+import symbol_rules
+
+try:
+    import config
+    USE_OCO_ORDERS = getattr(config, 'USE_OCO_ORDERS', False) # TP / SL placés côté exchange (OCO)
+    OCO_STOP_LIMIT_OFFSET = getattr(config, 'OCO_STOP_LIMIT_OFFSET', 0.001) # Prix limite du stop au-delà du déclenchement
+except ImportError:
+    USE_OCO_ORDERS = False
+    OCO_STOP_LIMIT_OFFSET = 0.001
+
+# Moteur de sortie temps réel : suit les positions ouvertes par la stratégie et
+# évalue take-profit, stop-loss et stop suiveur à chaque tick de prix (flux
+# aggTrade / miniTicker), entre les clôtures de bougie, en O(1) par tick.
+# La sortie sur signal inverse est évaluée à la clôture de bougie.
+#
+# Avec USE_OCO_ORDERS, TP et SL sont aussi placés côté exchange (ordre OCO) :
+# la sortie ne dépend plus de la latence de la boucle du bot (ni de sa
+# disponibilité). Le moteur se contente alors de constater l'exécution de
+# l'OCO ; il ne le remplace par un ordre au marché que pour le stop suiveur et
+# le signal inverse.
+#
+# Un ordre au marché accepté mais pas encore exécuté (status NEW : latence simulée
+# du paper trading) est suivi comme ordre en attente : son exécution est lue via
+# broker.get_order aux ticks suivants, sans bloquer la boucle du bot.
+
+EXIT_TAKE_PROFIT = 'take_profit'
+EXIT_STOP_LOSS = 'stop_loss'
+EXIT_TRAILING_STOP = 'trailing_stop'
+EXIT_REVERSE_SIGNAL = 'reverse_signal'
+
+OCO_CHECK_INTERVAL = 1.0 # Délai minimal (s) entre deux lectures de l'état d'un OCO
+EXIT_RETRY_DELAY = 1.0 # Délai (s) avant une nouvelle tentative de clôture après un échec
+FINAL_STATUSES = ('FILLED', 'CANCELED', 'REJECTED', 'EXPIRED', 'EXPIRED_IN_MATCH')
+
+
+def _average_price(order):
+    """Prix moyen d'exécution d'un ordre (réponse place_order / get_order), None si non exécuté."""
+    try:
+        executed = float(order.get('executedQty') or 0)
+        quote = float(order.get('cummulativeQuoteQty') or 0)
+    except (TypeError, ValueError):
+        return None
+    return quote / executed if executed > 0 and quote > 0 else None
+
+
+def _is_pending(order):
+    """True si l'ordre est accepté mais encore sans exécution (suivi via broker.get_order)."""
+    return order.get('status') not in FINAL_STATUSES and order.get('orderId') is not None and _average_price(order) is None
+
+
+class Position:
+    """Position ouverte suivie par le moteur (long : entrée BUY, short : entrée SELL)."""
+
+    def __init__(self, symbol, side, quantity, entry_price, stop_loss_percent=0.0, take_profit_percent=0.0,
+                 trailing_stop_percent=0.0):
+        self.symbol = symbol
+        self.side = side
+        self.direction = 1 if side == 'BUY' else -1
+        self.quantity = quantity # Decimal, arrondie au stepSize (quantité à revendre / racheter)
+        self.entry_price = entry_price
+        self.stop_price = entry_price * (1 - self.direction * stop_loss_percent) if stop_loss_percent > 0 else None
+        self.take_profit_price = entry_price * (1 + self.direction * take_profit_percent) if take_profit_percent > 0 else None
+        self.trailing_stop_percent = trailing_stop_percent
+        self.trailing_active = False # True dès que le stop suiveur a dépassé le stop initial
+        self.best_price = entry_price # Plus haut (long) / plus bas (short) atteint depuis l'entrée
+        self.last_price = entry_price
+        self.opened_at = time.time()
+        self.oco_order_list_id = None
+        self.exit_order = None # (orderId, raison, prix de déclenchement) d'une clôture en attente d'exécution
+        self.next_attempt_at = 0.0 # time.monotonic() avant lequel aucune action n'est retentée
+
+    @property
+    def exit_side(self):
+        return 'SELL' if self.direction == 1 else 'BUY'
+
+    def update(self, price):
+        """
+        Intègre un nouveau prix (stop suiveur) et retourne la raison de sortie déclenchée, ou None.
+        """
+        self.last_price = price
+        d = self.direction
+        if self.trailing_stop_percent > 0 and (price - self.best_price) * d > 0:
+            self.best_price = price
+            trail = price * (1 - d * self.trailing_stop_percent)
+            if self.stop_price is None or (trail - self.stop_price) * d > 0:
+                self.stop_price = trail
+                self.trailing_active = True
+        if self.stop_price is not None and (price - self.stop_price) * d <= 0:
+            return EXIT_TRAILING_STOP if self.trailing_active else EXIT_STOP_LOSS
+        if self.take_profit_price is not None and (price - self.take_profit_price) * d >= 0:
+            return EXIT_TAKE_PROFIT
+        return None
+
+    def to_status(self):
+        return {
+            'side': self.side,
+            'quantity': float(self.quantity),
+            'entry_price': self.entry_price,
+            'stop_price': self.stop_price,
+            'take_profit_price': self.take_profit_price,
+            'trailing_active': self.trailing_active,
+            'unrealized_return': self.direction * (self.last_price / self.entry_price - 1),
+            'oco_order_list_id': self.oco_order_list_id,
+        }
+
+
+class ExitEngine:
+    """
+    Positions ouvertes par symbole et règles de sortie. Les méthodes d'évaluation sont appelées
+    par la boucle du bot (à chaque tick de prix, à chaque clôture de bougie) ; le verrou protège
+    seulement le registre des positions, lu par /status.
+    """
+
+    def __init__(self, use_oco=None, broker=None, name=None):
+        """
+        Args:
+            broker: Module ou objet exposant place_order / place_oco_order / cancel_order_list / get_order_list /
+                    get_order (défaut binance_client_wrapper ; order_manager.OrderManager, ou paper_trading.PaperAccount
+                    pour des ordres simulés).
+            name (str, optional): Nom du portefeuille (stratégies fantômes), préfixé aux logs ; les sorties d'un
+                                  moteur nommé ne sont pas comptées dans les métriques du bot.
+        """
+        self.use_oco = USE_OCO_ORDERS if use_oco is None else use_oco
+        self.broker = broker or binance_client_wrapper
+        self.name = name
+        self._label = f"{name}:" if name else ""
+        self._positions = {}
+        self._pending_entries = {} # symbol -> (orderId, params, rules, prochaine lecture) : entrées en attente d'exécution
+        self._lock = threading.Lock()
+
+    def get(self, symbol):
+        return self._positions.get(symbol)
+
+    def has_position(self, symbol):
+        """True si le symbole a une position ouverte ou une entrée en attente d'exécution."""
+        return symbol in self._positions or symbol in self._pending_entries
+
+    def _next_check_at(self):
+        """Échéance de la prochaine lecture d'un ordre en attente (immédiate pour un broker simulé, en mémoire)."""
+        return time.monotonic() + (0.0 if getattr(self.broker, 'simulated', False) else OCO_CHECK_INTERVAL)
+
+    def open_position(self, symbol, order, params, rules):
+        """
+        Enregistre la position ouverte par un ordre d'entrée exécuté et place l'OCO si activé.
+
+        Args:
+            symbol (str): Le symbole.
+            order (dict): Réponse de l'ordre d'entrée (place_order).
+            params (StrategyParams): Paramètres de sortie (stop_loss_percent, take_profit_percent, trailing_stop_percent).
+            rules (SymbolRules): Règles du symbole (arrondi des quantités et prix).
+
+        Returns:
+            Position: La position suivie, ou None si l'ordre n'a pas été exécuté (ou est en attente
+                      d'exécution : has_position est alors True et la position s'ouvre à son exécution).
+        """
+        if _is_pending(order):
+            with self._lock:
+                self._pending_entries[symbol] = (order['orderId'], params, rules, 0.0)
+            logging.info(f"[{self._label}{symbol}] Ordre d'entrée {order['orderId']} en attente d'exécution, position suivie à son exécution.")
+            return None
+        entry_price = _average_price(order)
+        if entry_price is None:
+            logging.warning(f"[{self._label}{symbol}] Ordre d'entrée non exécuté ({order.get('status')}), position non suivie.")
+            return None
+        executed = float(order['executedQty'])
+        # Frais prélevés sur l'asset reçu : seule la quantité nette pourra être revendue à la sortie
+        commission = sum(float(fill.get('commission', 0)) for fill in order.get('fills', [])
+                         if fill.get('commissionAsset') == rules.base_asset)
+        position = Position(symbol, order.get('side'), rules.quantize_quantity(executed - commission, market=True), entry_price,
+                            params.stop_loss_percent, params.take_profit_percent, params.trailing_stop_percent)
+        with self._lock:
+            self._positions[symbol] = position
+        logging.info(f"[{self._label}{symbol}] Position {'longue' if position.direction == 1 else 'courte'} de {symbol_rules.SymbolRules.format_decimal(position.quantity)} à {entry_price} "
+                     f"(SL {position.stop_price}, TP {position.take_profit_price}).")
+        if self.use_oco:
+            self._place_oco(position, rules)
+        return position
+
+    def _place_oco(self, position, rules):
+        """Place l'OCO TP / SL d'une position ; en cas d'échec, la surveillance locale prend le relais."""
+        if position.take_profit_price is None or position.stop_price is None:
+            logging.info(f"[{self._label}{position.symbol}] OCO non placé (TP et SL requis), sorties surveillées localement.")
+            return False
+        fmt = symbol_rules.SymbolRules.format_decimal
+        quantity = rules.quantize_quantity(position.quantity, market=False)
+        take_profit = rules.quantize_price(position.take_profit_price)
+        stop = rules.quantize_price(position.stop_price)
+        stop_limit = rules.quantize_price(position.stop_price * (1 - position.direction * OCO_STOP_LIMIT_OFFSET))
+        for price in (take_profit, stop_limit):
+            valid, reason = rules.validate(quantity, price, market=False)
+            if not valid:
+                logging.warning(f"[{self._label}{position.symbol}] OCO refusé par les filtres ({reason}), sorties surveillées localement.")
+                return False
+        order_list = self.broker.place_oco_order(position.symbol, position.exit_side, fmt(quantity), fmt(take_profit),
+                                                 fmt(stop), fmt(stop_limit))
+        if order_list is None:
+            logging.warning(f"[{self._label}{position.symbol}] Échec du placement de l'OCO, sorties surveillées localement.")
+            return False
+        position.oco_order_list_id = order_list.get('orderListId')
+        return True
+
+    def on_price(self, symbol, price):
+        """
+        Évalue TP / SL / stop suiveur de la position du symbole au dernier prix (appelé à chaque tick).
+
+        Returns:
+            dict: Sortie exécutée (voir _record_exit), ou None.
+        """
+        if symbol in self._pending_entries:
+            self._check_pending_entry(symbol)
+        position = self._positions.get(symbol)
+        if position is None:
+            return None
+        if position.exit_order is not None:
+            position.update(price)
+            return self._check_pending_exit(position)
+        reason = position.update(price)
+        if reason is None or time.monotonic() < position.next_attempt_at:
+            return None
+        if position.oco_order_list_id is not None and reason != EXIT_TRAILING_STOP:
+            # TP / SL exécutés par l'exchange : constater l'exécution de l'OCO
+            position.next_attempt_at = time.monotonic() + OCO_CHECK_INTERVAL
+            return self.sync_oco(symbol)
+        return self.close_position(symbol, reason, price)
+
+    def on_signal(self, symbol, signal, price=None, exit_on_reverse=True):
+        """Clôture la position du symbole sur un signal inverse (clôture de bougie). Retourne la sortie ou None."""
+        position = self._positions.get(symbol)
+        if position is None or not exit_on_reverse or signal != -position.direction:
+            return None
+        return self.close_position(symbol, EXIT_REVERSE_SIGNAL, price)
+
+    def close_position(self, symbol, reason, price=None):
+        """
+        Clôture la position au marché (après annulation de son OCO éventuel).
+
+        Returns:
+            dict: Sortie exécutée, ou None (échec : nouvelle tentative au tick suivant après EXIT_RETRY_DELAY).
+        """
+        position = self._positions.get(symbol)
+        if position is None:
+            return None
+        if position.exit_order is not None:
+            return self._check_pending_exit(position) # Clôture déjà envoyée
+        triggered_at = time.perf_counter()
+        if position.oco_order_list_id is not None:
+            if self.broker.cancel_order_list(symbol, position.oco_order_list_id) is None:
+                # Annulation refusée : l'OCO vient peut-être d'être exécuté
+                result = self.sync_oco(symbol)
+                if result is None:
+                    position.next_attempt_at = time.monotonic() + EXIT_RETRY_DELAY
+                return result
+            position.oco_order_list_id = None
+        logging.info(f"[{self._label}{symbol}] Sortie {reason} déclenchée à {price} : ordre {position.exit_side} {symbol_rules.SymbolRules.format_decimal(position.quantity)} au marché.")
+        order = self.broker.place_order(symbol, position.exit_side, symbol_rules.SymbolRules.format_decimal(position.quantity),
+                                        order_type='MARKET')
+        if not order:
+            logging.error(f"[{self._label}{symbol}] Échec de la clôture ({reason}), nouvelle tentative dans {EXIT_RETRY_DELAY}s.")
+            position.next_attempt_at = time.monotonic() + EXIT_RETRY_DELAY
+            return None
+        if _is_pending(order):
+            # Exécution constatée aux ticks suivants (_check_pending_exit)
+            position.exit_order = (order['orderId'], reason, price)
+            position.next_attempt_at = self._next_check_at()
+            return None
+        if self.name is None and not getattr(self.broker, 'simulated', False):
+            metrics.EXIT_LATENCY_SECONDS.observe(time.perf_counter() - triggered_at, symbol=symbol)
+        return self._record_exit(position, reason, _average_price(order) or price or position.last_price)
+
+    def _check_pending_entry(self, symbol):
+        """Ouvre la position d'une entrée en attente une fois exécutée ; l'abandonne si l'ordre est terminé sans exécution."""
+        order_id, params, rules, check_at = self._pending_entries[symbol]
+        if time.monotonic() < check_at:
+            return
+        order = self.broker.get_order(symbol, order_id)
+        if order is None or _is_pending(order):
+            with self._lock:
+                self._pending_entries[symbol] = (order_id, params, rules, self._next_check_at())
+            return
+        with self._lock:
+            self._pending_entries.pop(symbol, None)
+        self.open_position(symbol, order, params, rules)
+
+    def _check_pending_exit(self, position):
+        """Constate l'exécution d'une clôture en attente ; retourne la sortie, ou None (en attente, ou relance au tick suivant)."""
+        if time.monotonic() < position.next_attempt_at:
+            return None
+        order_id, reason, price = position.exit_order
+        order = self.broker.get_order(position.symbol, order_id)
+        if order is None or _is_pending(order):
+            position.next_attempt_at = self._next_check_at()
+            return None
+        position.exit_order = None
+        exit_price = _average_price(order)
+        if exit_price is None:
+            logging.error(f"[{self._label}{position.symbol}] Clôture {order_id} terminée sans exécution ({order.get('status')}), nouvelle tentative dans {EXIT_RETRY_DELAY}s.")
+            position.next_attempt_at = time.monotonic() + EXIT_RETRY_DELAY
+            return None
+        return self._record_exit(position, reason, exit_price)
+
+    def sync_oco(self, symbol):
+        """
+        Lit l'état de l'OCO de la position ; s'il a été exécuté, la position est clôturée.
+
+        Returns:
+            dict: Sortie constatée, ou None (OCO toujours ouvert, ou erreur).
+        """
+        position = self._positions.get(symbol)
+        if position is None or position.oco_order_list_id is None:
+            return None
+        order_list = self.broker.get_order_list(position.oco_order_list_id)
+        if order_list is None or order_list.get('listOrderStatus') != 'ALL_DONE':
+            return None
+        for leg in order_list.get('orders', []):
+            order = self.broker.get_order(symbol, leg['orderId'])
+            if order is not None and order.get('status') == 'FILLED':
+                reason = EXIT_TAKE_PROFIT if order.get('type') == 'LIMIT_MAKER' else EXIT_STOP_LOSS
+                return self._record_exit(position, reason, _average_price(order) or position.last_price)
+        # OCO annulé ou expiré hors du bot : reprise de la surveillance locale
+        logging.warning(f"[{self._label}{symbol}] OCO {position.oco_order_list_id} terminé sans exécution, sorties surveillées localement.")
+        position.oco_order_list_id = None
+        return None
+
+    def _record_exit(self, position, reason, exit_price):
+        with self._lock:
+            self._positions.pop(position.symbol, None)
+        trade_return = position.direction * (exit_price / position.entry_price - 1)
+        if self.name is None:
+            metrics.POSITION_EXITS.inc(symbol=position.symbol, reason=reason)
+        logging.info(f"[{self._label}{position.symbol}] Position clôturée ({reason}) à {exit_price} (entrée {position.entry_price}, {trade_return:+.2%}).")
+        return {
+            'symbol': position.symbol, 'side': position.side, 'reason': reason, 'quantity': float(position.quantity),
+            'entry_price': position.entry_price, 'exit_price': exit_price, 'return': trade_return,
+        }
+
+    def to_status(self):
+        with self._lock:
+            positions = dict(self._positions)
+        return {symbol: position.to_status() for symbol, position in positions.items()}
@@ -0,0 +1,256 @@
+import logging
+import math
+from collections import deque
+
+# Moteur d'indicateurs incrémental : chaque nouvelle bougie clôturée met à jour
+# l'état courant (EMA, RSI de Wilder, SMA glissante) en temps constant, au lieu
+# de recalculer toute la fenêtre avec pandas_ta à chaque cycle.
+# Les formules reproduisent exactement celles de pandas_ta (chemin batch de
+# strategy.calculate_indicators), qui reste disponible pour l'initialisation.
+
+NAN = float('nan')
+
+
+class EMAState:
+    """
+    EMA incrémentale, identique à pandas_ta.ema (amorçage par la SMA des
+    `length` premières valeurs, puis lissage récursif alpha = 2 / (length + 1)).
+    """
+
+    __slots__ = ('length', 'alpha', 'count', 'value', '_seed_sum')
+
+    def __init__(self, length):
+        if length <= 0:
+            raise ValueError(f"Longueur EMA invalide : {length}")
+        self.length = length
+        self.alpha = 2.0 / (length + 1)
+        self.count = 0
+        self.value = NAN
+        self._seed_sum = 0.0
+
+    def update(self, x):
+        """Ajoute une valeur et retourne l'EMA courante (NaN tant que non initialisée)."""
+        self.count += 1
+        if self.count < self.length:
+            self._seed_sum += x
+            return NAN
+        if self.count == self.length:
+            self._seed_sum += x
+            self.value = self._seed_sum / self.length
+            return self.value
+        self.value = (1.0 - self.alpha) * self.value + self.alpha * x
+        return self.value
+
+
+class RSIState:
+    """
+    RSI de Wilder incrémental, identique à pandas_ta.rsi (moyennes des gains et
+    pertes lissées par pandas_ta.rma, c.-à-d. ewm(alpha=1/length, adjust=True)).
+    Les moyennes ajustées sont tenues sous forme numérateur / dénominateur,
+    ce qui garde une mise à jour en O(1).
+    """
+
+    __slots__ = ('length', 'decay', 'count', 'value', '_prev_close', '_gain_num', '_loss_num', '_den')
+
+    def __init__(self, length):
+        if length <= 0:
+            raise ValueError(f"Longueur RSI invalide : {length}")
+        self.length = length
+        self.decay = 1.0 - 1.0 / length
+        self.count = 0 # Nombre de variations (diff) observées
+        self.value = NAN
+        self._prev_close = None
+        self._gain_num = 0.0
+        self._loss_num = 0.0
+        self._den = 0.0
+
+    def update(self, close):
+        """Ajoute un prix de clôture et retourne le RSI courant (NaN tant que non initialisé)."""
+        if self._prev_close is None:
+            self._prev_close = close
+            return NAN
+        diff = close - self._prev_close
+        self._prev_close = close
+        gain = diff if diff > 0 else 0.0
+        loss = -diff if diff < 0 else 0.0
+        self._gain_num = gain + self.decay * self._gain_num
+        self._loss_num = loss + self.decay * self._loss_num
+        self._den = 1.0 + self.decay * self._den
+        self.count += 1
+        if self.count < self.length:
+            return NAN
+        avg_gain = self._gain_num / self._den
+        avg_loss = self._loss_num / self._den
+        total = avg_gain + avg_loss
+        # Même comportement que pandas (0/0 -> NaN) si le prix n'a jamais bougé
+        self.value = 100.0 * avg_gain / total if total != 0 else NAN
+        return self.value
+
+
+class SMAState:
+    """Moyenne mobile simple glissante (équivalente à pandas_ta.sma / rolling.mean)."""
+
+    # Resommation périodique de la fenêtre pour éviter la dérive des flottants
+    RESUM_EVERY = 1000
+
+    __slots__ = ('length', 'value', '_window', '_sum', '_updates')
+
+    def __init__(self, length):
+        if length <= 0:
+            raise ValueError(f"Longueur SMA invalide : {length}")
+        self.length = length
+        self.value = NAN
+        self._window = deque(maxlen=length)
+        self._sum = 0.0
+        self._updates = 0
+
+    def update(self, x):
+        """Ajoute une valeur et retourne la moyenne courante (NaN tant que la fenêtre n'est pas pleine)."""
+        if len(self._window) == self.length:
+            self._sum -= self._window[0]
+        self._window.append(x)
+        self._sum += x
+        self._updates += 1
+        if self._updates % self.RESUM_EVERY == 0:
+            self._sum = math.fsum(self._window)
+        if len(self._window) < self.length:
+            return NAN
+        self.value = self._sum / self.length
+        return self.value
+
+
+class IndicatorEngine:
+    """
+    Moteur incrémental regroupant les indicateurs de la stratégie EMA crossover / RSI
+    pour un jeu de paramètres donné. Les lignes produites ont les mêmes clés que
+    les colonnes du DataFrame batch ('Close', 'Volume', 'EMA_x', 'RSI_x',
+    'Volume_MA_x', 'signal'), elles peuvent donc être passées telles quelles à
+    strategy.check_entry_conditions.
+    """
+
+    def __init__(self, ema_short_period, ema_long_period, ema_filter_period, rsi_period,
+                 rsi_overbought, rsi_oversold, volume_avg_period,
+                 use_ema_filter=True, use_volume_confirmation=False):
+        self.params = (ema_short_period, ema_long_period, ema_filter_period, rsi_period,
+                       rsi_overbought, rsi_oversold, volume_avg_period,
+                       use_ema_filter, use_volume_confirmation)
+        self.rsi_overbought = rsi_overbought
+        self.rsi_oversold = rsi_oversold
+        self.use_ema_filter = use_ema_filter
+        self.use_volume_confirmation = use_volume_confirmation
+
+        self.ema_short_key = f'EMA_{ema_short_period}'
+        self.ema_long_key = f'EMA_{ema_long_period}'
+        self.ema_filter_key = f'EMA_{ema_filter_period}'
+        self.rsi_key = f'RSI_{rsi_period}'
+        self.volume_ma_key = f'Volume_MA_{volume_avg_period}'
+
+        self._ema_short = EMAState(ema_short_period)
+        self._ema_long = EMAState(ema_long_period)
+        self._ema_filter = EMAState(ema_filter_period) if use_ema_filter else None
+        self._rsi = RSIState(rsi_period)
+        self._volume_ma = SMAState(volume_avg_period) if use_volume_confirmation else None
+
+        # Valeurs EMA de la dernière ligne valide (équivalent du shift(1) après dropna)
+        self._prev_short = None
+        self._prev_long = None
+
+        self.last_open_time = None # Open time (ms) de la dernière bougie intégrée
+        self.last_row = None       # Dernière ligne valide (dict) ou None pendant le warm-up
+        self.candles_seen = 0
+
+    def update(self, close, volume, open_time=None, close_time=None):
+        """
+        Intègre une bougie clôturée et met à jour tous les indicateurs en O(1).
+
+        Args:
+            close (float): Prix de clôture.
+            volume (float): Volume de la bougie.
+            open_time (int, optional): Open time en ms (sert à ignorer les doublons).
+            close_time (int, optional): Close time en ms.
+
+        Returns:
+            dict: Ligne complète (indicateurs + 'signal') si tous les indicateurs sont
+                  disponibles, None pendant la phase de warm-up.
+        """
+        if open_time is not None and self.last_open_time is not None and open_time <= self.last_open_time:
+            logging.debug(f"Bougie {open_time} déjà intégrée au moteur d'indicateurs, ignorée.")
+            return None
+        self.last_open_time = open_time
+        self.candles_seen += 1
+
+        ema_short = self._ema_short.update(close)
+        ema_long = self._ema_long.update(close)
+        ema_filter = self._ema_filter.update(close) if self._ema_filter else None
+        rsi = self._rsi.update(close)
+        volume_ma = self._volume_ma.update(volume) if self._volume_ma else None
+
+        values = [ema_short, ema_long, rsi]
+        if ema_filter is not None: values.append(ema_filter)
+        if volume_ma is not None: values.append(volume_ma)
+        if any(math.isnan(v) for v in values):
+            # Ligne qui serait supprimée par le dropna du chemin batch
+            return None
+
+        signal = 0
+        prev_short, prev_long = self._prev_short, self._prev_long
+        if prev_short is not None:
+            volume_ok = (volume > volume_ma) if volume_ma is not None else True
+            if ema_short > ema_long and prev_short <= prev_long:
+                filter_ok = (close > ema_filter) if ema_filter is not None else True
+                if filter_ok and rsi < self.rsi_overbought and volume_ok:
+                    signal = 1
+            elif ema_short < ema_long and prev_short >= prev_long:
+                filter_ok = (close < ema_filter) if ema_filter is not None else True
+                if filter_ok and rsi > self.rsi_oversold and volume_ok:
+                    signal = -1
+        self._prev_short, self._prev_long = ema_short, ema_long
+
+        row = {
+            'Open time': open_time, 'Close time': close_time, 'Close': close, 'Volume': volume,
+            self.ema_short_key: ema_short, self.ema_long_key: ema_long, self.rsi_key: rsi,
+            'signal': signal,
+        }
+        if ema_filter is not None: row[self.ema_filter_key] = ema_filter
+        if volume_ma is not None: row[self.volume_ma_key] = volume_ma
+        self.last_row = row
+        return row
+
+    def update_kline(self, kline):
+        """Intègre une kline au format python-binance (liste de 12 champs, prix en str)."""
+        return self.update(float(kline[4]), float(kline[5]), int(kline[0]), int(kline[6]))
+
+    def warm_up(self, klines):
+        """
+        Initialise l'état à partir d'un historique de klines clôturées (rejoué une seule fois).
+
+        Args:
+            klines (list): Klines au format python-binance, triées par open time croissant.
+
+        Returns:
+            dict: Dernière ligne valide, ou None si l'historique est trop court.
+        """
+        for kline in klines:
+            self.update_kline(kline)
+        if self.last_row is None:
+            logging.warning(f"Historique insuffisant ({len(klines)} bougies) pour initialiser les indicateurs.")
+        return self.last_row
+
+    def warm_up_arrays(self, close, volume, open_time=None, close_time=None):
+        """
+        Initialise l'état à partir de tableaux (ex: vues NumPy d'un KlineRingBuffer).
+
+        Args:
+            close, volume (array-like): Prix de clôture et volumes, du plus ancien au plus récent.
+            open_time, close_time (array-like, optional): Horodatages en ms.
+
+        Returns:
+            dict: Dernière ligne valide, ou None si l'historique est trop court.
+        """
+        for i in range(len(close)):
+            self.update(float(close[i]), float(volume[i]),
+                        int(open_time[i]) if open_time is not None else None,
+                        int(close_time[i]) if close_time is not None else None)
+        if self.last_row is None:
+            logging.warning(f"Historique insuffisant ({len(close)} bougies) pour initialiser les indicateurs.")
+        return self.last_row
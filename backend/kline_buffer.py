@@ -0,0 +1,306 @@
+import asyncio
+import functools
+import logging
+import threading
+import numpy as np
+from binance.helpers import interval_to_milliseconds
+import binance_client_wrapper
+import kline_store
+
+try:
+    import config
+    USE_KLINE_STORE = getattr(config, 'USE_KLINE_STORE', True) # Persister les bougies clôturées (démarrage à chaud)
+except ImportError:
+    USE_KLINE_STORE = True
+
+# Buffer circulaire de bougies OHLCV par (symbole, intervalle), stocké dans des
+# tableaux NumPy. Seules les bougies manquantes depuis la dernière clôture sont
+# téléchargées à chaque cycle, au lieu de toute la fenêtre de lookback.
+#
+# Chaque colonne est stockée deux fois (indices i et i + capacity) : les `size`
+# dernières bougies forment donc toujours une tranche contiguë, exposée sans
+# copie sous forme de vue NumPy en lecture seule.
+#
+# Avec un KlineStore, les bougies clôturées sont aussi écrites sur disque et un
+# buffer vide est d'abord rempli depuis le disque : au redémarrage du bot, seules
+# les bougies manquées pendant l'arrêt sont téléchargées.
+
+FLOAT_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+INT_FIELDS = ('open_time', 'close_time')
+# Index des champs dans une kline python-binance
+KLINE_INDEX = {'open_time': 0, 'open': 1, 'high': 2, 'low': 3, 'close': 4, 'volume': 5, 'close_time': 6}
+
+# Taille maximale d'une requête klines Binance
+MAX_KLINES_PER_REQUEST = 1000
+
+# Étapes produites par les générateurs _sync_steps() : la logique de rattrapage est écrite
+# une seule fois, sync() et sync_async() ne diffèrent que par la façon d'exécuter les étapes
+FETCH = 'fetch' # (symbol, interval, limit, start_time) -> klines via fetch
+IO = 'io'       # Appel sans argument sur le stockage local (hors boucle asyncio en asynchrone)
+
+
+def _run_sync_steps(steps, fetch):
+    """Exécute les étapes d'un générateur _sync_steps() en bloquant ; retourne sa valeur de retour."""
+    result = None
+    try:
+        while True:
+            kind, step = steps.send(result)
+            if kind == FETCH:
+                symbol, interval, limit, start_time = step
+                result = fetch(symbol, interval, limit=limit, start_time=start_time)
+            else:
+                result = step()
+    except StopIteration as done:
+        return done.value
+
+async def _run_sync_steps_async(steps, fetch):
+    """Comme _run_sync_steps, avec un fetch asynchrone ; les accès disque passent par un thread de l'executor."""
+    loop = asyncio.get_running_loop()
+    result = None
+    try:
+        while True:
+            kind, step = steps.send(result)
+            if kind == FETCH:
+                symbol, interval, limit, start_time = step
+                result = await fetch(symbol, interval, limit=limit, start_time=start_time)
+            else:
+                result = await loop.run_in_executor(None, step)
+    except StopIteration as done:
+        return done.value
+
+
+class KlineRingBuffer:
+    """
+    Buffer circulaire borné des bougies clôturées d'un symbole / intervalle.
+    La bougie encore ouverte (dernière kline renvoyée par l'API) est conservée à part
+    dans `open_candle` et n'entre dans le buffer qu'une fois clôturée.
+    """
+
+    def __init__(self, symbol, interval, capacity, store=None):
+        if capacity <= 0:
+            raise ValueError(f"Capacité de buffer invalide : {capacity}")
+        self.symbol = symbol
+        self.interval = interval
+        self.interval_ms = interval_to_milliseconds(interval)
+        self.capacity = capacity
+        self.size = 0
+        self._head = 0 # Prochain index d'écriture dans [0, capacity)
+        self._columns = {}
+        for field in FLOAT_FIELDS:
+            self._columns[field] = np.zeros(2 * capacity, dtype=np.float64)
+        for field in INT_FIELDS:
+            self._columns[field] = np.zeros(2 * capacity, dtype=np.int64)
+        self.last_open_time = None # Open time (ms) de la dernière bougie clôturée
+        self.open_candle = None    # Kline (liste) de la bougie en cours, ou None
+        self.store = store         # KlineStore optionnel (persistance des bougies clôturées)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.size
+
+    def _append(self, kline):
+        head, cap = self._head, self.capacity
+        for field, index in KLINE_INDEX.items():
+            column = self._columns[field]
+            value = kline[index]
+            column[head] = value # Conversion str -> float/int par NumPy
+            column[head + cap] = column[head]
+        self._head = (head + 1) % cap
+        self.size = min(self.size + 1, cap)
+        self.last_open_time = int(kline[0])
+
+    def ingest(self, klines, now_ms=None, persist=True):
+        """
+        Intègre des klines (format python-binance) triées par open time croissant.
+        Les bougies déjà connues sont ignorées ; une bougie pas encore clôturée
+        remplace `open_candle`. Avec persist=False, l'écriture sur disque est laissée à l'appelant (persist()).
+
+        Returns:
+            list: Les klines nouvellement clôturées, dans l'ordre.
+        """
+        if now_ms is None:
+            now_ms = binance_client_wrapper.server_clock.now_ms()
+        new_klines = []
+        with self.lock:
+            for kline in klines:
+                open_time = int(kline[0])
+                if int(kline[6]) >= now_ms:
+                    self.open_candle = kline
+                    continue
+                if self.last_open_time is not None and open_time <= self.last_open_time:
+                    continue
+                self._append(kline)
+                new_klines.append(kline)
+            if self.open_candle is not None and self.last_open_time is not None and int(self.open_candle[0]) <= self.last_open_time:
+                self.open_candle = None # La bougie ouverte connue vient d'être clôturée
+        if persist:
+            self.persist(new_klines)
+        return new_klines
+
+    def persist(self, klines):
+        """Écrit des bougies clôturées dans le stockage local (s'il y en a un)."""
+        if self.store is None or not klines:
+            return
+        try:
+            self.store.append(klines)
+        except OSError as e:
+            logging.error(f"Écriture du stockage {self.symbol} {self.interval} impossible : {e}")
+
+    def load_from_store(self, now_ms=None):
+        """
+        Remplit un buffer vide avec les dernières bougies du stockage local, si celui-ci est
+        assez récent pour que le rattrapage REST suffise à combler l'écart avec maintenant.
+
+        Returns:
+            int: Nombre de bougies chargées.
+        """
+        if self.store is None or self.size:
+            return 0
+        now_ms = binance_client_wrapper.server_clock.now_ms() if now_ms is None else now_ms
+        last_open_time = self.store.last_open_time
+        if last_open_time is None or now_ms - last_open_time > self.capacity * self.interval_ms:
+            return 0
+        views = self.store.read(last=self.capacity)
+        with self.lock:
+            if self.size:
+                return 0
+            n = self._fill(views)
+        logging.info(f"Buffer {self.symbol} {self.interval} : {n} bougie(s) chargée(s) depuis le stockage local.")
+        return n
+
+    def _fill(self, columns):
+        """Remplit le buffer vide avec les `capacity` dernières valeurs de colonnes triées (verrou tenu)."""
+        n = min(len(columns['open_time']), self.capacity)
+        if n == 0:
+            return 0
+        cap = self.capacity
+        for field, column in self._columns.items():
+            values = columns[field][len(columns[field]) - n:]
+            column[:n] = values # Les deux copies (indices i et i + capacity)
+            column[cap:cap + n] = values
+        self._head = n % cap
+        self.size = n
+        self.last_open_time = int(columns['open_time'][-1])
+        return n
+
+    def next_fetch_start(self):
+        """Open time (ms) de la première bougie manquante, ou None si le buffer est vide."""
+        if self.last_open_time is None:
+            return None
+        return self.last_open_time + self.interval_ms
+
+    def is_behind(self, klines=(), now_ms=None):
+        """
+        True si des bougies clôturées manquent au buffer : entre sa dernière bougie et `klines`
+        (bougies du flux en attente), ou, sans klines, jusqu'à maintenant. Un rattrapage REST est alors nécessaire.
+        """
+        start = self.next_fetch_start()
+        if start is None:
+            return True
+        if klines:
+            return int(klines[0][0]) > start # Trou entre l'historique et le flux
+        now_ms = binance_client_wrapper.server_clock.now_ms() if now_ms is None else now_ms
+        return start + self.interval_ms <= now_ms
+
+    def _sync_steps(self):
+        """
+        Rattrapage du buffer, sous forme de générateur d'étapes (FETCH, IO) exécutées par
+        sync() ou sync_async() : télécharge uniquement les bougies manquantes depuis la dernière
+        clôture (la fenêtre complète au premier appel), les intègre, puis les écrit sur disque.
+
+        Returns:
+            list: Les klines nouvellement clôturées, ou None en cas d'échec de récupération.
+        """
+        yield IO, self.load_from_store
+        start_time = self.next_fetch_start()
+        new_klines = []
+        if start_time is None or binance_client_wrapper.server_clock.now_ms() - start_time > self.capacity * self.interval_ms:
+            # Buffer vide (ou trop en retard) : fenêtre complète + bougie ouverte
+            klines = yield FETCH, (self.symbol, self.interval, min(self.capacity + 1, MAX_KLINES_PER_REQUEST), None)
+            if klines is not None:
+                new_klines = self.ingest(klines, persist=False)
+        else:
+            while True:
+                klines = yield FETCH, (self.symbol, self.interval, MAX_KLINES_PER_REQUEST, start_time)
+                if klines is None:
+                    break
+                new_klines.extend(self.ingest(klines, persist=False))
+                if len(klines) < MAX_KLINES_PER_REQUEST:
+                    break
+                start_time = int(klines[-1][0]) + self.interval_ms
+        if new_klines and self.store is not None:
+            yield IO, functools.partial(self.persist, new_klines) # Pages déjà intégrées conservées même en cas d'échec
+        if klines is None:
+            return None
+        logging.debug(f"Buffer {self.symbol} {self.interval} : {len(new_klines)} nouvelle(s) bougie(s) clôturée(s).")
+        return new_klines
+
+    def sync(self, fetch=None):
+        """
+        Télécharge uniquement les bougies manquantes depuis la dernière clôture
+        (la fenêtre complète au premier appel) et les intègre au buffer.
+
+        Args:
+            fetch (callable, optional): Fonction (symbol, interval, limit, start_time) -> klines.
+                                        Par défaut binance_client_wrapper.get_klines.
+
+        Returns:
+            list: Les klines nouvellement clôturées, ou None en cas d'échec de récupération.
+        """
+        return _run_sync_steps(self._sync_steps(), fetch or binance_client_wrapper.get_klines)
+
+    async def sync_async(self, fetch):
+        """
+        Variante asynchrone de sync() pour le client asyncio (plusieurs buffers rattrapés en parallèle).
+        Les lectures et écritures du stockage local s'exécutent hors de la boucle asyncio.
+
+        Args:
+            fetch (coroutine function): (symbol, interval, limit, start_time) -> klines,
+                                        ex: async_client_wrapper.get_klines.
+
+        Returns:
+            list: Les klines nouvellement clôturées, ou None en cas d'échec de récupération.
+        """
+        return await _run_sync_steps_async(self._sync_steps(), fetch)
+
+    def view(self, field, n=None):
+        """
+        Vue NumPy (sans copie, lecture seule) des `n` dernières valeurs clôturées d'une colonne,
+        de la plus ancienne à la plus récente. La vue reflète le contenu du buffer
+        au moment de l'appel : la copier si elle doit survivre aux prochaines mises à jour.
+        """
+        n = self.size if n is None else min(n, self.size)
+        end = self._head + self.capacity
+        values = self._columns[field][end - n:end]
+        values.flags.writeable = False
+        return values
+
+    def views(self, n=None):
+        """Dictionnaire {champ: vue} pour toutes les colonnes."""
+        return {field: self.view(field, n) for field in self._columns}
+
+
+# --- Registre des buffers par (symbole, intervalle) ---
+_buffers = {}
+_buffers_lock = threading.Lock()
+
+def get_buffer(symbol, interval, capacity):
+    """
+    Retourne le buffer de (symbol, interval), créé si nécessaire.
+    Si la fenêtre demandée dépasse la capacité actuelle, un nouveau buffer plus grand
+    remplace l'ancien (l'historique complet sera retéléchargé au prochain sync()).
+    """
+    key = (symbol, interval)
+    with _buffers_lock:
+        buffer = _buffers.get(key)
+        if buffer is None or buffer.capacity < capacity:
+            if buffer is not None:
+                logging.info(f"Agrandissement du buffer {symbol} {interval} : {buffer.capacity} -> {capacity} bougies.")
+            buffer = KlineRingBuffer(symbol, interval, capacity, kline_store.get_store(symbol, interval) if USE_KLINE_STORE else None)
+            _buffers[key] = buffer
+        return buffer
+
+def clear_buffers():
+    """Vide le registre (ex: changement de configuration)."""
+    with _buffers_lock:
+        _buffers.clear()
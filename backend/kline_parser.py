@@ -0,0 +1,52 @@
+import operator
+import numpy as np
+
+# Conversion des klines brutes (listes de 12 valeurs renvoyées par get_klines,
+# prix et volumes en chaînes) directement en tableaux NumPy typés et contigus,
+# champ par champ : pas de DataFrame intermédiaire à colonnes objet, pas de
+# pd.to_numeric ni de copie défensive. Seuls les champs demandés sont convertis.
+
+# Index des champs dans une kline python-binance
+KLINE_INDEX = {
+    'open_time': 0, 'open': 1, 'high': 2, 'low': 3, 'close': 4, 'volume': 5, 'close_time': 6,
+    'quote_volume': 7, 'trades': 8, 'taker_buy_volume': 9, 'taker_buy_quote_volume': 10,
+}
+FIELD_DTYPES = {
+    'open_time': np.int64, 'open': np.float64, 'high': np.float64, 'low': np.float64, 'close': np.float64,
+    'volume': np.float64, 'close_time': np.int64, 'quote_volume': np.float64, 'trades': np.int64,
+    'taker_buy_volume': np.float64, 'taker_buy_quote_volume': np.float64,
+}
+# Champs utilisés par la stratégie (indicateurs, signaux, horodatage)
+STRATEGY_FIELDS = ('open_time', 'close', 'volume', 'close_time')
+
+
+def _float_or_nan(value):
+    """float(value), ou NaN si la valeur n'est pas numérique (comme pd.to_numeric(errors='coerce'))."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def parse_klines(klines, fields=STRATEGY_FIELDS, coerce=False):
+    """
+    Convertit des klines au format python-binance en colonnes NumPy.
+
+    Args:
+        klines (list): Klines (valeurs str ou nombres), ex: retour de client.get_klines().
+        fields (iterable): Champs à extraire (clés de KLINE_INDEX).
+        coerce (bool): Valeurs non numériques des champs float converties en NaN au lieu de lever une erreur.
+
+    Returns:
+        dict: {champ: np.ndarray} (int64 pour les temps et le nombre de trades, float64 sinon).
+
+    Raises:
+        ValueError: Valeur non numérique dans un champ demandé (champs entiers seulement si coerce).
+    """
+    count = len(klines)
+    arrays = {}
+    for field in fields:
+        dtype = FIELD_DTYPES[field]
+        convert = (_float_or_nan if coerce else float) if dtype is np.float64 else int
+        arrays[field] = np.fromiter(map(convert, map(operator.itemgetter(KLINE_INDEX[field]), klines)), dtype=dtype, count=count)
+    return arrays
@@ -0,0 +1,215 @@
+import logging
+import threading
+import numpy as np
+from binance.helpers import interval_to_milliseconds
+import binance_client_wrapper
+import kline_buffer
+
+try:
+    import config
+    USE_RESAMPLING = getattr(config, 'USE_RESAMPLING', True) # Timeframes agrégés depuis les bougies 1m
+    BASE_BUFFER_SIZE = getattr(config, 'BASE_BUFFER_SIZE', 5000) # Bougies 1m gardées en mémoire par symbole
+except ImportError:
+    USE_RESAMPLING = True
+    BASE_BUFFER_SIZE = 5000
+
+# Agrégation des bougies 1m d'un symbole en bougies de timeframe supérieur
+# (3m à 1d), en mémoire. Un seul flux de klines 1m alimente tous les timeframes :
+# changer de timeframe ne redémarre pas le flux et, si le buffer 1m couvre la
+# fenêtre demandée, ne télécharge rien.
+#
+# Un ResampledKlineBuffer ne garde aucun état d'agrégation partiel : à chaque
+# mise à jour, il agrège les bougies 1m postérieures à sa dernière bougie
+# clôturée (au plus une bougie en cours + les nouvelles), par tranches NumPy
+# (reduceat). Plusieurs timeframes peuvent ainsi partager le même buffer 1m.
+
+BASE_INTERVAL = '1m'
+BASE_INTERVAL_MS = 60_000
+# Les bougies Binance jusqu'à 1d sont alignées sur l'epoch Unix ; 3d, 1w et 1M ont leur
+# propre alignement et restent téléchargées directement
+MAX_RESAMPLE_MS = 86_400_000
+
+
+def can_resample(interval):
+    """True si `interval` s'obtient par agrégation de bougies 1m alignées sur l'epoch."""
+    interval_ms = interval_to_milliseconds(interval)
+    return interval_ms is not None and BASE_INTERVAL_MS < interval_ms <= MAX_RESAMPLE_MS and MAX_RESAMPLE_MS % interval_ms == 0
+
+def source_interval(interval):
+    """Intervalle des klines à recevoir (flux, REST) pour construire les bougies de `interval`."""
+    return BASE_INTERVAL if USE_RESAMPLING and can_resample(interval) else interval
+
+def resample_arrays(arrays, interval_ms):
+    """
+    Agrège des colonnes de bougies (open_time, open, high, low, close, volume, close_time),
+    triées par open time croissant, en bougies de interval_ms alignées sur l'epoch.
+
+    Args:
+        arrays (dict): {champ: np.ndarray}, ex: KlineRingBuffer.views() ou KlineStore.read().
+        interval_ms (int): Durée des bougies agrégées.
+
+    Returns:
+        tuple: (colonnes des bougies clôturées, kline de la bougie en cours ou None)
+    """
+    open_time = np.asarray(arrays['open_time'])
+    if len(open_time) == 0:
+        return {field: np.asarray(arrays[field])[:0] for field in kline_buffer.KLINE_INDEX}, None
+    bucket = open_time - open_time % interval_ms
+    starts = np.flatnonzero(np.concatenate(([True], bucket[1:] != bucket[:-1])))
+    ends = np.append(starts[1:], len(open_time)) - 1
+    columns = {
+        'open_time': bucket[starts],
+        'open': np.asarray(arrays['open'])[starts],
+        'high': np.maximum.reduceat(arrays['high'], starts),
+        'low': np.minimum.reduceat(arrays['low'], starts),
+        'close': np.asarray(arrays['close'])[ends],
+        'volume': np.add.reduceat(arrays['volume'], starts),
+        'close_time': bucket[starts] + interval_ms - 1,
+    }
+    # La dernière bougie n'est clôturée que si la bougie de base qui la termine est arrivée
+    if int(arrays['close_time'][-1]) >= int(columns['close_time'][-1]):
+        return columns, None
+    open_candle = [columns[field][-1].item() for field in kline_buffer.KLINE_INDEX]
+    return {field: values[:-1] for field, values in columns.items()}, open_candle
+
+def columns_to_klines(columns):
+    """Colonnes -> klines (listes open_time, open, high, low, close, volume, close_time)."""
+    return [list(row) for row in zip(*(columns[field].tolist() for field in kline_buffer.KLINE_INDEX))]
+
+
+class ResampledKlineBuffer(kline_buffer.KlineRingBuffer):
+    """
+    Buffer des bougies clôturées d'un timeframe agrégé depuis le buffer 1m (`base`) du symbole.
+    S'utilise comme un KlineRingBuffer : ingest() reçoit les klines 1m du flux et retourne les
+    bougies agrégées nouvellement clôturées ; sync() rattrape le buffer 1m par REST.
+    """
+
+    def __init__(self, base, interval, capacity):
+        super().__init__(base.symbol, interval, capacity)
+        self.base = base
+
+    def _base_since(self, start_ms):
+        """Vues des bougies de base d'open time >= start_ms."""
+        views = self.base.views()
+        i = int(np.searchsorted(views['open_time'], start_ms))
+        return {field: values[i:] for field, values in views.items()}
+
+    def _base_covers(self, start_ms):
+        """True si le buffer de base remonte jusqu'à start_ms (bougie agrégée complète)."""
+        open_time = self.base.view('open_time')
+        return len(open_time) > 0 and int(open_time[0]) <= start_ms
+
+    def refresh(self):
+        """
+        Agrège les bougies de base reçues depuis la dernière bougie clôturée du buffer. Si la base
+        ne remonte pas jusqu'au début de la bougie en cours (démarrage récent sur un grand
+        timeframe), rien n'est agrégé : cette bougie sera téléchargée par sync() à sa clôture.
+
+        Returns:
+            list: Les klines agrégées nouvellement clôturées, dans l'ordre.
+        """
+        if self.last_open_time is None:
+            return []
+        start = self.last_open_time + self.interval_ms
+        if not self._base_covers(start):
+            return []
+        columns, open_candle = resample_arrays(self._base_since(start), self.interval_ms)
+        klines = columns_to_klines(columns)
+        with self.lock:
+            for kline in klines:
+                self._append(kline)
+            self.open_candle = open_candle
+        return klines
+
+    def ingest(self, klines, now_ms=None):
+        """Intègre des klines de base (1m, ex: flux WebSocket). Returns: les klines agrégées nouvellement clôturées."""
+        self.base.ingest(klines, now_ms)
+        return self.refresh()
+
+    def load_from_store(self, now_ms=None):
+        """
+        Remplit un buffer vide en agrégeant le buffer de base (lui-même chargé depuis le stockage
+        local si besoin), sans appel REST, si celui-ci couvre toute la fenêtre du buffer.
+
+        Returns:
+            int: Nombre de bougies chargées (0 si la base ne suffit pas : voir sync()).
+        """
+        if self.size:
+            return 0
+        self.base.load_from_store(now_ms)
+        if len(self.base) == 0:
+            return 0
+        first = int(self.base.view('open_time')[0])
+        start = -(-first // self.interval_ms) * self.interval_ms # Première bougie complète
+        columns, open_candle = resample_arrays(self._base_since(start), self.interval_ms)
+        if len(columns['open_time']) < self.capacity:
+            return 0
+        with self.lock:
+            if self.size:
+                return 0
+            n = self._fill(columns)
+            self.open_candle = open_candle
+        logging.info(f"Buffer {self.symbol} {self.interval} : {n} bougie(s) agrégée(s) depuis le buffer {self.base.interval}.")
+        return n
+
+    def is_behind(self, klines=(), now_ms=None):
+        """
+        Rattrapage nécessaire si le buffer est vide, si le buffer de base a des bougies manquantes,
+        ou si une bougie que la base ne couvre pas est clôturée.
+        """
+        if self.size == 0 or self.base.is_behind(klines, now_ms):
+            return True
+        return not self._base_covers(self.next_fetch_start()) and super().is_behind(now_ms=now_ms)
+
+    def _needs_download(self):
+        """True si la base ne peut pas compléter le buffer (vide, ou base sans la bougie en cours)."""
+        return self.size == 0 or not self._base_covers(self.next_fetch_start())
+
+    def _sync_steps(self):
+        """
+        Rattrape le buffer de base par REST (bougies 1m manquantes uniquement), puis agrège.
+        Un buffer que la base ne couvre pas est d'abord rempli par un téléchargement direct
+        de la fenêtre complète dans son propre timeframe (une requête). Exécuté par sync() / sync_async().
+
+        Returns:
+            list: Les klines agrégées nouvellement clôturées, ou None en cas d'échec de récupération.
+        """
+        yield kline_buffer.IO, self.load_from_store
+        if (yield from self.base._sync_steps()) is None:
+            return None
+        yield kline_buffer.IO, self.load_from_store # La base rattrapée couvre peut-être déjà la fenêtre
+        new_klines = []
+        if self._needs_download():
+            klines = yield kline_buffer.FETCH, (self.symbol, self.interval, min(self.capacity + 1, kline_buffer.MAX_KLINES_PER_REQUEST), None)
+            if klines is None:
+                return None
+            new_klines = super().ingest(klines)
+        return new_klines + self.refresh()
+
+
+# --- Registre des buffers agrégés par (symbole, intervalle) ---
+_buffers = {}
+_buffers_lock = threading.Lock()
+
+def get_buffer(symbol, interval, capacity):
+    """
+    Retourne le buffer de (symbol, interval) : agrégé depuis le buffer 1m du symbole si
+    l'intervalle le permet (et USE_RESAMPLING), sinon kline_buffer.get_buffer().
+    """
+    if source_interval(interval) == interval:
+        return kline_buffer.get_buffer(symbol, interval, capacity)
+    # Le buffer 1m doit contenir au moins la bougie en cours du plus grand timeframe
+    base = kline_buffer.get_buffer(symbol, BASE_INTERVAL, max(BASE_BUFFER_SIZE, 2 * interval_to_milliseconds(interval) // BASE_INTERVAL_MS))
+    key = (symbol, interval)
+    with _buffers_lock:
+        buffer = _buffers.get(key)
+        if buffer is None or buffer.capacity < capacity or buffer.base is not base:
+            buffer = ResampledKlineBuffer(base, interval, capacity)
+            _buffers[key] = buffer
+        return buffer
+
+def clear_buffers():
+    """Vide le registre des buffers agrégés et celui des buffers téléchargés."""
+    with _buffers_lock:
+        _buffers.clear()
+    kline_buffer.clear_buffers()
@@ -0,0 +1,280 @@
+import argparse
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from binance.helpers import interval_to_milliseconds
+import binance_client_wrapper
+import kline_parser
+
+# Stockage local des klines clôturées, par symbole et intervalle, en colonnes
+# binaires de largeur fixe (un fichier par champ : int64 pour les temps, float64
+# pour les prix/volumes, little-endian). Les nouvelles bougies sont ajoutées en
+# fin de fichier ; les lectures passent par np.memmap et retournent des tranches
+# sans copie. Le téléchargement (backfill) ne porte que sur les plages absentes.
+#
+# Le bot y amorce ses buffers au démarrage (seules les bougies manquées depuis
+# l'arrêt sont redemandées), et le backtest / l'optimiseur peuvent lire une
+# plage de dates directement depuis le disque.
+#
+#   data/klines/BTCUSDT/1m/open_time.i8, open.f8, ..., close_time.i8
+
+try:
+    import config
+    STORE_DIR = getattr(config, 'KLINE_STORE_DIR', None)
+except ImportError:
+    STORE_DIR = None
+STORE_DIR = STORE_DIR or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'klines')
+
+FIELDS = {'open_time': '<i8', 'open': '<f8', 'high': '<f8', 'low': '<f8', 'close': '<f8', 'volume': '<f8', 'close_time': '<i8'}
+ROW_BYTES = 8 # Tous les champs font 8 octets
+MAX_KLINES_PER_REQUEST = 1000
+
+
+def klines_to_arrays(klines):
+    """Convertit des klines (format python-binance, valeurs str ou nombres) en colonnes NumPy typées."""
+    return kline_parser.parse_klines(klines, FIELDS)
+
+def to_ms(value):
+    """Date 'YYYY-MM-DD' (UTC), datetime ou timestamp ms -> timestamp ms (None inchangé)."""
+    if value is None or isinstance(value, (int, np.integer)):
+        return value
+    if isinstance(value, str):
+        value = datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1000)
+
+
+class KlineStore:
+    """
+    Klines clôturées d'un symbole / intervalle sur disque, triées par open time strictement croissant
+    (des trous sont possibles : bot arrêté, maintenance Binance ; missing_ranges() les détecte).
+    """
+
+    def __init__(self, symbol, interval, root=None):
+        self.symbol = symbol.upper()
+        self.interval = interval
+        self.interval_ms = interval_to_milliseconds(interval)
+        self.path = os.path.join(root or STORE_DIR, self.symbol, interval)
+        os.makedirs(self.path, exist_ok=True)
+        self.lock = threading.RLock()
+        self._maps = {}
+        self._mapped_rows = -1
+        self._rows = self._repair()
+
+    def _file(self, field):
+        return os.path.join(self.path, f"{field}.{FIELDS[field][1:]}")
+
+    def _repair(self):
+        """Nombre de lignes complètes ; les colonnes plus longues (ajout interrompu) sont tronquées."""
+        sizes = {field: os.path.getsize(self._file(field)) if os.path.exists(self._file(field)) else 0 for field in FIELDS}
+        rows = min(size // ROW_BYTES for size in sizes.values())
+        for field, size in sizes.items():
+            if size != rows * ROW_BYTES:
+                logging.warning(f"Stockage {self.symbol} {self.interval} : colonne {field} tronquée à {rows} lignes.")
+                with open(self._file(field), 'ab') as f:
+                    f.truncate(rows * ROW_BYTES)
+        return rows
+
+    def __len__(self):
+        return self._rows
+
+    def _column(self, field):
+        """Colonne complète en memmap lecture seule (remappée si le fichier a grandi)."""
+        if self._mapped_rows != self._rows:
+            self._maps = {} if self._rows == 0 else {
+                name: np.memmap(self._file(name), dtype=dtype, mode='r', shape=(self._rows,)) for name, dtype in FIELDS.items()}
+            self._mapped_rows = self._rows
+        if self._rows == 0:
+            return np.empty(0, dtype=FIELDS[field])
+        return self._maps[field]
+
+    @property
+    def first_open_time(self):
+        with self.lock:
+            return int(self._column('open_time')[0]) if self._rows else None
+
+    @property
+    def last_open_time(self):
+        with self.lock:
+            return int(self._column('open_time')[-1]) if self._rows else None
+
+    def read(self, start_ms=None, end_ms=None, fields=None, last=None):
+        """
+        Lecture sans copie d'une plage de bougies (open time dans [start_ms, end_ms], bornes incluses).
+
+        Args:
+            start_ms, end_ms (int | str, optional): Bornes en ms ou dates 'YYYY-MM-DD'.
+            fields (iterable, optional): Champs voulus (tous par défaut).
+            last (int, optional): Ne garder que les `last` dernières bougies de la plage.
+
+        Returns:
+            dict: {champ: tranche np.memmap en lecture seule}. Copier les tranches qui doivent
+                  survivre à une réécriture du stockage (fusion de données anciennes).
+        """
+        with self.lock:
+            open_time = self._column('open_time')
+            lo = 0 if start_ms is None else int(np.searchsorted(open_time, to_ms(start_ms), 'left'))
+            hi = self._rows if end_ms is None else int(np.searchsorted(open_time, to_ms(end_ms), 'right'))
+            if last is not None:
+                lo = max(lo, hi - last)
+            return {field: self._column(field)[lo:hi] for field in (fields or FIELDS)}
+
+    def write_arrays(self, arrays):
+        """
+        Enregistre des colonnes de bougies clôturées. Les bougies postérieures à la dernière
+        connue sont simplement ajoutées en fin de fichier ; des bougies plus anciennes
+        (remplissage d'un trou) imposent une réécriture triée des colonnes.
+
+        Returns:
+            int: Nombre de bougies nouvellement enregistrées.
+        """
+        if len(arrays['open_time']) == 0:
+            return 0
+        order = np.argsort(arrays['open_time'], kind='stable')
+        open_time, first = np.unique(np.asarray(arrays['open_time'])[order], return_index=True)
+        new = {field: np.ascontiguousarray(np.asarray(arrays[field])[order][first], dtype=dtype) for field, dtype in FIELDS.items()}
+        new['open_time'] = open_time.astype(FIELDS['open_time'])
+        with self.lock:
+            last = self.last_open_time
+            if last is None or new['open_time'][0] > last:
+                for field in FIELDS:
+                    with open(self._file(field), 'ab') as f:
+                        f.write(new[field].tobytes())
+                self._rows += len(open_time)
+                return len(open_time)
+            # Fusion : les données existantes sont prioritaires (np.unique garde la première occurrence)
+            old = {field: np.array(self._column(field)) for field in FIELDS}
+            merged_time, keep = np.unique(np.concatenate((old['open_time'], new['open_time'])), return_index=True)
+            added = len(merged_time) - self._rows
+            if added == 0:
+                return 0
+            self._maps = {}; self._mapped_rows = -1 # Libérer les memmaps avant de remplacer les fichiers
+            for field in FIELDS:
+                column = np.concatenate((old[field], new[field]))[keep]
+                tmp = self._file(field) + '.tmp'
+                with open(tmp, 'wb') as f:
+                    f.write(np.ascontiguousarray(column, dtype=FIELDS[field]).tobytes())
+                os.replace(tmp, self._file(field))
+            self._rows = len(merged_time)
+            return added
+
+    def append(self, klines):
+        """Enregistre des klines clôturées (format python-binance). Returns: nombre de bougies nouvelles."""
+        return self.write_arrays(klines_to_arrays(klines)) if klines else 0
+
+    def missing_ranges(self, start_ms, end_ms):
+        """Plages d'open time [début, fin] absentes entre start_ms et end_ms (bornes incluses)."""
+        start_ms, end_ms = to_ms(start_ms), to_ms(end_ms)
+        step = self.interval_ms
+        open_time = self.read(start_ms, end_ms, fields=('open_time',))['open_time']
+        if len(open_time) == 0:
+            return [(start_ms, end_ms)] if start_ms <= end_ms else []
+        ranges = []
+        if open_time[0] - start_ms >= step:
+            ranges.append((start_ms, int(open_time[0]) - step))
+        gaps = np.flatnonzero(np.diff(open_time) > step)
+        ranges.extend((int(open_time[i]) + step, int(open_time[i + 1]) - step) for i in gaps)
+        if end_ms - open_time[-1] >= step:
+            ranges.append((int(open_time[-1]) + step, end_ms))
+        return ranges
+
+    def backfill(self, start_ms, end_ms=None, fetch=None):
+        """
+        Télécharge uniquement les bougies clôturées absentes entre start_ms et end_ms (maintenant par défaut).
+
+        Args:
+            fetch (callable, optional): (symbol, interval, limit, start_time, end_time) -> klines.
+                                        Par défaut binance_client_wrapper.get_klines.
+
+        Returns:
+            int: Nombre de bougies ajoutées, ou None en cas d'échec de récupération.
+        """
+        fetch = fetch or binance_client_wrapper.get_klines
+        now_ms = binance_client_wrapper.server_clock.now_ms()
+        end_ms = min(to_ms(end_ms) if end_ms is not None else now_ms, now_ms - self.interval_ms)
+        added = 0
+        for range_start, range_end in self.missing_ranges(to_ms(start_ms), end_ms):
+            cursor = range_start
+            while cursor <= range_end:
+                klines = fetch(self.symbol, self.interval, limit=MAX_KLINES_PER_REQUEST, start_time=cursor, end_time=range_end)
+                if klines is None:
+                    return None
+                closed = [kline for kline in klines if int(kline[6]) < now_ms]
+                added += self.append(closed)
+                if len(klines) < MAX_KLINES_PER_REQUEST:
+                    break # Fin de la plage (ou trou côté Binance : rien de plus à télécharger)
+                cursor = int(klines[-1][0]) + self.interval_ms
+        if added:
+            logging.info(f"Stockage {self.symbol} {self.interval} : {added} bougie(s) téléchargée(s) ({len(self)} au total).")
+        return added
+
+    def to_dataframe(self, start_ms=None, end_ms=None):
+        """DataFrame au format de backtest.load_klines (temps en ms) pour une plage de dates."""
+        views = self.read(start_ms, end_ms)
+        return pd.DataFrame({'Open time': views['open_time'], 'Open': views['open'], 'High': views['high'],
+                             'Low': views['low'], 'Close': views['close'], 'Volume': views['volume'],
+                             'Close time': views['close_time']})
+
+
+# --- Registre des stockages par (symbole, intervalle) ---
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_store(symbol, interval):
+    """Retourne le stockage de (symbol, interval), ouvert une seule fois par processus."""
+    key = (symbol.upper(), interval)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = KlineStore(symbol, interval)
+        return store
+
+def load_dataframe(symbol, interval, start=None, end=None, backfill=False):
+    """
+    Klines d'une plage de dates lues depuis le stockage local (téléchargées au préalable si backfill).
+
+    Returns:
+        pd.DataFrame: Colonnes de backtest.KLINE_COLUMNS, ou None si aucune bougie.
+    """
+    store = get_store(symbol, interval)
+    if backfill:
+        if start is None:
+            logging.error("Une date de début est nécessaire pour télécharger les klines manquantes.")
+            return None
+        store.backfill(start, end)
+    df = store.to_dataframe(start, end)
+    if df.empty:
+        logging.error(f"Aucune kline {symbol} {interval} dans le stockage local pour cette plage.")
+        return None
+    logging.info(f"{len(df)} klines {symbol} {interval} lues depuis le stockage local.")
+    return df
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Stockage local des klines : téléchargement des plages manquantes, import, état.")
+    parser.add_argument('symbol')
+    parser.add_argument('interval')
+    parser.add_argument('--start', help="Date de début (YYYY-MM-DD, UTC) des klines à télécharger")
+    parser.add_argument('--end', help="Date de fin (YYYY-MM-DD, UTC), maintenant par défaut")
+    parser.add_argument('--import', dest='import_files', nargs='+', metavar='FICHIER',
+                        help="Importer des fichiers CSV/ZIP (data.binance.vision) au lieu de télécharger")
+    args = parser.parse_args()
+
+    store = get_store(args.symbol, args.interval)
+    if args.import_files:
+        import backtest
+        df = backtest.load_klines(args.import_files)
+        if df is not None:
+            added = store.write_arrays({field: df[column].to_numpy() for field, column in zip(FIELDS, backtest.KLINE_COLUMNS)})
+            print(f"{added} bougie(s) importée(s).")
+    elif args.start:
+        store.backfill(args.start, args.end)
+    if len(store):
+        first, last = (datetime.fromtimestamp(t / 1000, timezone.utc).strftime('%Y-%m-%d %H:%M') for t in (store.first_open_time, store.last_open_time))
+        holes = store.missing_ranges(store.first_open_time, store.last_open_time)
+        print(f"{store.symbol} {store.interval} : {len(store)} bougies du {first} au {last} UTC, {len(holes)} trou(s) ({store.path}).")
+    else:
+        print(f"{store.symbol} {store.interval} : stockage vide ({store.path}).")
@@ -0,0 +1,172 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Métriques internes du bot (compteurs, jauges, histogrammes) exposées au format
+# texte Prometheus par la route /metrics de bot.py. Implémentation minimale,
+# thread-safe et sans dépendance : une observation coûte un verrou et quelques
+# additions, ce qui permet d'instrumenter le chemin critique de chaque cycle.
+
+# Bornes (s) par défaut : appels REST et phases du cycle
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Bornes (s) des latences de bout en bout (clôture de bougie -> signal -> exécution)
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (list(extra) if extra else [])
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        if not self.labelnames and self.kind in ('counter', 'gauge'):
+            self._values[()] = 0 # Série exposée dès le démarrage
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Labels attendus pour {self.name} : {self.labelnames}, reçus : {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._render_samples(items))
+        return lines
+
+    def _render_samples(self, items):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Counter(_Metric):
+    """Compteur monotone (ex: nombre d'erreurs API)."""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Valeur instantanée (ex: poids de requêtes consommé dans la minute)."""
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """Distribution d'observations (s) par tranches cumulées, avec somme et nombre."""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0] # (comptes par tranche, somme, nombre)
+            counts = state[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Mesure la durée du bloc (perf_counter), y compris s'il lève une exception."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_samples(self, items):
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', _format_value(float(bound)))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+def render():
+    """Toutes les métriques au format d'exposition texte Prometheus (version 0.0.4)."""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+# --- Métriques du bot ---
+CYCLE_PHASE_SECONDS = Histogram(
+    'tradingbot_cycle_phase_seconds', "Durée des phases d'un cycle du bot (rules, fetch, ingest, indicators, signal, cycle).",
+    ['phase'])
+API_REQUEST_SECONDS = Histogram(
+    'tradingbot_api_request_seconds', "Durée des appels REST Binance (hors attente du limiteur de débit).",
+    ['endpoint', 'client'])
+API_ERRORS = Counter(
+    'tradingbot_api_errors_total', "Erreurs des appels REST Binance par endpoint et code d'erreur.",
+    ['endpoint', 'code'])
+CANDLE_TO_SIGNAL_SECONDS = Histogram(
+    'tradingbot_candle_close_to_signal_seconds', "Délai entre la clôture d'une bougie et l'évaluation de son signal.",
+    ['symbol'], buckets=LATENCY_BUCKETS)
+SIGNAL_TO_FILL_SECONDS = Histogram(
+    'tradingbot_signal_to_fill_seconds', "Délai entre la détection d'un signal d'entrée et la réponse d'exécution de l'ordre.",
+    ['symbol'], buckets=LATENCY_BUCKETS)
+RATE_LIMIT_USED_WEIGHT = Gauge(
+    'tradingbot_rate_limit_used_weight', "Poids de requêtes consommé dans la minute (en-tête X-MBX-USED-WEIGHT-1M).")
+RATE_LIMIT_WEIGHT_LIMIT = Gauge(
+    'tradingbot_rate_limit_weight_limit', "Poids de requêtes autorisé par minute.")
+RATE_LIMIT_THROTTLED = Counter(
+    'tradingbot_rate_limit_throttled_total', "Requêtes retardées par le limiteur de débit local.")
+RATE_LIMIT_BANS = Counter(
+    'tradingbot_rate_limit_bans_total', "Réponses 429/418 (limite Binance atteinte) reçues.",
+    ['status'])
+POSITION_EXITS = Counter(
+    'tradingbot_position_exits_total', "Positions clôturées par raison de sortie (take_profit, stop_loss, trailing_stop, reverse_signal).",
+    ['symbol', 'reason'])
+EXIT_LATENCY_SECONDS = Histogram(
+    'tradingbot_exit_trigger_to_fill_seconds', "Délai entre le tick de prix qui déclenche une sortie et la réponse de l'ordre de clôture.",
+    ['symbol'], buckets=LATENCY_BUCKETS)
+CLOCK_OFFSET_SECONDS = Gauge(
+    'tradingbot_clock_offset_seconds', "Décalage estimé entre l'horloge du serveur Binance et l'horloge locale.")
+SCHEDULER_WAKEUP_DELAY_SECONDS = Histogram(
+    'tradingbot_scheduler_wakeup_delay_seconds', "Retard du réveil d'un minuteur de l'ordonnanceur par rapport à son échéance (heure serveur).",
+    ['timer'], buckets=DEFAULT_BUCKETS)
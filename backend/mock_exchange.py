@@ -0,0 +1,723 @@
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import threading
+import time
+import numpy as np
+from aiohttp import web, WSMsgType
+from binance.helpers import interval_to_milliseconds
+import binance_client_wrapper
+
+# Exchange Binance simulé en local pour faire tourner binance_client_wrapper,
+# async_client_wrapper, MarketStream et run_bot sans testnet.
+# Sert les endpoints REST utilisés par le wrapper (ping, time, exchangeInfo,
+# klines, ticker/price, account, order, order/oco, orderList, myTrades, userDataStream), le
+# combined stream WebSocket (kline + miniTicker / aggTrade) et le user data stream
+# (executionReport, outboundAccountPosition), à partir de klines 1m historiques (CSV) ou synthétiques,
+# rejouées plus vite que le temps réel (horloge virtuelle, facteur `speed`).
+#
+# Les bougies servies sont toujours antérieures à l'heure réelle : seules les
+# bougies clôturées à l'heure virtuelle sont renvoyées par REST, et le flux
+# WebSocket les publie (x = true) au fil de l'horloge virtuelle.
+#
+# Utilisation :
+#   python mock_exchange.py --symbols BTCUSDT,ETHUSDT --speed 60
+#   puis dans config.py : API_URL = "http://localhost:8766/api", STREAM_URL = "ws://localhost:8766"
+
+BASE_INTERVAL_MS = 60_000 # Les données sources sont en 1m
+QUOTE_ASSETS = ('USDT', 'BUSD', 'USDC', 'BTC', 'ETH', 'BNB')
+
+# Chemin REST -> clé de poids du limiteur (pour l'en-tête X-MBX-USED-WEIGHT-1M)
+PATH_WEIGHTS = {'ping': 'ping', 'time': 'ping', 'klines': 'klines', 'ticker/price': 'ticker',
+                'account': 'account', 'exchangeInfo': 'exchange_info', 'order': 'order',
+                'order/oco': 'order_oco', 'orderList': 'order_list', 'myTrades': 'my_trades',
+                'userDataStream': 'listen_key'}
+
+
+def synthetic_klines(n, start_price=30000.0, volatility=0.0008, seed=1, start_time=1577836800000):
+    """
+    Génère n bougies 1m synthétiques (marche aléatoire géométrique), reproductibles via seed.
+
+    Returns:
+        dict: Tableaux NumPy 'open_time', 'open', 'high', 'low', 'close', 'volume'.
+    """
+    rng = np.random.default_rng(seed)
+    close = start_price * np.exp(np.cumsum(rng.normal(0, volatility, n)))
+    open_ = np.concatenate(([start_price], close[:-1]))
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, volatility, n))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, volatility, n))
+    return {'open_time': start_time + np.arange(n, dtype=np.int64) * BASE_INTERVAL_MS,
+            'open': open_, 'high': high, 'low': low, 'close': close, 'volume': rng.uniform(1, 10, n)}
+
+def klines_from_dataframe(df):
+    """Convertit un DataFrame backtest.load_klines (bougies 1m) au format de MockExchange."""
+    return {'open_time': df['Open time'].to_numpy(dtype=np.int64), 'open': df['Open'].to_numpy(dtype=np.float64),
+            'high': df['High'].to_numpy(dtype=np.float64), 'low': df['Low'].to_numpy(dtype=np.float64),
+            'close': df['Close'].to_numpy(dtype=np.float64), 'volume': df['Volume'].to_numpy(dtype=np.float64)}
+
+def _split_symbol(symbol):
+    for quote in QUOTE_ASSETS:
+        if symbol.endswith(quote) and len(symbol) > len(quote):
+            return symbol[:-len(quote)], quote
+    return symbol[:-4], symbol[-4:]
+
+def _fmt(value):
+    return f"{value:.8f}"
+
+
+class MockExchange:
+    """
+    Exchange simulé : données de marché rejouées sur une horloge virtuelle,
+    soldes et ordres en mémoire (MARKET exécutés immédiatement, LIMIT à la traversée du prix).
+    """
+
+    def __init__(self, data, speed=60.0, warmup_bars=1000, balances=None, fee_rate=0.001,
+                 slippage=0.0, latency=0.0, host='127.0.0.1', port=8766):
+        """
+        Args:
+            data (dict): {symbole: tableaux 1m (voir synthetic_klines)}.
+            speed (float): Minutes virtuelles écoulées par minute réelle (0 : horloge pilotée par advance()).
+            warmup_bars (int): Bougies d'historique disponibles au démarrage de l'horloge.
+            balances (dict): Soldes initiaux {asset: quantité}, par défaut 10000 USDT.
+            fee_rate (float): Frais par exécution (déduits de l'asset reçu).
+            slippage (float): Glissement appliqué aux ordres MARKET.
+            latency (float): Délai (s réelles) ajouté à chaque réponse REST.
+        """
+        self.data = data
+        self.speed = speed
+        self.fee_rate = fee_rate
+        self.slippage = slippage
+        self.latency = latency
+        self.host = host
+        self.port = port
+        first_close = min(int(arrays['open_time'][0]) for arrays in data.values())
+        self.start_ms = first_close + warmup_bars * BASE_INTERVAL_MS
+        self.end_ms = min(int(arrays['open_time'][-1]) for arrays in data.values()) + BASE_INTERVAL_MS
+        self.balances = {asset: [float(qty), 0.0] for asset, qty in (balances or {'USDT': 10000.0}).items()}
+        self.orders = {}
+        self.order_lists = {} # orderListId -> {'symbol', 'orderIds', 'listOrderStatus', ...} (OCO)
+        self.stats = {'requests': {}, 'orders': 0, 'fills': 0, 'ws_messages': 0, 'user_events': 0}
+        self.user_events = [] # Événements du user data stream (JSON), diffusés à chaque connexion depuis son ouverture
+        self._listen_keys = set()
+        self._streams = set() # Connexions WebSocket ouvertes du flux de marché
+        self._order_ids = itertools.count(1)
+        self._order_list_ids = itertools.count(1)
+        self._weight_window = (0, 0) # (minute réelle, poids utilisé)
+        self._lock = threading.Lock()
+        self._t0 = None
+        self._offset_ms = 0
+        self._loop = None
+        self._thread = None
+        self._runner = None
+        self._ready = threading.Event()
+
+    # --- Horloge virtuelle ---
+    def now_ms(self):
+        """Heure virtuelle courante (ms), bornée par la fin des données."""
+        elapsed = 0 if self._t0 is None else int((time.monotonic() - self._t0) * self.speed * 1000)
+        return min(self.end_ms, self.start_ms + self._offset_ms + elapsed)
+
+    def advance(self, ms):
+        """Avance l'horloge virtuelle de ms (avec speed=0, l'horloge ne bouge que par advance : rejeu pas à pas)."""
+        self._offset_ms += int(ms)
+
+    def finished(self):
+        return self.now_ms() >= self.end_ms
+
+    # --- Données de marché ---
+    def price(self, symbol, now_ms=None):
+        """Prix courant : interpolation linéaire entre l'ouverture et la clôture de la bougie 1m en cours."""
+        arrays = self.data[symbol]
+        now_ms = self.now_ms() if now_ms is None else now_ms
+        i = max(0, min(len(arrays['open_time']) - 1, int(np.searchsorted(arrays['open_time'], now_ms, side='right')) - 1))
+        progress = min(1.0, max(0.0, (now_ms - int(arrays['open_time'][i])) / BASE_INTERVAL_MS))
+        return float(arrays['open'][i] + (arrays['close'][i] - arrays['open'][i]) * progress)
+
+    def klines(self, symbol, interval, limit=500, start_time=None, end_time=None, now_ms=None):
+        """
+        Bougies clôturées à l'heure virtuelle, agrégées depuis les bougies 1m, au format REST Binance.
+        (Intervalles alignés sur l'epoch : '1w' et '1M' ne suivent pas le calendrier de Binance.)
+        """
+        arrays = self.data[symbol]
+        interval_ms = interval_to_milliseconds(interval) or 30 * 86_400_000
+        now_ms = self.now_ms() if now_ms is None else now_ms
+        last_open = (now_ms // interval_ms) * interval_ms - interval_ms # Dernière bougie clôturée
+        if end_time is not None:
+            last_open = min(last_open, (int(end_time) // interval_ms) * interval_ms)
+        if start_time is not None:
+            first_open = -(-int(start_time) // interval_ms) * interval_ms
+            last_open = min(last_open, first_open + (limit - 1) * interval_ms)
+        else:
+            first_open = last_open - (limit - 1) * interval_ms
+        if last_open < first_open:
+            return []
+        times = arrays['open_time']
+        lo = int(np.searchsorted(times, first_open, side='left'))
+        hi = int(np.searchsorted(times, last_open + interval_ms, side='left'))
+        if hi <= lo:
+            return []
+        buckets = (times[lo:hi] // interval_ms) * interval_ms
+        starts = np.flatnonzero(np.concatenate(([True], buckets[1:] != buckets[:-1])))
+        ends = np.concatenate((starts[1:], [hi - lo])) - 1
+        opens = arrays['open'][lo:hi][starts]
+        closes = arrays['close'][lo:hi][ends]
+        highs = np.maximum.reduceat(arrays['high'][lo:hi], starts)
+        lows = np.minimum.reduceat(arrays['low'][lo:hi], starts)
+        volumes = np.add.reduceat(arrays['volume'][lo:hi], starts)
+        result = []
+        for j, open_time in enumerate(buckets[starts].tolist()):
+            quote_volume = volumes[j] * closes[j]
+            result.append([open_time, _fmt(opens[j]), _fmt(highs[j]), _fmt(lows[j]), _fmt(closes[j]), _fmt(volumes[j]),
+                           open_time + interval_ms - 1, _fmt(quote_volume), int(ends[j] - starts[j] + 1),
+                           _fmt(volumes[j] / 2), _fmt(quote_volume / 2), '0'])
+        return result
+
+    def symbol_info(self, symbol):
+        base, quote = _split_symbol(symbol)
+        return {
+            'symbol': symbol, 'status': 'TRADING', 'baseAsset': base, 'quoteAsset': quote,
+            'baseAssetPrecision': 8, 'quoteAssetPrecision': 8, 'orderTypes': ['LIMIT', 'MARKET'],
+            'filters': [
+                {'filterType': 'PRICE_FILTER', 'minPrice': '0.01000000', 'maxPrice': '1000000.00000000', 'tickSize': '0.01000000'},
+                {'filterType': 'LOT_SIZE', 'minQty': '0.00001000', 'maxQty': '9000.00000000', 'stepSize': '0.00001000'},
+                {'filterType': 'MARKET_LOT_SIZE', 'minQty': '0.00000000', 'maxQty': '100.00000000', 'stepSize': '0.00000000'},
+                {'filterType': 'NOTIONAL', 'minNotional': '5.00000000', 'applyMinToMarket': True,
+                 'maxNotional': '9000000.00000000', 'applyMaxToMarket': False, 'avgPriceMins': 5},
+            ],
+        }
+
+    # --- Ordres et soldes ---
+    def _balance(self, asset):
+        return self.balances.setdefault(asset, [0.0, 0.0])
+
+    def _error(self, code, msg, status=400):
+        return web.json_response({'code': code, 'msg': msg}, status=status)
+
+    def _order_response(self, order):
+        return {key: value for key, value in order.items() if not key.startswith('_')}
+
+    def _fill(self, order, price):
+        """Exécute un ordre au prix donné et met à jour les soldes (frais sur l'asset reçu)."""
+        base, quote = _split_symbol(order['symbol'])
+        qty = float(order['origQty'])
+        notional = qty * price
+        base_balance, quote_balance = self._balance(base), self._balance(quote)
+        if order['side'] == 'BUY':
+            quote_balance[order['_locked_in']] -= notional if order['type'] == 'MARKET' else order['_locked']
+            if order['type'] != 'MARKET':
+                quote_balance[0] += order['_locked'] - notional # Montant bloqué au-delà du coût réel (OCO, stop-limit)
+            base_balance[0] += qty * (1 - self.fee_rate)
+            commission, commission_asset = qty * self.fee_rate, base
+        else:
+            base_balance[order['_locked_in']] -= qty
+            quote_balance[0] += notional * (1 - self.fee_rate)
+            commission, commission_asset = notional * self.fee_rate, quote
+        order.update({'status': 'FILLED', 'executedQty': _fmt(qty), 'cummulativeQuoteQty': _fmt(notional),
+                      'updateTime': self.now_ms(),
+                      'fills': [{'price': _fmt(price), 'qty': _fmt(qty), 'commission': _fmt(commission),
+                                 'commissionAsset': commission_asset, 'tradeId': order['orderId']}]})
+        self.stats['fills'] += 1
+        self._report(order, 'TRADE', qty, price, commission, commission_asset, trade_id=order['orderId'])
+        self._account_event(base, quote)
+
+    # --- User data stream (appelants détenteurs de _lock) ---
+    def _report(self, order, exec_type, last_qty=0.0, last_price=0.0, commission=0.0, commission_asset=None, trade_id=-1,
+                original_client_id=''):
+        """Ajoute l'executionReport d'un ordre (NEW, TRADE, CANCELED) au user data stream."""
+        now_ms = self.now_ms()
+        self.user_events.append(json.dumps({
+            'e': 'executionReport', 'E': now_ms, 's': order['symbol'], 'c': order['clientOrderId'] if not original_client_id else f"cancel{order['orderId']}",
+            'S': order['side'], 'o': order['type'], 'f': order['timeInForce'], 'q': order['origQty'], 'p': order['price'],
+            'P': order.get('stopPrice', _fmt(0.0)), 'x': exec_type, 'X': order['status'], 'r': 'NONE', 'i': order['orderId'],
+            'l': _fmt(last_qty), 'z': order['executedQty'], 'L': _fmt(last_price), 'n': _fmt(commission), 'N': commission_asset,
+            'T': now_ms, 't': trade_id, 'w': order['status'] == 'NEW', 'm': order['type'] != 'MARKET', 'O': order['transactTime'],
+            'Z': order['cummulativeQuoteQty'], 'g': order['orderListId'], 'C': original_client_id}))
+
+    def _account_event(self, *assets):
+        """Ajoute les soldes des assets modifiés (outboundAccountPosition) au user data stream."""
+        now_ms = self.now_ms()
+        self.user_events.append(json.dumps({'e': 'outboundAccountPosition', 'E': now_ms, 'u': now_ms, 'B': [
+            {'a': asset, 'f': _fmt(self._balance(asset)[0]), 'l': _fmt(self._balance(asset)[1])} for asset in assets]}))
+
+    def place_order(self, params):
+        """Crée un ordre (MARKET exécuté immédiatement) ; retourne (réponse, statut HTTP)."""
+        symbol = params.get('symbol')
+        if symbol not in self.data:
+            return {'code': -1121, 'msg': 'Invalid symbol.'}, 400
+        side, order_type = params.get('side'), params.get('type')
+        try:
+            qty = float(params.get('quantity'))
+            price = float(params['price']) if order_type == 'LIMIT' else self.price(symbol)
+        except (TypeError, ValueError, KeyError):
+            return {'code': -1102, 'msg': 'Mandatory parameter was not sent, was empty/null, or malformed.'}, 400
+        if side not in ('BUY', 'SELL') or order_type not in ('MARKET', 'LIMIT') or qty <= 0:
+            return {'code': -1116, 'msg': 'Invalid orderType or side.'}, 400
+        base, quote = _split_symbol(symbol)
+        if order_type == 'MARKET':
+            price *= (1 + self.slippage) if side == 'BUY' else (1 - self.slippage)
+        with self._lock:
+            # Solde disponible (free) ; un ordre LIMIT bloque le montant (locked) jusqu'à l'exécution
+            needed, asset = (qty * price, quote) if side == 'BUY' else (qty, base)
+            balance = self._balance(asset)
+            if balance[0] + 1e-12 < needed:
+                return {'code': -2010, 'msg': 'Account has insufficient balance for requested action.'}, 400
+            order_id = next(self._order_ids)
+            order = {'symbol': symbol, 'orderId': order_id, 'orderListId': -1,
+                     'clientOrderId': params.get('newClientOrderId') or f"mock{order_id}",
+                     'transactTime': self.now_ms(), 'price': _fmt(price if order_type == 'LIMIT' else 0.0),
+                     'origQty': _fmt(qty), 'executedQty': _fmt(0.0), 'cummulativeQuoteQty': _fmt(0.0),
+                     'status': 'NEW', 'timeInForce': params.get('timeInForce', 'GTC'), 'type': order_type,
+                     'side': side, 'fills': [], '_locked': needed, '_locked_in': 0}
+            if order_type == 'LIMIT':
+                balance[0] -= needed; balance[1] += needed; order['_locked_in'] = 1
+            self.orders[order_id] = order
+            self.stats['orders'] += 1
+            self._report(order, 'NEW')
+            if order_type == 'LIMIT':
+                self._account_event(asset)
+            if order_type == 'MARKET':
+                self._fill(order, price)
+            return self._order_response(order), 200
+
+    def place_oco_order(self, params):
+        """
+        Crée un OCO (LIMIT_MAKER + STOP_LOSS_LIMIT partageant un orderListId) ; retourne (réponse, statut HTTP).
+        La quantité (ou le montant, à l'achat) n'est bloquée qu'une fois pour les deux ordres.
+        """
+        symbol = params.get('symbol')
+        if symbol not in self.data:
+            return {'code': -1121, 'msg': 'Invalid symbol.'}, 400
+        side = params.get('side')
+        try:
+            qty = float(params.get('quantity'))
+            limit_price, stop_price = float(params['price']), float(params['stopPrice'])
+            stop_limit_price = float(params['stopLimitPrice'])
+        except (TypeError, ValueError, KeyError):
+            return {'code': -1102, 'msg': 'Mandatory parameter was not sent, was empty/null, or malformed.'}, 400
+        if side not in ('BUY', 'SELL') or qty <= 0:
+            return {'code': -1116, 'msg': 'Invalid orderType or side.'}, 400
+        price = self.price(symbol)
+        if (side == 'SELL' and not limit_price > price > stop_price) or (side == 'BUY' and not limit_price < price < stop_price):
+            return {'code': -2010, 'msg': 'The relationship of the prices for the orders is not correct.'}, 400
+        base, quote = _split_symbol(symbol)
+        with self._lock:
+            needed, asset = (qty * max(limit_price, stop_limit_price), quote) if side == 'BUY' else (qty, base)
+            balance = self._balance(asset)
+            if balance[0] + 1e-12 < needed:
+                return {'code': -2010, 'msg': 'Account has insufficient balance for requested action.'}, 400
+            balance[0] -= needed; balance[1] += needed
+            order_list_id = next(self._order_list_ids)
+            legs = []
+            for order_type, leg_price, client_key in (('STOP_LOSS_LIMIT', stop_limit_price, 'stopClientOrderId'),
+                                                      ('LIMIT_MAKER', limit_price, 'limitClientOrderId')):
+                order_id = next(self._order_ids)
+                order = {'symbol': symbol, 'orderId': order_id, 'orderListId': order_list_id,
+                         'clientOrderId': params.get(client_key) or f"mock{order_id}", 'transactTime': self.now_ms(), 'price': _fmt(leg_price),
+                         'origQty': _fmt(qty), 'executedQty': _fmt(0.0), 'cummulativeQuoteQty': _fmt(0.0),
+                         'status': 'NEW', 'timeInForce': 'GTC', 'type': order_type, 'side': side, 'fills': [],
+                         '_locked': needed, '_locked_in': 1}
+                if order_type == 'STOP_LOSS_LIMIT':
+                    order.update({'stopPrice': _fmt(stop_price), 'timeInForce': params.get('stopLimitTimeInForce', 'GTC'), '_triggered': False})
+                self.orders[order_id] = order
+                legs.append(order)
+            self.order_lists[order_list_id] = {'orderListId': order_list_id, 'contingencyType': 'OCO',
+                                               'listStatusType': 'EXEC_STARTED', 'listOrderStatus': 'EXECUTING',
+                                               'symbol': symbol, 'transactionTime': self.now_ms(),
+                                               'orderIds': [leg['orderId'] for leg in legs]}
+            self.stats['orders'] += 1
+            for leg in legs:
+                self._report(leg, 'NEW')
+            self._account_event(asset)
+            return self._order_list_response(order_list_id), 200
+
+    def _order_list_response(self, order_list_id):
+        order_list = self.order_lists[order_list_id]
+        orders = [self.orders[order_id] for order_id in order_list['orderIds']]
+        response = {key: value for key, value in order_list.items() if key != 'orderIds'}
+        response['orders'] = [{'symbol': o['symbol'], 'orderId': o['orderId'], 'clientOrderId': o['clientOrderId']} for o in orders]
+        response['orderReports'] = [self._order_response(o) for o in orders]
+        return response
+
+    def _close_order_list(self, order):
+        """Termine l'OCO de l'ordre : l'autre ordre est annulé (sans débloquer, c'est fait par l'appelant)."""
+        order_list = self.order_lists.get(order['orderListId'])
+        if order_list is None:
+            return
+        for order_id in order_list['orderIds']:
+            if order_id != order['orderId'] and self.orders[order_id]['status'] == 'NEW':
+                self.orders[order_id]['status'] = 'CANCELED'
+                self._report(self.orders[order_id], 'CANCELED', original_client_id=self.orders[order_id]['clientOrderId'])
+        order_list.update({'listStatusType': 'ALL_DONE', 'listOrderStatus': 'ALL_DONE', 'transactionTime': self.now_ms()})
+
+    def match_limit_orders(self):
+        """
+        Exécute les ordres LIMIT / LIMIT_MAKER dont le prix limite a été traversé, au prix limite. Un
+        STOP_LOSS_LIMIT est déclenché quand le prix traverse stopPrice, puis s'exécute au prix courant
+        tant que son prix limite le permet.
+        """
+        with self._lock:
+            for order in self.orders.values():
+                if order['status'] != 'NEW' or order['type'] not in ('LIMIT', 'LIMIT_MAKER', 'STOP_LOSS_LIMIT'):
+                    continue
+                limit_price = float(order['price'])
+                price = self.price(order['symbol'])
+                if order['type'] == 'STOP_LOSS_LIMIT':
+                    stop_price = float(order['stopPrice'])
+                    if not order['_triggered']:
+                        order['_triggered'] = price <= stop_price if order['side'] == 'SELL' else price >= stop_price
+                    if not order['_triggered']:
+                        continue
+                    fill_price = price
+                else:
+                    fill_price = limit_price
+                if (order['side'] == 'BUY' and price <= limit_price) or (order['side'] == 'SELL' and price >= limit_price):
+                    self._fill(order, fill_price)
+                    if order['orderListId'] != -1:
+                        self._close_order_list(order)
+
+    def cancel_order(self, params):
+        with self._lock:
+            order = self._find_order(params)
+            if order is None or order['status'] != 'NEW':
+                return {'code': -2011, 'msg': 'Unknown order sent.'}, 400
+            self._unlock(order)
+            order['status'] = 'CANCELED'
+            self._report(order, 'CANCELED', original_client_id=order['clientOrderId'])
+            if order['orderListId'] != -1:
+                self._close_order_list(order) # Annuler un ordre d'un OCO annule l'OCO
+            return self._order_response(order), 200
+
+    def cancel_order_list(self, params):
+        with self._lock:
+            try:
+                order_list = self.order_lists.get(int(params.get('orderListId')))
+            except (TypeError, ValueError):
+                order_list = None
+            if order_list is None or order_list['listOrderStatus'] == 'ALL_DONE':
+                return {'code': -2011, 'msg': 'Unknown order list sent.'}, 400
+            first = self.orders[order_list['orderIds'][0]]
+            self._unlock(first) # Montant bloqué une seule fois pour les deux ordres
+            first['status'] = 'CANCELED'
+            self._report(first, 'CANCELED', original_client_id=first['clientOrderId'])
+            self._close_order_list(first)
+            return self._order_list_response(order_list['orderListId']), 200
+
+    def _unlock(self, order):
+        if order['_locked_in'] == 1:
+            base, quote = _split_symbol(order['symbol'])
+            asset = quote if order['side'] == 'BUY' else base
+            balance = self._balance(asset)
+            balance[0] += order['_locked']; balance[1] -= order['_locked']
+            self._account_event(asset)
+
+    def _find_order(self, params):
+        if params.get('orderId'):
+            return self.orders.get(int(params['orderId']))
+        client_id = params.get('origClientOrderId')
+        return next((o for o in self.orders.values() if o['clientOrderId'] == client_id), None)
+
+    # --- Serveur HTTP / WebSocket ---
+    def _count_weight(self, path):
+        endpoint = PATH_WEIGHTS.get(path)
+        weight = binance_client_wrapper.ENDPOINT_WEIGHTS.get(endpoint, 1)
+        minute = int(time.time() // 60)
+        with self._lock:
+            current_minute, used = self._weight_window
+            used = (used if current_minute == minute else 0) + weight
+            self._weight_window = (minute, used)
+            self.stats['requests'][path] = self.stats['requests'].get(path, 0) + 1
+        return used
+
+    async def _handle_rest(self, request):
+        path = request.match_info['path']
+        used = self._count_weight(path)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        params = dict(request.query)
+        if request.method in ('POST', 'PUT', 'DELETE') and request.can_read_body:
+            params.update(await request.post())
+        status = 200
+        if path == 'ping':
+            body = {}
+        elif path == 'time':
+            body = {'serverTime': self.now_ms()}
+        elif path == 'exchangeInfo':
+            symbols = [params['symbol']] if 'symbol' in params else json.loads(params['symbols']) if 'symbols' in params else list(self.data)
+            body = {'timezone': 'UTC', 'serverTime': self.now_ms(), 'rateLimits': [], 'exchangeFilters': [],
+                    'symbols': [self.symbol_info(s) for s in symbols if s in self.data]}
+        elif path == 'klines':
+            if params.get('symbol') not in self.data:
+                return self._error(-1121, 'Invalid symbol.')
+            body = self.klines(params['symbol'], params.get('interval', '1m'), int(params.get('limit', 500)),
+                               params.get('startTime'), params.get('endTime'))
+        elif path == 'ticker/price':
+            if 'symbol' in params:
+                if params['symbol'] not in self.data:
+                    return self._error(-1121, 'Invalid symbol.')
+                body = {'symbol': params['symbol'], 'price': _fmt(self.price(params['symbol']))}
+            else:
+                symbols = json.loads(params['symbols']) if 'symbols' in params else list(self.data)
+                body = [{'symbol': s, 'price': _fmt(self.price(s))} for s in symbols if s in self.data]
+        elif path == 'account':
+            with self._lock:
+                body = {'makerCommission': 10, 'takerCommission': 10, 'canTrade': True, 'accountType': 'SPOT',
+                        'updateTime': self.now_ms(),
+                        'balances': [{'asset': a, 'free': _fmt(f), 'locked': _fmt(l)} for a, (f, l) in self.balances.items()]}
+        elif path == 'order' and request.method == 'POST':
+            body, status = self.place_order(params)
+        elif path == 'order' and request.method == 'DELETE':
+            body, status = self.cancel_order(params)
+        elif path == 'order/oco' and request.method == 'POST':
+            body, status = self.place_oco_order(params)
+        elif path == 'orderList' and request.method == 'DELETE':
+            body, status = self.cancel_order_list(params)
+        elif path == 'orderList':
+            with self._lock:
+                found = params.get('orderListId', '').isdigit() and int(params['orderListId']) in self.order_lists
+                body, status = (self._order_list_response(int(params['orderListId'])), 200) if found \
+                    else ({'code': -2018, 'msg': 'Order list does not exist.'}, 400)
+        elif path == 'order':
+            order = self._find_order(params)
+            body, status = (self._order_response(order), 200) if order else ({'code': -2013, 'msg': 'Order does not exist.'}, 400)
+        elif path == 'myTrades':
+            with self._lock:
+                order = self._find_order(params)
+                body = [{'symbol': order['symbol'], 'id': fill['tradeId'], 'orderId': order['orderId'], 'orderListId': order['orderListId'],
+                         'price': fill['price'], 'qty': fill['qty'], 'quoteQty': _fmt(float(fill['price']) * float(fill['qty'])),
+                         'commission': fill['commission'], 'commissionAsset': fill['commissionAsset'], 'time': order['updateTime'],
+                         'isBuyer': order['side'] == 'BUY', 'isMaker': order['type'] != 'MARKET', 'isBestMatch': True}
+                        for fill in order['fills']] if order else []
+        elif path == 'userDataStream':
+            if request.method == 'POST':
+                listen_key = f"mockListenKey{len(self._listen_keys) + 1}"
+                self._listen_keys.add(listen_key)
+                body = {'listenKey': listen_key}
+            elif params.get('listenKey') not in self._listen_keys:
+                return self._error(-1125, 'This listenKey does not exist.')
+            else:
+                if request.method == 'DELETE': self._listen_keys.discard(params['listenKey'])
+                body = {}
+        elif path == 'openOrders':
+            body = [self._order_response(o) for o in self.orders.values()
+                    if o['status'] == 'NEW' and params.get('symbol') in (None, o['symbol'])]
+        else:
+            return self._error(-1000, f"Endpoint non simulé : {path}", status=404)
+        return web.json_response(body, status=status, headers={'X-MBX-USED-WEIGHT-1M': str(used)})
+
+    def _kline_event(self, symbol, interval, kline, closed):
+        return {'e': 'kline', 'E': self.now_ms(), 's': symbol, 'k': {
+            't': kline[0], 'T': kline[6], 's': symbol, 'i': interval, 'o': kline[1], 'c': kline[4], 'h': kline[2],
+            'l': kline[3], 'v': kline[5], 'n': kline[8], 'x': closed, 'q': kline[7], 'V': kline[9], 'Q': kline[10], 'B': '0'}}
+
+    async def _handle_stream(self, request):
+        ws = web.WebSocketResponse(heartbeat=20)
+        await ws.prepare(request)
+        self._streams.add(ws)
+        subscriptions = []
+        for name in request.query.get('streams', '').split('/'):
+            stream_symbol, _, kind = name.partition('@')
+            symbol = stream_symbol.upper()
+            if symbol in self.data:
+                subscriptions.append((name, symbol, kind))
+        last_sent = {} # Flux kline -> open time de la dernière bougie clôturée envoyée
+        last_prices = {}
+        try:
+            while not ws.closed:
+                now_ms = self.now_ms()
+                for name, symbol, kind in subscriptions:
+                    if kind.startswith('kline_'):
+                        interval = kind[len('kline_'):]
+                        closed = self.klines(symbol, interval, limit=1000, start_time=last_sent[name] + 1, now_ms=now_ms) \
+                            if name in last_sent else self.klines(symbol, interval, limit=1, now_ms=now_ms)
+                        if name not in last_sent:
+                            last_sent[name] = closed[-1][0] if closed else 0 # Ne pas renvoyer l'historique
+                            continue
+                        for kline in closed:
+                            await ws.send_str(json.dumps({'stream': name, 'data': self._kline_event(symbol, interval, kline, True)}))
+                            last_sent[name] = kline[0]; self.stats['ws_messages'] += 1
+                    elif kind in ('miniTicker', 'aggTrade'):
+                        price = self.price(symbol, now_ms)
+                        if last_prices.get(name) != price:
+                            last_prices[name] = price
+                            data = {'e': '24hrMiniTicker', 'E': now_ms, 's': symbol, 'c': _fmt(price)} if kind == 'miniTicker' \
+                                else {'e': 'aggTrade', 'E': now_ms, 's': symbol, 'p': _fmt(price), 'q': '1', 'T': now_ms}
+                            await ws.send_str(json.dumps({'stream': name, 'data': data})); self.stats['ws_messages'] += 1
+                try:
+                    message = await ws.receive(timeout=0.1)
+                    if message.type in (WSMsgType.CLOSE, WSMsgType.CLOSING, WSMsgType.CLOSED, WSMsgType.ERROR):
+                        break
+                except asyncio.TimeoutError:
+                    pass
+        except (ConnectionResetError, RuntimeError):
+            pass
+        finally:
+            self._streams.discard(ws)
+        return ws
+
+    def drop_streams(self):
+        """Ferme les connexions du flux de marché (coupure réseau simulée : reconnexion et backfill REST du client)."""
+        async def close_all():
+            for ws in list(self._streams):
+                await ws.close()
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(close_all(), self._loop).result(5)
+
+    async def _handle_user_stream(self, request):
+        """User data stream d'une clé d'écoute : événements produits depuis la connexion."""
+        if request.match_info['listen_key'] not in self._listen_keys:
+            return web.Response(status=400, text='Invalid listenKey')
+        ws = web.WebSocketResponse(heartbeat=20)
+        await ws.prepare(request)
+        with self._lock:
+            sent = len(self.user_events)
+        try:
+            while not ws.closed:
+                with self._lock:
+                    pending = self.user_events[sent:]
+                for message in pending:
+                    await ws.send_str(message); self.stats['user_events'] += 1
+                sent += len(pending)
+                try:
+                    message = await ws.receive(timeout=0.05)
+                    if message.type in (WSMsgType.CLOSE, WSMsgType.CLOSING, WSMsgType.CLOSED, WSMsgType.ERROR):
+                        break
+                except asyncio.TimeoutError:
+                    pass
+        except (ConnectionResetError, RuntimeError):
+            pass
+        return ws
+
+    async def _matcher(self):
+        while True:
+            self.match_limit_orders()
+            await asyncio.sleep(0.1)
+
+    def build_app(self):
+        app = web.Application()
+        app.router.add_route('*', '/api/v3/{path:.+}', self._handle_rest)
+        app.router.add_get('/stream', self._handle_stream)
+        app.router.add_get('/ws/{listen_key}', self._handle_user_stream)
+        return app
+
+    async def _serve(self):
+        self._runner = web.AppRunner(self.build_app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self._t0 = time.monotonic()
+        matcher = asyncio.ensure_future(self._matcher())
+        logging.info(f"Exchange simulé sur http://{self.host}:{self.port} ({', '.join(self.data)}, x{self.speed}).")
+        self._ready.set()
+        try:
+            while True:
+                await asyncio.sleep(3600)
+        finally:
+            matcher.cancel()
+            await self._runner.cleanup()
+
+    def start(self):
+        """Démarre le serveur dans un thread de fond et attend qu'il écoute."""
+        def run():
+            self._loop = asyncio.new_event_loop()
+            try:
+                self._loop.run_until_complete(self._serve())
+            except asyncio.CancelledError:
+                pass
+            finally:
+                self._loop.close()
+        self._thread = threading.Thread(target=run, name="MockExchange", daemon=True)
+        self._thread.start()
+        self._ready.wait(10)
+        return self
+
+    def stop(self):
+        """Arrête le serveur."""
+        if self._loop is not None and not self._loop.is_closed():
+            def cancel_all():
+                for task in asyncio.all_tasks(self._loop):
+                    task.cancel()
+            self._loop.call_soon_threadsafe(cancel_all) # Annulation dans la boucle : pas de course avec sa fermeture
+        if self._thread is not None:
+            self._thread.join(5)
+
+    @property
+    def api_url(self):
+        return f"http://{self.host}:{self.port}/api"
+
+    @property
+    def stream_url(self):
+        return f"ws://{self.host}:{self.port}"
+
+
+def run_bot_replay(exchange, duration, timeframe='1m'):
+    """
+    Fait tourner run_bot contre l'exchange simulé pendant `duration` secondes réelles
+    et retourne un résumé (requêtes par endpoint, ordres, état final par symbole).
+    """
+    import async_client_wrapper
+    import bot
+    import kline_buffer
+    binance_client_wrapper.API_URL = async_client_wrapper.API_URL = exchange.api_url
+    binance_client_wrapper.STREAM_URL = exchange.stream_url
+    bot.SYMBOLS = list(exchange.data)
+    bot.bot_state['symbol'] = bot.SYMBOLS[0]
+    bot.USE_WEBSOCKET_STREAM = True # Seul mode compatible avec l'horloge virtuelle (réveil sur les événements du flux)
+    kline_buffer.USE_KLINE_STORE = False # Données simulées : ne pas les mélanger au stockage local des vraies klines
+    # Horloge virtuelle accélérée : pas de synchronisation sur l'heure serveur ni de détection
+    # de flux muet (les clôtures simulées ne tombent pas sur les clôtures réelles)
+    binance_client_wrapper.SYNC_SERVER_TIME = False
+    bot.STREAM_STALL_TIMEOUT = 0
+    with bot.config_lock: bot.bot_config['TIMEFRAME_STR'] = timeframe
+    bot.bot_state['stop_requested'] = False
+    thread = threading.Thread(target=bot.run_bot, name="ReplayBot", daemon=True)
+    started = time.monotonic()
+    thread.start()
+    while time.monotonic() - started < duration and not exchange.finished() and thread.is_alive():
+        time.sleep(0.5)
+    bot.bot_state['stop_requested'] = True
+    bot.wake_bot()
+    thread.join(10)
+    async_client_wrapper.run(async_client_wrapper.close_async_client())
+    return {
+        'real_seconds': round(time.monotonic() - started, 1),
+        'virtual_minutes': round((exchange.now_ms() - exchange.start_ms) / BASE_INTERVAL_MS, 1),
+        'requests': dict(exchange.stats['requests']), 'orders': exchange.stats['orders'],
+        'fills': exchange.stats['fills'], 'ws_messages': exchange.stats['ws_messages'],
+        'balances': {a: round(f, 8) for a, (f, l) in exchange.balances.items() if f or l},
+        'symbols': {s: st.to_status() for s, st in bot.bot_state['symbols'].items()},
+    }
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Exchange Binance simulé (REST + WebSocket) pour tests hors ligne.")
+    parser.add_argument('--symbols', default='BTCUSDT', help="Symboles séparés par des virgules")
+    parser.add_argument('--data', nargs='*', help="Fichiers CSV/ZIP de klines 1m (un par symbole, dans l'ordre) ; synthétiques sinon")
+    parser.add_argument('--bars', type=int, default=20000, help="Nombre de bougies 1m synthétiques par symbole")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--speed', type=float, default=60.0, help="Facteur d'accélération de l'horloge virtuelle")
+    parser.add_argument('--latency', type=float, default=0.0, help="Latence REST simulée (s)")
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--run-bot', type=float, metavar='SECONDES', help="Fait tourner run_bot contre l'exchange pendant cette durée")
+    parser.add_argument('--timeframe', default='1m', help="Timeframe du bot en mode --run-bot")
+    args = parser.parse_args()
+
+    symbols = [s.strip().upper() for s in args.symbols.split(',') if s.strip()]
+    if args.data:
+        import backtest
+        data = {symbol: klines_from_dataframe(backtest.load_klines(path)) for symbol, path in zip(symbols, args.data)}
+    else:
+        data = {symbol: synthetic_klines(args.bars, start_price=100.0 * (i + 1) ** 2, seed=args.seed + i)
+                for i, symbol in enumerate(symbols)}
+    exchange = MockExchange(data, speed=args.speed, latency=args.latency, port=args.port).start()
+    try:
+        if args.run_bot:
+            print(json.dumps(run_bot_replay(exchange, args.run_bot, args.timeframe), indent=2, default=str))
+        else:
+            while True:
+                time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        exchange.stop()
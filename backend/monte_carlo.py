@@ -0,0 +1,212 @@
+import argparse
+import logging
+import time
+import numpy as np
+import pandas as pd
+import backtest
+import strategy
+
+try:
+    import config
+    RISK_PER_TRADE = getattr(config, 'RISK_PER_TRADE', 0.01)
+except ImportError:
+    RISK_PER_TRADE = 0.01
+
+# Simulation Monte Carlo des séquences de trades d'un backtest, pour choisir
+# RISK_PER_TRADE en connaissant la distribution des drawdowns : les rendements
+# des trades sont tirés avec remise (bootstrap) ou permutés, sur des dizaines de
+# milliers de trajectoires, puis rejoués avec la taille de position du bot
+# (risque / distance du stop, voir backtest.position_fraction) pour chaque
+# valeur candidate.
+#
+# Les trajectoires sont traitées par blocs (au plus CHUNK_BYTES de tableaux de
+# travail) : une matrice d'index de trades par bloc, partagée par toutes les
+# valeurs candidates, et une seule somme cumulée des log-rendements par valeur.
+#
+# La fraction engagée est plafonnée à 100% (spot) : au-delà de la distance du
+# stop, les candidats donnent des trajectoires identiques (colonne 'capped',
+# avertissement). CAPITAL_ALLOCATION n'est pas appliqué par
+# strategy.calculate_position_size ; --capital-allocation simule ce plafond.
+
+# Mémoire de travail maximale d'un bloc de trajectoires (octets)
+CHUNK_BYTES = 64 * 1024 * 1024
+# Octets par (trajectoire, trade) : index intp (sans conversion par np.take) + log-equity et sommets float64
+BYTES_PER_STEP = 8 + 8 + 8
+PERCENTILES = [5, 25, 50, 75, 95]
+# Candidats par défaut : multiples du RISK_PER_TRADE configuré, ou fractions de la distance du stop
+# si certains multiples dépassent cette distance (position plafonnée à 100% : candidats indiscernables)
+DEFAULT_RISK_MULTIPLES = [0.25, 0.5, 1, 1.5, 2]
+DEFAULT_STOP_FRACTIONS = [0.1, 0.25, 0.5, 0.75, 1]
+METHODS = ('bootstrap', 'permute')
+
+
+def load_trade_returns(path):
+    """
+    Rendements des trades exportés par backtest.py --trades-csv (colonne 'return').
+
+    Returns:
+        np.ndarray: Rendements float64, ou None si le fichier est illisible.
+    """
+    try:
+        returns = pd.read_csv(path, usecols=['return'])['return'].to_numpy(dtype=np.float64)
+    except (OSError, ValueError) as e:
+        logging.error(f"Impossible de lire les trades {path} : {e}")
+        return None
+    returns = returns[np.isfinite(returns)]
+    logging.info(f"{len(returns)} trades chargés depuis {path}.")
+    return returns
+
+
+def _trade_indexes(rng, n_returns, n_paths, n_trades, method):
+    """Matrice [trajectoires x trades] d'index dans le tableau des rendements."""
+    if method == 'permute':
+        indexes = np.tile(np.arange(n_returns, dtype=np.intp), (n_paths, 1))
+        return rng.permuted(indexes, axis=1, out=indexes)[:, :n_trades] # Mélange sur place
+    return rng.integers(0, n_returns, size=(n_paths, n_trades), dtype=np.intp)
+
+
+def _chunk_paths(n_paths, n_trades, n_returns, method, chunk_bytes=CHUNK_BYTES):
+    """Trajectoires par bloc : 'permute' mélange les n_returns index de chaque trajectoire avant de tronquer à n_trades."""
+    columns = max(n_trades, n_returns) if method == 'permute' else n_trades
+    return max(1, min(n_paths, chunk_bytes // (columns * BYTES_PER_STEP)))
+
+
+def simulate(returns, risks, stop_loss_percent=None, n_paths=20000, n_trades=None, method='bootstrap',
+             ruin_level=0.5, seed=None, chunk_bytes=CHUNK_BYTES, capital_allocation=None):
+    """
+    Rejoue n_paths séquences de trades pour chaque RISK_PER_TRADE candidat.
+
+    Args:
+        returns (np.ndarray): Rendements nets des trades (backtest), position entière.
+        risks (list): Valeurs candidates de RISK_PER_TRADE.
+        stop_loss_percent (float, optional): Distance du stop (défaut strategy.STOP_LOSS_PERCENT).
+        n_trades (int, optional): Trades par trajectoire (défaut : nombre de trades du backtest ;
+            au plus ce nombre avec 'permute').
+        method (str): 'bootstrap' (tirage avec remise) ou 'permute' (ordre des trades mélangé).
+        ruin_level (float): Perte, depuis le capital initial, considérée comme une ruine (0.5 = -50%).
+        capital_allocation (float, optional): Fraction maximale du capital engagée par trade (défaut : 100%).
+
+    Returns:
+        pd.DataFrame: Une ligne par risque : fraction engagée (capped : plafonnée), percentiles du rendement
+                      final et du drawdown maximal, probabilité de ruine.
+    """
+    stop_loss_percent = strategy.STOP_LOSS_PERCENT if stop_loss_percent is None else stop_loss_percent
+    returns = np.asarray(returns, dtype=np.float64)
+    n_trades = len(returns) if n_trades is None else n_trades
+    if method == 'permute':
+        n_trades = min(n_trades, len(returns))
+    max_fraction = min(capital_allocation, 1.0) if capital_allocation else 1.0
+    fractions = [min(backtest.position_fraction(risk, stop_loss_percent), max_fraction) for risk in risks]
+    capped = [risk / stop_loss_percent >= max_fraction for risk in risks]
+    if sum(capped) > 1:
+        logging.warning(f"RISK_PER_TRADE {', '.join(str(risk) for risk, cap in zip(risks, capped) if cap)} plafonnés à une fraction "
+                        f"de {max_fraction:.0%} (stop à {stop_loss_percent:.2%}) : résultats identiques.")
+    # Fractions distinctes (plusieurs risques plafonnés à 100% se simulent une seule fois)
+    unique_fractions = sorted(set(fractions))
+    # Log-croissance du capital par trade, pour chaque fraction (une perte >= 100% ruine le compte)
+    with np.errstate(divide='ignore'):
+        log_growth = [np.log(np.maximum(1 + fraction * returns, 0)) for fraction in unique_fractions]
+    ruin_log = np.log(1 - ruin_level) if ruin_level < 1 else -np.inf
+
+    rng = np.random.default_rng(seed)
+    chunk = _chunk_paths(n_paths, n_trades, len(returns), method, chunk_bytes)
+    final = np.empty((len(unique_fractions), n_paths))
+    drawdown = np.empty((len(unique_fractions), n_paths))
+    ruined = np.zeros(len(unique_fractions), dtype=np.int64)
+    log_equity = np.empty((chunk, n_trades))
+    peaks = np.empty((chunk, n_trades))
+    for start in range(0, n_paths, chunk):
+        size = min(chunk, n_paths - start)
+        indexes = _trade_indexes(rng, len(returns), size, n_trades, method)
+        equity, peak = log_equity[:size], peaks[:size]
+        for i, growth in enumerate(log_growth):
+            np.take(growth, indexes, out=equity, mode='clip') # Index toujours valides ; 'raise' copierait out
+            np.cumsum(equity, axis=1, out=equity)
+            np.maximum.accumulate(equity, axis=1, out=peak)
+            np.maximum(peak, 0, out=peak) # Sommet initial : le capital de départ
+            final[i, start:start + size] = np.expm1(equity[:, -1])
+            ruined[i] += int(np.count_nonzero(equity.min(axis=1) <= ruin_log))
+            # Drawdown en log (inf après une ruine totale : drawdown de 100%)
+            drawdown[i, start:start + size] = -np.expm1(-np.subtract(peak, equity, out=peak).max(axis=1))
+        del indexes # Libéré avant le tirage du bloc suivant
+
+    rows = []
+    for risk, fraction, is_capped in zip(risks, fractions, capped):
+        i = unique_fractions.index(fraction)
+        row = {'risk_per_trade': risk, 'position_fraction': fraction, 'capped': is_capped}
+        row.update({f'return_p{p}': value for p, value in zip(PERCENTILES, np.percentile(final[i], PERCENTILES))})
+        row.update({f'drawdown_p{p}': value for p, value in zip(PERCENTILES, np.percentile(drawdown[i], PERCENTILES))})
+        row['loss_probability'] = float(np.mean(final[i] < 0))
+        row['ruin_probability'] = float(ruined[i] / n_paths)
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def format_results(results):
+    """Met en forme les résultats pour l'affichage console (pourcentages)."""
+    shown = results.copy()
+    for column in shown.columns:
+        if column not in ('risk_per_trade', 'capped'):
+            shown[column] = shown[column].map(lambda value: f"{value:+.1%}" if column.startswith('return') else f"{value:.1%}")
+    return shown.to_string(index=False)
+
+
+def parse_risks(spec=None, stop_loss_percent=None):
+    """
+    Valeurs candidates 'v1,v2,v3' ou 'début:fin:pas' (fin incluse). Défaut : DEFAULT_RISK_MULTIPLES x RISK_PER_TRADE,
+    ou DEFAULT_STOP_FRACTIONS x distance du stop si un multiple la dépasse (fraction plafonnée à 100%).
+    """
+    if not spec:
+        stop_loss_percent = strategy.STOP_LOSS_PERCENT if stop_loss_percent is None else stop_loss_percent
+        risks = [round(RISK_PER_TRADE * multiple, 10) for multiple in DEFAULT_RISK_MULTIPLES]
+        if max(risks) <= stop_loss_percent:
+            return risks
+        return [round(stop_loss_percent * fraction, 10) for fraction in DEFAULT_STOP_FRACTIONS]
+    if ':' in spec:
+        start, stop, step = (float(v) for v in spec.split(':'))
+        return [round(value, 10) for value in np.arange(start, stop + step / 2, step)]
+    return [float(v) for v in spec.split(',')]
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Monte Carlo des séquences de trades : drawdowns et ruine selon RISK_PER_TRADE.")
+    backtest.add_data_arguments(parser)
+    parser.add_argument('--trades', help="Trades exportés par backtest.py --trades-csv (au lieu de lancer un backtest)")
+    parser.add_argument('--risk', help=f"RISK_PER_TRADE candidats, ex: 0.0005,0.001,0.002 ou 0.0005:0.003:0.0005 (défaut {parse_risks()})")
+    parser.add_argument('--stop-loss', type=float, help=f"Distance du stop (défaut {strategy.STOP_LOSS_PERCENT})")
+    parser.add_argument('--capital-allocation', type=float,
+                        help="Fraction maximale du capital engagée par trade (CAPITAL_ALLOCATION, non appliqué par le bot ; défaut 100%%)")
+    parser.add_argument('--paths', type=int, default=20000, help="Nombre de trajectoires (défaut 20000)")
+    parser.add_argument('--n-trades', type=int, help="Trades par trajectoire (défaut : nombre de trades du backtest)")
+    parser.add_argument('--method', default='bootstrap', choices=METHODS)
+    parser.add_argument('--ruin', type=float, default=0.5, help="Perte depuis le capital initial comptée comme ruine (défaut 0.5)")
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--fee', type=float, default=0.001)
+    parser.add_argument('--slippage', type=float, default=0.0005)
+    parser.add_argument('--long-only', action='store_true')
+    parser.add_argument('--output', help="Exporter les résultats dans ce fichier CSV")
+    args = parser.parse_args()
+
+    if args.trades:
+        trade_returns = load_trade_returns(args.trades)
+    else:
+        klines_df = backtest.load_data(args)
+        _, trades_df = backtest.run_backtest(klines_df, fee_rate=args.fee, slippage=args.slippage,
+                                             allow_short=not args.long_only) if klines_df is not None else (None, None)
+        trade_returns = trades_df['return'].to_numpy() if trades_df is not None else None
+    if trade_returns is not None and len(trade_returns) == 0:
+        logging.error("Aucun trade à rééchantillonner.")
+    elif trade_returns is not None:
+        started = time.perf_counter()
+        n_trades = args.n_trades or len(trade_returns)
+        if args.method == 'permute': n_trades = min(n_trades, len(trade_returns))
+        results = simulate(trade_returns, parse_risks(args.risk, args.stop_loss), stop_loss_percent=args.stop_loss, n_paths=args.paths,
+                           n_trades=n_trades, method=args.method, ruin_level=args.ruin, seed=args.seed,
+                           capital_allocation=args.capital_allocation)
+        print(format_results(results))
+        print(f"{args.paths} trajectoires x {n_trades} trades ({args.method}) "
+              f"en {time.perf_counter() - started:.2f}s")
+        if args.output:
+            results.to_csv(args.output, index=False)
+            print(f"Résultats exportés dans {args.output}")
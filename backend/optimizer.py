@@ -0,0 +1,246 @@
+import argparse
+import itertools
+import logging
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+import pandas_ta as ta
+import backtest
+import strategy
+
+# Optimiseur de paramètres (grille ou recherche aléatoire) pour la stratégie
+# EMA crossover / RSI. Toutes les séries d'indicateurs nécessaires (chaque
+# longueur d'EMA, chaque période RSI / moyenne de volume) sont calculées une
+# seule fois dans le processus principal et placées dans un bloc de mémoire
+# partagée : les workers n'en reçoivent que le nom et l'index, sans re-pickler
+# les données pour chaque combinaison.
+
+# Paramètres optimisables (mêmes noms que l'endpoint /parameters)
+PARAM_NAMES = ['EMA_SHORT_PERIOD', 'EMA_LONG_PERIOD', 'EMA_FILTER_PERIOD', 'RSI_PERIOD',
+               'RSI_OVERBOUGHT', 'RSI_OVERSOLD', 'VOLUME_AVG_PERIOD',
+               'USE_EMA_FILTER', 'USE_VOLUME_CONFIRMATION']
+
+# Métriques conservées dans le tableau de résultats
+RESULT_METRICS = ['total_return', 'max_drawdown', 'trades', 'win_rate', 'profit_factor',
+                  'avg_trade_return', 'final_equity']
+
+BASE_SERIES = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+
+def default_params():
+    """Paramètres par défaut de la stratégie (valeurs des axes non explorés)."""
+    params = strategy.DEFAULT_PARAMS.to_config()
+    return {name: params[name] for name in PARAM_NAMES}
+
+
+def is_valid_combination(params):
+    """Mêmes contraintes de cohérence que set_parameters dans bot.py."""
+    return (0 < params['EMA_SHORT_PERIOD'] < params['EMA_LONG_PERIOD']
+            and params['EMA_FILTER_PERIOD'] > 0 and params['RSI_PERIOD'] > 1
+            and 0 <= params['RSI_OVERSOLD'] < 50 < params['RSI_OVERBOUGHT'] <= 100
+            and params['VOLUME_AVG_PERIOD'] > 0)
+
+
+def build_combinations(space, n_random=None, seed=None):
+    """
+    Construit les combinaisons de paramètres à évaluer.
+
+    Args:
+        space (dict): {nom: [valeurs]} ; les paramètres absents gardent leur valeur courante.
+        n_random (int, optional): Si fourni, tirage aléatoire sans remise de n combinaisons de la grille.
+        seed (int, optional): Graine du tirage aléatoire.
+
+    Returns:
+        list: Liste de dicts de paramètres valides.
+    """
+    base = default_params()
+    names = [name for name in PARAM_NAMES if name in space]
+    grid = [dict(base, **dict(zip(names, values))) for values in itertools.product(*(space[n] for n in names))]
+    combinations = [params for params in grid if is_valid_combination(params)]
+    if n_random is not None and n_random < len(combinations):
+        combinations = random.Random(seed).sample(combinations, n_random)
+    return combinations
+
+
+def precompute_series(klines_df, combinations):
+    """
+    Calcule une seule fois chaque série d'indicateur utilisée par au moins une combinaison.
+
+    Returns:
+        tuple: (matrice float64 [séries x bougies], {nom de série: ligne})
+    """
+    close = pd.to_numeric(klines_df['Close'], errors='coerce').astype(np.float64)
+    volume = pd.to_numeric(klines_df['Volume'], errors='coerce').astype(np.float64)
+    ema_lengths = set()
+    rsi_periods = set()
+    volume_periods = set()
+    for params in combinations:
+        ema_lengths.update((params['EMA_SHORT_PERIOD'], params['EMA_LONG_PERIOD']))
+        if params['USE_EMA_FILTER']: ema_lengths.add(params['EMA_FILTER_PERIOD'])
+        rsi_periods.add(params['RSI_PERIOD'])
+        if params['USE_VOLUME_CONFIRMATION']: volume_periods.add(params['VOLUME_AVG_PERIOD'])
+
+    series = {name: pd.to_numeric(klines_df[name], errors='coerce').to_numpy(dtype=np.float64) for name in BASE_SERIES}
+    for length in sorted(ema_lengths):
+        series[f'EMA_{length}'] = ta.ema(close, length=length).to_numpy(dtype=np.float64)
+    for period in sorted(rsi_periods):
+        series[f'RSI_{period}'] = ta.rsi(close, length=period).to_numpy(dtype=np.float64)
+    for period in sorted(volume_periods):
+        series[f'Volume_MA_{period}'] = ta.sma(volume, length=period).to_numpy(dtype=np.float64)
+
+    index = {name: row for row, name in enumerate(series)}
+    matrix = np.empty((len(series), len(klines_df)), dtype=np.float64)
+    for name, row in index.items():
+        matrix[row] = series[name]
+    return matrix, index
+
+
+# --- Côté worker : données partagées attachées une fois par processus ---
+_shared = {}
+
+def _init_worker(shm_name, shape, index, sim_options):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _shared['shm'] = shm # Garder une référence pour que le bloc reste mappé
+    _shared['matrix'] = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    _shared['index'] = index
+    _shared['options'] = sim_options
+
+def _series(name):
+    return _shared['matrix'][_shared['index'][name]]
+
+def backtest_params(series, params, options, trade_from=0):
+    """
+    Backtest d'une combinaison à partir de séries précalculées (precompute_series).
+
+    Args:
+        series (callable): nom de série -> np.ndarray.
+        params (dict): Combinaison de paramètres (PARAM_NAMES).
+        options (dict): Options de simulation (frais, glissement, risque, capital, shorts, stop-loss).
+        trade_from (int): Première bougie tradée ; les précédentes ne servent qu'au warm-up des indicateurs.
+
+    Returns:
+        dict: Paramètres + RESULT_METRICS.
+    """
+    rows, signals = strategy.generate_signals_arrays(
+        series('Close'), series('Volume'),
+        series(f"EMA_{params['EMA_SHORT_PERIOD']}"), series(f"EMA_{params['EMA_LONG_PERIOD']}"),
+        series(f"RSI_{params['RSI_PERIOD']}"), params['RSI_OVERBOUGHT'], params['RSI_OVERSOLD'],
+        ema_filter=series(f"EMA_{params['EMA_FILTER_PERIOD']}") if params['USE_EMA_FILTER'] else None,
+        volume_ma=series(f"Volume_MA_{params['VOLUME_AVG_PERIOD']}") if params['USE_VOLUME_CONFIRMATION'] else None)
+    if trade_from:
+        traded = rows >= trade_from
+        rows, signals = rows[traded], signals[traded]
+    trades = backtest.simulate_trades(
+        series('Open')[rows], series('High')[rows], series('Low')[rows], series('Close')[rows], signals,
+        stop_loss_percent=options['stop_loss_percent'], fee_rate=options['fee_rate'],
+        slippage=options['slippage'], allow_short=options['allow_short'])
+    report = backtest.compute_report(trades, len(rows), options['initial_capital'],
+                                     options['risk_per_trade'], options['stop_loss_percent'])
+    result = dict(params)
+    result.update({metric: report[metric] for metric in RESULT_METRICS})
+    return result
+
+def evaluate_combination(params):
+    """Backtest d'une combinaison à partir des séries partagées (exécuté dans un worker)."""
+    return backtest_params(_series, params, _shared['options'])
+
+
+def simulation_options(fee_rate=0.001, slippage=0.0005, risk_per_trade=0.01,
+                       initial_capital=1000.0, allow_short=True, stop_loss_percent=None):
+    """Options de simulation transmises aux workers."""
+    return {
+        'fee_rate': fee_rate, 'slippage': slippage, 'risk_per_trade': risk_per_trade,
+        'initial_capital': initial_capital, 'allow_short': allow_short,
+        'stop_loss_percent': strategy.STOP_LOSS_PERCENT if stop_loss_percent is None else stop_loss_percent,
+    }
+
+
+def run_optimization(klines_df, combinations, workers=None, rank_by='total_return',
+                     fee_rate=0.001, slippage=0.0005, risk_per_trade=0.01,
+                     initial_capital=1000.0, allow_short=True, stop_loss_percent=None):
+    """
+    Évalue toutes les combinaisons en parallèle (un processus par cœur par défaut).
+
+    Returns:
+        pd.DataFrame: Résultats classés par `rank_by` décroissant (colonne 'rank' à partir de 1).
+    """
+    started = time.perf_counter()
+    matrix, index = precompute_series(klines_df, combinations)
+    logging.info(f"{len(index)} séries d'indicateurs précalculées ({matrix.nbytes / 1e6:.1f} Mo) en {time.perf_counter() - started:.2f}s.")
+
+    sim_options = simulation_options(fee_rate, slippage, risk_per_trade, initial_capital, allow_short, stop_loss_percent)
+    workers = workers or os.cpu_count() or 1
+    shm = shared_memory.SharedMemory(create=True, size=matrix.nbytes)
+    try:
+        np.ndarray(matrix.shape, dtype=np.float64, buffer=shm.buf)[:] = matrix
+        del matrix
+        chunksize = max(1, len(combinations) // (workers * 8))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(shm.name, (len(index), len(klines_df)), index, sim_options)) as executor:
+            results = list(executor.map(evaluate_combination, combinations, chunksize=chunksize))
+    finally:
+        shm.close()
+        shm.unlink()
+
+    ranking = pd.DataFrame(results)
+    if not ranking.empty:
+        ranking = ranking.sort_values(rank_by, ascending=(rank_by == 'max_drawdown')).reset_index(drop=True)
+        ranking.insert(0, 'rank', np.arange(1, len(ranking) + 1))
+    logging.info(f"{len(results)} combinaisons évaluées sur {workers} worker(s) en {time.perf_counter() - started:.2f}s.")
+    return ranking
+
+
+def parse_space(specs):
+    """
+    Parse des axes de recherche 'NOM=v1,v2,v3' ou 'NOM=début:fin:pas' (fin incluse).
+
+    Returns:
+        dict: {nom: [valeurs]}
+    """
+    space = {}
+    for spec in specs:
+        name, _, values = spec.partition('=')
+        name = name.strip().upper()
+        if name not in PARAM_NAMES:
+            raise ValueError(f"Paramètre inconnu : {name}")
+        if name.startswith('USE_'):
+            space[name] = [v.strip().lower() in ('1', 'true', 'oui', 'yes') for v in values.split(',')]
+        elif ':' in values:
+            start, stop, step = (int(v) for v in values.split(':'))
+            space[name] = list(range(start, stop + 1, step))
+        else:
+            space[name] = [int(v) for v in values.split(',')]
+    return space
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Optimisation parallèle des paramètres de la stratégie.")
+    backtest.add_data_arguments(parser)
+    parser.add_argument('--param', action='append', default=[], metavar='NOM=VALEURS',
+                        help="Axe de recherche, ex: EMA_SHORT_PERIOD=5:15:1 ou RSI_PERIOD=7,14,21 (répétable)")
+    parser.add_argument('--random', type=int, help="Nombre de combinaisons tirées au hasard (recherche aléatoire)")
+    parser.add_argument('--seed', type=int, help="Graine de la recherche aléatoire")
+    parser.add_argument('--workers', type=int, help="Nombre de processus (défaut : nombre de cœurs)")
+    parser.add_argument('--rank-by', default='total_return', choices=RESULT_METRICS, help="Métrique de classement")
+    parser.add_argument('--fee', type=float, default=0.001)
+    parser.add_argument('--slippage', type=float, default=0.0005)
+    parser.add_argument('--risk', type=float, default=0.01)
+    parser.add_argument('--long-only', action='store_true')
+    parser.add_argument('--output', default='optimization_results.csv', help="Fichier CSV du classement")
+    args = parser.parse_args()
+
+    klines_df = backtest.load_data(args)
+    if klines_df is not None:
+        combinations = build_combinations(parse_space(args.param), n_random=args.random, seed=args.seed)
+        logging.info(f"{len(combinations)} combinaisons à évaluer.")
+        ranking = run_optimization(klines_df, combinations, workers=args.workers, rank_by=args.rank_by,
+                                   fee_rate=args.fee, slippage=args.slippage, risk_per_trade=args.risk,
+                                   allow_short=not args.long_only)
+        ranking.to_csv(args.output, index=False)
+        print(ranking.head(20).to_string(index=False))
+        print(f"Classement complet écrit dans {args.output}")
@@ -0,0 +1,323 @@
+import collections
+import itertools
+import logging
+import threading
+import time
+import binance_client_wrapper
+import symbol_rules
+
+try:
+    import config
+    CLIENT_ORDER_PREFIX = getattr(config, 'CLIENT_ORDER_PREFIX', 'tb') # Préfixe des newClientOrderId du bot
+    ORDER_RECONCILE_AFTER = getattr(config, 'ORDER_RECONCILE_AFTER', 5) # Délai (s) avant de relire par REST un ordre sans nouvelles
+except ImportError:
+    CLIENT_ORDER_PREFIX = 'tb'
+    ORDER_RECONCILE_AFTER = 5
+
+# Gestionnaire d'ordres : chaque ordre du bot reçoit un identifiant client
+# (newClientOrderId) et est suivi jusqu'à un état final, à partir de la réponse
+# REST puis des executionReport du user data stream (binance_client_wrapper.
+# UserDataStream, ou mock_exchange.py). Chaque exécution est appliquée une seule
+# fois (identifiant de trade), quelle que soit la source qui la rapporte en
+# premier : le bot connaît ainsi son exposition exacte et son prix moyen
+# d'entrée par symbole, sans relire les soldes après chaque ordre.
+#
+# Sans flux (ou après une coupure), les ordres non terminés sont relus par REST
+# (reconcile) et leurs exécutions manquantes récupérées via myTrades.
+#
+# Le gestionnaire expose les fonctions d'ordre du wrapper (place_order,
+# place_oco_order, cancel_order_list, get_order_list, get_order) : il sert de
+# broker à strategy.check_entry_conditions et à exit_engine.ExitEngine.
+
+FINAL_STATUSES = ('FILLED', 'CANCELED', 'REJECTED', 'EXPIRED', 'EXPIRED_IN_MATCH')
+ORDER_HISTORY = 200 # Ordres terminés conservés pour /status et les rapports tardifs
+
+
+class TrackedOrder:
+    """Ordre du bot suivi par son identifiant client, avec les exécutions déjà appliquées."""
+
+    def __init__(self, symbol, side, order_type, quantity, client_order_id):
+        self.symbol = symbol
+        self.side = side
+        self.order_type = order_type
+        self.quantity = float(quantity)
+        self.client_order_id = client_order_id
+        self.order_id = None
+        self.order_list_id = None
+        self.status = 'PENDING_NEW' # Envoyé, pas encore confirmé par l'exchange
+        self.executed_qty = 0.0  # Somme des exécutions appliquées
+        self.quote_qty = 0.0
+        self.reported_qty = 0.0  # executedQty annoncé par l'exchange (peut devancer les exécutions reçues)
+        self.trade_ids = set()
+        self.created_at = time.time()
+        self.updated_at = time.monotonic()
+
+    @property
+    def is_final(self):
+        return self.status in FINAL_STATUSES
+
+    @property
+    def average_price(self):
+        return self.quote_qty / self.executed_qty if self.executed_qty > 0 else None
+
+    def to_status(self):
+        return {
+            'symbol': self.symbol, 'side': self.side, 'type': self.order_type, 'quantity': self.quantity,
+            'client_order_id': self.client_order_id, 'order_id': self.order_id, 'status': self.status,
+            'executed_qty': self.executed_qty, 'average_price': self.average_price,
+        }
+
+
+class PositionState:
+    """Exposition nette du bot sur un symbole (quantité de base signée) et prix moyen d'entrée."""
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.quantity = 0.0 # > 0 : long, < 0 : court
+        self.average_entry_price = None
+        self.realized_pnl = 0.0 # En asset de cotation, hors frais
+
+    def apply_fill(self, side, quantity, price, base_commission=0.0):
+        """
+        Intègre une exécution : le prix moyen suit les augmentations de position, une réduction
+        réalise le PnL au prix moyen, un retournement repart du prix d'exécution.
+        """
+        delta = quantity if side == 'BUY' else -quantity
+        previous = self.quantity
+        if previous == 0 or (previous > 0) == (delta > 0):
+            total = abs(previous) + abs(delta)
+            self.average_entry_price = (abs(previous) * (self.average_entry_price or price) + abs(delta) * price) / total
+        else:
+            closed = min(abs(previous), abs(delta))
+            self.realized_pnl += closed * (price - self.average_entry_price) * (1 if previous > 0 else -1)
+            if abs(delta) > abs(previous):
+                self.average_entry_price = price
+        # Frais prélevés sur l'asset de base : la quantité détenue diminue
+        self.quantity = previous + delta - base_commission
+        if abs(self.quantity) < 1e-12:
+            self.quantity, self.average_entry_price = 0.0, None
+
+    def to_status(self):
+        return {
+            'quantity': self.quantity,
+            'average_entry_price': self.average_entry_price,
+            'realized_pnl': self.realized_pnl,
+        }
+
+
+class OrderManager:
+    """
+    Ordres du bot et exposition par symbole. Les rapports d'exécution peuvent arriver depuis
+    le thread du user data stream pendant que la boucle du bot passe des ordres : l'état est
+    protégé par un verrou, et les listeners sont appelés hors verrou.
+    """
+
+    def __init__(self, broker=None, prefix=None):
+        """
+        Args:
+            broker: Module exposant les fonctions d'ordre du wrapper (défaut binance_client_wrapper).
+            prefix (str, optional): Préfixe des identifiants client (défaut CLIENT_ORDER_PREFIX).
+        """
+        self.broker = broker or binance_client_wrapper
+        self.prefix = CLIENT_ORDER_PREFIX if prefix is None else prefix
+        self._orders = collections.OrderedDict() # client_order_id -> TrackedOrder
+        self._positions = {}
+        self._listeners = []
+        self._ids = itertools.count(1)
+        self._session = format(int(time.time()), 'x') # Identifiants uniques d'un démarrage à l'autre
+        self._needs_reconcile = False
+        self.stream_connected = False # Rapports poussés par le user data stream
+        self._lock = threading.Lock()
+
+    def add_listener(self, callback):
+        """
+        Enregistre callback(event), appelé à chaque exécution appliquée :
+        {'type': 'fill', 'symbol', 'order': TrackedOrder.to_status(), 'position': PositionState.to_status()},
+        et pour les événements 'account' / 'connected' / 'disconnected' du user data stream.
+        """
+        self._listeners.append(callback)
+
+    def new_client_order_id(self):
+        """Identifiant client unique (au plus 36 caractères [A-Za-z0-9_-], contrainte Binance)."""
+        return f"{self.prefix}-{self._session}-{next(self._ids)}"
+
+    def get_position(self, symbol):
+        with self._lock:
+            position = self._positions.get(symbol)
+            return position.to_status() if position is not None else PositionState(symbol).to_status()
+
+    def open_orders(self, symbol=None):
+        with self._lock:
+            return [order.to_status() for order in self._orders.values()
+                    if not order.is_final and symbol in (None, order.symbol)]
+
+    def _track(self, symbol, side, order_type, quantity):
+        order = TrackedOrder(symbol, side, order_type, quantity, self.new_client_order_id())
+        with self._lock:
+            self._orders[order.client_order_id] = order
+            self._prune()
+        return order
+
+    def _prune(self):
+        """Oublie les ordres terminés les plus anciens au-delà de ORDER_HISTORY (appelant détenteur du verrou)."""
+        excess = len(self._orders) - ORDER_HISTORY
+        if excess <= 0:
+            return
+        for client_order_id in [cid for cid, order in self._orders.items() if order.is_final][:excess]:
+            del self._orders[client_order_id]
+
+    # --- Fonctions d'ordre (même signature que binance_client_wrapper) ---
+
+    def place_order(self, symbol, side, quantity, order_type='MARKET', price=None, time_in_force='GTC'):
+        """Place un ordre avec un identifiant client suivi ; la réponse (exécutions comprises) est appliquée."""
+        tracked = self._track(symbol, side, order_type, quantity)
+        order = self.broker.place_order(symbol, side, quantity, order_type=order_type, price=price, time_in_force=time_in_force,
+                                        client_order_id=tracked.client_order_id)
+        if not order:
+            # Refus (ou réponse perdue : un executionReport portant cet identifiant corrigera l'état)
+            with self._lock:
+                if tracked.status == 'PENDING_NEW':
+                    tracked.status = 'REJECTED'
+            return order
+        self.apply_order(order)
+        return order
+
+    def place_oco_order(self, symbol, side, quantity, price, stop_price, stop_limit_price, time_in_force='GTC'):
+        """Place un OCO dont les deux ordres (take-profit, stop) sont suivis par identifiant client."""
+        limit_leg = self._track(symbol, side, 'LIMIT_MAKER', quantity)
+        stop_leg = self._track(symbol, side, 'STOP_LOSS_LIMIT', quantity)
+        order_list = self.broker.place_oco_order(symbol, side, quantity, price, stop_price, stop_limit_price, time_in_force=time_in_force,
+                                                 limit_client_order_id=limit_leg.client_order_id,
+                                                 stop_client_order_id=stop_leg.client_order_id)
+        if not order_list:
+            with self._lock:
+                for leg in (limit_leg, stop_leg):
+                    if leg.status == 'PENDING_NEW': leg.status = 'REJECTED'
+            return order_list
+        for report in order_list.get('orderReports', []):
+            self.apply_order(report)
+        return order_list
+
+    def cancel_order_list(self, symbol, order_list_id):
+        result = self.broker.cancel_order_list(symbol, order_list_id)
+        for report in (result or {}).get('orderReports', []):
+            self.apply_order(report)
+        return result
+
+    def get_order_list(self, order_list_id):
+        return self.broker.get_order_list(order_list_id)
+
+    def get_order(self, symbol, order_id=None, client_order_id=None):
+        """Lit l'état d'un ordre par REST et l'applique (exécutions manquantes récupérées si besoin)."""
+        order = self.broker.get_order(symbol, order_id=order_id, client_order_id=client_order_id)
+        if order:
+            self.apply_order(order)
+        return order
+
+    # --- Application des rapports (réponses REST, user data stream) ---
+
+    def apply_order(self, order):
+        """
+        Applique l'état d'un ordre au format REST (place_order, get_order, orderReports d'un OCO) et ses
+        exécutions ('fills'). Si l'exchange annonce plus d'exécutions que celles reçues, elles sont lues via myTrades.
+        """
+        with self._lock:
+            tracked = self._orders.get(order.get('clientOrderId'))
+            if tracked is None:
+                return
+            tracked.order_id = order.get('orderId', tracked.order_id)
+            tracked.order_list_id = order.get('orderListId', tracked.order_list_id)
+            tracked.status = order.get('status', tracked.status)
+            tracked.reported_qty = max(tracked.reported_qty, float(order.get('executedQty') or 0))
+            tracked.updated_at = time.monotonic()
+        for fill in order.get('fills', []):
+            self._apply_fill(tracked, fill.get('tradeId'), float(fill['qty']), float(fill['price']),
+                             float(fill.get('commission') or 0), fill.get('commissionAsset'))
+        if tracked.reported_qty > tracked.executed_qty + 1e-12 and tracked.order_id is not None:
+            self._fetch_trades(tracked)
+
+    def _fetch_trades(self, tracked):
+        trades = self.broker.get_order_trades(tracked.symbol, tracked.order_id)
+        for trade in trades or []:
+            self._apply_fill(tracked, trade.get('id'), float(trade['qty']), float(trade['price']),
+                             float(trade.get('commission') or 0), trade.get('commissionAsset'))
+
+    def on_execution_report(self, report):
+        """Applique un executionReport du user data stream (ordres hors bot ignorés)."""
+        # Annulation : 'c' est l'identifiant de la requête d'annulation, 'C' celui de l'ordre d'origine
+        client_order_id = (report.get('C') or report.get('c')) if report.get('x') == 'CANCELED' else report.get('c')
+        with self._lock:
+            tracked = self._orders.get(client_order_id)
+            if tracked is None:
+                return
+            tracked.order_id = report.get('i', tracked.order_id)
+            if report.get('g', -1) != -1: tracked.order_list_id = report['g']
+            tracked.status = report.get('X', tracked.status)
+            tracked.reported_qty = max(tracked.reported_qty, float(report.get('z') or 0))
+            tracked.updated_at = time.monotonic()
+        if report.get('x') == 'TRADE':
+            self._apply_fill(tracked, report.get('t'), float(report['l']), float(report['L']),
+                             float(report.get('n') or 0), report.get('N'))
+
+    def on_stream_event(self, event):
+        """Callback de binance_client_wrapper.UserDataStream (rapports appliqués, autres événements relayés aux listeners)."""
+        if event['type'] == 'execution_report':
+            self.on_execution_report(event['report'])
+            return
+        if event['type'] in ('connected', 'disconnected'):
+            self.stream_connected = event['type'] == 'connected'
+            self._needs_reconcile = self._needs_reconcile or self.stream_connected # Rapports manqués pendant la coupure
+        for listener in self._listeners:
+            listener(event)
+
+    def _apply_fill(self, tracked, trade_id, quantity, price, commission, commission_asset):
+        """Applique une exécution une seule fois (identifiant de trade), puis prévient les listeners."""
+        rules = symbol_rules.get_symbol_rules(tracked.symbol)
+        base_asset = rules.base_asset if rules is not None else None
+        with self._lock:
+            if trade_id is not None and trade_id in tracked.trade_ids:
+                return
+            tracked.trade_ids.add(trade_id)
+            tracked.executed_qty += quantity
+            tracked.quote_qty += quantity * price
+            position = self._positions.setdefault(tracked.symbol, PositionState(tracked.symbol))
+            position.apply_fill(tracked.side, quantity, price, commission if commission_asset == base_asset else 0.0)
+            event = {'type': 'fill', 'symbol': tracked.symbol, 'order': tracked.to_status(), 'position': position.to_status()}
+        logging.info(f"[{tracked.symbol}] Exécution {tracked.side} {quantity} à {price} (ordre {tracked.client_order_id}, "
+                     f"{tracked.status}) : exposition {position.quantity}.")
+        for listener in self._listeners:
+            listener(event)
+
+    def reconcile(self, force=False):
+        """
+        Relit par REST les ordres non terminés sans nouvelles depuis ORDER_RECONCILE_AFTER s, ou tous après
+        une reconnexion du flux (force). Flux connecté, seuls les ordres jamais confirmés sont concernés.
+
+        Returns:
+            int: Nombre d'ordres relus.
+        """
+        force = force or self._needs_reconcile
+        self._needs_reconcile = False
+        now = time.monotonic()
+        with self._lock:
+            stale = [order for order in self._orders.values()
+                     if not order.is_final and (force or now - order.updated_at >= ORDER_RECONCILE_AFTER)
+                     and (force or not self.stream_connected or order.status == 'PENDING_NEW')]
+        for tracked in stale:
+            order = self.broker.get_order(tracked.symbol, client_order_id=tracked.client_order_id)
+            if order:
+                self.apply_order(order)
+            else:
+                with self._lock:
+                    tracked.updated_at = time.monotonic() # Nouvelle tentative après ORDER_RECONCILE_AFTER
+        if stale:
+            logging.info(f"{len(stale)} ordre(s) resynchronisé(s) par REST.")
+        return len(stale)
+
+    def to_status(self):
+        with self._lock:
+            return {
+                'positions': {symbol: position.to_status() for symbol, position in self._positions.items()},
+                'open_orders': [order.to_status() for order in self._orders.values() if not order.is_final],
+                'stream_connected': self.stream_connected,
+            }
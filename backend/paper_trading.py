@@ -0,0 +1,257 @@
+import collections
+import itertools
+import logging
+import threading
+import time
+import binance_client_wrapper
+import exit_engine
+import symbol_rules
+
+try:
+    import config
+    PAPER_TRADING = getattr(config, 'PAPER_TRADING', False) # Ordres du bot simulés (aucun ordre envoyé à Binance)
+    PAPER_TRADE_SHADOWS = getattr(config, 'PAPER_TRADE_SHADOWS', True) # Un portefeuille virtuel par stratégie shadow
+    PAPER_BALANCES = getattr(config, 'PAPER_BALANCES', {'USDT': 10000.0}) # Soldes virtuels initiaux
+    PAPER_FEE_RATE = getattr(config, 'PAPER_FEE_RATE', 0.001)
+    PAPER_SLIPPAGE = getattr(config, 'PAPER_SLIPPAGE', 0.0005)
+    PAPER_LATENCY_MS = getattr(config, 'PAPER_LATENCY_MS', 0)
+except ImportError:
+    PAPER_TRADING = False
+    PAPER_TRADE_SHADOWS = True
+    PAPER_BALANCES = {'USDT': 10000.0}
+    PAPER_FEE_RATE = 0.001
+    PAPER_SLIPPAGE = 0.0005
+    PAPER_LATENCY_MS = 0
+
+# Paper trading : les ordres passent par le même chemin que les ordres réels
+# (strategy.check_entry_conditions, exit_engine.ExitEngine) mais sont exécutés
+# en mémoire par un PaperAccount, au dernier prix reçu (ticker / aggTrade du flux,
+# réel ou rejoué par mock_exchange.py), après une latence simulée et avec un
+# glissement défavorable. Aucun appel REST : ni coût, ni poids consommé sur les
+# limites d'ordres, ce qui permet de faire trader en parallèle toutes les
+# stratégies shadow (un PaperBook chacune) sur les données live.
+#
+# La latence simulée ne bloque pas le thread du bot : l'ordre est accepté (status
+# NEW) puis exécuté au premier prix reçu après PAPER_LATENCY_MS (update_price,
+# chemin des ticks) ; ExitEngine suit son exécution via get_order.
+
+_order_ids = itertools.count(1)
+ORDER_HISTORY = 200 # Ordres simulés conservés pour get_order
+
+
+class PaperAccount:
+    """
+    Soldes virtuels et exécution simulée des ordres au marché. Expose place_order avec la signature
+    de binance_client_wrapper.place_order (utilisable comme broker de check_entry_conditions / ExitEngine).
+    """
+
+    simulated = True # Exclu des métriques d'exécution réelles
+
+    def __init__(self, balances=None, fee_rate=None, slippage=None, latency_ms=None, name=None, price_source=None,
+                 clock=time.monotonic):
+        """
+        Args:
+            balances (dict, optional): Soldes initiaux {asset: quantité} (défaut PAPER_BALANCES).
+            price_source (callable, optional): price_source(symbol) -> dernier prix connu ou None, lu après la
+                latence (ex: prix du flux WebSocket, mis à jour par son propre thread). Sinon : update_price.
+            clock (callable): Horloge monotone (s) des échéances de latence, injectable pour les tests.
+        """
+        self.name = name or 'paper'
+        self.initial_balances = {asset: float(quantity) for asset, quantity in (PAPER_BALANCES if balances is None else balances).items()}
+        self.fee_rate = PAPER_FEE_RATE if fee_rate is None else fee_rate
+        self.slippage = PAPER_SLIPPAGE if slippage is None else slippage
+        self.latency_ms = PAPER_LATENCY_MS if latency_ms is None else latency_ms
+        self.price_source = price_source
+        self.clock = clock
+        self._balances = dict(self.initial_balances)
+        self._prices = {}
+        self._fees = {} # Frais payés par asset
+        self.order_count = 0
+        self._orders = collections.OrderedDict() # orderId -> réponse au format Binance (ORDER_HISTORY derniers)
+        self._pending = {} # orderId -> échéance (time.monotonic()) des ordres en attente de la latence simulée
+        self._lock = threading.Lock()
+
+    def update_price(self, symbol, price):
+        """
+        Dernier prix d'un symbole (tick du flux ou prix du cycle) : prix d'exécution des prochains ordres,
+        et des ordres en attente du symbole dont la latence simulée est écoulée.
+        """
+        self._prices[symbol] = price
+        now = self.clock()
+        with self._lock:
+            due = [self._orders[order_id] for order_id, due_at in self._pending.items()
+                   if due_at <= now and self._orders[order_id]['symbol'] == symbol]
+            for order in due:
+                del self._pending[order['orderId']]
+        for order in due: # Hors verrou : _execute le prend
+            self._execute(order, price)
+
+    def last_price(self, symbol):
+        price = self.price_source(symbol) if self.price_source is not None else None
+        return price or self._prices.get(symbol)
+
+    def free(self, asset):
+        """Solde virtuel disponible d'un asset (0.0 si non possédé)."""
+        return self._balances.get(asset, 0.0)
+
+    def snapshot(self):
+        """Soldes virtuels au format binance_client_wrapper.AccountSnapshot."""
+        with self._lock:
+            balances = [{'asset': asset, 'free': quantity, 'locked': 0.0} for asset, quantity in self._balances.items()]
+        return binance_client_wrapper.AccountSnapshot(balances)
+
+    def place_order(self, symbol, side, quantity, order_type='MARKET', price=None, time_in_force='GTC'):
+        """
+        Exécute un ordre au marché simulé : dernier prix, glissement défavorable de PAPER_SLIPPAGE,
+        frais PAPER_FEE_RATE prélevés sur l'asset reçu (comme Binance sans BNB). Avec PAPER_LATENCY_MS,
+        l'ordre est seulement accepté (status NEW) et exécuté au premier prix reçu après ce délai (update_price).
+
+        Returns:
+            dict: Réponse au format Binance (status FILLED, executedQty, cummulativeQuoteQty, fills ; ou NEW
+                  avec latence), None sinon (type non supporté, prix inconnu, solde insuffisant).
+        """
+        if order_type != 'MARKET':
+            logging.error(f"[{self.name}] Type d'ordre '{order_type}' non supporté en paper trading.")
+            return None
+        if symbol_rules.get_symbol_rules(symbol) is None:
+            logging.error(f"[{self.name}] Règles de {symbol} indisponibles, ordre simulé refusé.")
+            return None
+        order = {
+            'symbol': symbol, 'orderId': next(_order_ids), 'transactTime': binance_client_wrapper.server_clock.now_ms(),
+            'side': side, 'type': order_type, 'status': 'NEW',
+            'origQty': str(float(quantity)), 'executedQty': '0', 'cummulativeQuoteQty': '0', 'fills': [],
+        }
+        with self._lock:
+            self._orders[order['orderId']] = order
+            while len(self._orders) > ORDER_HISTORY:
+                self._pending.pop(self._orders.popitem(last=False)[0], None)
+            if self.latency_ms > 0:
+                # Aller-retour de l'ordre : exécuté au premier tick après la latence, le prix peut bouger entre-temps
+                self._pending[order['orderId']] = self.clock() + self.latency_ms / 1000
+                response = dict(order)
+        if self.latency_ms > 0:
+            logging.info(f"[{self.name}] Ordre simulé {side} de {quantity} {symbol} accepté, exécution après {self.latency_ms} ms.")
+            return response
+        last_price = self.last_price(symbol)
+        if not last_price:
+            logging.error(f"[{self.name}] Aucun prix connu pour {symbol}, ordre simulé refusé.")
+            with self._lock:
+                order['status'] = 'REJECTED'
+            return None
+        return dict(order) if self._execute(order, last_price) else None
+
+    def _execute(self, order, last_price):
+        """Exécute un ordre simulé au prix last_price (glissement et frais inclus) ; EXPIRED si le solde est insuffisant."""
+        symbol, side, quantity = order['symbol'], order['side'], float(order['origQty'])
+        rules = symbol_rules.get_symbol_rules(symbol)
+        fill_price = last_price * (1 + self.slippage) if side == 'BUY' else last_price * (1 - self.slippage)
+        quote_quantity = quantity * fill_price
+        base, quote = rules.base_asset, rules.quote_asset
+        with self._lock:
+            if side == 'BUY':
+                spent_asset, spent, received_asset, received = quote, quote_quantity, base, quantity
+            else:
+                spent_asset, spent, received_asset, received = base, quantity, quote, quote_quantity
+            if self._balances.get(spent_asset, 0.0) < spent:
+                logging.error(f"[{self.name}] Solde {spent_asset} insuffisant pour l'ordre {side} de {quantity} {symbol} "
+                              f"({self._balances.get(spent_asset, 0.0)} < {spent}).")
+                order['status'] = 'EXPIRED'
+                return False
+            commission = received * self.fee_rate
+            self._balances[spent_asset] -= spent
+            self._balances[received_asset] = self._balances.get(received_asset, 0.0) + received - commission
+            self._fees[received_asset] = self._fees.get(received_asset, 0.0) + commission
+            self.order_count += 1
+            order.update({
+                'status': 'FILLED', 'executedQty': str(quantity), 'cummulativeQuoteQty': str(quote_quantity),
+                'fills': [{'price': str(fill_price), 'qty': str(quantity), 'commission': str(commission),
+                           'commissionAsset': received_asset}],
+            })
+        logging.info(f"[{self.name}] Ordre simulé {side} de {quantity} {symbol} exécuté à {fill_price} (dernier prix {last_price}).")
+        return True
+
+    def get_order(self, symbol, order_id=None, client_order_id=None):
+        """État d'un ordre simulé (format Binance), None s'il est inconnu (signature de binance_client_wrapper.get_order)."""
+        with self._lock:
+            order = self._orders.get(order_id)
+            response = dict(order) if order is not None and order['symbol'] == symbol else None
+        if response is None:
+            logging.error(f"[{self.name}] Ordre simulé {order_id} introuvable pour {symbol}.")
+        return response
+
+    def equity(self, quote_asset='USDT', balances=None):
+        """Valeur des soldes virtuels (ou de balances) en quote_asset, au dernier prix connu (assets sans prix ignorés)."""
+        if balances is None:
+            with self._lock:
+                balances = dict(self._balances)
+        total = 0.0
+        for asset, quantity in balances.items():
+            if asset == quote_asset:
+                total += quantity
+            elif quantity:
+                total += quantity * (self.last_price(asset + quote_asset) or 0.0)
+        return total
+
+    def to_status(self, quote_asset='USDT'):
+        initial = self.equity(quote_asset, self.initial_balances) # Soldes initiaux conservés, aux prix actuels
+        equity = self.equity(quote_asset)
+        with self._lock:
+            balances = {asset: quantity for asset, quantity in self._balances.items() if quantity}
+            fees = dict(self._fees)
+            pending_orders = len(self._pending)
+        return {
+            'name': self.name,
+            'balances': balances,
+            'equity': equity,
+            'return': equity / initial - 1 if initial else None,
+            'orders': self.order_count,
+            'pending_orders': pending_orders,
+            'fees': fees,
+        }
+
+
+class PaperBook:
+    """
+    Stratégie tradée en paper trading : son propre PaperAccount et ses positions (ExitEngine sans OCO,
+    TP / SL / stop suiveur évalués à chaque tick). Les stratégies shadow en ont un chacune.
+    """
+
+    def __init__(self, strategy_instance, account=None):
+        self.strategy = strategy_instance
+        self.account = account or PaperAccount(name=strategy_instance.name)
+        self.exits = exit_engine.ExitEngine(use_oco=False, broker=self.account, name=strategy_instance.name)
+        self.trades = 0
+        self.wins = 0
+
+    def has_position(self, symbol):
+        return self.exits.has_position(symbol)
+
+    def _record(self, exit_result):
+        if exit_result is not None:
+            self.trades += 1
+            self.wins += exit_result['return'] > 0
+        return exit_result
+
+    def on_price(self, symbol, price):
+        """Nouveau prix (tick) : prix d'exécution du compte et sorties TP / SL / stop suiveur."""
+        self.account.update_price(symbol, price)
+        return self._record(self.exits.on_price(symbol, price))
+
+    def on_candle(self, symbol, row, risk_per_trade, capital_allocation, rules):
+        """Bougie clôturée (signaux de la stratégie) : sortie sur signal inverse puis entrée, comme process_symbol."""
+        if self.exits.has_position(symbol):
+            self._record(self.strategy.check_exit_conditions(row, symbol, self.exits))
+        if not self.exits.has_position(symbol):
+            order = self.strategy.check_entry_conditions(row, symbol, risk_per_trade, capital_allocation,
+                                                         self.account.free(rules.quote_asset), rules, broker=self.account)
+            if order:
+                self.exits.open_position(symbol, order, self.strategy.params, rules)
+
+    def to_status(self):
+        status = self.account.to_status()
+        status.update({
+            'positions': self.exits.to_status(),
+            'trades': self.trades,
+            'win_rate': self.wins / self.trades if self.trades else None,
+        })
+        return status
@@ -1,8 +1,14 @@
+import numpy as np
 import pandas as pd
 import pandas_ta as ta
 import logging
-import math # Pour les ajustements de quantité (floor, log10)
+import time
+from typing import NamedTuple
 import binance_client_wrapper # Import the wrapper
+import kline_parser # Klines brutes -> tableaux NumPy typés
+import metrics # Latence signal -> exécution
+import symbol_rules # Règles de trading précompilées (arrondi Decimal exact au stepSize)
+from indicators import IndicatorEngine # Moteur incrémental (O(1) par bougie)
 
 # Importer la configuration (pour les périodes, niveaux RSI, etc.)
 try:
@@ -17,6 +23,10 @@ try:
     VOLUME_AVG_PERIOD = getattr(config, 'VOLUME_AVG_PERIOD', 20) # Pour la confirmation de volume
     USE_EMA_FILTER = getattr(config, 'USE_EMA_FILTER', True) # Activer/désactiver le filtre EMA long
     USE_VOLUME_CONFIRMATION = getattr(config, 'USE_VOLUME_CONFIRMATION', False) # Activer/désactiver confirmation volume
+    STOP_LOSS_PERCENT = getattr(config, 'STOP_LOSS_PERCENT', 0.003) # Stop-loss à 0.3% du prix d'entrée
+    TAKE_PROFIT_PERCENT = getattr(config, 'TAKE_PROFIT_PERCENT', 0.0) # Take-profit (0 : désactivé)
+    TRAILING_STOP_PERCENT = getattr(config, 'TRAILING_STOP_PERCENT', 0.0) # Stop suiveur (0 : désactivé)
+    EXIT_ON_REVERSE_SIGNAL = getattr(config, 'EXIT_ON_REVERSE_SIGNAL', True) # Sortie sur signal inverse
 
 except ImportError:
     logging.warning("Fichier config.py non trouvé. Utilisation des paramètres par défaut pour la stratégie.")
@@ -30,9 +40,67 @@ except ImportError:
     VOLUME_AVG_PERIOD = 20
     USE_EMA_FILTER = True
     USE_VOLUME_CONFIRMATION = False
+    STOP_LOSS_PERCENT = 0.003
+    TAKE_PROFIT_PERCENT = 0.0
+    TRAILING_STOP_PERCENT = 0.0
+    EXIT_ON_REVERSE_SIGNAL = True
 
 
-def calculate_indicators(df):
+class StrategyParams(NamedTuple):
+    """
+    Jeu de paramètres immuable de la stratégie EMA crossover / RSI.
+    Les 9 premiers champs sont, dans l'ordre, ceux de IndicatorEngine.
+    """
+    ema_short_period: int = 9
+    ema_long_period: int = 21
+    ema_filter_period: int = 50
+    rsi_period: int = 14
+    rsi_overbought: float = 75
+    rsi_oversold: float = 25
+    volume_avg_period: int = 20
+    use_ema_filter: bool = True
+    use_volume_confirmation: bool = False
+    stop_loss_percent: float = 0.003
+    take_profit_percent: float = 0.0
+    trailing_stop_percent: float = 0.0
+    exit_on_reverse_signal: bool = True
+
+    @classmethod
+    def from_config(cls, mapping, base=None):
+        """
+        Construit un jeu de paramètres à partir de clés au format config.py / endpoint /parameters
+        (ex: {'EMA_SHORT_PERIOD': 12}) ; les clés absentes gardent la valeur de base.
+        """
+        base = base if base is not None else DEFAULT_PARAMS
+        changes = {field: mapping[key] for key, field in CONFIG_KEYS.items() if key in mapping}
+        return base._replace(**changes)
+
+    def to_config(self):
+        """Paramètres au format config.py / endpoint /parameters."""
+        return {key: getattr(self, field) for key, field in CONFIG_KEYS.items()}
+
+    @property
+    def indicator_params(self):
+        """Tuple des paramètres d'indicateurs (comparable à IndicatorEngine.params)."""
+        return tuple(self[:9])
+
+    def required_history(self):
+        """Nombre de bougies à conserver pour calculer tous les indicateurs utilisés (+ marge)."""
+        return max(self.ema_long_period, self.ema_filter_period if self.use_ema_filter else 0, self.rsi_period,
+                   self.volume_avg_period if self.use_volume_confirmation else 0) + 5
+
+# Clés config.py / /parameters -> champs de StrategyParams
+CONFIG_KEYS = {field.upper(): field for field in StrategyParams._fields}
+
+# Paramètres par défaut (config.py), lus une seule fois au chargement : les valeurs modifiées
+# à chaud (/parameters) vivent dans des instances Strategy, jamais dans les globales du module
+DEFAULT_PARAMS = StrategyParams(EMA_SHORT_PERIOD, EMA_LONG_PERIOD, EMA_FILTER_PERIOD, RSI_PERIOD,
+                                RSI_OVERBOUGHT, RSI_OVERSOLD, VOLUME_AVG_PERIOD,
+                                USE_EMA_FILTER, USE_VOLUME_CONFIRMATION, STOP_LOSS_PERCENT,
+                                TAKE_PROFIT_PERCENT, TRAILING_STOP_PERCENT, EXIT_ON_REVERSE_SIGNAL)
+
+
+def calculate_indicators(df, params=None):
     """
     Calcule les indicateurs techniques nécessaires sur le DataFrame de klines.
 
@@ -42,6 +110,7 @@ def calculate_indicators(df):
                             'Quote asset volume', 'Number of trades', 'Taker buy base asset volume',
                             'Taker buy quote asset volume', 'Ignore'] - typique de python-binance.
                            Assurez-vous que 'Close' et 'Volume' sont de type float.
+        params (StrategyParams, optional): Paramètres de la stratégie (défaut DEFAULT_PARAMS).
 
     Returns:
         pd.DataFrame: DataFrame original avec les indicateurs ajoutés.
@@ -50,6 +119,7 @@ def calculate_indicators(df):
     if df is None or df.empty:
         logging.error("DataFrame vide fourni pour le calcul des indicateurs.")
         return None
+    params = params if params is not None else DEFAULT_PARAMS
 
     try:
         # Assurer les types de données corrects
@@ -62,17 +132,17 @@ def calculate_indicators(df):
              return None
 
         # Calcul des EMAs
-        df[f'EMA_{EMA_SHORT_PERIOD}'] = ta.ema(df['Close'], length=EMA_SHORT_PERIOD)
-        df[f'EMA_{EMA_LONG_PERIOD}'] = ta.ema(df['Close'], length=EMA_LONG_PERIOD)
-        if USE_EMA_FILTER:
-            df[f'EMA_{EMA_FILTER_PERIOD}'] = ta.ema(df['Close'], length=EMA_FILTER_PERIOD)
+        df[f'EMA_{params.ema_short_period}'] = ta.ema(df['Close'], length=params.ema_short_period)
+        df[f'EMA_{params.ema_long_period}'] = ta.ema(df['Close'], length=params.ema_long_period)
+        if params.use_ema_filter:
+            df[f'EMA_{params.ema_filter_period}'] = ta.ema(df['Close'], length=params.ema_filter_period)
 
         # Calcul du RSI
-        df[f'RSI_{RSI_PERIOD}'] = ta.rsi(df['Close'], length=RSI_PERIOD)
+        df[f'RSI_{params.rsi_period}'] = ta.rsi(df['Close'], length=params.rsi_period)
 
         # Calcul de la moyenne mobile du volume
-        if USE_VOLUME_CONFIRMATION:
-            df[f'Volume_MA_{VOLUME_AVG_PERIOD}'] = ta.sma(df['Volume'], length=VOLUME_AVG_PERIOD)
+        if params.use_volume_confirmation:
+            df[f'Volume_MA_{params.volume_avg_period}'] = ta.sma(df['Volume'], length=params.volume_avg_period)
 
         # Supprimer les lignes initiales avec NaN dues aux calculs d'indicateurs
         df.dropna(inplace=True)
@@ -84,12 +154,13 @@ def calculate_indicators(df):
         return None
 
 
-def generate_signals(df):
+def generate_signals(df, params=None):
     """
     Génère les signaux d'achat (1), de vente (-1) ou neutre (0) basés sur la stratégie.
 
     Args:
         df (pd.DataFrame): DataFrame avec les indicateurs calculés.
+        params (StrategyParams, optional): Paramètres utilisés pour calculer les indicateurs (défaut DEFAULT_PARAMS).
 
     Returns:
         pd.DataFrame: DataFrame avec une colonne 'signal' ajoutée.
@@ -98,6 +169,7 @@ def generate_signals(df):
     if df is None or df.empty:
         logging.error("DataFrame vide fourni pour la génération de signaux.")
         return None
+    params = params if params is not None else DEFAULT_PARAMS
 
     try:
         # Conditions initiales (pas de signal)
@@ -105,31 +177,31 @@ def generate_signals(df):
 
         # --- Conditions de base pour le croisement EMA ---
         # Croisement haussier : EMA courte passe au-dessus de l'EMA longue
-        condition_crossover_bull = (df[f'EMA_{EMA_SHORT_PERIOD}'] > df[f'EMA_{EMA_LONG_PERIOD}']) & \
-                                   (df[f'EMA_{EMA_SHORT_PERIOD}'].shift(1) <= df[f'EMA_{EMA_LONG_PERIOD}'].shift(1))
+        condition_crossover_bull = (df[f'EMA_{params.ema_short_period}'] > df[f'EMA_{params.ema_long_period}']) & \
+                                   (df[f'EMA_{params.ema_short_period}'].shift(1) <= df[f'EMA_{params.ema_long_period}'].shift(1))
 
         # Croisement baissier : EMA courte passe en dessous de l'EMA longue
-        condition_crossover_bear = (df[f'EMA_{EMA_SHORT_PERIOD}'] < df[f'EMA_{EMA_LONG_PERIOD}']) & \
-                                   (df[f'EMA_{EMA_SHORT_PERIOD}'].shift(1) >= df[f'EMA_{EMA_LONG_PERIOD}'].shift(1))
+        condition_crossover_bear = (df[f'EMA_{params.ema_short_period}'] < df[f'EMA_{params.ema_long_period}']) & \
+                                   (df[f'EMA_{params.ema_short_period}'].shift(1) >= df[f'EMA_{params.ema_long_period}'].shift(1))
 
         # --- Filtres Optionnels ---
         # Filtre EMA longue
         condition_ema_filter_long = True # Par défaut, n'applique pas le filtre
-        if USE_EMA_FILTER:
-            condition_ema_filter_long = (df['Close'] > df[f'EMA_{EMA_FILTER_PERIOD}'])
+        if params.use_ema_filter:
+            condition_ema_filter_long = (df['Close'] > df[f'EMA_{params.ema_filter_period}'])
 
         condition_ema_filter_short = True # Par défaut, n'applique pas le filtre
-        if USE_EMA_FILTER:
-            condition_ema_filter_short = (df['Close'] < df[f'EMA_{EMA_FILTER_PERIOD}'])
+        if params.use_ema_filter:
+            condition_ema_filter_short = (df['Close'] < df[f'EMA_{params.ema_filter_period}'])
 
         # Filtre RSI (éviter achat/vente extrêmes)
-        condition_rsi_ok_long = (df[f'RSI_{RSI_PERIOD}'] < RSI_OVERBOUGHT)
-        condition_rsi_ok_short = (df[f'RSI_{RSI_PERIOD}'] > RSI_OVERSOLD)
+        condition_rsi_ok_long = (df[f'RSI_{params.rsi_period}'] < params.rsi_overbought)
+        condition_rsi_ok_short = (df[f'RSI_{params.rsi_period}'] > params.rsi_oversold)
 
         # Filtre Volume (confirmation)
         condition_volume_ok = True # Par défaut, n'applique pas le filtre
-        if USE_VOLUME_CONFIRMATION:
-            condition_volume_ok = (df['Volume'] > df[f'Volume_MA_{VOLUME_AVG_PERIOD}'])
+        if params.use_volume_confirmation:
+            condition_volume_ok = (df['Volume'] > df[f'Volume_MA_{params.volume_avg_period}'])
 
         # --- Application des Conditions ---
         # Signal d'Achat (Long)
@@ -148,50 +220,238 @@ def generate_signals(df):
         return None
 
 
-def calculate_indicators_and_signals(klines_data):
+def generate_signals_arrays(close, volume, ema_short, ema_long, rsi, rsi_overbought, rsi_oversold,
+                            ema_filter=None, volume_ma=None):
+    """
+    Équivalent NumPy de generate_signals, sur des tableaux d'indicateurs déjà calculés
+    (utilisé par l'optimiseur pour éviter de reconstruire un DataFrame par combinaison).
+    Les lignes où un indicateur utilisé est NaN sont supprimées comme par le dropna
+    de calculate_indicators.
+
+    Args:
+        close, volume, ema_short, ema_long, rsi (np.ndarray): Séries alignées.
+        rsi_overbought, rsi_oversold (float): Niveaux RSI.
+        ema_filter (np.ndarray, optional): EMA filtre (None si USE_EMA_FILTER est faux).
+        volume_ma (np.ndarray, optional): Moyenne du volume (None si USE_VOLUME_CONFIRMATION est faux).
+
+    Returns:
+        tuple: (index des lignes conservées, signaux 1 / -1 / 0 pour ces lignes).
+    """
+    valid = ~(np.isnan(close) | np.isnan(volume) | np.isnan(ema_short) | np.isnan(ema_long) | np.isnan(rsi))
+    if ema_filter is not None: valid &= ~np.isnan(ema_filter)
+    if volume_ma is not None: valid &= ~np.isnan(volume_ma)
+    rows = np.flatnonzero(valid)
+
+    c, short, long_ = close[rows], ema_short[rows], ema_long[rows]
+    prev_short = np.concatenate(([np.nan], short[:-1])) # shift(1) : comparaisons fausses sur la 1re ligne
+    prev_long = np.concatenate(([np.nan], long_[:-1]))
+    bull = (short > long_) & (prev_short <= prev_long)
+    bear = (short < long_) & (prev_short >= prev_long)
+
+    long_ok = rsi[rows] < rsi_overbought
+    short_ok = rsi[rows] > rsi_oversold
+    if ema_filter is not None:
+        long_ok &= c > ema_filter[rows]
+        short_ok &= c < ema_filter[rows]
+    if volume_ma is not None:
+        volume_ok = volume[rows] > volume_ma[rows]
+        long_ok &= volume_ok
+        short_ok &= volume_ok
+
+    signals = np.zeros(len(rows), dtype=np.int8)
+    signals[bull & long_ok] = 1
+    signals[bear & short_ok] = -1
+    return rows, signals
+
+
+def calculate_indicators_and_signals(klines_data, params=None):
     """
     Fonction principale pour traiter les données klines, calculer les indicateurs et générer les signaux.
+    Les klines sont converties directement en tableaux NumPy (seuls les champs utiles), sans
+    DataFrame intermédiaire des 12 colonnes ; les indicateurs et signaux sont identiques à
+    calculate_indicators + generate_signals.
 
     Args:
         klines_data (list): Liste de listes, format retourné par client.get_klines().
+        params (StrategyParams, optional): Paramètres de la stratégie (défaut DEFAULT_PARAMS).
 
     Returns:
-        pd.DataFrame: DataFrame final avec OHLCV, indicateurs et signaux.
+        pd.DataFrame: 'Open time', 'Close time' (datetime), 'Close', 'Volume', indicateurs et 'signal',
+                      sans les lignes initiales où un indicateur n'est pas encore défini.
                       Retourne None si une erreur se produit.
     """
     if not klines_data:
         logging.error("Aucune donnée kline fournie.")
         return None
+    params = params if params is not None else DEFAULT_PARAMS
 
-    # Noms de colonnes typiques de python-binance
-    columns = ['Open time', 'Open', 'High', 'Low', 'Close', 'Volume', 'Close time',
-               'Quote asset volume', 'Number of trades', 'Taker buy base asset volume',
-               'Taker buy quote asset volume', 'Ignore']
-
-    # Créer le DataFrame
-    df = pd.DataFrame(klines_data, columns=columns)
-
-    # Convertir les timestamps en datetime (optionnel mais utile)
-    df['Open time'] = pd.to_datetime(df['Open time'], unit='ms')
-    df['Close time'] = pd.to_datetime(df['Close time'], unit='ms')
-
-    # Calculer les indicateurs
-    df_with_indicators = calculate_indicators(df.copy()) # Utiliser une copie pour éviter SettingWithCopyWarning
-
-    if df_with_indicators is None:
-        logging.error("Échec du calcul des indicateurs.")
+    try:
+        try:
+            arrays = kline_parser.parse_klines(klines_data)
+        except (TypeError, ValueError):
+            # Prix ou volume non numérique : converti en NaN, ligne écartée ci-dessous (comme calculate_indicators)
+            arrays = kline_parser.parse_klines(klines_data, coerce=True)
+    except (TypeError, ValueError, IndexError) as e:
+        logging.error(f"Klines invalides : {e}")
         return None
+    kept = np.flatnonzero(~(np.isnan(arrays['close']) | np.isnan(arrays['volume'])))
+    if len(kept) < len(klines_data):
+        if len(kept) == 0:
+            logging.error("Aucune bougie valide après nettoyage des NaN.")
+            return None
+        logging.warning(f"{len(klines_data) - len(kept)} bougie(s) sans prix ou volume valide ignorée(s).")
+        arrays = {field: values[kept] for field, values in arrays.items()}
+    close, volume = arrays['close'], arrays['volume']
 
-    # Générer les signaux
-    df_with_signals = generate_signals(df_with_indicators.copy()) # Utiliser une copie
+    try:
+        # Calcul des indicateurs (pandas_ta, comme calculate_indicators) sur des Series sans copie
+        close_series = pd.Series(close, copy=False)
+        indicators = {f'EMA_{params.ema_short_period}': ta.ema(close_series, length=params.ema_short_period),
+                      f'EMA_{params.ema_long_period}': ta.ema(close_series, length=params.ema_long_period)}
+        if params.use_ema_filter:
+            indicators[f'EMA_{params.ema_filter_period}'] = ta.ema(close_series, length=params.ema_filter_period)
+        indicators[f'RSI_{params.rsi_period}'] = ta.rsi(close_series, length=params.rsi_period)
+        if params.use_volume_confirmation:
+            indicators[f'Volume_MA_{params.volume_avg_period}'] = ta.sma(pd.Series(volume, copy=False), length=params.volume_avg_period)
+        if any(series is None for series in indicators.values()):
+            logging.error(f"Historique insuffisant ({len(close)} bougies) pour calculer les indicateurs.")
+            return None
+        indicators = {name: series.to_numpy(dtype=np.float64) for name, series in indicators.items()}
+
+        # Générer les signaux (mêmes règles que generate_signals)
+        rows, signals = generate_signals_arrays(
+            close, volume, indicators[f'EMA_{params.ema_short_period}'], indicators[f'EMA_{params.ema_long_period}'],
+            indicators[f'RSI_{params.rsi_period}'], params.rsi_overbought, params.rsi_oversold,
+            ema_filter=indicators.get(f'EMA_{params.ema_filter_period}') if params.use_ema_filter else None,
+            volume_ma=indicators.get(f'Volume_MA_{params.volume_avg_period}') if params.use_volume_confirmation else None)
+    except Exception as e:
+        logging.error(f"Erreur lors du calcul des indicateurs : {e}")
+        return None
 
-    if df_with_signals is None:
-        logging.error("Échec de la génération des signaux.")
+    if len(rows) == 0:
+        logging.error("Aucune bougie exploitable après le calcul des indicateurs.")
         return None
+    columns = {'Open time': arrays['open_time'][rows].astype('datetime64[ms]'), 'Close': close[rows], 'Volume': volume[rows],
+               'Close time': arrays['close_time'][rows].astype('datetime64[ms]')}
+    columns.update((name, values[rows]) for name, values in indicators.items())
+    columns['signal'] = signals.astype(np.int64)
+    df_with_signals = pd.DataFrame(columns, index=kept[rows]) # Index des klines d'origine
 
     logging.info("Indicateurs et signaux calculés avec succès.")
     return df_with_signals
 
+def get_indicator_params(params=None):
+    """Retourne les paramètres des indicateurs (tuple comparable à IndicatorEngine.params, défaut DEFAULT_PARAMS)."""
+    return (params if params is not None else DEFAULT_PARAMS).indicator_params
+
+
+def create_indicator_engine(warmup_klines=None, warmup_buffer=None, params=None):
+    """
+    Crée un moteur d'indicateurs incrémental pour un jeu de paramètres de la stratégie.
+    Donne les mêmes valeurs que calculate_indicators_and_signals, mais chaque nouvelle
+    bougie clôturée est intégrée en temps constant au lieu de tout recalculer.
+
+    Args:
+        warmup_klines (list, optional): Klines clôturées (format python-binance) pour l'initialisation.
+        warmup_buffer (KlineRingBuffer, optional): Buffer de klines dont les vues NumPy servent à l'initialisation.
+        params (StrategyParams, optional): Paramètres de la stratégie (défaut DEFAULT_PARAMS).
+
+    Returns:
+        IndicatorEngine: Le moteur initialisé.
+    """
+    engine = IndicatorEngine(*get_indicator_params(params))
+    if warmup_klines:
+        engine.warm_up(warmup_klines)
+    elif warmup_buffer is not None and len(warmup_buffer) > 0:
+        views = warmup_buffer.views()
+        engine.warm_up_arrays(views['close'], views['volume'], views['open_time'], views['close_time'])
+    return engine
+
+
+class Strategy:
+    """
+    Instance de la stratégie pour un jeu de paramètres immuable (StrategyParams).
+    Chaque instance possède ses propres moteurs d'indicateurs (un par symbole) : plusieurs
+    instances peuvent évaluer les mêmes bougies côte à côte (comparaison A/B, mode shadow
+    sans ordres), et de nouveaux paramètres se traduisent par une nouvelle instance qui
+    remplace l'active entre deux bougies, sans toucher à l'état des autres.
+    Une instance n'est mise à jour que par un seul thread (la boucle du bot).
+    """
+
+    def __init__(self, params=None, name='active'):
+        self.params = params if params is not None else DEFAULT_PARAMS
+        self.name = name
+        self._engines = {}      # symbole -> (timeframe, IndicatorEngine)
+        self.last_signals = {}  # symbole -> signal de la dernière bougie évaluée
+        self.signal_counts = {1: 0, -1: 0}
+
+    def __repr__(self):
+        return f"Strategy({self.name!r}, {self.params})"
+
+    def required_history(self):
+        return self.params.required_history()
+
+    def calculate_indicators_and_signals(self, klines_data):
+        """Chemin batch (calculate_indicators_and_signals) avec les paramètres de l'instance."""
+        return calculate_indicators_and_signals(klines_data, self.params)
+
+    def needs_warmup(self, symbol, timeframe=None):
+        """True si le moteur du symbole doit être (ré)initialisé depuis l'historique."""
+        entry = self._engines.get(symbol)
+        return entry is None or entry[0] != timeframe
+
+    def last_row(self, symbol):
+        """Dernière ligne d'indicateurs du symbole (None pendant le warm-up)."""
+        entry = self._engines.get(symbol)
+        return entry[1].last_row if entry is not None else None
+
+    def update(self, symbol, candle_buffer, new_klines, timeframe=None):
+        """
+        Intègre les nouvelles bougies clôturées d'un symbole (O(1) par bougie). À la première
+        bougie, ou après un changement de timeframe, le moteur est initialisé depuis le buffer.
+
+        Args:
+            symbol (str): Symbole.
+            candle_buffer (KlineRingBuffer): Buffer du symbole (sert à l'initialisation).
+            new_klines (list): Klines clôturées reçues depuis le cycle précédent.
+            timeframe (str, optional): Timeframe des bougies.
+
+        Returns:
+            dict: Ligne (indicateurs + 'signal') de la dernière nouvelle bougie, ou None si aucune.
+        """
+        if self.needs_warmup(symbol, timeframe):
+            engine = create_indicator_engine(warmup_buffer=candle_buffer, params=self.params)
+            self._engines[symbol] = (timeframe, engine)
+            row = engine.last_row
+        else:
+            engine = self._engines[symbol][1]
+            row = None
+            for k in new_klines:
+                row = engine.update_kline(k) or row
+        if row is not None:
+            self.last_signals[symbol] = row['signal']
+            if row['signal']: self.signal_counts[row['signal']] += 1
+        return row
+
+    def check_entry_conditions(self, current_signal_data, symbol, risk_per_trade, capital_allocation, available_balance, symbol_info,
+                               broker=None):
+        """check_entry_conditions avec le stop-loss de l'instance."""
+        return check_entry_conditions(current_signal_data, symbol, risk_per_trade, capital_allocation, available_balance,
+                                      symbol_info, stop_loss_percent=self.params.stop_loss_percent, broker=broker)
+
+    def check_exit_conditions(self, current_signal_data, symbol, exit_engine):
+        """check_exit_conditions avec la règle de sortie sur signal inverse de l'instance."""
+        return check_exit_conditions(current_signal_data, symbol, exit_engine, self.params.exit_on_reverse_signal)
+
+    def to_status(self):
+        return {
+            'name': self.name,
+            'params': self.params.to_config(),
+            'last_signals': dict(self.last_signals),
+            'buy_signals': self.signal_counts[1],
+            'sell_signals': self.signal_counts[-1],
+        }
+
 # --- Fonctions pour la gestion des ordres (à développer) ---
 
 def calculate_position_size(account_balance, risk_per_trade, entry_price, stop_loss_price, symbol_info):
@@ -203,10 +463,10 @@ def calculate_position_size(account_balance, risk_per_trade, entry_price, stop_l
         risk_per_trade (float): Pourcentage du capital à risquer par trade (ex: 0.01 pour 1%).
         entry_price (float): Prix d'entrée de la position.
         stop_loss_price (float): Prix du stop-loss.
-        symbol_info (dict): Informations du symbole récupérées via l'API Binance (get_symbol_info).
+        symbol_info (dict | SymbolRules): Informations du symbole (get_symbol_info) ou règles déjà compilées.
 
     Returns:
-        float: La quantité à acheter/vendre, formatée selon les règles de Binance (stepSize).
+        float: La quantité à acheter/vendre, arrondie au stepSize (ordre au marché).
                Retourne 0 en cas d'erreur ou si la taille de la position est invalide.
     """
     try:
@@ -223,51 +483,39 @@ def calculate_position_size(account_balance, risk_per_trade, entry_price, stop_l
 
         theoretical_quantity = risk_amount / stop_loss_distance
 
-        # 4. Ajuster la quantité en fonction des règles de Binance (LOT_SIZE)
-        lot_size_filter = next((f for f in symbol_info['filters'] if f['filterType'] == 'LOT_SIZE'), None)
-        if not lot_size_filter:
+        # 4. Ajuster la quantité en fonction des règles de Binance (LOT_SIZE / MARKET_LOT_SIZE)
+        rules = symbol_rules.from_symbol_info(symbol_info) # Filtres parsés une seule fois par symbole
+        if not rules.has_lot_size:
             logging.error("Filtre LOT_SIZE non trouvé dans les informations du symbole.")
             return 0
 
-        min_qty = float(lot_size_filter.get('minQty'))
-        max_qty = float(lot_size_filter.get('maxQty'))
-        step_size = float(lot_size_filter.get('stepSize'))
-
-        # Formater la quantité selon le stepSize
-        # Exemple : si stepSize est 0.001, on veut arrondir à 3 décimales
-        decimal_places = int(-math.log10(step_size)) if step_size > 0 else 0 # Gérer le cas stepSize == 0
-
-        # Arrondir à la baisse (floor) pour respecter le stepSize
-        # Utiliser une chaîne de formatage pour contrôler le nombre de décimales
-        # Correction: On doit arrondir *vers le bas* au multiple de step_size
-        # quantity = math.floor(theoretical_quantity / step_size) * step_size
-        # Utiliser le formatage est plus simple pour les décimales standard
-        quantity = math.floor(theoretical_quantity * (10**decimal_places)) / (10**decimal_places)
-
+        # Arrondi exact vers le bas au multiple du stepSize (Decimal)
+        quantity = rules.quantize_quantity(theoretical_quantity, market=True)
 
         # 5. Vérifier les contraintes minQty et maxQty
-        if quantity < min_qty:
-            logging.warning(f"Quantité calculée ({quantity}) après arrondi est inférieure à la quantité minimale autorisée ({min_qty}).")
+        if quantity < rules.market_min_qty:
+            logging.warning(f"Quantité calculée ({quantity}) après arrondi est inférieure à la quantité minimale autorisée ({rules.market_min_qty}).")
+            return 0
+        if rules.market_max_qty > 0 and quantity > rules.market_max_qty:
+            logging.warning(f"Quantité calculée ({quantity}) est supérieure à la quantité maximale autorisée ({rules.market_max_qty}). Ajustement à maxQty.")
+            quantity = rules.quantize_quantity(rules.market_max_qty, market=True) # Ou retourner 0 si on ne veut pas ajuster ?
+
+        # 6. Valider l'ordre complet (stepSize, minNotional...) au prix d'entrée estimé
+        valid, reason = rules.validate(quantity, entry_price, market=True)
+        if not valid:
+            logging.warning(f"Taille de position refusée par les filtres {rules.symbol} : {reason}")
             return 0
-        if quantity > max_qty:
-            logging.warning(f"Quantité calculée ({quantity}) est supérieure à la quantité maximale autorisée ({max_qty}). Ajustement à maxQty.")
-            quantity = max_qty # Ou retourner 0 si on ne veut pas ajuster ?
-
-        # Re-vérifier après ajustement potentiel à maxQty (si maxQty < minQty, ce qui ne devrait pas arriver)
-        if quantity < min_qty:
-             logging.error(f"Quantité ({quantity}) toujours inférieure à minQty ({min_qty}) même après ajustement maxQty. Problème de configuration?")
-             return 0
-
 
         logging.info(f"Taille de position calculée : {quantity} (risque : {risk_amount:.2f} USDT, distance SL : {stop_loss_distance:.4f})")
-        return quantity
+        return float(quantity)
 
     except Exception as e:
         logging.error(f"Erreur lors du calcul de la taille de la position : {e}")
         return 0
 
 # CORRECTION: Removed 'client' parameter
-def check_entry_conditions(current_signal_data, symbol, risk_per_trade, capital_allocation, available_balance, symbol_info):
+def check_entry_conditions(current_signal_data, symbol, risk_per_trade, capital_allocation, available_balance, symbol_info,
+                           stop_loss_percent=None, broker=None):
     """
     Vérifie s'il faut entrer en position et place l'ordre si toutes les conditions sont remplies.
     Utilise le client géré par binance_client_wrapper.
@@ -278,10 +526,12 @@ def check_entry_conditions(current_signal_data, symbol, risk_per_trade, capital_
         risk_per_trade (float): Le risque par trade (ex: 0.01 pour 1%).
         capital_allocation (float): Le pourcentage du capital à allouer (pourrait être utilisé).
         available_balance (float): Le solde disponible.
-        symbol_info (dict): Les informations du symbole (pour LOT_SIZE).
+        symbol_info (dict | SymbolRules): Les informations du symbole (pour LOT_SIZE) ou règles compilées.
+        stop_loss_percent (float, optional): Distance du stop-loss (défaut STOP_LOSS_PERCENT de config.py).
+        broker (optional): Objet exposant place_order à la place du wrapper (order_manager.OrderManager, paper_trading.PaperAccount).
 
     Returns:
-        bool: True si l'ordre a été placé avec succès, False sinon.
+        dict | bool: Réponse de l'ordre exécuté (évaluée à True) si l'ordre a été placé avec succès, False sinon.
     """
     try:
         # 1. Vérifier s'il y a déjà une position ouverte (à implémenter plus tard si nécessaire)
@@ -296,13 +546,14 @@ def check_entry_conditions(current_signal_data, symbol, risk_per_trade, capital_
             # logging.info("Pas de signal d'entrée.") # Peut être trop verbeux
             return False
 
+        signal_detected_at = time.perf_counter()
         side = 'BUY' if signal == 1 else 'SELL' # BUY pour long, SELL pour short
         logging.info(f"Signal d'entrée {side} détecté pour {symbol}.")
 
         # 3. Définir le prix d'entrée et le prix du stop-loss
         entry_price = current_signal_data['Close'] # Utiliser le prix de clôture comme prix d'entrée
-        # Exemple simple : stop-loss à 0.3% en dessous/au-dessus du prix d'entrée
-        stop_loss_percent = 0.003 # 0.3%
+        # Exemple simple : stop-loss à stop_loss_percent (0.3% par défaut) en dessous/au-dessus du prix d'entrée
+        if stop_loss_percent is None: stop_loss_percent = STOP_LOSS_PERCENT
         stop_loss_price = entry_price * (1 - stop_loss_percent) if side == 'BUY' else entry_price * (1 + stop_loss_percent)
 
         # 4. Calculer la taille de la position
@@ -314,10 +565,10 @@ def check_entry_conditions(current_signal_data, symbol, risk_per_trade, capital_
         # 5. Placer l'ordre via le wrapper (qui gère le client)
         logging.info(f"Tentative de placement d'ordre {side} {quantity} {symbol} au marché...")
         # CORRECTION: Assume place_order in wrapper doesn't need client passed
-        order = binance_client_wrapper.place_order(
+        order = (broker or binance_client_wrapper).place_order(
             symbol=symbol,
             side=side,
-            quantity=quantity,
+            quantity=symbol_rules.SymbolRules.format_decimal(quantity), # '0.00001' et non '1e-05'
             order_type='MARKET'
             # price=None,
             # stop_loss_price=None,
@@ -325,9 +576,11 @@ def check_entry_conditions(current_signal_data, symbol, risk_per_trade, capital_
         )
 
         if order:
+            if not getattr(broker, 'simulated', False): # Ordres simulés (paper trading) : hors des métriques d'exécution
+                metrics.SIGNAL_TO_FILL_SECONDS.observe(time.perf_counter() - signal_detected_at, symbol=symbol)
             # La fonction place_order dans le wrapper devrait déjà logger le succès/échec
             # logging.info(f"Ordre {side} placé avec succès pour {symbol} (quantité: {quantity}). Détails: {order}")
-            return True
+            return order # Prix et quantité exécutés : point de départ du suivi de la position (exit_engine)
         else:
             # La fonction place_order dans le wrapper devrait déjà logger l'échec
             # logging.error(f"Échec du placement de l'ordre {side} pour {symbol}.")
@@ -339,18 +592,26 @@ def check_entry_conditions(current_signal_data, symbol, risk_per_trade, capital_
         return False
 
 # CORRECTION: Removed 'client' parameter
-def check_exit_conditions(symbol):
-    """Vérifie s'il faut sortir d'une position existante (TP/SL/Signal inverse)."""
-    # ... logique à implémenter ...
-    # Utiliser binance_client_wrapper pour récupérer les positions, ordres, etc.
-    # Exemple:
-    # position = binance_client_wrapper.get_position(symbol)
-    # if position:
-    #    current_price = binance_client_wrapper.get_current_price(symbol)
-    #    # Vérifier SL/TP/Signal inverse
-    #    if should_exit:
-    #        binance_client_wrapper.close_position(symbol, position_qty)
-    pass
+def check_exit_conditions(current_signal_data, symbol, exit_engine, exit_on_reverse_signal=True):
+    """
+    Vérifie à la clôture d'une bougie s'il faut sortir de la position sur signal inverse.
+    TP, SL et stop suiveur sont évalués à chaque tick de prix par exit_engine, entre les bougies.
+
+    Args:
+        current_signal_data (dict | pd.Series): Données de la bougie clôturée (dont 'signal' et 'Close').
+        symbol (str): Le symbole.
+        exit_engine (ExitEngine): Moteur de sortie qui suit les positions ouvertes.
+        exit_on_reverse_signal (bool): Clôturer sur un signal inverse.
+
+    Returns:
+        dict: Sortie exécutée (voir ExitEngine.close_position), None sinon.
+    """
+    try:
+        return exit_engine.on_signal(symbol, int(current_signal_data['signal']), float(current_signal_data['Close']),
+                                     exit_on_reverse=exit_on_reverse_signal)
+    except Exception:
+        logging.exception(f"Erreur lors de la vérification des conditions de sortie")
+        return None
 
 # Exemple d'utilisation (pourrait être dans bot.py)
 if __name__ == '__main__':
@@ -374,6 +635,14 @@ if __name__ == '__main__':
             # Afficher les signaux générés
             print("\nSignaux générés (1=Achat, -1=Vente):")
             print(results[results['signal'] != 0]['signal'])
+            # Vérifier que le moteur incrémental donne les mêmes valeurs que le chemin batch
+            # (les open time factices se répètent : on alimente le moteur sans horodatage)
+            engine = create_indicator_engine()
+            for k in dummy_klines: engine.update(float(k[4]), float(k[5]))
+            if engine.last_row is not None:
+                last_batch = results.iloc[-1]
+                ecarts = {k: abs(engine.last_row[k] - last_batch[k]) for k in engine.last_row if k.startswith(('EMA_', 'RSI_', 'Volume_MA_'))}
+                print(f"\nÉcarts moteur incrémental / batch (dernière bougie) : {ecarts}")
         else:
             print("Erreur lors du calcul.")
     else:
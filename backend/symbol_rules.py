@@ -0,0 +1,220 @@
+import logging
+import threading
+import time
+from decimal import Decimal, ROUND_FLOOR, InvalidOperation
+import binance_client_wrapper
+
+# Règles de trading précompilées par symbole (LOT_SIZE, MARKET_LOT_SIZE, PRICE_FILTER,
+# NOTIONAL / MIN_NOTIONAL). Les chaînes de l'exchangeInfo sont parsées une seule fois
+# en Decimal ; l'arrondi au stepSize / tickSize est exact (pas d'astuce log10, qui
+# échoue pour des pas comme 0.5).
+
+try:
+    import config
+    RULES_REFRESH_INTERVAL = getattr(config, 'SYMBOL_RULES_REFRESH_INTERVAL', 3600) # Secondes
+except ImportError:
+    RULES_REFRESH_INTERVAL = 3600
+
+
+def _to_decimal(value):
+    """Convertit une valeur (str, int, float) en Decimal sans erreur de représentation binaire."""
+    if isinstance(value, Decimal):
+        return value
+    if isinstance(value, float):
+        return Decimal(repr(value)) # repr donne l'écriture décimale la plus courte du float
+    return Decimal(str(value))
+
+
+def _floor_to_step(value, step):
+    """Arrondit value vers le bas au multiple de step le plus proche (step > 0)."""
+    return ((value / step).to_integral_value(rounding=ROUND_FLOOR) * step).normalize()
+
+
+class SymbolRules:
+    """Filtres de trading d'un symbole, parsés une fois pour toutes."""
+
+    def __init__(self, symbol_info):
+        self.symbol = symbol_info.get('symbol', '')
+        self.base_asset = symbol_info.get('baseAsset', '')
+        self.quote_asset = symbol_info.get('quoteAsset', '')
+        self.compiled_at = time.monotonic()
+        self.raw_filters = symbol_info.get('filters', []) # Filtres d'origine (détection d'un exchangeInfo modifié)
+
+        filters = {f.get('filterType'): f for f in self.raw_filters}
+
+        lot_size = filters.get('LOT_SIZE', {})
+        self.min_qty = _to_decimal(lot_size.get('minQty', '0'))
+        self.max_qty = _to_decimal(lot_size.get('maxQty', '0'))
+        self.step_size = _to_decimal(lot_size.get('stepSize', '0')).normalize()
+        self.has_lot_size = 'LOT_SIZE' in filters
+
+        # MARKET_LOT_SIZE : des valeurs à 0 signifient « pas de contrainte supplémentaire »
+        market_lot = filters.get('MARKET_LOT_SIZE', {})
+        self.market_min_qty = max(self.min_qty, _to_decimal(market_lot.get('minQty', '0')))
+        market_max = _to_decimal(market_lot.get('maxQty', '0'))
+        if market_max > 0 and self.max_qty > 0:
+            self.market_max_qty = min(self.max_qty, market_max)
+        else:
+            self.market_max_qty = market_max if market_max > 0 else self.max_qty
+        market_step = _to_decimal(market_lot.get('stepSize', '0')).normalize()
+        self.market_step_size = market_step if market_step > 0 else self.step_size
+
+        price_filter = filters.get('PRICE_FILTER', {})
+        self.min_price = _to_decimal(price_filter.get('minPrice', '0'))
+        self.max_price = _to_decimal(price_filter.get('maxPrice', '0'))
+        self.tick_size = _to_decimal(price_filter.get('tickSize', '0')).normalize()
+
+        # NOTIONAL (actuel) ou MIN_NOTIONAL (ancien format)
+        notional = filters.get('NOTIONAL') or filters.get('MIN_NOTIONAL') or {}
+        self.min_notional = _to_decimal(notional.get('minNotional', '0'))
+        self.max_notional = _to_decimal(notional.get('maxNotional', '0'))
+        self.apply_min_to_market = bool(notional.get('applyMinToMarket', notional.get('applyToMarket', True)))
+        self.apply_max_to_market = bool(notional.get('applyMaxToMarket', False))
+
+    def quantize_quantity(self, quantity, market=True):
+        """
+        Arrondit une quantité vers le bas au stepSize (MARKET_LOT_SIZE pour un ordre au marché).
+
+        Returns:
+            Decimal: Quantité arrondie (peut être 0).
+        """
+        step = self.market_step_size if market else self.step_size
+        quantity = _to_decimal(quantity)
+        if step <= 0:
+            return quantity
+        return _floor_to_step(quantity, step)
+
+    def quantize_price(self, price):
+        """Arrondit un prix vers le bas au tickSize."""
+        price = _to_decimal(price)
+        if self.tick_size <= 0:
+            return price
+        return _floor_to_step(price, self.tick_size)
+
+    def validate(self, quantity, price, market=True):
+        """
+        Vérifie une quantité / un prix contre les filtres du symbole.
+
+        Args:
+            quantity: Quantité (déjà arrondie).
+            price: Prix limite, ou prix de référence estimé pour un ordre au marché.
+            market (bool): True pour un ordre au marché.
+
+        Returns:
+            tuple: (bool, str) - validité et raison du refus ('' si valide).
+        """
+        try:
+            quantity = _to_decimal(quantity)
+            price = _to_decimal(price)
+        except (InvalidOperation, ValueError, TypeError) as e:
+            return False, f"Valeur invalide : {e}"
+
+        min_qty = self.market_min_qty if market else self.min_qty
+        max_qty = self.market_max_qty if market else self.max_qty
+        step = self.market_step_size if market else self.step_size
+        if quantity <= 0:
+            return False, "Quantité nulle ou négative"
+        if quantity < min_qty:
+            return False, f"Quantité {quantity} < minQty ({min_qty})"
+        if max_qty > 0 and quantity > max_qty:
+            return False, f"Quantité {quantity} > maxQty ({max_qty})"
+        if step > 0 and (quantity - min_qty) % step != 0:
+            return False, f"Quantité {quantity} non multiple du stepSize ({step})"
+
+        if not market:
+            if self.min_price > 0 and price < self.min_price:
+                return False, f"Prix {price} < minPrice ({self.min_price})"
+            if self.max_price > 0 and price > self.max_price:
+                return False, f"Prix {price} > maxPrice ({self.max_price})"
+            if self.tick_size > 0 and (price - self.min_price) % self.tick_size != 0:
+                return False, f"Prix {price} non multiple du tickSize ({self.tick_size})"
+
+        notional = quantity * price
+        if self.min_notional > 0 and (not market or self.apply_min_to_market) and notional < self.min_notional:
+            return False, f"Notionnel {notional} < minNotional ({self.min_notional})"
+        if self.max_notional > 0 and (not market or self.apply_max_to_market) and notional > self.max_notional:
+            return False, f"Notionnel {notional} > maxNotional ({self.max_notional})"
+        return True, ''
+
+    @staticmethod
+    def format_decimal(value):
+        """Formate un Decimal en chaîne non scientifique pour l'API (ex: '0.00001' et non '1E-5')."""
+        return format(_to_decimal(value).normalize(), 'f')
+
+
+# --- Registre des règles compilées par symbole ---
+_rules = {}
+_rules_lock = threading.Lock()
+
+def compile_symbol_rules(symbol_info):
+    """Compile (et enregistre) les règles d'un symbole à partir de son dictionnaire get_symbol_info."""
+    rules = SymbolRules(symbol_info)
+    with _rules_lock:
+        _rules[rules.symbol] = rules
+    return rules
+
+def from_symbol_info(symbol_info):
+    """
+    Retourne les règles compilées correspondant à un symbol_info (dict) ou à des règles déjà compilées,
+    en réutilisant le registre pour ne parser les filtres qu'une fois. Si les filtres du dict diffèrent
+    des règles enregistrées (exchangeInfo plus récent), elles sont recompilées.
+    """
+    if isinstance(symbol_info, SymbolRules):
+        return symbol_info
+    rules = _rules.get(symbol_info.get('symbol'))
+    if rules is not None and rules.raw_filters == symbol_info.get('filters', []):
+        return rules
+    return compile_symbol_rules(symbol_info)
+
+def get_symbol_rules(symbol, max_age=None):
+    """
+    Retourne les règles d'un symbole, (re)chargées via get_symbol_info si absentes
+    ou plus vieilles que max_age (par défaut RULES_REFRESH_INTERVAL).
+
+    Returns:
+        SymbolRules: Les règles, ou None si le symbole est introuvable (les anciennes
+                     règles sont conservées si le rafraîchissement échoue).
+    """
+    max_age = RULES_REFRESH_INTERVAL if max_age is None else max_age
+    rules = _rules.get(symbol)
+    if rules is not None and time.monotonic() - rules.compiled_at <= max_age:
+        return rules
+    symbol_info = binance_client_wrapper.get_symbol_info(symbol)
+    if not symbol_info:
+        if rules is not None:
+            logging.warning(f"Rafraîchissement des règles {symbol} impossible, utilisation des règles existantes.")
+        return rules
+    return compile_symbol_rules(symbol_info)
+
+def load_all_symbol_rules():
+    """
+    Compile les règles de tous les symboles en un seul appel exchangeInfo.
+
+    Returns:
+        int: Nombre de symboles chargés (0 en cas d'échec).
+    """
+    exchange_info = binance_client_wrapper.get_exchange_info()
+    if not exchange_info:
+        return 0
+    symbols = exchange_info.get('symbols', [])
+    compiled = {info.get('symbol'): SymbolRules(info) for info in symbols}
+    with _rules_lock:
+        _rules.update(compiled)
+    logging.info(f"Règles de trading chargées pour {len(compiled)} symboles.")
+    return len(compiled)
+
+def refresh_symbol_rules(symbols, max_age=None):
+    """
+    Retourne les règles de plusieurs symboles ; si l'une d'elles est absente ou périmée, toutes sont
+    rechargées par un seul appel exchangeInfo (get_symbol_info télécharge aussi l'exchangeInfo complet :
+    un appel par symbole multiplierait le poids).
+
+    Returns:
+        dict: {symbol: SymbolRules ou None} (les anciennes règles sont conservées si le rechargement échoue).
+    """
+    max_age = RULES_REFRESH_INTERVAL if max_age is None else max_age
+    now = time.monotonic()
+    if any(_rules.get(symbol) is None or now - _rules[symbol].compiled_at > max_age for symbol in symbols):
+        if not load_all_symbol_rules():
+            logging.warning(f"Rafraîchissement des règles de {', '.join(symbols)} impossible, utilisation des règles existantes.")
+    return {symbol: _rules.get(symbol) for symbol in symbols}
@@ -0,0 +1,62 @@
+import os
+import socket
+import sys
+import pytest
+
+# Les modules du backend s'importent par leur nom (python bot.py depuis backend/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import binance_client_wrapper
+import mock_exchange
+import symbol_rules
+
+SYMBOL = 'BTCUSDT'
+
+
+class FakeClock:
+    """Horloge monotone (s) avancée à la main, à injecter à la place de time.monotonic."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds + 1e-9 # Marge sur les arrondis des échéances
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_exchange(monkeypatch, data, **kwargs):
+    """
+    Démarre un exchange simulé (mock_exchange.py) sur un port libre, horloge virtuelle pilotée par advance()
+    (speed=0), et y redirige le wrapper (REST et WebSocket). L'appelant l'arrête (stop()).
+    """
+    ex = mock_exchange.MockExchange(data, speed=0, port=_free_port(), **kwargs).start()
+    monkeypatch.setattr(binance_client_wrapper, 'API_URL', ex.api_url)
+    monkeypatch.setattr(binance_client_wrapper, 'STREAM_URL', ex.stream_url)
+    monkeypatch.setattr(binance_client_wrapper, 'SYNC_SERVER_TIME', False)
+    monkeypatch.setattr(binance_client_wrapper, '_client', None) # Client recréé sur l'URL de l'exchange simulé
+    return ex
+
+
+@pytest.fixture
+def exchange(monkeypatch):
+    """Exchange simulé sur des klines synthétiques, wrapper redirigé vers lui (voir start_exchange)."""
+    data = {SYMBOL: mock_exchange.synthetic_klines(3000, start_price=100.0, seed=3)}
+    ex = start_exchange(monkeypatch, data, balances={'USDT': 100000.0, 'BTC': 100.0})
+    yield ex
+    ex.stop()
+
+
+@pytest.fixture
+def rules(monkeypatch):
+    """Règles de SYMBOL (exchangeInfo de l'exchange simulé) enregistrées sans appel REST, dans un registre isolé."""
+    monkeypatch.setattr(symbol_rules, '_rules', {})
+    ex = mock_exchange.MockExchange({SYMBOL: mock_exchange.synthetic_klines(10)}, speed=0, warmup_bars=5)
+    return symbol_rules.compile_symbol_rules(ex.symbol_info(SYMBOL))
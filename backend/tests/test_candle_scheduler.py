@@ -0,0 +1,90 @@
+import threading
+import pytest
+import candle_scheduler
+
+MINUTE_MS = 60_000
+DAY_MS = 86_400_000
+
+
+class ManualServerClock:
+    """Heure serveur (ms) avancée à la main, à la place de binance_client_wrapper.server_clock."""
+
+    def __init__(self, now_ms):
+        self.ms = now_ms
+
+    def now_ms(self):
+        return self.ms
+
+
+@pytest.fixture
+def clock():
+    return ManualServerClock(10 * MINUTE_MS + 1000)
+
+
+@pytest.fixture
+def scheduler(clock):
+    return candle_scheduler.CandleScheduler(clock)
+
+
+@pytest.mark.parametrize('interval, now_ms, delay_ms, expected', [
+    ('1m', 59_999, 0, MINUTE_MS),
+    ('1m', MINUTE_MS, 0, 2 * MINUTE_MS), # Strictement après : la clôture courante est déjà passée
+    ('1m', MINUTE_MS + 100, 250, MINUTE_MS + 250),
+    ('1m', MINUTE_MS + 250, 250, 2 * MINUTE_MS + 250),
+    ('1h', 3 * 3_600_000 - 1, 0, 3 * 3_600_000),
+    ('1w', 0, 0, 4 * DAY_MS), # Semaines alignées sur le lundi (l'epoch est un jeudi)
+    ('1w', 4 * DAY_MS, 0, 11 * DAY_MS),
+    ('1M', 0, 0, None),
+])
+def test_next_candle_close_is_aligned_on_the_server_clock(interval, now_ms, delay_ms, expected):
+    assert candle_scheduler.next_candle_close_ms(interval, now_ms, delay_ms) == expected
+
+
+def test_due_timers_are_returned_in_deadline_order_and_rearmed(clock, scheduler):
+    scheduler.schedule_candle_close('5m', '5m', delay_ms=250)  # 900 250
+    scheduler.schedule_candle_close('1m', '1m', delay_ms=250)  # 660 250
+    scheduler.schedule_every('status', 90)                     # 691 000
+    assert scheduler.wait(timeout=0) == []
+
+    clock.ms = 700_000
+    assert scheduler.wait(timeout=0) == ['1m', 'status']
+    clock.ms = 950_000 # Cycle trop long : trois clôtures 1m manquées
+    assert scheduler.wait(timeout=0) == ['1m', 'status', '5m']
+    clock.ms = 959_000
+    assert scheduler.wait(timeout=0) == [] # Clôtures manquées non rejouées
+    clock.ms = 960_250
+    assert scheduler.wait(timeout=0) == ['1m']
+
+
+def test_cancelled_and_rescheduled_timers_are_skipped(clock, scheduler):
+    scheduler.schedule_candle_close('candle', '1m', delay_ms=0)
+    scheduler.schedule_candle_close('candle', '1m', delay_ms=0) # Déjà armé : sans effet
+    scheduler.schedule_every('status', 30)
+    scheduler.cancel('status')
+    assert not scheduler.is_scheduled('status')
+    scheduler.schedule_candle_close('candle', '5m', delay_ms=0) # Autre intervalle : réarmé, l'ancienne entrée est ignorée
+
+    clock.ms = 14 * MINUTE_MS
+    assert scheduler.wait(timeout=0) == []
+    clock.ms = 15 * MINUTE_MS
+    assert scheduler.wait(timeout=0) == ['candle']
+    assert scheduler.is_scheduled('candle')
+    with pytest.raises(ValueError):
+        scheduler.schedule_candle_close('monthly', '1M')
+
+
+def test_wake_interrupts_a_blocking_wait(scheduler):
+    scheduler.schedule_every('far', 3600)
+    started = threading.Event()
+    results = []
+    def wait():
+        started.set()
+        results.append(scheduler.wait())
+    thread = threading.Thread(target=wait)
+    thread.start()
+    started.wait()
+    scheduler.wake()
+    thread.join(timeout=5)
+    assert not thread.is_alive() and results == [[]]
+    scheduler.wake() # Réveil sans attente en cours : la prochaine attente retourne immédiatement
+    assert scheduler.wait() == []
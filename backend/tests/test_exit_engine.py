@@ -0,0 +1,171 @@
+import types
+import pytest
+import binance_client_wrapper
+import exit_engine
+import mock_exchange
+import paper_trading
+from conftest import SYMBOL, FakeClock, start_exchange
+
+MINUTE_MS = 60_000
+WARMUP_BARS = 1000
+
+
+def exit_params(stop_loss_percent=0.01, take_profit_percent=0.0, trailing_stop_percent=0.0):
+    """Paramètres de sortie lus par ExitEngine (sous-ensemble de strategy.StrategyParams)."""
+    return types.SimpleNamespace(stop_loss_percent=stop_loss_percent, take_profit_percent=take_profit_percent,
+                                 trailing_stop_percent=trailing_stop_percent)
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(exit_engine, 'EXIT_RETRY_DELAY', 0.0)
+    monkeypatch.setattr(exit_engine, 'OCO_CHECK_INTERVAL', 0.0)
+
+
+# --- Règles de sortie (Position) ---
+
+def test_long_position_hits_take_profit_then_stop_loss():
+    position = exit_engine.Position(SYMBOL, 'BUY', 1, 100.0, stop_loss_percent=0.01, take_profit_percent=0.02)
+    assert (position.stop_price, position.take_profit_price) == pytest.approx((99.0, 102.0))
+    assert position.update(101.9) is None
+    assert position.update(102.0) == exit_engine.EXIT_TAKE_PROFIT
+    assert position.update(99.0) == exit_engine.EXIT_STOP_LOSS
+
+
+def test_short_trailing_stop_activates_below_the_initial_stop():
+    position = exit_engine.Position(SYMBOL, 'SELL', 1, 100.0, stop_loss_percent=0.01, trailing_stop_percent=0.005)
+    assert position.exit_side == 'BUY'
+    assert position.update(100.5) is None # Prix défavorable : le stop initial (101) reste en place
+    assert position.stop_price == pytest.approx(101.0) and not position.trailing_active
+    assert position.update(98.0) is None
+    assert position.stop_price == pytest.approx(98.49) and position.trailing_active
+    assert position.update(98.3) is None
+    assert position.stop_price == pytest.approx(98.49) # Le stop ne recule jamais
+    assert position.update(98.5) == exit_engine.EXIT_TRAILING_STOP
+
+
+# --- Ordres en attente (PaperAccount avec latence) ---
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def paper_engine(clock, latency_ms, balances=None):
+    account = paper_trading.PaperAccount(balances={'USDT': 10000.0} if balances is None else balances, fee_rate=0.001,
+                                         slippage=0.0, latency_ms=latency_ms, name='test', clock=clock)
+    account.update_price(SYMBOL, 100.0)
+    return account, exit_engine.ExitEngine(use_oco=False, broker=account, name='test')
+
+
+def tick(account, engine, price):
+    account.update_price(SYMBOL, price)
+    return engine.on_price(SYMBOL, price)
+
+
+@pytest.mark.parametrize('latency_ms', [0, 100])
+def test_stop_loss_closes_the_position_at_market(rules, clock, latency_ms):
+    account, engine = paper_engine(clock, latency_ms)
+    engine.open_position(SYMBOL, account.place_order(SYMBOL, 'BUY', '10'), exit_params(), rules)
+    assert engine.has_position(SYMBOL)
+    clock.advance(0.1)
+    assert tick(account, engine, 100.0) is None
+    position = engine.get(SYMBOL)
+    assert position.entry_price == pytest.approx(100.0)
+    assert float(position.quantity) == pytest.approx(9.99) # Frais en BTC : quantité nette revendue
+
+    result = tick(account, engine, 98.9)
+    if latency_ms:
+        assert result is None and position.exit_order is not None # Clôture envoyée, exécution au tick suivant
+        assert tick(account, engine, 98.8) is None # Latence pas écoulée : pas de second ordre
+        assert account.to_status()['pending_orders'] == 1
+        clock.advance(0.1)
+        result = tick(account, engine, 98.7)
+    assert result['reason'] == exit_engine.EXIT_STOP_LOSS
+    assert result['exit_price'] == pytest.approx(98.7 if latency_ms else 98.9)
+    assert not engine.has_position(SYMBOL)
+    assert account.free('BTC') == pytest.approx(0.0, abs=1e-9)
+
+
+def test_pending_entry_that_expires_is_abandoned(rules, clock):
+    account, engine = paper_engine(clock, 100, balances={'USDT': 500.0})
+    engine.open_position(SYMBOL, account.place_order(SYMBOL, 'BUY', '10'), exit_params(), rules) # 1000 USDT > 500
+    assert engine.has_position(SYMBOL)
+    clock.advance(0.1)
+    assert tick(account, engine, 100.0) is None
+    assert not engine.has_position(SYMBOL) and engine.get(SYMBOL) is None
+
+
+def test_expired_exit_is_retried_on_the_next_tick(rules, clock):
+    account, engine = paper_engine(clock, 100)
+    engine.open_position(SYMBOL, account.place_order(SYMBOL, 'BUY', '10'), exit_params(), rules)
+    clock.advance(0.1)
+    tick(account, engine, 100.0)
+    account.place_order(SYMBOL, 'SELL', '9.99') # Vend la position hors du moteur : la clôture expirera
+    assert tick(account, engine, 98.9) is None
+    clock.advance(0.1)
+    assert tick(account, engine, 98.9) is None # Clôture EXPIRED : position conservée
+    position = engine.get(SYMBOL)
+    assert position is not None and position.exit_order is None
+    assert tick(account, engine, 98.9) is None # Nouvelle tentative
+    assert position.exit_order is not None and account.to_status()['pending_orders'] == 1
+
+
+# --- OCO sur l'exchange simulé ---
+
+def price_path(target):
+    """Prix plat à 100, puis passage linéaire à target pendant la bougie qui suit le démarrage de l'horloge."""
+    data = mock_exchange.synthetic_klines(WARMUP_BARS + 10, start_price=100.0, volatility=0.0)
+    for field in ('open', 'high', 'low', 'close'):
+        data[field][WARMUP_BARS + 2:] = target
+    data['close'][WARMUP_BARS + 1] = target
+    data['high'][WARMUP_BARS + 1] = max(100.0, target)
+    data['low'][WARMUP_BARS + 1] = min(100.0, target)
+    return {SYMBOL: data}
+
+
+@pytest.fixture
+def oco_exchange(request, monkeypatch, rules):
+    ex = start_exchange(monkeypatch, price_path(request.param), warmup_bars=WARMUP_BARS, balances={'USDT': 10000.0})
+    yield ex
+    ex.stop()
+
+
+def open_with_oco(exchange, rules):
+    engine = exit_engine.ExitEngine(use_oco=True, broker=binance_client_wrapper)
+    order = binance_client_wrapper.place_order(SYMBOL, 'BUY', '1')
+    position = engine.open_position(SYMBOL, order, exit_params(take_profit_percent=0.01), rules)
+    assert position.oco_order_list_id is not None
+    return engine, position
+
+
+@pytest.mark.parametrize('oco_exchange, reason, exit_price', [
+    (101.5, exit_engine.EXIT_TAKE_PROFIT, 101.0), # LIMIT_MAKER exécuté à son prix limite
+    (98.95, exit_engine.EXIT_STOP_LOSS, 98.95),   # STOP_LOSS_LIMIT déclenché à 99, exécuté au prix courant
+], indirect=['oco_exchange'])
+def test_executed_oco_is_recorded_by_leg_type(oco_exchange, rules, reason, exit_price):
+    engine, position = open_with_oco(oco_exchange, rules)
+    assert engine.on_price(SYMBOL, 100.0) is None
+
+    oco_exchange.advance(2 * MINUTE_MS)
+    oco_exchange.match_limit_orders()
+    price = oco_exchange.price(SYMBOL)
+    result = engine.on_price(SYMBOL, price)
+    assert result['reason'] == reason
+    assert result['exit_price'] == pytest.approx(exit_price)
+    assert not engine.has_position(SYMBOL)
+    assert oco_exchange.stats['orders'] == 2 # Entrée + OCO : aucun ordre au marché de clôture
+
+
+@pytest.mark.parametrize('oco_exchange', [100.0], indirect=True)
+def test_reverse_signal_cancels_the_oco_before_closing_at_market(oco_exchange, rules):
+    engine, position = open_with_oco(oco_exchange, rules)
+    order_list_id = position.oco_order_list_id
+
+    result = engine.on_signal(SYMBOL, -1, 100.0)
+    assert result['reason'] == exit_engine.EXIT_REVERSE_SIGNAL
+    assert result['exit_price'] == pytest.approx(100.0)
+    order_list = binance_client_wrapper.get_order_list(order_list_id)
+    assert order_list['listOrderStatus'] == 'ALL_DONE'
+    assert {oco_exchange.orders[leg['orderId']]['status'] for leg in order_list['orders']} == {'CANCELED'}
+    assert oco_exchange.balances['BTC'] == pytest.approx([0.0, 0.0], abs=1e-9) # Quantité débloquée puis revendue
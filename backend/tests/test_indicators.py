@@ -0,0 +1,57 @@
+import math
+import pandas as pd
+import pytest
+
+pytest.importorskip('pandas_ta') # Chemin batch de référence (strategy.calculate_indicators_and_signals)
+
+import mock_exchange
+import strategy
+from conftest import SYMBOL
+
+
+@pytest.fixture(scope='module')
+def klines():
+    data = {SYMBOL: mock_exchange.synthetic_klines(1500, start_price=100.0, volatility=0.002, seed=7)}
+    exchange = mock_exchange.MockExchange(data, speed=0, warmup_bars=1499) # Klines servies sans démarrer le serveur
+    return exchange.klines(SYMBOL, '1m', limit=1000)
+
+
+@pytest.mark.parametrize('overrides', [
+    {},
+    {'USE_VOLUME_CONFIRMATION': True, 'VOLUME_AVG_PERIOD': 10},
+    {'USE_EMA_FILTER': False, 'EMA_SHORT_PERIOD': 5, 'EMA_LONG_PERIOD': 13, 'RSI_PERIOD': 7},
+])
+def test_incremental_engine_matches_batch_indicators(klines, overrides):
+    params = strategy.StrategyParams.from_config(overrides)
+    batch = strategy.calculate_indicators_and_signals(klines, params)
+    engine = strategy.create_indicator_engine(warmup_klines=klines[:200], params=params)
+    rows = {row['Open time']: row for row in map(engine.update_kline, klines[200:]) if row is not None}
+
+    expected = batch[batch['Open time'] >= pd.Timestamp(int(klines[200][0]), unit='ms')]
+    assert len(rows) == len(expected)
+    indicator_columns = [column for column in expected.columns if column.startswith(('EMA_', 'RSI_', 'Volume_MA_'))]
+    for _, row in expected.iterrows():
+        incremental = rows[int(row['Open time'].value // 1_000_000)]
+        for column in indicator_columns:
+            assert math.isclose(incremental[column], row[column], rel_tol=1e-9), column
+        assert incremental['signal'] == row['signal']
+    assert expected['signal'].abs().sum() > 0 # Au moins un croisement comparé
+
+
+def test_engine_ignores_duplicate_candles(klines):
+    engine = strategy.create_indicator_engine(warmup_klines=klines[:200])
+    before = dict(engine.last_row)
+    assert engine.update_kline(klines[199]) is None
+    assert engine.last_row == before
+
+
+def test_non_numeric_prices_are_dropped_instead_of_failing(klines):
+    dirty = [list(kline) for kline in klines[:300]]
+    dirty[100][4] = '' # Close vide
+    dirty[150][5] = None # Volume manquant
+    result = strategy.calculate_indicators_and_signals(dirty)
+    clean = strategy.calculate_indicators_and_signals([kline for i, kline in enumerate(klines[:300]) if i not in (100, 150)])
+
+    assert result is not None
+    pd.testing.assert_frame_equal(result.reset_index(drop=True), clean.reset_index(drop=True))
+    assert 100 not in result.index and 150 not in result.index and result.index[-1] == 299 # Index des klines d'origine
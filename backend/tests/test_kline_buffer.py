@@ -0,0 +1,85 @@
+import asyncio
+import threading
+import numpy as np
+import pytest
+import binance_client_wrapper
+import kline_buffer
+import kline_store
+import mock_exchange
+from conftest import SYMBOL
+
+MINUTE_MS = 60_000
+
+
+def make_exchange():
+    data = {SYMBOL: mock_exchange.synthetic_klines(600, start_price=100.0, seed=5)}
+    return mock_exchange.MockExchange(data, speed=0, warmup_bars=100) # Klines servies sans démarrer le serveur
+
+
+def test_ring_buffer_keeps_the_last_closed_candles_in_order():
+    exchange = make_exchange()
+    klines = exchange.klines(SYMBOL, '1m', limit=100)
+    buffer = kline_buffer.KlineRingBuffer(SYMBOL, '1m', capacity=30)
+    now_ms = int(klines[-1][6]) + 1
+    assert len(buffer.ingest(klines, now_ms)) == 100
+
+    close = buffer.view('close')
+    assert len(buffer) == 30 and not close.flags.writeable
+    np.testing.assert_array_equal(close, [float(kline[4]) for kline in klines[-30:]])
+    np.testing.assert_array_equal(buffer.view('open_time', 5), [kline[0] for kline in klines[-5:]])
+    assert buffer.last_open_time == klines[-1][0]
+    assert buffer.ingest(klines[-10:], now_ms) == [] # Bougies déjà connues ignorées
+
+
+def test_open_candle_enters_the_buffer_once_closed():
+    exchange = make_exchange()
+    buffer = kline_buffer.KlineRingBuffer(SYMBOL, '1m', capacity=10)
+    closed = exchange.klines(SYMBOL, '1m', limit=10)
+    buffer.ingest(closed, int(closed[-1][6]) + 1)
+    exchange.advance(MINUTE_MS)
+    candle = exchange.klines(SYMBOL, '1m', limit=1)[0]
+
+    assert buffer.ingest([candle], now_ms=candle[6]) == [] # Encore ouverte à sa close time
+    assert buffer.open_candle == candle
+    assert buffer.is_behind(now_ms=candle[6] + 1)
+    assert buffer.ingest([candle], now_ms=candle[6] + 1) == [candle]
+    assert buffer.open_candle is None and buffer.last_open_time == candle[0]
+
+
+@pytest.fixture
+def paged_exchange(monkeypatch):
+    data = {SYMBOL: mock_exchange.synthetic_klines(3000, start_price=100.0, seed=9)}
+    exchange = mock_exchange.MockExchange(data, speed=0, warmup_bars=100)
+    monkeypatch.setattr(binance_client_wrapper.server_clock, 'now_ms', exchange.now_ms) # Horloge virtuelle
+    return exchange
+
+
+def sync(buffer, fetch, use_async):
+    """Rattrape le buffer par sync(), ou par sync_async() avec la même fonction fetch rendue asynchrone."""
+    if not use_async:
+        return buffer.sync(fetch)
+    async def fetch_async(*args, **kwargs):
+        return fetch(*args, **kwargs)
+    return asyncio.run(buffer.sync_async(fetch_async))
+
+
+@pytest.mark.parametrize('use_async', [False, True])
+def test_sync_downloads_only_missing_candles_page_by_page(paged_exchange, tmp_path, use_async):
+    requests, append_threads = [], []
+    def fetch(symbol, interval, limit, start_time=None):
+        requests.append((limit, start_time))
+        return paged_exchange.klines(symbol, interval, limit=limit, start_time=start_time)
+    store = kline_store.KlineStore(SYMBOL, '1m', root=str(tmp_path))
+    append = store.append
+    store.append = lambda klines: append_threads.append(threading.current_thread()) or append(klines)
+    buffer = kline_buffer.KlineRingBuffer(SYMBOL, '1m', capacity=1500, store=store)
+
+    assert len(sync(buffer, fetch, use_async)) == 100 # Fenêtre complète au premier appel
+    paged_exchange.advance(1200 * MINUTE_MS)
+    new_klines = sync(buffer, fetch, use_async)
+    assert len(new_klines) == 1200
+    assert [start_time for _, start_time in requests] == [None, new_klines[0][0], new_klines[1000][0]]
+    np.testing.assert_array_equal(buffer.view('open_time'), [kline[0] for kline in paged_exchange.klines(SYMBOL, '1m', limit=1300)])
+    assert len(store) == 1300
+    if use_async: # Écritures disque hors de la boucle asyncio
+        assert all(thread is not threading.main_thread() for thread in append_threads)
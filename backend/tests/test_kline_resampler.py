@@ -0,0 +1,84 @@
+import asyncio
+import pytest
+import binance_client_wrapper
+import kline_buffer
+import kline_store
+import kline_resampler
+import mock_exchange
+from conftest import SYMBOL
+
+MINUTE_MS = 60_000
+
+
+@pytest.fixture
+def exchange():
+    data = {SYMBOL: mock_exchange.synthetic_klines(3000, start_price=100.0, seed=13)}
+    ex = mock_exchange.MockExchange(data, speed=0, warmup_bars=1000) # Klines servies sans démarrer le serveur
+    ex.advance(7 * MINUTE_MS) # Heure virtuelle au milieu d'une bougie 5m et 15m
+    return ex
+
+
+def assert_klines_equal(actual, expected):
+    assert [kline[0] for kline in actual] == [kline[0] for kline in expected]
+    assert [kline[6] for kline in actual] == [kline[6] for kline in expected]
+    for field in (1, 2, 3, 4, 5): # open, high, low, close, volume
+        assert [float(kline[field]) for kline in actual] == pytest.approx([float(kline[field]) for kline in expected], rel=1e-9)
+
+
+@pytest.mark.parametrize('interval, resampled', [('3m', True), ('1h', True), ('1d', True), ('7m', False), ('3d', False), ('1w', False)])
+def test_only_epoch_aligned_intervals_are_resampled(interval, resampled):
+    assert kline_resampler.can_resample(interval) == resampled
+
+
+@pytest.mark.parametrize('interval', ['5m', '15m', '1h'])
+def test_resample_arrays_matches_exchange_klines(exchange, interval):
+    interval_ms = kline_buffer.interval_to_milliseconds(interval)
+    first_open = int(exchange.data[SYMBOL]['open_time'][0]) # Aligné sur le jour : première bougie agrégée complète
+    base = kline_store.klines_to_arrays(exchange.klines(SYMBOL, '1m', limit=1000, start_time=first_open))
+    columns, open_candle = kline_resampler.resample_arrays(base, interval_ms)
+
+    last_close = int(base['close_time'][-1])
+    expected = [kline for kline in exchange.klines(SYMBOL, interval, limit=1000, start_time=first_open) if kline[6] <= last_close]
+    assert_klines_equal(kline_resampler.columns_to_klines(columns), expected)
+    if (last_close + 1) % interval_ms == 0:
+        assert open_candle is None
+    else:
+        assert open_candle[0] == last_close + 1 - (last_close + 1) % interval_ms
+
+
+def test_resampled_buffer_closes_candles_from_the_1m_stream(exchange):
+    base = kline_buffer.KlineRingBuffer(SYMBOL, '1m', capacity=1000)
+    now_ms = exchange.now_ms()
+    base.ingest(exchange.klines(SYMBOL, '1m', limit=1000), now_ms)
+    buffer = kline_resampler.ResampledKlineBuffer(base, '5m', capacity=100)
+    assert buffer.load_from_store(now_ms) == 100 # Rempli depuis le buffer 1m, sans REST
+    assert_klines_equal(kline_resampler.columns_to_klines(buffer.views()), exchange.klines(SYMBOL, '5m', limit=100))
+
+    closed = []
+    for _ in range(10): # Bougies 1m du flux, une par minute
+        exchange.advance(MINUTE_MS)
+        now_ms = exchange.now_ms()
+        closed.extend(buffer.ingest(exchange.klines(SYMBOL, '1m', limit=1, now_ms=now_ms), now_ms))
+    assert_klines_equal(closed, exchange.klines(SYMBOL, '5m', limit=2))
+    assert buffer.last_open_time == closed[-1][0]
+
+
+@pytest.mark.parametrize('use_async', [False, True])
+def test_sync_catches_up_the_base_buffer_then_resamples(exchange, monkeypatch, use_async):
+    monkeypatch.setattr(binance_client_wrapper.server_clock, 'now_ms', exchange.now_ms) # Horloge virtuelle
+    intervals = []
+    def fetch(symbol, interval, limit, start_time=None):
+        intervals.append(interval)
+        return exchange.klines(symbol, interval, limit=limit, start_time=start_time)
+    async def fetch_async(*args, **kwargs):
+        return fetch(*args, **kwargs)
+    base = kline_buffer.KlineRingBuffer(SYMBOL, '1m', capacity=1000)
+    buffer = kline_resampler.ResampledKlineBuffer(base, '5m', capacity=100)
+    run = (lambda: asyncio.run(buffer.sync_async(fetch_async))) if use_async else (lambda: buffer.sync(fetch))
+
+    assert len(run()) == 0 # Rempli depuis le buffer 1m téléchargé, sans requête 5m
+    assert intervals == ['1m']
+    assert_klines_equal(kline_resampler.columns_to_klines(buffer.views()), exchange.klines(SYMBOL, '5m', limit=100))
+    exchange.advance(10 * MINUTE_MS)
+    assert_klines_equal(run(), exchange.klines(SYMBOL, '5m', limit=2))
+    assert intervals == ['1m', '1m']
@@ -0,0 +1,64 @@
+import os
+import numpy as np
+import pytest
+import kline_store
+import mock_exchange
+from conftest import SYMBOL
+
+MINUTE_MS = 60_000
+
+
+@pytest.fixture
+def klines():
+    data = {SYMBOL: mock_exchange.synthetic_klines(200, start_price=100.0, seed=11)}
+    exchange = mock_exchange.MockExchange(data, speed=0, warmup_bars=199) # Klines servies sans démarrer le serveur
+    return exchange.klines(SYMBOL, '1m', limit=60)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return kline_store.KlineStore(SYMBOL, '1m', root=str(tmp_path))
+
+
+def test_missing_ranges_reports_gaps_and_edges(store, klines):
+    store.append(klines[10:20] + klines[30:40])
+    start, end = klines[0][0], klines[49][0]
+    assert store.missing_ranges(start, end) == [
+        (klines[0][0], klines[9][0]), (klines[20][0], klines[29][0]), (klines[40][0], klines[49][0])]
+
+
+def test_older_candles_are_merged_in_order_and_existing_data_wins(store, klines):
+    store.append(klines[30:40])
+    altered = [list(kline) for kline in klines[20:35]]
+    altered[-1][4] = '1.0' # Bougie déjà enregistrée : la valeur stockée est conservée
+    assert store.append(altered) == 10
+    assert store.append(klines[:20] + klines[40:]) == 40
+
+    views = store.read()
+    assert len(store) == 60
+    np.testing.assert_array_equal(views['open_time'], [kline[0] for kline in klines])
+    np.testing.assert_array_equal(views['close'], [float(kline[4]) for kline in klines])
+    assert store.missing_ranges(klines[0][0], klines[-1][0]) == []
+
+
+def test_backfill_downloads_only_missing_ranges(store, klines):
+    store.append(klines[:10] + klines[25:])
+    requests = []
+    def fetch(symbol, interval, limit, start_time=None, end_time=None):
+        requests.append((start_time, end_time))
+        return [kline for kline in klines if start_time <= kline[0] <= end_time][:limit]
+
+    assert store.backfill(klines[0][0], klines[-1][0], fetch=fetch) == 15
+    assert requests == [(klines[10][0], klines[24][0])]
+    assert store.backfill(klines[0][0], klines[-1][0], fetch=fetch) == 0
+    assert len(requests) == 1
+
+
+def test_reopening_truncates_a_partially_written_row(tmp_path, store, klines):
+    store.append(klines[:5])
+    with open(store._file('close'), 'ab') as f:
+        f.write(b'\0' * 4) # Ajout interrompu
+    reopened = kline_store.KlineStore(SYMBOL, '1m', root=str(tmp_path))
+    assert len(reopened) == 5
+    assert os.path.getsize(reopened._file('close')) == 5 * kline_store.ROW_BYTES
+    assert reopened.last_open_time == klines[4][0]
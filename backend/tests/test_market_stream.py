@@ -0,0 +1,103 @@
+import time
+import pytest
+import binance_client_wrapper
+from conftest import SYMBOL
+
+MINUTE_MS = 60_000
+
+
+def next_event(stream, event_type, timeout=10):
+    """Prochain événement du type demandé (les autres sont ignorés), ou None après timeout."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        event = stream.get_event(timeout=0.1)
+        if event is not None and event['type'] == event_type:
+            return event
+    return None
+
+def closed_klines(stream, count, timeout=10):
+    events = []
+    while len(events) < count:
+        event = next_event(stream, 'kline_closed', timeout)
+        if event is None:
+            break
+        events.append(event)
+    return events
+
+
+@pytest.fixture
+def stream(exchange):
+    market_stream = binance_client_wrapper.MarketStream([SYMBOL], '1m', url=exchange.stream_url, reconnect_delay=1)
+    market_stream.start()
+    assert next_event(market_stream, 'connected') is not None
+    # Premier prix reçu : l'exchange a fixé la dernière bougie déjà envoyée, les suivantes seront publiées
+    assert next_event(market_stream, 'ticker') is not None
+    yield market_stream
+    market_stream.stop()
+
+
+def test_closed_klines_are_published_from_the_stream(exchange, stream):
+    exchange.advance(3 * MINUTE_MS)
+    events = closed_klines(stream, 3)
+    expected = exchange.klines(SYMBOL, '1m', limit=3)
+    assert [event['source'] for event in events] == ['ws'] * 3
+    assert [event['kline'][0] for event in events] == [kline[0] for kline in expected]
+    assert [event['kline'][4] for event in events] == [kline[4] for kline in expected]
+    assert [event['kline'][6] for event in events] == [kline[6] for kline in expected]
+
+
+def test_missed_klines_are_backfilled_by_rest_after_a_disconnect(exchange, stream):
+    exchange.advance(MINUTE_MS)
+    last_ws = closed_klines(stream, 1)[0]['kline']
+
+    exchange.drop_streams()
+    assert next_event(stream, 'disconnected') is not None
+    exchange.advance(5 * MINUTE_MS) # Bougies clôturées pendant la coupure
+    assert next_event(stream, 'connected') is not None
+    backfilled = closed_klines(stream, 5)
+    assert [event['source'] for event in backfilled] == ['rest'] * 5
+    assert [event['kline'][0] for event in backfilled] == [last_ws[0] + i * MINUTE_MS for i in range(1, 6)]
+    assert [event['kline'][4] for event in backfilled] == [kline[4] for kline in exchange.klines(SYMBOL, '1m', limit=5)]
+
+    # Le flux reprend après les bougies rattrapées, sans doublon
+    exchange.advance(MINUTE_MS)
+    resumed = closed_klines(stream, 1)
+    assert resumed[0]['source'] == 'ws'
+    assert resumed[0]['kline'][0] == last_ws[0] + 6 * MINUTE_MS
+    assert next_event(stream, 'kline_closed', timeout=0.5) is None
+
+
+def test_gaps_longer_than_one_page_are_backfilled_page_by_page(exchange, stream):
+    exchange.advance(MINUTE_MS)
+    last_ws = closed_klines(stream, 1)[0]['kline']
+
+    exchange.drop_streams()
+    assert next_event(stream, 'disconnected') is not None
+    exchange.advance(1500 * MINUTE_MS)
+    assert next_event(stream, 'connected') is not None
+    backfilled = closed_klines(stream, 1500)
+    assert [event['source'] for event in backfilled] == ['rest'] * 1500
+    assert [event['kline'][0] for event in backfilled] == [last_ws[0] + i * MINUTE_MS for i in range(1, 1501)]
+    assert exchange.stats['requests']['klines'] == 2 # Deux pages (1000 + 500)
+
+
+def test_failed_backfill_keeps_the_gap_open_until_rest_recovers(exchange, stream, monkeypatch):
+    exchange.advance(MINUTE_MS)
+    last_ws = closed_klines(stream, 1)[0]['kline']
+    get_klines = binance_client_wrapper.get_klines
+    monkeypatch.setattr(binance_client_wrapper, 'get_klines', lambda *args, **kwargs: None) # REST indisponible
+
+    exchange.drop_streams()
+    assert next_event(stream, 'disconnected') is not None
+    exchange.advance(3 * MINUTE_MS)
+    failed = next_event(stream, 'backfill_failed')
+    assert failed is not None and failed['start_time'] == last_ws[0] + MINUTE_MS
+    exchange.advance(MINUTE_MS) # Bougie du flux après le trou : non publiée tant que le trou n'est pas comblé
+    assert next_event(stream, 'backfill_failed') is not None
+    assert next_event(stream, 'kline_closed', timeout=0.5) is None
+
+    monkeypatch.setattr(binance_client_wrapper, 'get_klines', get_klines)
+    exchange.advance(MINUTE_MS)
+    events = closed_klines(stream, 5)
+    assert [event['source'] for event in events] == ['rest'] * 4 + ['ws']
+    assert [event['kline'][0] for event in events] == [last_ws[0] + i * MINUTE_MS for i in range(1, 6)]
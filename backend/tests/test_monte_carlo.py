@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('pandas_ta') # monte_carlo -> backtest, strategy
+
+import monte_carlo
+
+STOP = 0.01
+
+
+@pytest.fixture
+def returns():
+    rng = np.random.default_rng(0)
+    return rng.normal(0.002, 0.01, 200)
+
+
+def test_seeded_results_are_reproducible(returns):
+    kwargs = dict(stop_loss_percent=STOP, n_paths=3000, seed=42, chunk_bytes=200 * monte_carlo.BYTES_PER_STEP * 500)
+    first = monte_carlo.simulate(returns, [0.002, 0.005], **kwargs)
+    pd.testing.assert_frame_equal(first, monte_carlo.simulate(returns, [0.002, 0.005], **kwargs))
+    assert not first.equals(monte_carlo.simulate(returns, [0.002, 0.005], **dict(kwargs, seed=43)))
+    assert (first['return_p5'] <= first['return_p50']).all() and (first['return_p50'] <= first['return_p95']).all()
+
+
+def test_permuting_every_trade_keeps_the_final_return(returns):
+    results = monte_carlo.simulate(returns, [0.005], stop_loss_percent=STOP, n_paths=500, method='permute', seed=1,
+                                   chunk_bytes=len(returns) * monte_carlo.BYTES_PER_STEP * 64) # Plusieurs blocs
+    expected = np.prod(1 + 0.5 * returns) - 1 # Fraction engagée : 0.005 / 0.01
+    for p in monte_carlo.PERCENTILES:
+        assert results[f'return_p{p}'][0] == pytest.approx(expected, rel=1e-9)
+    assert results['drawdown_p5'][0] < results['drawdown_p95'][0] # L'ordre des trades change le drawdown
+
+
+def test_ruin_probability_and_capped_fractions():
+    losses = np.full(10, -0.2)
+    results = monte_carlo.simulate(losses, [0.005, 0.01, 0.02], stop_loss_percent=STOP, n_paths=100, n_trades=4, seed=0)
+    # Fraction 0.5 : 0.9^4 = -34% (pas de ruine à -50%) ; fraction 1 : 0.8^4 = -59% (ruine)
+    assert list(results['ruin_probability']) == [0.0, 1.0, 1.0]
+    assert list(results['capped']) == [False, True, True]
+    assert results['position_fraction'][2] == 1.0 # Plafonnée : trajectoires identiques à 0.01
+    assert results['return_p50'][0] == pytest.approx(0.9 ** 4 - 1)
+
+
+def test_permute_chunks_are_sized_on_the_shuffled_columns():
+    chunk_bytes = 1000 * monte_carlo.BYTES_PER_STEP * 10
+    assert monte_carlo._chunk_paths(10_000, 10, 1000, 'bootstrap', chunk_bytes) == 1000
+    assert monte_carlo._chunk_paths(10_000, 10, 1000, 'permute', chunk_bytes) == 10 # 1000 index mélangés par trajectoire
+    assert monte_carlo._chunk_paths(5, 10, 1000, 'permute', chunk_bytes) == 5
+    assert monte_carlo._chunk_paths(10_000, 10, 10 ** 9, 'permute', chunk_bytes) == 1
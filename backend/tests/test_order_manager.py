@@ -0,0 +1,72 @@
+import json
+import types
+import pytest
+import binance_client_wrapper
+import order_manager
+from conftest import SYMBOL
+
+
+def execution_reports(exchange, client_order_id):
+    events = (json.loads(message) for message in exchange.user_events)
+    return [event for event in events if event['e'] == 'executionReport' and event['c'] == client_order_id]
+
+
+@pytest.fixture
+def fills():
+    return []
+
+
+def make_manager(fills, broker=None):
+    manager = order_manager.OrderManager(broker=broker, prefix='t')
+    manager.add_listener(lambda event: fills.append(event) if event['type'] == 'fill' else None)
+    return manager
+
+
+def test_stream_report_after_rest_response_is_not_double_counted(exchange, fills):
+    manager = make_manager(fills)
+    order = manager.place_order(SYMBOL, 'BUY', 0.5)
+    assert order['status'] == 'FILLED'
+    price = float(order['fills'][0]['price'])
+
+    for report in execution_reports(exchange, order['clientOrderId']):
+        manager.on_execution_report(report) # Même exécution (tradeId) rapportée par le flux
+    position = manager.get_position(SYMBOL)
+    assert len(fills) == 1
+    assert position['quantity'] == pytest.approx(0.5 * (1 - exchange.fee_rate)) # Frais prélevés sur l'asset de base
+    assert position['average_entry_price'] == pytest.approx(price)
+    assert manager.open_orders() == []
+
+
+def test_stream_report_before_rest_response_is_not_double_counted(exchange, fills):
+    def place_order(*args, **kwargs):
+        response = binance_client_wrapper.place_order(*args, **kwargs)
+        for report in execution_reports(exchange, kwargs['client_order_id']):
+            manager.on_execution_report(report) # Flux plus rapide que la réponse REST
+        assert len(fills) == 1
+        return response
+
+    manager = make_manager(fills, broker=types.SimpleNamespace(place_order=place_order))
+    manager.place_order(SYMBOL, 'BUY', 0.5)
+    assert len(fills) == 1
+    assert manager.get_position(SYMBOL)['quantity'] == pytest.approx(0.5 * (1 - exchange.fee_rate))
+
+
+def test_fills_missing_from_the_response_are_fetched_once(exchange, fills):
+    def place_order(*args, **kwargs):
+        response = binance_client_wrapper.place_order(*args, **kwargs)
+        return dict(response, fills=[]) # Réponse sans exécutions (newOrderRespType=RESULT)
+
+    broker = types.SimpleNamespace(place_order=place_order, get_order_trades=binance_client_wrapper.get_order_trades)
+    manager = make_manager(fills, broker=broker)
+    buy = manager.place_order(SYMBOL, 'BUY', 0.5)
+    assert len(fills) == 1 # Exécution lue via myTrades
+    for report in execution_reports(exchange, buy['clientOrderId']):
+        manager.on_execution_report(report)
+    assert len(fills) == 1
+
+    quantity = manager.get_position(SYMBOL)['quantity']
+    sell = manager.place_order(SYMBOL, 'SELL', quantity)
+    for report in execution_reports(exchange, sell['clientOrderId']):
+        manager.on_execution_report(report)
+    assert len(fills) == 2
+    assert manager.get_position(SYMBOL)['quantity'] == 0.0
@@ -0,0 +1,101 @@
+import pytest
+import paper_trading
+from conftest import SYMBOL, FakeClock
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def make_account(clock, latency_ms=0, balances=None):
+    return paper_trading.PaperAccount(balances={'USDT': 10000.0} if balances is None else balances, fee_rate=0.001,
+                                      slippage=0.001, latency_ms=latency_ms, name='test', clock=clock)
+
+
+def test_market_orders_fill_with_adverse_slippage_and_fees_on_the_received_asset(rules, clock):
+    account = make_account(clock)
+    account.update_price(SYMBOL, 100.0)
+    buy = account.place_order(SYMBOL, 'BUY', '10')
+    assert buy['status'] == 'FILLED'
+    assert float(buy['fills'][0]['price']) == pytest.approx(100.1)
+    assert buy['fills'][0]['commissionAsset'] == 'BTC'
+    assert account.free('USDT') == pytest.approx(10000 - 1001)
+    assert account.free('BTC') == pytest.approx(10 * 0.999)
+
+    account.update_price(SYMBOL, 110.0)
+    sell = account.place_order(SYMBOL, 'SELL', '5')
+    assert float(sell['fills'][0]['price']) == pytest.approx(109.89)
+    assert sell['fills'][0]['commissionAsset'] == 'USDT'
+    assert account.free('USDT') == pytest.approx(10000 - 1001 + 5 * 109.89 * 0.999)
+    assert account.to_status()['fees'] == pytest.approx({'BTC': 0.01, 'USDT': 5 * 109.89 * 0.001})
+
+
+def test_orders_are_refused_without_price_or_balance(rules, clock):
+    account = make_account(clock)
+    assert account.place_order(SYMBOL, 'BUY', '1') is None # Aucun prix connu
+    account.update_price(SYMBOL, 100.0)
+    assert account.place_order(SYMBOL, 'BUY', '100') is None # 10010 USDT > 10000
+    assert account.place_order(SYMBOL, 'LIMIT', '1') is None
+    assert account.free('USDT') == 10000.0 and account.order_count == 0
+
+
+def test_latency_fills_at_the_first_price_after_the_delay(rules, clock):
+    account = make_account(clock, latency_ms=200)
+    account.update_price(SYMBOL, 100.0)
+    order = account.place_order(SYMBOL, 'BUY', '10')
+    assert order['status'] == 'NEW' and account.to_status()['pending_orders'] == 1
+
+    clock.advance(0.1)
+    account.update_price(SYMBOL, 101.0)
+    assert account.get_order(SYMBOL, order['orderId'])['status'] == 'NEW' # Latence pas encore écoulée
+    clock.advance(0.1)
+    account.update_price('ETHUSDT', 2000.0) # Autre symbole : l'ordre reste en attente
+    assert account.get_order(SYMBOL, order['orderId'])['status'] == 'NEW'
+    account.update_price(SYMBOL, 102.0)
+
+    filled = account.get_order(SYMBOL, order['orderId'])
+    assert filled['status'] == 'FILLED'
+    assert float(filled['fills'][0]['price']) == pytest.approx(102.0 * 1.001) # Prix après la latence
+    assert account.to_status()['pending_orders'] == 0
+    assert account.get_order('ETHUSDT', order['orderId']) is None
+
+
+def test_pending_order_expires_if_the_balance_is_gone(rules, clock):
+    account = make_account(clock, latency_ms=100)
+    account.update_price(SYMBOL, 100.0)
+    first = account.place_order(SYMBOL, 'BUY', '60')
+    second = account.place_order(SYMBOL, 'BUY', '60') # Accepté : le solde n'est vérifié qu'à l'exécution
+    clock.advance(0.1)
+    account.update_price(SYMBOL, 100.0)
+    assert account.get_order(SYMBOL, first['orderId'])['status'] == 'FILLED'
+    assert account.get_order(SYMBOL, second['orderId'])['status'] == 'EXPIRED'
+    assert account.order_count == 1
+
+
+@pytest.mark.parametrize('latency_ms', [0, 100])
+def test_paper_book_opens_on_a_signal_and_exits_on_the_stop(rules, clock, latency_ms):
+    strategy = pytest.importorskip('strategy') # pandas_ta
+    params = strategy.StrategyParams(stop_loss_percent=0.01)
+    book = paper_trading.PaperBook(strategy.Strategy(params, name='test'), account=make_account(clock, latency_ms))
+    book.on_price(SYMBOL, 100.0)
+    book.on_candle(SYMBOL, {'signal': 1, 'Close': 100.0}, 0.001, 1.0, rules)
+    assert book.has_position(SYMBOL)
+    if latency_ms:
+        assert book.exits.get(SYMBOL) is None # Entrée en attente d'exécution
+        clock.advance(0.1)
+        book.on_price(SYMBOL, 100.0)
+    position = book.exits.get(SYMBOL)
+    assert position.entry_price == pytest.approx(100.1)
+    assert float(position.quantity) == pytest.approx(10 * 0.999) # 10 USDT risqués / 1 USDT de distance, frais déduits
+
+    assert book.on_price(SYMBOL, 99.5) is None
+    exit_result = book.on_price(SYMBOL, 99.0)
+    if latency_ms:
+        assert exit_result is None # Clôture en attente d'exécution
+        clock.advance(0.1)
+        exit_result = book.on_price(SYMBOL, 98.0)
+    assert exit_result['reason'] == 'stop_loss'
+    assert not book.has_position(SYMBOL)
+    status = book.to_status()
+    assert status['trades'] == 1 and status['win_rate'] == 0.0 and status['positions'] == {}
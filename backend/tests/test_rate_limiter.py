@@ -0,0 +1,80 @@
+import types
+import pytest
+import binance_client_wrapper
+from conftest import FakeClock
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def make_limiter(clock, weight_limit=600, order_limit_10s=10):
+    # budget 540/min -> 9 jetons/s, seau de 90 ; réserves 4.5 (compte) et 9 (marché) ; 9 ordres par 10 s
+    return binance_client_wrapper.RateLimiter(weight_limit, order_limit_10s, clock=clock)
+
+
+def ban(status_code, retry_after):
+    return types.SimpleNamespace(status_code=status_code, response=types.SimpleNamespace(headers={'Retry-After': retry_after}))
+
+
+def test_market_data_is_throttled_then_refilled(clock):
+    limiter = make_limiter(clock)
+    served = 0
+    while limiter.try_acquire('klines') == 0:
+        served += 1
+    assert served == 40 # 90 jetons, poids 2, réserve de 9 laissée intacte
+    delay = limiter.try_acquire('klines')
+    assert delay == pytest.approx(1 / 9)
+    clock.advance(delay)
+    assert limiter.try_acquire('klines') == 0
+
+
+def test_reserves_keep_budget_for_orders_and_account(clock):
+    limiter = make_limiter(clock)
+    while limiter.try_acquire('klines') == 0:
+        pass
+    assert limiter.try_acquire('order') == 0 # Sans réserve : puise dans ce que le marché ne peut plus prendre
+    assert limiter.try_acquire('order_status') == 0 # Poids 4 + réserve 4.5 <= 9 jetons
+    assert limiter.try_acquire('order_status') > 0
+
+
+def test_order_bucket_limits_orders_per_10s(clock):
+    limiter = make_limiter(clock)
+    for _ in range(9):
+        assert limiter.try_acquire('order') == 0
+    delay = limiter.try_acquire('order')
+    assert delay == pytest.approx(1 / 0.9)
+    clock.advance(delay)
+    assert limiter.try_acquire('order') == 0
+    assert limiter.try_acquire('order_oco') == pytest.approx(2 / 0.9) # Deux ordres comptés
+
+
+def test_requests_heavier_than_the_bucket_are_eventually_served(clock):
+    limiter = make_limiter(clock, weight_limit=120, order_limit_10s=1) # Seau de 18 jetons, 0.9 ordre
+    assert limiter.try_acquire('account') == 0 # Poids 20 : part seau plein
+    delay = limiter.try_acquire('exchange_info')
+    assert 0 < delay < float('inf')
+    clock.advance(delay)
+    assert limiter.try_acquire('exchange_info') == 0
+    clock.advance(10)
+    assert limiter.try_acquire('order_oco') == 0 # Deux ordres pour une capacité de 0.9
+
+
+def test_retry_after_blocks_every_request(clock):
+    limiter = make_limiter(clock)
+    limiter.record_error(ban(400, '30')) # Autre erreur : ignorée
+    assert limiter.try_acquire('order') == 0
+    limiter.record_error(ban(429, '30'))
+    assert limiter.try_acquire('order') == pytest.approx(30)
+    assert limiter.try_acquire('klines') == pytest.approx(30)
+    clock.advance(30)
+    assert limiter.try_acquire('order') == 0
+
+
+def test_server_counters_recalibrate_the_budget(clock):
+    limiter = make_limiter(clock)
+    limiter.record_headers({'x-mbx-used-weight-1m': '530', 'x-mbx-order-count-10s': '9'})
+    assert limiter.used_weight == 530
+    assert limiter.try_acquire('klines') > 0 # 10 jetons restants côté serveur, réserve de 9
+    assert limiter.try_acquire('order') > 0
@@ -0,0 +1,66 @@
+from decimal import Decimal
+import pytest
+import symbol_rules
+
+SYMBOL_INFO = {
+    'symbol': 'BTCUSDT', 'baseAsset': 'BTC', 'quoteAsset': 'USDT',
+    'filters': [
+        {'filterType': 'PRICE_FILTER', 'minPrice': '0.01000000', 'maxPrice': '1000000.00000000', 'tickSize': '0.01000000'},
+        {'filterType': 'LOT_SIZE', 'minQty': '0.00001000', 'maxQty': '9000.00000000', 'stepSize': '0.00001000'},
+        {'filterType': 'MARKET_LOT_SIZE', 'minQty': '0.00000000', 'maxQty': '100.00000000', 'stepSize': '0.00000000'},
+        {'filterType': 'NOTIONAL', 'minNotional': '5.00000000', 'applyMinToMarket': True,
+         'maxNotional': '9000000.00000000', 'applyMaxToMarket': False, 'avgPriceMins': 5},
+    ],
+}
+
+
+@pytest.fixture
+def rules():
+    return symbol_rules.SymbolRules(SYMBOL_INFO)
+
+
+@pytest.mark.parametrize('quantity, expected', [
+    (0.123456789, '0.12345'),
+    ('0.00001999', '0.00001'),
+    (0.3, '0.3'), # Pas d'erreur de représentation binaire (0.29999 avec un arrondi en float)
+    (1e-06, '0'),
+])
+def test_quantity_is_floored_to_the_step_size(rules, quantity, expected):
+    assert rules.quantize_quantity(quantity) == Decimal(expected)
+
+
+def test_market_lot_size_zero_values_fall_back_to_lot_size(rules):
+    assert rules.market_step_size == Decimal('0.00001')
+    assert rules.market_min_qty == Decimal('0.00001')
+    assert rules.market_max_qty == Decimal('100') # Le plus strict de LOT_SIZE et MARKET_LOT_SIZE
+
+
+def test_price_is_floored_to_the_tick_size(rules):
+    assert rules.quantize_price(30123.456789) == Decimal('30123.45')
+    assert symbol_rules.SymbolRules.format_decimal(rules.quantize_quantity('0.00001')) == '0.00001'
+
+
+@pytest.mark.parametrize('quantity, price, market, reason', [
+    ('0.001', 30000, True, ''),
+    ('0.0001', 30000, True, 'minNotional'), # 3 USDT
+    ('0.000015', 30000, True, 'stepSize'),
+    ('150', 30000, True, 'maxQty'), # MARKET_LOT_SIZE
+    ('150', 30000, False, ''),
+    ('0.001', '30000.005', False, 'tickSize'),
+])
+def test_validate_reports_the_failing_filter(rules, quantity, price, market, reason):
+    valid, message = rules.validate(quantity, price, market=market)
+    assert valid == (reason == '')
+    assert reason in message
+
+
+def test_from_symbol_info_reuses_rules_until_the_filters_change(monkeypatch):
+    monkeypatch.setattr(symbol_rules, '_rules', {}) # Registre isolé des autres tests
+    rules = symbol_rules.from_symbol_info(SYMBOL_INFO)
+    assert symbol_rules.from_symbol_info(dict(SYMBOL_INFO)) is rules # Mêmes filtres : pas de recompilation
+
+    filters = [dict(f, stepSize='0.00010000') if f['filterType'] == 'LOT_SIZE' else f for f in SYMBOL_INFO['filters']]
+    updated = symbol_rules.from_symbol_info(dict(SYMBOL_INFO, filters=filters))
+    assert updated is not rules
+    assert updated.step_size == Decimal('0.0001')
+    assert symbol_rules.get_symbol_rules('BTCUSDT') is updated
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('pandas_ta') # walk_forward -> backtest, optimizer, strategy
+
+import mock_exchange
+import optimizer
+import walk_forward
+
+HOUR_MS = 3_600_000
+DAY_MS = 86_400_000
+MONTH_BARS = 30 * 24
+WARMUP_BARS = 100
+
+
+def hourly_klines(n, seed=5):
+    """n bougies 1h synthétiques (KLINE_COLUMNS) ; les n premières ne dépendent pas de la longueur demandée."""
+    data = mock_exchange.synthetic_klines(n, start_price=100.0, volatility=0.01, seed=seed)
+    open_time = data['open_time'][0] + np.arange(n, dtype=np.int64) * HOUR_MS
+    return pd.DataFrame({'Open time': open_time, 'Open': data['open'], 'High': data['high'], 'Low': data['low'],
+                         'Close': data['close'], 'Volume': data['volume'], 'Close time': open_time + HOUR_MS - 1})
+
+
+def test_windows_are_epoch_aligned_and_stable_when_data_grows():
+    open_times = hourly_klines(5 * MONTH_BARS)['Open time'].to_numpy()
+    train_ms, test_ms = 30 * DAY_MS, 15 * DAY_MS
+    windows = walk_forward.build_windows(open_times[:4 * MONTH_BARS], train_ms, test_ms, test_ms, WARMUP_BARS)
+    assert windows
+    assert all(w['test_start'] % test_ms == 0 for w in windows)
+    assert windows[0]['train_start'] - open_times[0] >= WARMUP_BARS * HOUR_MS # Warm-up disponible avant l'optimisation
+    assert all(b['test_start'] - a['test_start'] == test_ms for a, b in zip(windows, windows[1:]))
+
+    extended = walk_forward.build_windows(open_times, train_ms, test_ms, test_ms, WARMUP_BARS)
+    assert extended[:len(windows)] == windows # Un mois de plus : mêmes fenêtres, suivies des nouvelles
+    assert len(extended) == len(windows) + 2
+    assert walk_forward.build_windows(open_times[:10], train_ms, test_ms, test_ms, WARMUP_BARS) == []
+
+
+def test_appending_a_month_only_evaluates_the_new_windows(tmp_path):
+    combinations = optimizer.build_combinations({'EMA_SHORT_PERIOD': [5, 9], 'RSI_PERIOD': [7, 14]})
+    klines = hourly_klines(5 * MONTH_BARS)
+    kwargs = dict(train='30d', test='15d', workers=1, warmup_bars=WARMUP_BARS, min_trades=0, cache_dir=str(tmp_path))
+
+    first, _ = walk_forward.run_walk_forward(klines.iloc[:4 * MONTH_BARS], combinations, **kwargs)
+    assert (first['cached'] == 0).all()
+    second, _ = walk_forward.run_walk_forward(klines, combinations, **kwargs)
+    assert len(second) == len(first) + 2
+    old, new = second.iloc[:len(first)], second.iloc[len(first):]
+    # Fenêtres déjà évaluées : grille in-sample et test des meilleurs paramètres lus du cache
+    assert (old['cached'] == len(combinations) + 1).all()
+    assert (new['cached'] == 0).all()
+    pd.testing.assert_frame_equal(old.drop(columns='cached'), first.drop(columns='cached'))
+
+    widened = optimizer.build_combinations({'EMA_SHORT_PERIOD': [5, 9, 12], 'RSI_PERIOD': [7, 14]})
+    third, _ = walk_forward.run_walk_forward(klines, widened, **kwargs)
+    assert (third['cached'] >= len(combinations)).all() # Seules les nouvelles combinaisons sont calculées
@@ -0,0 +1,292 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from binance.helpers import interval_to_milliseconds
+import backtest
+import optimizer
+import strategy
+
+try:
+    import config
+    CACHE_DIR = getattr(config, 'WALK_FORWARD_CACHE_DIR', None)
+except ImportError:
+    CACHE_DIR = None
+CACHE_DIR = CACHE_DIR or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'walk_forward')
+
+# Validation walk-forward de la stratégie : fenêtres glissantes d'optimisation
+# (in-sample) suivies chacune d'une fenêtre de test (out-of-sample) où seuls
+# les meilleurs paramètres de l'optimisation sont rejoués. Les fenêtres sont
+# évaluées en parallèle (une fenêtre par worker).
+#
+# Les fenêtres sont alignées sur l'epoch (multiples du pas) et chaque évaluation
+# ne dépend que des bougies de sa fenêtre (plus un warm-up fixe des indicateurs) :
+# leurs résultats sont mis en cache par empreinte des données et des options.
+# Relancer après l'ajout d'un mois de données ne calcule que les nouvelles
+# fenêtres (et les combinaisons absentes du cache si la grille a changé).
+
+# Colonnes des klines prises en compte dans l'empreinte d'une fenêtre
+FINGERPRINT_COLUMNS = ['Open time', 'Open', 'High', 'Low', 'Close', 'Volume']
+# Warm-up des indicateurs avant chaque fenêtre, en multiples de l'historique requis
+# (les EMA ont alors oublié leur initialisation)
+WARMUP_FACTOR = 3
+DAY_MS = 86_400_000
+
+
+def build_windows(open_times, train_ms, test_ms, step_ms, warmup_bars):
+    """
+    Découpe la plage de bougies en fenêtres (optimisation, test) complètes.
+    Les débuts de test sont des multiples de step_ms depuis l'epoch : les fenêtres
+    restent identiques quand la plage de données s'étend.
+
+    Args:
+        open_times (np.ndarray): Open times triés (ms).
+        train_ms, test_ms, step_ms (int): Durées d'optimisation, de test et pas entre fenêtres.
+        warmup_bars (int): Bougies nécessaires avant la fenêtre d'optimisation.
+
+    Returns:
+        list: dicts (train_start, test_start, test_end en ms ; index de bougies correspondants).
+    """
+    if len(open_times) == 0:
+        return []
+    first, last = int(open_times[0]), int(open_times[-1])
+    windows = []
+    test_start = -(-(first + train_ms) // step_ms) * step_ms
+    while test_start + test_ms <= last + 1:
+        train_start = test_start - train_ms
+        i_train, i_test, i_end = np.searchsorted(open_times, [train_start, test_start, test_start + test_ms])
+        if i_train >= warmup_bars and i_test > i_train and i_end > i_test:
+            windows.append({'train_start': train_start, 'test_start': test_start, 'test_end': test_start + test_ms,
+                            'i_train': int(i_train), 'i_test': int(i_test), 'i_end': int(i_end)})
+        test_start += step_ms
+    return windows
+
+
+def fingerprint(klines_df, trade_from, options):
+    """Empreinte d'une évaluation : bougies (warm-up compris), première bougie tradée et options."""
+    digest = hashlib.sha1()
+    for column in FINGERPRINT_COLUMNS:
+        digest.update(np.ascontiguousarray(klines_df[column].to_numpy(dtype=np.float64)).tobytes())
+    digest.update(json.dumps({'trade_from': trade_from, **options}, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def _key(params):
+    """Clé hashable d'une combinaison (types normalisés : le CSV relit des numpy.int64)."""
+    return tuple(bool(params[name]) if name.startswith('USE_') else int(params[name]) for name in optimizer.PARAM_NAMES)
+
+
+def evaluate_cached(klines_df, trade_from, combinations, options, cache_dir):
+    """
+    Backtest de chaque combinaison sur klines_df à partir de la bougie trade_from,
+    en ne calculant que les combinaisons absentes du cache de cette fenêtre.
+
+    Returns:
+        tuple: (DataFrame des résultats des combinaisons demandées, nombre de combinaisons lues du cache)
+    """
+    path = os.path.join(cache_dir, f"{fingerprint(klines_df, trade_from, options)}.csv")
+    cached = pd.read_csv(path) if os.path.exists(path) else pd.DataFrame(columns=optimizer.PARAM_NAMES + optimizer.RESULT_METRICS)
+    known = {_key(row): row for row in cached.to_dict('records')}
+    missing = [params for params in combinations if _key(params) not in known]
+    if missing:
+        matrix, index = optimizer.precompute_series(klines_df, missing)
+        series = lambda name: matrix[index[name]]
+        computed = [optimizer.backtest_params(series, params, options, trade_from) for params in missing]
+        known.update((_key(result), result) for result in computed)
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        pd.DataFrame(list(known.values()), columns=optimizer.PARAM_NAMES + optimizer.RESULT_METRICS).to_csv(tmp_path, index=False)
+        os.replace(tmp_path, path) # Écriture atomique (runs concurrents sur la même fenêtre)
+    results = pd.DataFrame([known[_key(params)] for params in combinations])
+    return results, len(combinations) - len(missing)
+
+
+def select_best(results, rank_by='total_return', min_trades=1):
+    """Meilleure combinaison (dict) selon rank_by, parmi celles d'au moins min_trades trades."""
+    eligible = results[results['trades'] >= min_trades]
+    if eligible.empty:
+        return None
+    ordered = eligible.sort_values(rank_by, ascending=(rank_by == 'max_drawdown'), kind='stable')
+    return ordered.iloc[0].to_dict()
+
+
+def run_window(task):
+    """
+    Optimise une fenêtre puis rejoue les meilleurs paramètres sur sa fenêtre de test (exécuté dans un worker).
+
+    Returns:
+        dict: Bornes de la fenêtre, paramètres retenus, métriques in-sample (is_*) et out-of-sample (oos_*).
+    """
+    window = task['window']
+    warmup = task['warmup_bars']
+    train_df = task['train_df']
+    train, train_cached = evaluate_cached(train_df, warmup, task['combinations'], task['options'], task['cache_dir'])
+    best = select_best(train, task['rank_by'], task['min_trades'])
+    row = {'train_start': window['train_start'], 'test_start': window['test_start'], 'test_end': window['test_end'],
+           'cached': train_cached}
+    if best is None:
+        return row
+    params = dict(zip(optimizer.PARAM_NAMES, _key(best)))
+    test, test_cached = evaluate_cached(task['test_df'], warmup, [params], task['options'], task['cache_dir'])
+    row['cached'] += test_cached
+    row.update(params)
+    row.update({f'is_{metric}': best[metric] for metric in optimizer.RESULT_METRICS})
+    row.update({f'oos_{metric}': test.iloc[0][metric] for metric in optimizer.RESULT_METRICS})
+    return row
+
+
+def daily_return(total_return, duration_ms):
+    """Rendement moyen par jour (composé) d'un rendement total sur duration_ms."""
+    return (1 + total_return) ** (DAY_MS / duration_ms) - 1 if total_return > -1 else -1.0
+
+
+def summarize(results):
+    """
+    Stabilité des paramètres retenus et dégradation in-sample -> out-of-sample.
+
+    Returns:
+        dict: Agrégats (rendement OOS composé, efficacité walk-forward, stabilité par paramètre).
+    """
+    done = results.dropna(subset=['oos_total_return']) if 'oos_total_return' in results else results.iloc[0:0]
+    if done.empty:
+        return {'windows': len(results), 'evaluated': 0}
+    train_ms = done['test_start'] - done['train_start']
+    test_ms = done['test_end'] - done['test_start']
+    is_daily = np.array([daily_return(r, d) for r, d in zip(done['is_total_return'], train_ms)])
+    oos_daily = np.array([daily_return(r, d) for r, d in zip(done['oos_total_return'], test_ms)])
+    keys = [_key(row) for row in done[optimizer.PARAM_NAMES].to_dict('records')]
+    stability = {}
+    for name in optimizer.PARAM_NAMES:
+        values = done[name]
+        counts = values.value_counts()
+        mode = counts.index[0]
+        stability[name] = {'mode': mode.item() if isinstance(mode, np.generic) else mode,
+                           'mode_share': float(counts.iloc[0] / len(values)), 'distinct': int(len(counts))}
+    return {
+        'windows': len(results),
+        'evaluated': len(done),
+        'oos_compounded_return': float(np.prod(1 + done['oos_total_return'].to_numpy()) - 1),
+        'oos_trades': int(done['oos_trades'].sum()),
+        'oos_profitable_windows': float((done['oos_total_return'] > 0).mean()),
+        'is_daily_return': float(is_daily.mean()),
+        'oos_daily_return': float(oos_daily.mean()),
+        # Rendement journalier OOS / IS : 1 = aucune dégradation hors échantillon
+        'efficiency': float(oos_daily.mean() / is_daily.mean()) if is_daily.mean() > 0 else float('nan'),
+        'is_max_drawdown': float(done['is_max_drawdown'].mean()),
+        'oos_max_drawdown': float(done['oos_max_drawdown'].mean()),
+        'param_changes': float(np.mean([a != b for a, b in zip(keys, keys[1:])])) if len(keys) > 1 else 0.0,
+        'stability': stability,
+    }
+
+
+def run_walk_forward(klines_df, combinations, train='90d', test='30d', step=None, workers=None,
+                     rank_by='total_return', min_trades=1, warmup_bars=None, cache_dir=None, **sim_kwargs):
+    """
+    Validation walk-forward : optimisation de la grille sur chaque fenêtre in-sample, puis
+    test des meilleurs paramètres sur la fenêtre suivante. Fenêtres évaluées en parallèle.
+
+    Args:
+        klines_df (pd.DataFrame): Klines (colonnes KLINE_COLUMNS), ex: retour de backtest.load_data().
+        combinations (list): Combinaisons de optimizer.build_combinations().
+        train, test, step (str): Durées des fenêtres (ex: '90d', '4w') ; step = test par défaut.
+        warmup_bars (int, optional): Bougies de warm-up avant chaque fenêtre (défaut : WARMUP_FACTOR x historique requis).
+        sim_kwargs: Options de simulation (voir optimizer.simulation_options).
+
+    Returns:
+        tuple: (DataFrame d'une ligne par fenêtre, dont 'cached' : résultats lus du cache ; dict de summarize()),
+               ou (None, None) si aucune fenêtre.
+    """
+    started = time.perf_counter()
+    train_ms, test_ms = interval_to_milliseconds(train), interval_to_milliseconds(test)
+    step_ms = interval_to_milliseconds(step) if step else test_ms
+    if not train_ms or not test_ms or not step_ms:
+        logging.error(f"Durées de fenêtre invalides : optimisation {train}, test {test}, pas {step} (ex: 90d, 4w, 12h).")
+        return None, None
+    if warmup_bars is None:
+        warmup_bars = WARMUP_FACTOR * max(strategy.StrategyParams.from_config(params).required_history() for params in combinations)
+    open_times = klines_df['Open time'].to_numpy(dtype=np.int64)
+    windows = build_windows(open_times, train_ms, test_ms, step_ms, warmup_bars)
+    if not windows:
+        logging.error(f"Aucune fenêtre complète ({train} + {test}, warm-up {warmup_bars} bougies) dans les données.")
+        return None, None
+
+    options = optimizer.simulation_options(**sim_kwargs)
+    tasks = [{
+        'window': window, 'warmup_bars': warmup_bars, 'combinations': combinations, 'options': options,
+        'rank_by': rank_by, 'min_trades': min_trades, 'cache_dir': cache_dir or CACHE_DIR,
+        'train_df': klines_df.iloc[window['i_train'] - warmup_bars:window['i_test']].reset_index(drop=True),
+        'test_df': klines_df.iloc[window['i_test'] - warmup_bars:window['i_end']].reset_index(drop=True),
+    } for window in windows]
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        rows = list(executor.map(run_window, tasks))
+
+    results = pd.DataFrame(rows)
+    summary = summarize(results)
+    cached = int(results['cached'].sum())
+    logging.info(f"{len(windows)} fenêtre(s) x {len(combinations)} combinaisons évaluées sur {workers} worker(s) "
+                 f"en {time.perf_counter() - started:.2f}s ({cached} résultat(s) lus du cache).")
+    for column in ('train_start', 'test_start', 'test_end'):
+        results[column] = pd.to_datetime(results[column], unit='ms')
+    return results, summary
+
+
+def format_summary(summary):
+    """Met en forme le résumé walk-forward pour l'affichage console."""
+    if not summary.get('evaluated'):
+        return f"Fenêtres                : {summary['windows']} (aucune n'a de combinaison avec assez de trades)"
+    lines = [
+        f"Fenêtres                : {summary['evaluated']} / {summary['windows']}",
+        f"Rendement OOS composé   : {summary['oos_compounded_return']:+.2%} ({summary['oos_trades']} trades, "
+        f"{summary['oos_profitable_windows']:.0%} des fenêtres gagnantes)",
+        f"Rendement / jour IS     : {summary['is_daily_return']:+.4%}",
+        f"Rendement / jour OOS    : {summary['oos_daily_return']:+.4%} (efficacité {summary['efficiency']:.2f})",
+        f"Drawdown moyen IS / OOS : {summary['is_max_drawdown']:.2%} / {summary['oos_max_drawdown']:.2%}",
+        f"Changements de réglage  : {summary['param_changes']:.0%} des fenêtres",
+        "Stabilité des paramètres :",
+    ]
+    for name, stats in summary['stability'].items():
+        lines.append(f"  {name:<24}: {stats['mode']} ({stats['mode_share']:.0%} des fenêtres, {stats['distinct']} valeur(s))")
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Validation walk-forward (optimisation in-sample, test out-of-sample) de la stratégie.")
+    backtest.add_data_arguments(parser)
+    parser.add_argument('--param', action='append', default=[], metavar='NOM=VALEURS',
+                        help="Axe de recherche, ex: EMA_SHORT_PERIOD=5:15:1 ou RSI_PERIOD=7,14,21 (répétable)")
+    parser.add_argument('--random', type=int, help="Nombre de combinaisons tirées au hasard (recherche aléatoire)")
+    parser.add_argument('--seed', type=int, default=0, help="Graine de la recherche aléatoire (fixe : même grille, cache réutilisé)")
+    parser.add_argument('--train', default='90d', help="Durée d'optimisation (défaut 90d)")
+    parser.add_argument('--test', default='30d', help="Durée de test (défaut 30d)")
+    parser.add_argument('--step', help="Pas entre deux fenêtres (défaut : durée de test)")
+    parser.add_argument('--warmup', type=int, help="Bougies de warm-up des indicateurs avant chaque fenêtre")
+    parser.add_argument('--workers', type=int, help="Nombre de processus (défaut : nombre de cœurs)")
+    parser.add_argument('--rank-by', default='total_return', choices=optimizer.RESULT_METRICS, help="Métrique de sélection in-sample")
+    parser.add_argument('--min-trades', type=int, default=1, help="Trades in-sample minimum d'une combinaison retenue")
+    parser.add_argument('--fee', type=float, default=0.001)
+    parser.add_argument('--slippage', type=float, default=0.0005)
+    parser.add_argument('--risk', type=float, default=0.01)
+    parser.add_argument('--long-only', action='store_true')
+    parser.add_argument('--cache-dir', help=f"Cache des résultats par fenêtre (défaut {CACHE_DIR})")
+    parser.add_argument('--output', default='walk_forward_results.csv', help="Fichier CSV des résultats par fenêtre")
+    args = parser.parse_args()
+
+    klines_df = backtest.load_data(args)
+    if klines_df is not None:
+        combinations = optimizer.build_combinations(optimizer.parse_space(args.param), n_random=args.random, seed=args.seed)
+        logging.info(f"{len(combinations)} combinaisons à évaluer par fenêtre.")
+        results, summary = run_walk_forward(klines_df, combinations, train=args.train, test=args.test, step=args.step,
+                                            workers=args.workers, rank_by=args.rank_by, min_trades=args.min_trades,
+                                            warmup_bars=args.warmup, cache_dir=args.cache_dir, fee_rate=args.fee,
+                                            slippage=args.slippage, risk_per_trade=args.risk, allow_short=not args.long_only)
+        if results is not None:
+            results.to_csv(args.output, index=False)
+            print(format_summary(summary))
+            print(f"Résultats par fenêtre écrits dans {args.output}")
@@ -27,7 +27,13 @@ document.addEventListener('DOMContentLoaded', () => {
         VOLUME_AVG_PERIOD: document.getElementById('param-volume-avg'),
         USE_EMA_FILTER: document.getElementById('param-use-ema-filter'),
         USE_VOLUME_CONFIRMATION: document.getElementById('param-use-volume'),
+        STOP_LOSS_PERCENT: document.getElementById('param-stop-loss'),
+        TAKE_PROFIT_PERCENT: document.getElementById('param-take-profit'),
+        TRAILING_STOP_PERCENT: document.getElementById('param-trailing-stop'),
+        EXIT_ON_REVERSE_SIGNAL: document.getElementById('param-exit-reverse'),
     };
+    // Paramètres exprimés en fraction côté backend, affichés en %
+    const PERCENT_PARAMS = ['RISK_PER_TRADE', 'STOP_LOSS_PERCENT', 'TAKE_PROFIT_PERCENT', 'TRAILING_STOP_PERCENT'];
     const saveParamsBtn = document.getElementById('save-params-btn');
     const paramSaveStatus = document.getElementById('param-save-status');
 
@@ -105,28 +111,75 @@ document.addEventListener('DOMContentLoaded', () => {
              return response.json();
          })
         .then(data => {
+            currentStatus = data;
             updateStatusUI(data);
         })
         .catch(error => {
             console.error('Erreur de récupération du statut:', error);
             addLogFromJS(`Erreur connexion statut: ${error.message}`); // Utiliser addLogFromJS
-            statusValue.textContent = 'Erreur Connexion';
-            statusValue.style.color = 'orange';
-            // Réinitialiser tous les champs en cas d'erreur
-            if (symbolValue) symbolValue.textContent = 'N/A';
-            if (timeframeValue) timeframeValue.textContent = 'N/A';
-            if (balanceValue) balanceValue.textContent = 'N/A';
-            if (quoteAssetLabel) quoteAssetLabel.textContent = 'USDT'; // Remettre défaut
-            if (quantityValue) quantityValue.textContent = 'N/A';     // Réinitialiser quantité
-            if (baseAssetLabel) baseAssetLabel.textContent = 'N/A';     // Réinitialiser label quantité
-            if (priceValue) priceValue.textContent = 'N/A';
-            if (symbolPriceLabel) symbolPriceLabel.textContent = 'N/A';
-            if (positionValue) positionValue.textContent = 'N/A';
-            startBtn.disabled = true;
-            stopBtn.disabled = true;
+            showStatusConnectionError();
         });
     }
 
+    function showStatusConnectionError() {
+        statusValue.textContent = 'Erreur Connexion';
+        statusValue.style.color = 'orange';
+        // Réinitialiser tous les champs en cas d'erreur
+        if (symbolValue) symbolValue.textContent = 'N/A';
+        if (timeframeValue) timeframeValue.textContent = 'N/A';
+        if (balanceValue) balanceValue.textContent = 'N/A';
+        if (quoteAssetLabel) quoteAssetLabel.textContent = 'USDT'; // Remettre défaut
+        if (quantityValue) quantityValue.textContent = 'N/A';     // Réinitialiser quantité
+        if (baseAssetLabel) baseAssetLabel.textContent = 'N/A';     // Réinitialiser label quantité
+        if (priceValue) priceValue.textContent = 'N/A';
+        if (symbolPriceLabel) symbolPriceLabel.textContent = 'N/A';
+        if (positionValue) positionValue.textContent = 'N/A';
+        startBtn.disabled = true;
+        stopBtn.disabled = true;
+    }
+
+    // --- Flux de statut SSE (remplace le polling de /status) ---
+    // Le backend envoie un événement 'snapshot' (statut complet) à la connexion,
+    // puis uniquement les champs modifiés, fusionnés dans currentStatus.
+    let statusSource = null;
+    let currentStatus = null;
+    function mergeStatus(target, changes) {
+        for (const key in changes) {
+            const value = changes[key];
+            if (value !== null && typeof value === 'object' && !Array.isArray(value)
+                && target[key] !== null && typeof target[key] === 'object') {
+                mergeStatus(target[key], value);
+            } else {
+                target[key] = value;
+            }
+        }
+        return target;
+    }
+
+    function connectStatusStream() {
+        if (statusSource) {
+            statusSource.close();
+        }
+        statusSource = new EventSource(`${API_BASE_URL}/stream_status`);
+
+        statusSource.addEventListener('snapshot', function(event) {
+            currentStatus = JSON.parse(event.data);
+            updateStatusUI(currentStatus);
+        });
+
+        statusSource.onmessage = function(event) {
+            if (!currentStatus) return; // Toujours précédé d'un snapshot
+            mergeStatus(currentStatus, JSON.parse(event.data));
+            updateStatusUI(currentStatus);
+        };
+
+        statusSource.onerror = function(err) {
+            console.error("Erreur flux de statut:", err);
+            showStatusConnectionError(); // EventSource se reconnecte et reçoit un nouveau snapshot
+        };
+    }
+    // --- FIN flux de statut ---
+
     function fetchParameters() {
         // console.log("Récupération des paramètres depuis le backend...");
         addLogFromJS("Chargement des paramètres..."); // Utiliser addLogFromJS
@@ -143,7 +196,7 @@ document.addEventListener('DOMContentLoaded', () => {
                     if (data.hasOwnProperty(key) && paramInputs[key]) {
                         const inputElement = paramInputs[key];
                         if (inputElement.type === 'checkbox') { inputElement.checked = data[key]; }
-                        else if (inputElement.name === 'RISK_PER_TRADE') { inputElement.value = (data[key] * 100).toFixed(1); }
+                        else if (PERCENT_PARAMS.includes(inputElement.name)) { inputElement.value = parseFloat((data[key] * 100).toFixed(3)); }
                         else { inputElement.value = data[key]; }
                     } else if (paramInputs[key]) { console.warn(`Clé paramètre "${key}" non trouvée dans les données backend.`); }
                 }
@@ -275,7 +328,7 @@ document.addEventListener('DOMContentLoaded', () => {
                         addLogFromJS(`Erreur: Valeur invalide pour ${label?.textContent || key}`); // Utiliser addLogFromJS
                         isValid = false; break;
                     }
-                    if (inputElement.name === 'RISK_PER_TRADE') { newParams[key] = value / 100.0; }
+                    if (PERCENT_PARAMS.includes(inputElement.name)) { newParams[key] = value / 100.0; }
                     else { newParams[key] = value; }
                 } else if (inputElement.tagName === 'SELECT') { newParams[key] = inputElement.value; }
                 else { newParams[key] = inputElement.value; }
@@ -319,7 +372,7 @@ document.addEventListener('DOMContentLoaded', () => {
     // --- Initialisation ---
     fetchParameters(); // Charger les paramètres en premier
     connectLogStream(); // Démarrer la connexion SSE pour les logs
-    const statusInterval = setInterval(fetchBotStatus, 5000); // Garder le polling pour le statut
+    connectStatusStream(); // Statut poussé par le backend (plus de polling toutes les 5s)
 
      // Gérer la fermeture de la page/onglet pour fermer SSE
      window.addEventListener('beforeunload', () => {
@@ -327,5 +380,8 @@ document.addEventListener('DOMContentLoaded', () => {
             evtSource.close();
             console.log("Flux de logs SSE fermé.");
         }
+        if (statusSource) {
+            statusSource.close();
+        }
     });
 });